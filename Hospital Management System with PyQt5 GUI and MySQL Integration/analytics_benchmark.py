@@ -0,0 +1,89 @@
+import argparse
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from clinical_analytics import DAY, MISSING, READMIT_DAYS, SEVERITIES, ClinicalAnalytics, compute, to_minutes
+
+
+def synthetic(count, patients, diseases, years, seed=5, first_id=1):
+    # Stays of 0-40 days spread over `years`, a few still open, 0-3 diagnoses each.
+    rng = np.random.default_rng(seed + first_id)
+    now = to_minutes(datetime.now())
+    admitted = now - rng.integers(0, years * 365 * DAY, count)
+    stay = (rng.lognormal(1.4, 0.8, count) * DAY).astype(np.int64).clip(60, 40 * DAY)
+    discharged = np.where((admitted + stay > now) | (rng.random(count) < 0.001), MISSING, admitted + stay)
+    reg = np.arange(first_id, first_id + count)
+    stays = np.stack([reg, rng.integers(1, patients + 1, count), admitted, discharged], axis=1).astype(np.int32)
+    per_stay = rng.integers(0, 4, count)
+    diag_reg = np.repeat(reg, per_stay)
+    # Repeats of a disease within one stay are dropped, as the (stay, disease) primary key would.
+    pairs = np.unique(np.stack([diag_reg, rng.integers(1, diseases + 1, len(diag_reg))], axis=1), axis=0)
+    return stays, pairs.astype(np.int32), now
+
+
+def reference_readmissions(stays, now):
+    # The same rule written the obvious pandas way, to check the sorted-array version against.
+    frame = pd.DataFrame(stays, columns=['reg', 'patient', 'admitted', 'discharged']).astype(np.int64)
+    frame = frame[frame.admitted != MISSING].sort_values(['patient', 'admitted'], kind='stable')
+    gap = frame.groupby('patient').admitted.shift(-1) - frame.discharged
+    back = (frame.discharged != MISSING) & (gap >= 0) & (gap <= READMIT_DAYS * DAY)
+    index = (frame.discharged != MISSING) & (frame.discharged >= frame.admitted) & \
+            (frame.discharged <= now - READMIT_DAYS * DAY)
+    return int(index.sum()), int((back & index).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the clinical analytics on synthetic registrations.")
+    parser.add_argument('--stays', type=int, default=10000000)
+    parser.add_argument('--patients', type=int, default=4000000)
+    parser.add_argument('--diseases', type=int, default=1000)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--increment', type=int, default=5000, help="new registrations per incremental update")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    stays, diagnoses, now = synthetic(args.stays, args.patients, args.diseases, args.years)
+    rng = np.random.default_rng(3)
+    lookup = [(i, f"Disease {i}", SEVERITIES[s]) for i, s in
+              zip(range(1, args.diseases + 1), rng.integers(0, 3, args.diseases))]
+    print(f"{args.stays:,} stays, {len(diagnoses):,} diagnoses generated in {time.perf_counter() - started:.1f} s")
+
+    analytics = ClinicalAnalytics()
+    started = time.perf_counter()
+    analytics.add(stays, diagnoses, lookup)
+    print(f"load + derive:       {time.perf_counter() - started:8.2f} s   ({analytics.nbytes() / 2 ** 20:,.0f} MB held)")
+
+    def run(months):
+        return compute(analytics.stays.view(), analytics.facts.view(), analytics.diagnoses.view(), lookup, months, now)
+
+    for months in (12, None):
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = run(months)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+        print(f"metrics, {'all time' if months is None else f'{months} months':<10} {elapsed:8.2f} s   "
+              f"(peak {peak:,.0f} MB extra)")
+
+    discharges, readmitted = reference_readmissions(stays, now)
+    assert result['readmissions'][1][0][1:3] == (discharges, readmitted), (result['readmissions'][1][0], discharges)
+    print(f"readmissions:        {readmitted:,} of {discharges:,} discharges ({100 * readmitted / discharges:.2f}%),"
+          f" matches pandas reference")
+
+    new, new_diagnoses, _ = synthetic(args.increment, args.patients, args.diseases, 1,
+                                      first_id=int(stays[-1, 0]) + 1)
+    started = time.perf_counter()
+    analytics.add(new, new_diagnoses, lookup)
+    added = time.perf_counter() - started
+    started = time.perf_counter()
+    run(12)
+    print(f"+{args.increment:,} stays:        {added:8.2f} s to merge, {time.perf_counter() - started:.2f} s to recompute")
+
+
+if __name__ == '__main__':
+    main()
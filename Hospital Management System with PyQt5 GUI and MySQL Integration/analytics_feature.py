@@ -0,0 +1,83 @@
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QFont
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QComboBox, QTabWidget
+from clinical_analytics import analytics
+from table_model import make_table
+from workers import run_task, show_db_error
+
+REFRESH_MS = 60000   # new registrations are picked up this often while the page is shown
+PERIODS = [("Last 12 months", 12), ("Last 24 months", 24), ("Last 5 years", 60), ("All time", None)]
+SECTIONS = [('length_of_stay', "Length of Stay"), ('prevalence', "Prevalence by Month"),
+            ('diseases', "Diseases"), ('readmissions', "30-Day Readmissions")]
+
+
+def load_analytics(months, rebuild=False, progress=None):
+    loaded = analytics.refresh(rebuild=rebuild, progress=progress)
+    return loaded, analytics.metrics(months)
+
+
+def build_analytics_page():
+    page = QWidget()
+    layout = QVBoxLayout()
+    title = QLabel("📈 Clinical Analytics")
+    title.setFont(QFont("Arial", 22))
+    title.setStyleSheet("padding: 10px; color: navy;")
+    layout.addWidget(title)
+
+    controls = QHBoxLayout()
+    period = QComboBox()
+    for label, months in PERIODS:
+        period.addItem(label, months)
+    controls.addWidget(QLabel("Period:"))
+    controls.addWidget(period)
+    controls.addStretch()
+    layout.addLayout(controls)
+
+    tabs = QTabWidget()
+    tables = {}
+    for section, label in SECTIONS:
+        tables[section] = make_table()
+        tabs.addTab(tables[section], label)
+    layout.addWidget(tabs, 1)
+    status = QLabel()
+    status.setStyleSheet("font-size: 11pt; color: gray;")
+    layout.addWidget(status)
+    state = {'busy': False}
+
+    def show(result):
+        state['busy'] = False
+        loaded, metrics = result
+        for section, _ in SECTIONS:
+            tables[section].model().set_rows(*metrics[section])
+        status.setText(f"{metrics['stays']:,} registrations · {loaded['added']:,} new and {loaded['changed']:,} "
+                       f"changed read in {loaded['elapsed']:.2f} s · metrics in {metrics['elapsed']:.2f} s · "
+                       f"{loaded['memory_mb']:,.0f} MB held")
+
+    def failed(message, manual):
+        state['busy'] = False
+        status.setText(f"⚠️ {message}")
+        if manual:
+            show_db_error(message)
+
+    def refresh(rebuild=False, manual=True):
+        if state['busy'] or (not manual and not page.isVisible()):
+            return
+        state['busy'] = True
+        status.setText("Rebuilding…" if rebuild else "Loading new registrations…")
+        run_task(load_analytics, period.currentData(), rebuild, on_done=show,
+                 on_error=lambda message: failed(message, manual),
+                 on_progress=lambda count: status.setText(f"Loading registrations… {count:,}"))
+
+    period.currentIndexChanged.connect(lambda _: refresh())
+    for label, slot in [("🔁 Refresh", refresh), ("🧱 Rebuild", lambda: refresh(rebuild=True))]:
+        b = QPushButton(label)
+        b.setStyleSheet("font-size: 12pt; padding: 6px;")
+        b.clicked.connect(lambda _, slot=slot: slot())
+        controls.addWidget(b)
+    page.setLayout(layout)
+
+    timer = QTimer(page)
+    timer.timeout.connect(lambda: refresh(manual=False))
+    timer.start(REFRESH_MS)
+    refresh()
+    return page
@@ -1,22 +1,34 @@
 
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QMessageBox
-import pandas as pd
+from datetime import datetime, timedelta
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QMessageBox, QInputDialog
+from batch_ops import batch_delete, batch_edit
+from bulk_export import start_export
 from dialogs_appointments import AddAppointmentDialog
-from utils import get_connection, style_table
+from occupancy import ensure_loaded, check_room_change, rooms_moved, bookings_removed
+from page_columns import PAGE_COLUMNS
+from paging import KeysetPager, make_pager_bar
+from table_model import make_table, open_selected
+from workers import run_task, show_db_error
+from write_queue import write_queue
 
 def build_appointment_page():
     page = QWidget()
     layout = QVBoxLayout()
-    table = QTableWidget()
-    style_table(table)
+    table = make_table(spec=PAGE_COLUMNS['appointments'])
+    table.pager = KeysetPager(table, "PatientRegister", "PatientRegisterID")
+    write_queue.track(table)
     layout.addWidget(table)
+    layout.addLayout(make_pager_bar(table.pager))
 
     btns = QHBoxLayout()
     for label, slot in [
         ("➕ Add", lambda: add_appointment(table)),
         ("✏️ Edit", lambda: edit_appointment(table)),
         ("🗑️ Delete", lambda: delete_appointment(table)),
-        ("🔁 Refresh", lambda: load_appointments(table))
+        ("🧮 Batch Edit", lambda: batch_edit_appointments(table)),
+        ("🚪 Free Rooms", lambda: show_free_rooms(table)),
+        ("🔁 Refresh", lambda: load_appointments(table)),
+        ("📤 Export", lambda: start_export(table, 'appointments'))
     ]:
         b = QPushButton(label)
         b.setStyleSheet("font-size: 12pt; padding: 6px;")
@@ -26,57 +38,51 @@ def build_appointment_page():
     layout.addLayout(btns)
     page.setLayout(layout)
     load_appointments(table)
+    # The booking dialog checks rooms against this index without a query of its own.
+    run_task(ensure_loaded)
     return page
 
 def load_appointments(table):
-    conn = get_connection()
-    if conn:
-        df = pd.read_sql("SELECT * FROM PatientRegister", conn)
-        conn.close()
-        table.setRowCount(len(df))
-        table.setColumnCount(len(df.columns))
-        table.setHorizontalHeaderLabels(df.columns)
-        for row in range(len(df)):
-            for col in range(len(df.columns)):
-                table.setItem(row, col, QTableWidgetItem(str(df.iloc[row, col])))
-
-def get_selected(table):
-    row = table.currentRow()
-    if row < 0:
-        return None
-    return {
-        table.horizontalHeaderItem(c).text(): table.item(row, c).text()
-        for c in range(table.columnCount())
-    }
+    table.pager.refresh_estimate()
+    table.pager.reload()
 
 def add_appointment(table):
-    dlg = AddAppointmentDialog()
-    if dlg.exec_():
-        load_appointments(table)
+    AddAppointmentDialog().exec_()
 
 def edit_appointment(table):
-    selected = get_selected(table)
-    if not selected:
+    if not open_selected(table, "PatientRegister", "PatientRegisterID",
+                         lambda appointment: open_appointment(table, appointment)):
         QMessageBox.warning(None, "No Selection", "Select an appointment to edit.")
-        return
-    dlg = AddAppointmentDialog(selected)
-    if dlg.exec_():
-        load_appointments(table)
+
+def open_appointment(table, appointment):
+    AddAppointmentDialog(appointment).exec_()
 
 def delete_appointment(table):
-    selected = get_selected(table)
-    if not selected:
-        QMessageBox.warning(None, "No Selection", "Select an appointment to delete.")
+    batch_delete(None, table, "PatientRegister", "PatientRegisterID", "appointment",
+                 lambda a: f"appointment ID {a['PatientRegisterID']}", on_deleted=bookings_removed)
+
+def batch_edit_appointments(table):
+    batch_edit(None, table, "PatientRegister", "PatientRegisterID", "appointment",
+               {'RoomNumber': None, 'CopayType': None}, on_updated=rooms_moved, check=check_room_change)
+
+def show_free_rooms(table):
+    text, ok = QInputDialog.getText(table, "Free Rooms", "Free from (YYYY-MM-DD HH:MM) for how many nights:",
+                                    text=f"{datetime.now():%Y-%m-%d %H:%M} 1")
+    if not ok:
+        return
+    try:
+        start_text, nights = text.rsplit(" ", 1)
+        start = datetime.fromisoformat(start_text.strip())
+        end = start + timedelta(days=int(nights))
+    except ValueError:
+        QMessageBox.warning(table, "Free Rooms", "Enter a start like 2024-05-01 18:00 followed by a number of nights.")
         return
-    confirm = QMessageBox.question(None, "Confirm Delete",
-                                   f"Delete appointment ID {selected['PatientRegisterID']}?",
-                                   QMessageBox.Yes | QMessageBox.No)
-    if confirm == QMessageBox.Yes:
-        conn = get_connection()
-        if conn:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM PatientRegister WHERE PatientRegisterID=%s", (selected['PatientRegisterID'],))
-            conn.commit()
-            conn.close()
-            load_appointments(table)
-    
\ No newline at end of file
+
+    def done(index):
+        free = index.free_rooms(start, end)
+        QMessageBox.information(table, "Free Rooms",
+                                f"{len(free)} of {len(index.rooms())} rooms free from {start:%Y-%m-%d %H:%M} "
+                                f"to {end:%Y-%m-%d %H:%M} ({index.occupied_at(start)} occupied at the start):\n\n"
+                                + (", ".join(free) or "none"))
+
+    run_task(ensure_loaded, on_done=done, on_error=show_db_error)
@@ -0,0 +1,150 @@
+from PyQt5.QtWidgets import QDialog, QFormLayout, QComboBox, QPushButton, QMessageBox, QLabel
+
+from dashboard_counts import adjust, counted
+from occupancy import rooms
+from patient_record import patient_records
+from table_model import get_selected_rows, refresh_rows
+from utils import db_connection
+from workers import run_task, show_db_error
+
+# Keys per DELETE/UPDATE statement; keeps each statement and its packet small while still
+# turning thousands of single-row round trips into a handful.
+IN_CHUNK = 1000
+
+
+def _chunks(keys, size=IN_CHUNK):
+    for i in range(0, len(keys), size):
+        yield keys[i:i + size]
+
+
+def delete_rows(source, key_column, keys):
+    # Every chunk runs in the same transaction; db_connection rolls all of it back if one fails.
+    deleted = 0
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        cur = conn.cursor()
+        for chunk in _chunks(keys):
+            marks = ', '.join(['%s'] * len(chunk))
+            # Read before the delete, so the dashboard totals also lose the rows it cascades to.
+            before = counted(cur, source, key_column, chunk)
+            deleted += cur.execute(f"DELETE FROM {source} WHERE {key_column} IN ({marks})", chunk)
+            adjust(cur, before, {})
+    _written(source, keys)
+    if source == 'Patient':
+        # Their stays go with them (ON DELETE CASCADE), and these keys are RegNos, not stay ids.
+        rooms.invalidate()
+    return deleted
+
+
+def update_rows(source, key_column, keys, column, value):
+    updated = 0
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        cur = conn.cursor()
+        for chunk in _chunks(keys):
+            marks = ', '.join(['%s'] * len(chunk))
+            before = counted(cur, source, key_column, chunk)
+            updated += cur.execute(f"UPDATE {source} SET `{column}`=%s WHERE {key_column} IN ({marks})",
+                                   [value] + list(chunk))
+            adjust(cur, before, counted(cur, source, key_column, chunk))
+    _written(source, keys)
+    return updated
+
+
+def _written(source, keys):
+    patient_records.written(source, keys)
+    if source == 'PatientLabReport':
+        # Not imported with the module: lab_flags brings pandas, which startup does not need.
+        from lab_flags import flags
+        flags.invalidate(keys)
+
+
+def batch_delete(parent, table, source, key_column, noun, describe, on_deleted=None):
+    rows = get_selected_rows(table)
+    if not rows:
+        QMessageBox.warning(parent, "No Selection", f"Select the {noun}s to delete.")
+        return
+    keys = [row[key_column] for row in rows]
+    question = f"Delete {describe(rows[0])}?" if len(rows) == 1 else f"Delete {len(rows):,} {noun}s?"
+    if QMessageBox.question(parent, "Confirm Delete", question, QMessageBox.Yes | QMessageBox.No) != QMessageBox.Yes:
+        return
+
+    def done(deleted):
+        table.model().remove_rows(key_column, keys)
+        if on_deleted:
+            on_deleted(keys)
+        if len(keys) > 1:
+            QMessageBox.information(parent, "Deleted", f"{deleted:,} of {len(keys):,} selected {noun}s deleted.")
+
+    def failed(message):
+        show_db_error(f"Nothing was deleted; the change was rolled back.\n\n{message}")
+
+    run_task(delete_rows, source, key_column, keys, on_done=done, on_error=failed)
+
+
+class BatchEditDialog(QDialog):
+    # fields: column -> list of choices; a choice is a value or a (value, label) pair.
+    def __init__(self, fields, count, noun, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Batch Edit")
+        self.setMinimumWidth(350)
+        self.fields = fields
+        layout = QFormLayout()
+        layout.addRow(QLabel(f"Apply one change to {count:,} selected {noun}s."))
+        self.field_box = QComboBox()
+        self.field_box.addItems(list(fields))
+        self.value_box = QComboBox()
+        self.field_box.currentTextChanged.connect(self.fill_values)
+        layout.addRow("Field:", self.field_box)
+        layout.addRow("New value:", self.value_box)
+        self.apply_btn = QPushButton("Apply")
+        self.apply_btn.clicked.connect(self.accept)
+        layout.addRow(self.apply_btn)
+        self.setLayout(layout)
+        self.fill_values(self.field_box.currentText())
+
+    def fill_values(self, column):
+        self.value_box.clear()
+        choices = self.fields.get(column)
+        # No fixed choices means free text, e.g. a room number.
+        self.value_box.setEditable(not choices)
+        for choice in choices or []:
+            value, label = choice if isinstance(choice, tuple) else (choice, str(choice))
+            self.value_box.addItem(label, value)
+
+    def get_change(self):
+        column = self.field_box.currentText()
+        if self.fields.get(column):
+            return column, self.value_box.currentData()
+        return column, self.value_box.currentText().strip() or None
+
+
+def batch_edit(parent, table, source, key_column, noun, fields, on_updated=None, check=None):
+    rows = get_selected_rows(table)
+    if not rows:
+        QMessageBox.warning(parent, "No Selection", f"Select the {noun}s to edit.")
+        return
+    dialog = BatchEditDialog(fields() if callable(fields) else fields, len(rows), noun, parent)
+    if not dialog.exec_():
+        return
+    column, value = dialog.get_change()
+    keys = [row[key_column] for row in rows]
+
+    def done(updated):
+        refresh_rows(table, source, key_column, keys)
+        if on_updated:
+            on_updated(keys, column, value)
+        QMessageBox.information(parent, "Updated", f"{column} set on {updated:,} of {len(keys):,} selected {noun}s.")
+
+    def failed(message):
+        show_db_error(f"Nothing was changed; the update was rolled back.\n\n{message}")
+
+    def apply():
+        # check runs on the worker too and may raise to veto the change before anything is written.
+        if check:
+            check(keys, column, value)
+        return update_rows(source, key_column, keys, column, value)
+
+    run_task(apply, on_done=done, on_error=failed)
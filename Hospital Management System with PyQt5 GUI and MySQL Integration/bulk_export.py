@@ -0,0 +1,288 @@
+import argparse
+import csv
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pymysql.cursors
+from pymysql.constants import FIELD_TYPE
+
+from utils import db_connection, get_connection
+
+CHUNK_SIZE = 10000   # rows pulled from the server-side cursor and written per step
+
+# kind -> (table, column used by the date-range filter or None)
+EXPORT_SOURCES = {
+    'patients': ('Patient', 'CreatedON'),
+    'employees': ('EmployeeDetails', 'DateOfJoining'),
+    'diseases': ('Disease', None),
+    'insurance': ('PatientInsurance', 'StartDate'),
+    'appointments': ('PatientRegister', 'AdmittedON'),
+    'lab_reports': ('PatientLabReport', 'DateOfTest'),
+}
+
+FORMATS = ['csv', 'parquet']
+COLUMNS_SQL = "SELECT * FROM {table} LIMIT 0"
+
+
+def table_columns(kind):
+    table, _ = EXPORT_SOURCES[kind]
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        cur = conn.cursor()
+        cur.execute(COLUMNS_SQL.format(table=table))
+        return [d[0] for d in cur.description]
+
+
+def build_query(kind, columns=None, date_from=None, date_to=None):
+    table, date_column = EXPORT_SOURCES[kind]
+    select = ', '.join(f"`{c}`" for c in columns) if columns else '*'
+    sql = f"SELECT {select} FROM {table}"
+    where, params = [], []
+    if (date_from or date_to) and not date_column:
+        raise ValueError(f"{table} has no date column to filter on")
+    if date_from:
+        where.append(f"{date_column} >= %s")
+        params.append(date_from)
+    if date_to:
+        where.append(f"{date_column} < %s")
+        params.append(date_to + timedelta(days=1))
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql, tuple(params)
+
+
+def _bit_to_int(value):
+    return int.from_bytes(value, 'big') if isinstance(value, (bytes, bytearray)) else value
+
+
+class CsvSink:
+    def __init__(self, path, description):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([d[0] for d in description])
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    # One row group per chunk, so memory stays at one chunk regardless of table size.
+    def __init__(self, path, description, compression='zstd'):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs the 'pyarrow' package (pip install pyarrow)")
+        self.pa = pa
+        self.schema = pa.schema([(d[0], self._arrow_type(d)) for d in description])
+        self.writer = pq.ParquetWriter(path, self.schema, compression=compression)
+
+    def _arrow_type(self, d):
+        pa, code = self.pa, d[1]
+        if code in (FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.LONG, FIELD_TYPE.LONGLONG,
+                    FIELD_TYPE.INT24, FIELD_TYPE.YEAR, FIELD_TYPE.BIT):
+            return pa.int64()
+        if code in (FIELD_TYPE.FLOAT, FIELD_TYPE.DOUBLE):
+            return pa.float64()
+        if code in (FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL):
+            return pa.decimal128(38, d[5] or 0)
+        if code in (FIELD_TYPE.DATE, FIELD_TYPE.NEWDATE):
+            return pa.date32()
+        if code in (FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP):
+            return pa.timestamp('us')
+        return pa.string()
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        arrays = [self.pa.array(list(col), type=field.type) for col, field in zip(columns, self.schema)]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def export_table(kind, path, columns=None, date_from=None, date_to=None, fmt=None,
+                 chunk_size=CHUNK_SIZE, stop_event=None, progress=None):
+    fmt = fmt or ('parquet' if path.lower().endswith('.parquet') else 'csv')
+    sql, params = build_query(kind, columns, date_from, date_to)
+    started = time.perf_counter()
+    rows_written = 0
+    stopped = False
+
+    def report():
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        info = {'rows': rows_written, 'elapsed': elapsed, 'rate': rows_written / elapsed,
+                'bytes': os.path.getsize(path) if os.path.exists(path) else 0, 'path': path}
+        if progress:
+            progress(info)
+        return info
+
+    conn = get_connection()
+    if not conn:
+        raise ConnectionError("Could not connect to the database.")
+    pick = None
+    if columns and getattr(conn, 'remote', False):
+        # The service offers whole-row exports only (each column subset would be a statement of its
+        # own), so the chosen columns are picked out of its rows here.
+        sql, params = build_query(kind, None, date_from, date_to)
+    drained = False
+    try:
+        # SSCursor streams rows from the server instead of buffering the whole result client-side.
+        cur = conn.cursor(pymysql.cursors.SSCursor)
+        cur.execute(sql, params)
+        description = cur.description
+        names = [d[0].lower() for d in description]
+        if columns and names != [c.lower() for c in columns]:
+            pick = [names.index(c.lower()) for c in columns]
+            description = [description[i] for i in pick]
+        bit_columns = [i for i, d in enumerate(description) if d[1] == FIELD_TYPE.BIT]
+        sink = ParquetSink(path, description) if fmt == 'parquet' else CsvSink(path, description)
+        try:
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    drained = True
+                    break
+                if pick:
+                    rows = [tuple(r[i] for i in pick) for r in rows]
+                if bit_columns:
+                    rows = [tuple(_bit_to_int(v) if i in bit_columns else v for i, v in enumerate(r)) for r in rows]
+                sink.write(rows)
+                rows_written += len(rows)
+                report()
+                if stop_event is not None and stop_event.is_set():
+                    stopped = True
+                    break
+        finally:
+            sink.close()
+    finally:
+        # An unfinished result is still on the wire, so that connection can't go back to the pool.
+        if drained:
+            conn.close()
+        else:
+            conn.discard()
+    result = report()
+    result['stopped'] = stopped
+    return result
+
+
+def summary(result):
+    text = (f"{result['rows']:,} rows written to {result['path']} in {result['elapsed']:.1f} s "
+            f"({result['rate']:,.0f} rows/s, {result['bytes'] / 1e6:,.1f} MB).")
+    if result.get('stopped'):
+        text += " Export stopped early; the file is incomplete."
+    return text
+
+
+def _parse_day(text):
+    return datetime.strptime(text, '%Y-%m-%d').date() if text else None
+
+
+def start_export(parent, kind):
+    from PyQt5.QtCore import Qt, QDate
+    from PyQt5.QtWidgets import (QDialog, QFormLayout, QListWidget, QListWidgetItem, QComboBox, QCheckBox,
+                                 QDateEdit, QPushButton, QFileDialog, QMessageBox, QProgressDialog)
+    from workers import run_task, show_db_error
+
+    table, date_column = EXPORT_SOURCES[kind]
+    dlg = QDialog(parent)
+    dlg.setWindowTitle(f"Export {table}")
+    dlg.setMinimumWidth(400)
+    layout = QFormLayout()
+    column_list = QListWidget()
+    fmt_box = QComboBox()
+    fmt_box.addItems([f.upper() for f in FORMATS])
+    use_dates = QCheckBox(f"Only rows with {date_column} between" if date_column else "No date filter available")
+    use_dates.setEnabled(bool(date_column))
+    date_from, date_to = QDateEdit(QDate.currentDate().addMonths(-1)), QDateEdit(QDate.currentDate())
+    for edit in (date_from, date_to):
+        edit.setCalendarPopup(True)
+        edit.setDisplayFormat("yyyy-MM-dd")
+    export_btn = QPushButton("Export…")
+    layout.addRow("Columns:", column_list)
+    layout.addRow("Format:", fmt_box)
+    layout.addRow(use_dates)
+    layout.addRow("From:", date_from)
+    layout.addRow("To:", date_to)
+    layout.addRow(export_btn)
+    dlg.setLayout(layout)
+
+    def fill_columns(columns):
+        for name in columns:
+            item = QListWidgetItem(name)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked)
+            column_list.addItem(item)
+
+    run_task(table_columns, kind, on_done=fill_columns, on_error=show_db_error)
+
+    def run_export():
+        columns = [column_list.item(i).text() for i in range(column_list.count())
+                   if column_list.item(i).checkState() == Qt.Checked]
+        if not columns:
+            QMessageBox.warning(dlg, "No Columns", "Select at least one column to export.")
+            return
+        fmt = FORMATS[fmt_box.currentIndex()]
+        path, _ = QFileDialog.getSaveFileName(dlg, "Export to", f"{table}.{fmt}", f"{fmt.upper()} (*.{fmt})")
+        if not path:
+            return
+        start, end = None, None
+        if use_dates.isChecked():
+            start = _parse_day(date_from.date().toString("yyyy-MM-dd"))
+            end = _parse_day(date_to.date().toString("yyyy-MM-dd"))
+        stop_event = threading.Event()
+        progress = QProgressDialog("Exporting…", "Stop", 0, 0, parent)
+        progress.setWindowTitle("Export")
+        progress.setMinimumDuration(0)
+        progress.canceled.connect(stop_event.set)
+
+        def on_progress(info):
+            progress.setLabelText(f"{info['rows']:,} rows · {info['rate']:,.0f} rows/s · "
+                                  f"{info['bytes'] / 1e6:,.1f} MB")
+
+        def on_done(result):
+            progress.reset()
+            QMessageBox.information(parent, "Export Finished", summary(result))
+
+        def on_error(message):
+            progress.reset()
+            QMessageBox.critical(parent, "Export Failed", message)
+
+        dlg.accept()
+        run_task(export_table, kind, path, columns, start, end, fmt, CHUNK_SIZE, stop_event,
+                 on_done=on_done, on_error=on_error, on_progress=on_progress)
+        progress.show()
+
+    export_btn.clicked.connect(run_export)
+    dlg.exec_()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a hospital table to CSV or Parquet.")
+    parser.add_argument('kind', choices=sorted(EXPORT_SOURCES))
+    parser.add_argument('path', help="output file; .parquet selects Parquet, anything else CSV")
+    parser.add_argument('--columns', help="comma-separated column list (default: all)")
+    parser.add_argument('--from', dest='date_from', help="YYYY-MM-DD, inclusive")
+    parser.add_argument('--to', dest='date_to', help="YYYY-MM-DD, inclusive")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    def show(info):
+        print(f"\r{info['rows']:,} rows · {info['rate']:,.0f} rows/s · {info['bytes'] / 1e6:,.1f} MB",
+              end='', flush=True)
+
+    columns = [c.strip() for c in args.columns.split(',')] if args.columns else None
+    result = export_table(args.kind, args.path, columns, _parse_day(args.date_from), _parse_day(args.date_to),
+                          chunk_size=args.chunk_size, progress=show)
+    print()
+    print(summary(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+import argparse
+import csv
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from dashboard_counts import added
+from patient_record import patient_records
+from utils import db_connection
+
+BATCH_SIZE = 5000          # rows per multi-row INSERT and per transaction
+PROGRESS_EVERY = 1         # batches between progress callbacks
+# Resume checkpoints (migration 0004), one row per file being imported.
+PROGRESS_LOAD_SQL = "SELECT RowsDone, Inserted, Rejected FROM ImportProgress WHERE ImportKey=%s"
+PROGRESS_SAVE_SQL = ("REPLACE INTO ImportProgress (ImportKey, Kind, SourcePath, RowsDone, Inserted, Rejected) "
+                     "VALUES (%s, %s, %s, %s, %s, %s)")
+PROGRESS_CLEAR_SQL = "DELETE FROM ImportProgress WHERE ImportKey=%s"
+
+ENUMS = {
+    'Gender': ['Male', 'Female', 'Other'],
+    'BloodGroup': ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'],
+    'MaritalStatus': ['Single', 'Married', 'Divorced'],
+    'InsuranceStatus': ['Active', 'Inactive'],
+    'Severity': ['Mild', 'Moderate', 'Severe'],
+}
+
+# column -> type; types: str, int, decimal, date, datetime, or an ENUMS key.
+IMPORT_SPECS = {
+    'patients': {
+        'table': 'Patient',
+        'columns': {
+            'PatientRegNo': 'str', 'FirstName': 'str', 'LastName': 'str', 'Gender': 'Gender',
+            'DateOfBirth': 'date', 'PhoneNumber': 'str', 'EmailID': 'str', 'Height': 'decimal',
+            'Weight': 'decimal', 'BloodGroup': 'BloodGroup', 'EmergencyContact': 'str', 'Address': 'str',
+            'Allergies': 'str', 'MaritalStatus': 'MaritalStatus', 'Occupation': 'str',
+            'InsuranceStatus': 'InsuranceStatus',
+        },
+        'required': ['PatientRegNo', 'FirstName', 'LastName', 'Gender'],
+    },
+    'employees': {
+        'table': 'EmployeeDetails',
+        'columns': {
+            'EmployeeID': 'int', 'FirstName': 'str', 'LastName': 'str', 'Gender': 'Gender',
+            'PhoneNumber': 'str', 'RoleID': 'int', 'Address': 'str', 'NationalID': 'str',
+            'DateOfBirth': 'date', 'DateOfJoining': 'date', 'Salary': 'decimal',
+        },
+        'required': ['EmployeeID', 'FirstName', 'LastName', 'Gender', 'RoleID'],
+    },
+    'lab_results': {
+        'table': 'PatientLabReport',
+        'columns': {
+            'PatientRegisterID': 'int', 'LabTestID': 'int', 'TestValue': 'str', 'Comment': 'str',
+            'DateOfTest': 'datetime',
+        },
+        'required': ['PatientRegisterID', 'LabTestID', 'TestValue'],
+    },
+    'diseases': {
+        'table': 'Disease',
+        'columns': {
+            'Name': 'str', 'Description': 'str', 'Severity': 'Severity', 'Symptoms': 'str',
+            'Complications': 'str', 'Treatment': 'str',
+        },
+        'required': ['Name'],
+    },
+}
+
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y']
+DATETIME_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S'] + DATE_FORMATS
+
+
+class RowError(ValueError):
+    pass
+
+
+def _parse_date(value, formats):
+    if isinstance(value, datetime):
+        return value
+    for fmt in formats:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise RowError(f"unrecognised date '{value}'")
+
+
+def convert(column, kind, value):
+    if value is None or str(value).strip() == '':
+        return None
+    value = str(value).strip() if not isinstance(value, datetime) else value
+    if kind == 'str':
+        return value
+    if kind == 'int':
+        try:
+            return int(float(value))
+        except ValueError:
+            raise RowError(f"{column}: '{value}' is not a whole number")
+    if kind == 'decimal':
+        try:
+            return Decimal(value)
+        except InvalidOperation:
+            raise RowError(f"{column}: '{value}' is not a number")
+    if kind == 'date':
+        return _parse_date(value, DATE_FORMATS).date()
+    if kind == 'datetime':
+        return _parse_date(value, DATETIME_FORMATS)
+    allowed = ENUMS[kind]
+    for option in allowed:
+        if option.lower() == value.lower():
+            return option
+    raise RowError(f"{column}: '{value}' is not one of {', '.join(allowed)}")
+
+
+def validate(spec, record):
+    row = []
+    for column, kind in spec['columns'].items():
+        value = convert(column, kind, record.get(column))
+        if value is None and column in spec['required']:
+            raise RowError(f"{column} is required")
+        row.append(value)
+    return tuple(row)
+
+
+def read_records(path):
+    # Both readers stream: csv reads line by line and openpyxl's read-only mode walks rows lazily.
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise RuntimeError("Excel import needs the 'openpyxl' package (pip install openpyxl)")
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(h).strip() if h is not None else '' for h in next(rows, [])]
+        for values in rows:
+            yield dict(zip(header, values))
+        workbook.close()
+        return
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for record in csv.DictReader(f):
+            yield record
+
+
+def _import_key(path, kind):
+    return hashlib.sha1(f"{kind}:{os.path.abspath(path)}".encode()).hexdigest()
+
+
+def _load_state(cur, key):
+    cur.execute(PROGRESS_LOAD_SQL, (key,))
+    rows_done, inserted, rejected = cur.fetchone() or (0, 0, 0)
+    return {'rows_done': rows_done, 'inserted': inserted, 'rejected': rejected}
+
+
+def _insert_batch(conn, sql, batch, rejects, checkpoint):
+    # One transaction per batch, which also moves the file's checkpoint: a crash keeps both or
+    # neither, so a resume never inserts a committed batch again. If the multi-row insert is refused
+    # (duplicate key, bad FK, ...) retry the rows one by one so only the offending rows are rejected.
+    cur = conn.cursor()
+    try:
+        if batch:
+            cur.executemany(sql, [row for _, _, row in batch])
+        checkpoint(cur, len(batch))
+        conn.commit()
+        return len(batch)
+    except Exception:
+        conn.rollback()
+    inserted = 0
+    for line, record, row in batch:
+        try:
+            cur.execute(sql, row)
+            inserted += 1
+        except Exception as e:
+            rejects.append((line, record, str(e)))
+    checkpoint(cur, inserted)
+    conn.commit()
+    return inserted
+
+
+def insert_sql(kind):
+    spec = IMPORT_SPECS[kind]
+    columns = list(spec['columns'])
+    return f"INSERT INTO {spec['table']} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+
+
+def import_file(kind, path, stop_event=None, resume=True, batch_size=BATCH_SIZE, progress=None):
+    spec = IMPORT_SPECS[kind]
+    sql = insert_sql(kind)
+    key = _import_key(path, kind)
+    reject_path = f"{path}.{kind}.rejects.csv"
+    reject_file = None
+    reject_writer = None
+    started = time.perf_counter()
+    done_this_run = 0
+    stopped = False
+
+    def write_rejects(rejects):
+        nonlocal reject_writer
+        for line, record, error in rejects:
+            if reject_writer is None:
+                reject_writer = csv.writer(reject_file)
+                if reject_file.tell() == 0:
+                    reject_writer.writerow(['line', 'error'] + list(record.keys()))
+            reject_writer.writerow([line, error] + [record.get(k) for k in record.keys()])
+        reject_file.flush()
+
+    def save(conn, batch, rejects):
+        nonlocal done_this_run
+        done = len(batch) + len(rejects)
+
+        def checkpoint(cur, inserted):
+            added(cur, spec['table'], inserted)
+            cur.execute(PROGRESS_SAVE_SQL, (key, kind, os.path.abspath(path)[:500], state['rows_done'] + done,
+                                            state['inserted'] + inserted, state['rejected'] + len(rejects)))
+
+        state['inserted'] += _insert_batch(conn, sql, batch, rejects, checkpoint)
+        state['rows_done'] += done
+        state['rejected'] += len(rejects)
+        done_this_run += done
+        write_rejects(rejects)
+
+    def report():
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        info = dict(state, rate=done_this_run / elapsed, elapsed=elapsed)
+        if progress:
+            progress(info)
+        return info
+
+    try:
+        with db_connection() as conn:
+            if not conn:
+                raise ConnectionError("Could not connect to the database.")
+            cur = conn.cursor()
+            if not resume:
+                cur.execute(PROGRESS_CLEAR_SQL, (key,))
+                conn.commit()
+            state = _load_state(cur, key)
+            skip = state['rows_done']
+            reject_file = open(reject_path, 'a' if skip else 'w', newline='', encoding='utf-8')
+            batch, rejects, batches = [], [], 0
+            for line, record in enumerate(read_records(path), start=2):
+                if line - 2 < skip:
+                    continue
+                try:
+                    batch.append((line, record, validate(spec, record)))
+                except RowError as e:
+                    rejects.append((line, record, str(e)))
+                if len(batch) + len(rejects) >= batch_size:
+                    save(conn, batch, rejects)
+                    batch, rejects = [], []
+                    batches += 1
+                    if batches % PROGRESS_EVERY == 0:
+                        report()
+                    if stop_event is not None and stop_event.is_set():
+                        stopped = True
+                        break
+            if not stopped:
+                if batch or rejects:
+                    save(conn, batch, rejects)
+                # Finished cleanly: a later run of the same file starts from the top again.
+                cur.execute(PROGRESS_CLEAR_SQL, (key,))
+                conn.commit()
+    finally:
+        if reject_file is not None:
+            reject_file.close()
+    if state['inserted']:
+        patient_records.written(spec['table'])
+    if state['inserted'] and spec['table'] == 'Disease':
+        # Not imported with the module: symptom_index brings numpy, which startup does not need.
+        from symptom_index import symptom_index
+        symptom_index.refresh()
+
+    result = report()
+    result.update(stopped=stopped, rejects_file=reject_path if state['rejected'] else None)
+    return result
+
+
+def summary(result):
+    text = (f"{result['inserted']:,} rows inserted, {result['rejected']:,} rejected "
+            f"({result['rate']:,.0f} rows/s).")
+    if result.get('stopped'):
+        text += " Import paused; run it again on the same file to resume."
+    if result.get('rejects_file'):
+        text += f"\nRejected rows: {result['rejects_file']}"
+    return text
+
+
+def start_import(parent, kind, on_finished=None):
+    from PyQt5.QtWidgets import QFileDialog, QMessageBox, QProgressDialog
+    from workers import run_task
+
+    path, _ = QFileDialog.getOpenFileName(parent, f"Import {kind.replace('_', ' ')}", "",
+                                          "Data files (*.csv *.xlsx);;CSV (*.csv);;Excel (*.xlsx)")
+    if not path:
+        return
+    stop_event = threading.Event()
+    dialog = QProgressDialog("Importing…", "Stop", 0, 0, parent)
+    dialog.setWindowTitle("Bulk Import")
+    dialog.setMinimumDuration(0)
+    dialog.canceled.connect(stop_event.set)
+
+    def on_progress(info):
+        dialog.setLabelText(f"{info['rows_done']:,} rows processed · {info['inserted']:,} inserted · "
+                            f"{info['rejected']:,} rejected · {info['rate']:,.0f} rows/s")
+
+    def on_done(result):
+        dialog.reset()
+        QMessageBox.information(parent, "Import Finished", summary(result))
+        if on_finished:
+            on_finished()
+
+    def on_error(message):
+        dialog.reset()
+        QMessageBox.critical(parent, "Import Failed", message)
+
+    run_task(import_file, kind, path, stop_event, on_done=on_done, on_error=on_error, on_progress=on_progress)
+    dialog.show()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a CSV/Excel file into the hospital database.")
+    parser.add_argument('kind', choices=sorted(IMPORT_SPECS))
+    parser.add_argument('path')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--restart', action='store_true', help="ignore any saved progress and start from row 1")
+    args = parser.parse_args()
+
+    def show(info):
+        print(f"\r{info['rows_done']:,} rows · {info['inserted']:,} inserted · {info['rejected']:,} rejected · "
+              f"{info['rate']:,.0f} rows/s", end='', flush=True)
+
+    result = import_file(args.kind, args.path, resume=not args.restart, batch_size=args.batch_size, progress=show)
+    print()
+    print(summary(result))
+
+
+if __name__ == '__main__':
+    main()
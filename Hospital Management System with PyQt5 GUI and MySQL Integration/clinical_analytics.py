@@ -0,0 +1,437 @@
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pymysql.cursors
+
+from lookups import lookups
+from utils import get_connection
+
+CHUNK = 200000                      # rows streamed and appended per step
+IN_CHUNK = 1000                     # open stays re-read per statement
+REBUILD_AGE = 6 * 3600              # seconds before a full reload picks up edits and deletes of older stays
+MISSING = int(np.iinfo(np.int32).min)   # NULL in the int32 columns
+DAY = 1440                          # minutes
+READMIT_DAYS = 30
+LOS_EDGES = [0, 1, 2, 3, 5, 7, 14, 30]  # length-of-stay buckets in days; the last one is open ended
+SEVERITIES = ['Mild', 'Moderate', 'Severe']  # codes 1-3; 0 is a stay with no diagnosis
+
+
+def _minutes(column):
+    # Datetimes come back as whole minutes since 1970, so a chunk of rows becomes an int32 array in
+    # one np.array() call instead of a datetime object per cell.
+    return f"COALESCE(TIMESTAMPDIFF(MINUTE, '1970-01-01', {column}), {MISSING})"
+
+
+STAYS_SQL = (f"SELECT PatientRegisterID, PatientID, {_minutes('AdmittedON')}, {_minutes('DischargeON')} "
+             f"FROM PatientRegister")
+DIAGNOSES_SQL = "SELECT PatientRegisterID, DiseaseID FROM PatientDisease"
+STAYS_AFTER_SQL = f"{STAYS_SQL} WHERE PatientRegisterID > %s ORDER BY PatientRegisterID"
+DIAGNOSES_RANGE_SQL = f"{DIAGNOSES_SQL} WHERE PatientRegisterID > %s AND PatientRegisterID <= %s"
+STAYS_IN_SQL = f"{STAYS_SQL} WHERE PatientRegisterID IN (%s)"
+DIAGNOSES_IN_SQL = f"{DIAGNOSES_SQL} WHERE PatientRegisterID IN (%s)"
+
+
+def to_minutes(moment):
+    return int((np.datetime64(moment, 'm') - np.datetime64('1970-01-01T00:00', 'm')).astype(np.int64))
+
+
+def to_months(minutes):
+    # Minutes since 1970 -> months since 1970 (0 = 1970-01).
+    return np.asarray(minutes, dtype=np.int64).astype('datetime64[m]').astype('datetime64[M]').astype(np.int64)
+
+
+def month_labels(first, count):
+    return np.datetime_as_string(np.arange(first, first + count).astype('datetime64[M]')).tolist()
+
+
+class _Columns:
+    # Append-only columns stored column-major. Capacity doubles, so a chunk is appended in place
+    # and memory stays within 2x of the item size per value.
+    def __init__(self, width, dtype=np.int32):
+        self.data = np.empty((width, 0), dtype)
+        self.size = 0
+
+    def append(self, block):
+        need = self.size + len(block)
+        if need > self.data.shape[1]:
+            grown = np.empty((self.data.shape[0], max(need, 2 * self.data.shape[1], 1024)), self.data.dtype)
+            grown[:, :self.size] = self.data[:, :self.size]
+            self.data = grown
+        self.data[:, self.size:need] = np.asarray(block, dtype=self.data.dtype).T
+        self.size = need
+
+    def keep(self, mask):
+        self.data = np.ascontiguousarray(self.view()[:, mask])
+        self.size = self.data.shape[1]
+
+    def view(self):
+        return self.data[:, :self.size]
+
+    def nbytes(self):
+        return self.data.nbytes
+
+
+def _stay_keys(stays):
+    # PatientID in the high half, AdmittedON in the low half: one int64 sorts by both.
+    return (stays[1].astype(np.int64) << 32) | (stays[2].astype(np.int64) - MISSING)
+
+
+def _pair_keys(rows):
+    rows = np.asarray(rows, dtype=np.int64).reshape(-1, 2)
+    return np.sort((rows[:, 0] << 32) | rows[:, 1])
+
+
+def severity_table(diseases):
+    # Severity code by DiseaseID.
+    codes = np.zeros(max((row[0] for row in diseases), default=0) + 1, np.int16)
+    for disease_id, _, severity in diseases:
+        codes[disease_id] = SEVERITIES.index(severity) + 1 if severity in SEVERITIES else 0
+    return codes
+
+
+def severity_codes(codes, disease_ids):
+    inside = (disease_ids >= 0) & (disease_ids < len(codes))
+    return np.where(inside, codes[np.where(inside, disease_ids, 0)], 0).astype(np.int16)
+
+
+class ClinicalAnalytics:
+    # PatientRegister and PatientDisease held as int32 columns, stays sorted by PatientRegisterID.
+    # refresh() only streams registrations above the last loaded ID, plus the stays that were
+    # still open (they may have been discharged or re-coded since); REBUILD_AGE catches the rest.
+    # What metrics() needs per stay (admission and discharge month, worst severity, readmitted) is kept
+    # alongside and updated only for the stays a refresh touches, so metrics() is a few passes of
+    # masks and bincounts whatever the period.
+    def __init__(self):
+        self._reset()
+        self.version = 0
+        self._results = {}
+        self._lock = threading.RLock()
+
+    def _reset(self):
+        self.stays = _Columns(4)                # PatientRegisterID, PatientID, AdmittedON, DischargeON
+        self.facts = _Columns(4, np.int16)      # admission month, discharge month, worst severity, readmitted
+        self.diagnoses = _Columns(3)            # PatientRegisterID, DiseaseID, position of the stay or -1
+        self.order = np.zeros(0, np.int32)      # stay positions by patient, then admission
+        self.codes = np.zeros(1, np.int16)
+        self.loaded_upto = 0
+        self.loaded_at = None
+
+    def refresh(self, chunk_size=CHUNK, rebuild=False, progress=None):
+        started = time.perf_counter()
+        diseases = lookups.get('Disease')
+        conn = get_connection()
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        with self._lock:
+            try:
+                if rebuild or self.loaded_at is None or time.monotonic() - self.loaded_at > REBUILD_AGE:
+                    self._reset()
+                    self.loaded_at = time.monotonic()
+                before = self.stays.size
+                recoded = self._set_codes(diseases)
+                changed = self._catch_up(conn, chunk_size, progress)
+            except Exception:
+                conn.discard()
+                self.loaded_at = None
+                raise
+            conn.close()
+            if recoded or changed or self.stays.size != before:
+                self.version += 1
+            return {'added': max(self.stays.size - before, 0), 'changed': changed, 'stays': self.stays.size,
+                    'diagnoses': self.diagnoses.size, 'elapsed': time.perf_counter() - started,
+                    'memory_mb': self.nbytes() / 2 ** 20}
+
+    def nbytes(self):
+        return self.stays.nbytes() + self.facts.nbytes() + self.diagnoses.nbytes() + self.order.nbytes
+
+    def _set_codes(self, diseases):
+        # A disease whose severity was edited changes the worst severity of every stay it is on.
+        codes = severity_table(diseases)
+        if np.array_equal(codes, self.codes):
+            return False
+        self.codes = codes
+        self.facts.view()[2] = 0
+        self._place(self.diagnoses.view())
+        return True
+
+    def _catch_up(self, conn, chunk_size, progress):
+        upto, before = self.loaded_upto, self.stays.size
+        reg, _, _, discharged = self.stays.view()
+        still_open = reg[discharged == MISSING]
+        changed, touched, resort = 0, np.zeros(0, np.int64), False
+        if len(still_open):
+            changed, touched, resort = self._reread(conn.cursor(), still_open)
+            before = self.stays.size
+
+        cur = conn.cursor(pymysql.cursors.SSCursor)
+        cur.execute(STAYS_AFTER_SQL, (upto,))
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            self._add_stays(rows)
+            if progress:
+                progress(self.stays.size)
+        if self.stays.size:
+            self.loaded_upto = int(self.stays.view()[0, -1])
+        # Bounded above too: a stay saved after the read above gets its diagnoses with its next catch-up.
+        cur.execute(DIAGNOSES_RANGE_SQL, (upto, self.loaded_upto))
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            self._add_diagnoses(rows)
+        self._link(before, touched, resort)
+        return changed
+
+    def _reread(self, cur, reg_ids):
+        stays, diagnoses = [], []
+        for i in range(0, len(reg_ids), IN_CHUNK):
+            chunk = reg_ids[i:i + IN_CHUNK].tolist()
+            marks = f"IN ({', '.join(['%s'] * len(chunk))})"
+            cur.execute(STAYS_IN_SQL.replace("IN (%s)", marks), chunk)
+            stays += cur.fetchall()
+            cur.execute(DIAGNOSES_IN_SQL.replace("IN (%s)", marks), chunk)
+            diagnoses += cur.fetchall()
+        # Returns how many of them changed, the positions of those that changed in place, and
+        # whether the patient order has to be rebuilt (an admission moved or a stay was deleted).
+        found = np.array(stays, dtype=np.int32).reshape(-1, 4)
+        data = self.stays.view()
+        at = np.searchsorted(data[0], found[:, 0])
+        differs = (data[:, at] != found.T).any(axis=0)
+        resort = bool((data[1:3, at] != found[:, 1:3].T).any())
+        data[:, at] = found.T
+        self.facts.view()[0, at] = self._months(found[:, 2])
+        self.facts.view()[1, at] = self._months(found[:, 3])
+        gone = np.setdiff1d(reg_ids, found[:, 0])
+        if len(gone):
+            kept = ~np.isin(data[0], gone)
+            self.stays.keep(kept)
+            self.facts.keep(kept)
+            resort = True
+        old = np.isin(self.diagnoses.view()[0], reg_ids)
+        new = np.array(diagnoses, dtype=np.int32).reshape(-1, 2)
+        recoded = np.setxor1d(_pair_keys(self.diagnoses.view()[:2, old].T), _pair_keys(new))
+        if len(recoded):
+            self.diagnoses.keep(~old)
+            if not resort:
+                self.facts.view()[2, at] = 0
+            self._add_diagnoses(new)
+        changed = int(differs.sum()) + len(gone) + len(np.unique(recoded >> 32))
+        return changed, at[differs], resort
+
+    def _months(self, moments):
+        return np.where(moments != MISSING, to_months(moments), 0).astype(np.int16)
+
+    def _add_stays(self, rows):
+        block = np.asarray(rows, dtype=np.int32).reshape(-1, 4)
+        self.stays.append(block)
+        facts = np.zeros((len(block), 4), np.int16)
+        facts[:, 0] = self._months(block[:, 2])
+        facts[:, 1] = self._months(block[:, 3])
+        self.facts.append(facts)
+
+    def _add_diagnoses(self, rows):
+        block = np.asarray(rows, dtype=np.int32).reshape(-1, 2)
+        if len(block):
+            self.diagnoses.append(np.column_stack([block, self._positions(block[:, 0])]))
+            self._place(self.diagnoses.view()[:, -len(block):])
+
+    def _positions(self, reg_ids):
+        reg = self.stays.view()[0]
+        if not len(reg):
+            return np.full(len(reg_ids), -1)
+        pos = np.minimum(np.searchsorted(reg, reg_ids), len(reg) - 1)
+        return np.where(reg[pos] == reg_ids, pos, -1)
+
+    def _place(self, diagnoses):
+        # Raises the worst severity of each diagnosis row's stay to the row's.
+        linked = diagnoses[2] >= 0
+        np.maximum.at(self.facts.view()[2], diagnoses[2, linked], severity_codes(self.codes, diagnoses[1, linked]))
+
+    def _link(self, appended_from, touched, resort):
+        # Stays sorted by patient, then admission, for the readmission flags. New stays are sorted
+        # on their own and merged in, and only they, the stays just before them and the stays
+        # re-read in place get their flag recomputed. Anything else re-derives all of it.
+        stays = self.stays.view()
+        if resort:
+            diagnoses = self.diagnoses.view()
+            diagnoses[2] = self._positions(diagnoses[0])
+            self.facts.view()[2] = 0
+            self._place(diagnoses)
+        # Merging in more stays than are already sorted costs more than sorting them all.
+        if resort or self.stays.size - appended_from > len(self.order):
+            self.order = np.argsort(_stay_keys(stays), kind='stable').astype(np.int32)
+            self._flag(np.arange(len(self.order)))
+            return
+        positions = [np.zeros(0, np.int64)]
+        if appended_from < self.stays.size:
+            keys = _stay_keys(stays)
+            new = np.argsort(keys[appended_from:], kind='stable') + appended_from
+            at = np.searchsorted(keys[self.order], keys[new], side='right')
+            self.order = np.insert(self.order, at, new.astype(np.int32))
+            placed = at + np.arange(len(new))
+            positions += [placed, placed[placed > 0] - 1]
+        if len(touched):
+            rank = np.empty(len(self.order), np.int64)
+            rank[self.order] = np.arange(len(self.order))
+            positions.append(rank[touched])
+        self._flag(np.concatenate(positions))
+
+    def _flag(self, positions):
+        # A stay counts as readmitted when the same patient's next admission starts within
+        # READMIT_DAYS of its discharge. positions index self.order.
+        if not len(positions):
+            return
+        _, patient, admitted, discharged = self.stays.view()
+        current = self.order[positions]
+        following = self.order[np.minimum(positions + 1, len(self.order) - 1)]
+        d = discharged[current].astype(np.int64)
+        gap = admitted[following] - d
+        self.facts.view()[3, current] = ((positions + 1 < len(self.order)) & (patient[following] == patient[current])
+                                         & (d != MISSING) & (admitted[current] != MISSING)
+                                         & (gap >= 0) & (gap <= READMIT_DAYS * DAY))
+
+    def add(self, stays, diagnoses=(), diseases=None):
+        # Rows read elsewhere, in STAYS_SQL / DIAGNOSES_SQL column order with PatientRegisterIDs above
+        # everything loaded so far; the benchmark feeds synthetic data through here.
+        with self._lock:
+            before = self.stays.size
+            self._set_codes(lookups.get('Disease') if diseases is None else diseases)
+            self._add_stays(stays)
+            self._add_diagnoses(diagnoses)
+            if self.stays.size:
+                self.loaded_upto = int(self.stays.view()[0, -1])
+                self.loaded_at = self.loaded_at or time.monotonic()
+            self._link(before, np.zeros(0, np.int64), False)
+            self.version += 1
+
+    def metrics(self, months=None, now=None):
+        # Length of stay, prevalence by month and 30-day readmissions for stays admitted (or, for
+        # readmissions, discharged) in the last `months` calendar months; None means all of them.
+        now = to_minutes(now or datetime.now())
+        key = (months, now // DAY)
+        with self._lock:
+            cached = self._results.get(key)
+            if cached and cached['version'] == self.version:
+                return cached
+            started = time.perf_counter()
+            result = compute(self.stays.view(), self.facts.view(), self.diagnoses.view(),
+                             lookups.get('Disease'), months, now)
+            result.update(version=self.version, stays=self.stays.size, elapsed=time.perf_counter() - started)
+            self._results = {k: v for k, v in self._results.items() if v['version'] == self.version}
+            self._results[key] = result
+            return result
+
+
+def compute(stays, facts, diagnoses, diseases, months, now):
+    # Column-major stays, their facts and the diagnoses as kept by ClinicalAnalytics, diseases the
+    # (DiseaseID, Name, Severity) lookup rows, now in minutes since 1970.
+    _, _, admitted, discharged = stays
+    month, discharge_month, worst, readmitted = facts
+    known = admitted != MISSING
+    last_month = to_months(now).item()
+    if months:
+        first_month = last_month - months + 1
+    else:
+        first_month = int(month[known].min()) if known.any() else last_month
+    start = to_minutes(np.datetime64(first_month, 'M'))
+    count = last_month - first_month + 1
+
+    admitted_in = known & (admitted >= start) & (admitted <= now)
+    # Diagnoses of the stays admitted in the period, counted per (month, disease) in one bincount.
+    # A diagnosis of no loaded stay has position -1, which picks the appended False.
+    inside = np.append(admitted_in, False)[diagnoses[2]]
+    picked = diagnoses[1, inside]
+    # DiseaseIDs are small, so a bincount finds the ones present without sorting the rows.
+    present = np.bincount(picked) if len(picked) else np.zeros(0, np.int64)
+    ids = np.flatnonzero(present)
+    index = (np.cumsum(present > 0) - 1).astype(np.int32)[picked]
+    diag_month = month[diagnoses[2, inside]].astype(np.int32) - first_month
+    cases = np.bincount(diag_month * len(ids) + index, minlength=count * len(ids)).reshape(count, len(ids))
+    names = {row[0]: (row[1], row[2]) for row in diseases}
+    stay_month = month[admitted_in].astype(np.int64) - first_month
+    return {
+        'length_of_stay': length_of_stay(admitted, discharged, admitted_in, worst),
+        'prevalence': prevalence(stay_month, worst[admitted_in], cases, ids, names, first_month, count),
+        'diseases': disease_totals(cases, ids, int(admitted_in.sum()), names, first_month),
+        'readmissions': readmissions(admitted, discharged, discharge_month, worst, readmitted, start, now,
+                                     first_month, count),
+    }
+
+
+def length_of_stay(admitted, discharged, admitted_in, worst):
+    done = admitted_in & (discharged != MISSING) & (discharged >= admitted)
+    # Kept in whole minutes (int32) and only divided into days for the figures shown.
+    minutes = discharged[done] - admitted[done]
+    group = worst[done]
+    bucket = np.searchsorted(np.array(LOS_EDGES, np.int32) * DAY, minutes, side='right') - 1
+    counts = np.bincount(group * len(LOS_EDGES) + bucket, minlength=4 * len(LOS_EDGES)).reshape(4, -1)
+    labels = [f"{low}-{high} d" for low, high in zip(LOS_EDGES, LOS_EDGES[1:])] + [f"{LOS_EDGES[-1]}+ d"]
+    columns = ["Group", "Stays", "Mean days", "Median days", "P90 days"] + labels
+
+    def summary(values):
+        if not len(values):
+            return [None] * 3
+        median, p90 = np.quantile(values, [0.5, 0.9]) / DAY
+        return [round(float(values.mean(dtype=np.float64)) / DAY, 2), round(float(median), 2), round(float(p90), 2)]
+
+    rows = [("All stays", len(minutes), *summary(minutes), *counts.sum(axis=0).tolist())]
+    for code, name in enumerate(["No diagnosis"] + SEVERITIES):
+        values = minutes[group == code]
+        if len(values):
+            rows.append((name, len(values), *summary(values), *counts[code].tolist()))
+    return columns, rows
+
+
+def prevalence(stay_month, worst, cases, ids, names, first_month, count):
+    # Per admission month: admissions by worst severity and the most frequent diagnosis.
+    admissions = np.bincount(stay_month, minlength=count)
+    by_severity = np.bincount(stay_month * 4 + worst, minlength=4 * count).reshape(count, 4)
+    top = cases.argmax(axis=1) if len(ids) else np.zeros(count, np.int64)
+    top_cases = cases[np.arange(count), top] if len(ids) else np.zeros(count, np.int64)
+    columns = ["Month", "Admissions", "No diagnosis"] + SEVERITIES + ["Top diagnosis", "Top share %"]
+    rows = []
+    for i, label in enumerate(month_labels(first_month, count)):
+        share = round(100 * int(top_cases[i]) / int(admissions[i]), 1) if admissions[i] else None
+        top_name = names.get(int(ids[top[i]]), (f"#{ids[top[i]]}",))[0] if top_cases[i] else ""
+        rows.append((label, int(admissions[i]), *by_severity[i].tolist(), top_name, share))
+    return columns, rows
+
+
+def disease_totals(cases, ids, admissions, names, first_month):
+    totals = cases.sum(axis=0)
+    peak = month_labels(first_month, len(cases))
+    columns = ["DiseaseID", "Disease", "Severity", "Cases", "% of admissions", "Peak month"]
+    rows = [(int(ids[i]), *names.get(int(ids[i]), (f"#{ids[i]}", "")), int(totals[i]),
+             round(100 * int(totals[i]) / admissions, 2) if admissions else None, peak[cases[:, i].argmax()])
+            for i in np.argsort(-totals, kind='stable') if totals[i]]
+    return columns, rows
+
+
+def readmissions(admitted, discharged, discharge_month, worst, readmitted, start, now, first_month, count):
+    # Discharges in the period whose whole READMIT_DAYS follow-up window has passed, and how many
+    # of them were followed by a readmission.
+    index = ((admitted != MISSING) & (discharged != MISSING) & (discharged >= admitted) & (discharged >= start)
+             & (discharged <= now - READMIT_DAYS * DAY))
+    month = discharge_month[index].astype(np.int64) - first_month
+    back = readmitted[index].astype(bool)
+    discharges = np.bincount(month, minlength=count)
+    returned = np.bincount(month[back], minlength=count)
+    severity = worst[index]
+    columns = ["Period", "Discharges", f"Readmitted ≤{READMIT_DAYS} d", "Rate %"]
+    rate = lambda n, total: round(100 * int(n) / int(total), 2) if total else None
+    rows = [("All", len(back), int(back.sum()), rate(back.sum(), len(back)))]
+    for code, name in enumerate(["No diagnosis"] + SEVERITIES):
+        chosen = severity == code
+        if chosen.any():
+            rows.append((name, int(chosen.sum()), int(back[chosen].sum()), rate(back[chosen].sum(), chosen.sum())))
+    for label, total, n in zip(month_labels(first_month, count), discharges, returned):
+        if total:
+            rows.append((label, int(total), int(n), rate(n, total)))
+    return columns, rows
+
+
+analytics = ClinicalAnalytics()
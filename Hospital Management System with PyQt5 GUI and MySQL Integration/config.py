@@ -1,6 +1,49 @@
+import os
+
 MYSQL_CONFIG = {
     'host': 'localhost',
     'user': 'root',
     'password': '123456',
     'database': 'HospitalManagementSystem'
-}
\ No newline at end of file
+}
+
+POOL_CONFIG = {
+    'min_size': 1,
+    'max_size': 10,
+    'idle_timeout': 300,     # seconds an idle connection may sit in the pool before it is closed
+    'acquire_timeout': 10    # seconds to wait for a free connection when the pool is exhausted
+}
+
+PERF_CONFIG = {
+    'enabled': True,         # wrap connections to record every statement for the Performance page
+    'slow_query_ms': 200,    # statements slower than this (execute + fetch) go to the slow-query log
+    'explain_slow': False,   # run EXPLAIN once per distinct slow statement, on a separate connection
+    'history': 5000          # most recent statements kept for the rolling histogram and percentiles
+}
+
+REPLICA_CONFIG = {
+    'enabled': True,         # keep a local SQLite copy of the main tables for instant startup and offline reads
+    'path': os.path.join(os.path.expanduser("~"), ".hospital_replica.db"),
+    'sync_interval_ms': 60000  # how often changes are pulled from MySQL (also how often an offline app retries)
+}
+
+WRITE_QUEUE_CONFIG = {
+    'path': os.path.join(os.path.expanduser("~"), ".hospital_write_queue.db"),  # journal of saves not yet applied
+    'batch_size': 50,        # queued saves applied per transaction
+    'retry_base_ms': 1000,   # first retry delay after a connection error; doubles on each further failure
+    'retry_max_ms': 60000,
+    'keep_days': 30          # saves queued longer ago are held for review; older AppliedWrite keys are purged
+}
+
+SERVICE_CONFIG = {
+    'host': '127.0.0.1',     # where hms_service.py listens
+    'port': 8765,
+    'token': os.environ.get('HMS_SERVICE_TOKEN', ''),  # shared secret sent as a Bearer token; required to start
+    'url': None,             # e.g. 'http://10.0.0.5:8765' makes the GUI use the service instead of MySQL
+    'cache_ttl': 5,          # seconds a small read result is shared between clients (writes through the service drop it)
+    'session_timeout': 60    # seconds an idle write transaction stays open before it is rolled back
+}
+
+SEARCH_CONFIG = {
+    'path': os.path.join(os.path.expanduser("~"), ".hospital_symptom_index.npz")  # saved Disease text index
+}
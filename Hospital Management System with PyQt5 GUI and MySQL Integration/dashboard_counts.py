@@ -0,0 +1,84 @@
+import argparse
+
+from utils import db_connection
+
+# Exact totals for the dashboard, kept in DashboardCount (migration 0005). Each write path counts
+# the rows it is about to touch before and after its write, inside the same transaction, and
+# moves the counters by the difference: inserts, edits, deletes and their cascades all stay exact
+# without any statement reading a whole table.
+ADJUST_SQL = "UPDATE DashboardCount SET Value = Value + %s WHERE Name = %s"
+SET_SQL = "REPLACE INTO DashboardCount (Name, Value) VALUES (%s, %s)"
+RECOUNT_SQL = {
+    'patients': "SELECT COUNT(*) FROM Patient",
+    'employees': "SELECT COUNT(*) FROM EmployeeDetails",
+    'active_insurance': "SELECT COUNT(*) FROM PatientInsurance WHERE IsCurrent = 1",
+}
+# Table written -> counter -> the counted rows among the written keys, cascaded children included.
+COUNTED = {
+    'Patient': {
+        'patients': "SELECT COUNT(*) FROM Patient WHERE {key} IN (%s)",
+        'active_insurance': ("SELECT COUNT(*) FROM PatientInsurance i JOIN Patient p ON p.PatientID = i.PatientID "
+                             "WHERE i.IsCurrent = 1 AND p.{key} IN (%s)"),
+    },
+    'EmployeeDetails': {'employees': "SELECT COUNT(*) FROM EmployeeDetails WHERE {key} IN (%s)"},
+    'PatientInsurance': {
+        'active_insurance': "SELECT COUNT(*) FROM PatientInsurance WHERE IsCurrent = 1 AND {key} IN (%s)",
+    },
+}
+# Counter every inserted row of a table adds to (bulk imports).
+INSERTED = {'Patient': 'patients', 'EmployeeDetails': 'employees'}
+
+
+def count_sql(table, key_column):
+    return {name: sql.format(key=key_column) for name, sql in COUNTED.get(table, {}).items()}
+
+
+def counted(cur, table, key_column, keys):
+    totals = {}
+    for name, sql in count_sql(table, key_column).items():
+        cur.execute(sql.replace("IN (%s)", f"IN ({', '.join(['%s'] * len(keys))})"), list(keys))
+        totals[name] = int(cur.fetchone()[0] or 0)
+    return totals
+
+
+def adjust(cur, before, after):
+    # before/after as counted() returns them; a counter missing from after counted nothing (deletes).
+    for name, value in before.items():
+        delta = after.get(name, 0) - value
+        if delta:
+            cur.execute(ADJUST_SQL, (delta, name))
+
+
+def added(cur, table, count):
+    if count and table in INSERTED:
+        cur.execute(ADJUST_SQL, (count, INSERTED[table]))
+
+
+def recount(cur):
+    # For writes made outside the app (or before migration 0005): counts each table once.
+    values = {}
+    for name, sql in RECOUNT_SQL.items():
+        cur.execute(sql)
+        values[name] = int(cur.fetchone()[0] or 0)
+        cur.execute(SET_SQL, (name, values[name]))
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recount the dashboard totals from the tables.")
+    parser.add_argument('--sqlite', metavar='PATH', help="recount a local SQLite stand-in instead of MySQL")
+    args = parser.parse_args()
+    if args.sqlite:
+        from sqlite_standin import use_sqlite
+        use_sqlite(args.sqlite)
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        values = recount(conn.cursor())
+        conn.commit()
+    for name, value in values.items():
+        print(f"{name:<20}{value:>12,}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import time
+
+from PyQt5.QtCore import QEvent, QObject, QTimer, pyqtSignal
+
+from utils import db_connection
+from workers import run_task
+
+CACHE_TTL = 30                 # seconds a computed snapshot is served without going back to MySQL
+REFRESH_INTERVAL_MS = 60000    # background refresh period while the dashboard is on screen
+
+# Every card in one round trip. The totals are DashboardCount rows the write paths keep exact
+# (dashboard_counts.py); the rest are range scans on idx_register_discharge and idx_labreport_date,
+# and a loose scan of idx_register_room (one index dive per room, not per stay).
+METRICS_SQL = """
+    SELECT
+        (SELECT Value FROM DashboardCount WHERE Name = 'patients') AS patients,
+        (SELECT Value FROM DashboardCount WHERE Name = 'employees') AS employees,
+        (SELECT Value FROM DashboardCount WHERE Name = 'active_insurance') AS active_insurance,
+        (SELECT COUNT(*) FROM PatientRegister WHERE DischargeON IS NULL) AS admissions,
+        (SELECT COUNT(DISTINCT RoomNumber) FROM PatientRegister WHERE DischargeON IS NULL) AS occupied_rooms,
+        (SELECT COUNT(*) FROM PatientLabReport
+            WHERE DateOfTest >= CURDATE() AND DateOfTest < CURDATE() + INTERVAL 1 DAY) AS labs_today,
+        (SELECT COUNT(*) FROM (SELECT RoomNumber FROM PatientRegister GROUP BY RoomNumber) rooms) AS known_rooms
+"""
+
+
+def fetch_metrics():
+    with db_connection() as conn:
+        if not conn:
+            return None
+        cur = conn.cursor()
+        cur.execute(METRICS_SQL)
+        row = cur.fetchone()
+        return {d[0]: int(value or 0) for d, value in zip(cur.description, row)}
+
+
+class DashboardMetrics(QObject):
+    updated = pyqtSignal(dict)
+
+    def __init__(self, parent=None, ttl=CACHE_TTL, interval_ms=REFRESH_INTERVAL_MS):
+        super().__init__(parent)
+        self.ttl = ttl
+        self.values = None
+        self.fetched_at = 0.0
+        self._in_flight = False
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(lambda: self.refresh(force=True))
+        # The timer only runs while the dashboard page is on screen.
+        if parent is not None:
+            parent.installEventFilter(self)
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Show:
+            self.timer.start()
+            self.refresh()
+        elif event.type() == QEvent.Hide:
+            self.timer.stop()
+        return False
+
+    def refresh(self, force=False):
+        if self.values is not None and not force and time.monotonic() - self.fetched_at < self.ttl:
+            self.updated.emit(self.values)
+            return
+        if self._in_flight:
+            return
+        self._in_flight = True
+        run_task(fetch_metrics, on_done=self._store, on_error=self._failed)
+
+    def _store(self, values):
+        self._in_flight = False
+        if values is None:
+            return
+        self.values = values
+        self.fetched_at = time.monotonic()
+        self.updated.emit(self.values)
+
+    def _failed(self, message):
+        self._in_flight = False
+        print("Dashboard metrics error:", message)
@@ -0,0 +1,145 @@
+import argparse
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from patient_dedup import CHUNK, REPORT_SCORE, WARN_SCORE, DedupIndex, concat, encode
+from synthetic_data import CITIES, STREETS
+
+SYLLABLES = ["al", "an", "ar", "ba", "da", "el", "fa", "ha", "in", "ja", "ka", "la", "li", "ma", "mi", "na", "ne",
+             "no", "ra", "ri", "sa", "se", "ta", "to", "ya", "za", "ber", "din", "han", "mar", "son", "tin"]
+ERRORS = ['typo', 'swap_names', 'phone_format', 'new_phone', 'day_month', 'dob_digit', 'no_email', 'address']
+
+
+def names(rng, count, syllables):
+    # Made-up names, drawn Zipf-like later so a few are very common like real ones.
+    return sorted({"".join(rng.choice(SYLLABLES, rng.integers(*syllables))).capitalize() for _ in range(count)})
+
+
+def zipf_choice(rng, values, size):
+    weights = 1 / np.arange(1, len(values) + 1) ** 0.8
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size, p=weights / weights.sum())]
+
+
+def typo(rng, text):
+    i = int(rng.integers(len(text)))
+    kind = rng.integers(4)
+    if kind == 0 and len(text) > 3:
+        return text[:i] + text[i + 1:]
+    if kind == 1:
+        return text[:i] + rng.choice(list("aeinorst")) + text[i:]
+    if kind == 2 and i < len(text) - 1:
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    return text[:i] + rng.choice(list("aeinorst")) + text[i + 1:]
+
+
+def perturb(rng, row, patient_id):
+    _, first, last, gender, born, phone, email, address = row
+    for error in rng.choice(ERRORS, rng.integers(1, 3), replace=False):
+        if error == 'typo':
+            if rng.random() < 0.5:
+                first = typo(rng, first)
+            else:
+                last = typo(rng, last)
+        elif error == 'swap_names':
+            first, last = last, first
+        elif error == 'phone_format':
+            phone = f"+20 ({phone[:3]}) {phone[4:7]} {phone[7:]}"
+        elif error == 'new_phone':
+            phone = f"0{rng.integers(10 ** 9, 10 ** 10)}"
+        elif error == 'day_month' and born.day <= 12:
+            born = date(born.year, born.day, born.month)
+        elif error == 'dob_digit':
+            born = born + timedelta(days=int(rng.choice([-1, 1, -10, 10])))
+        elif error == 'no_email':
+            email = None
+        elif error == 'address':
+            address = address.replace(" St", " Street").replace(",", "")
+    return patient_id, first, last, gender, born, phone, email, address
+
+
+def synthetic(count, duplicates, seed=5):
+    # (rows, {duplicate PatientID: original PatientID}); duplicates carry one or two typical entry errors.
+    rng = np.random.default_rng(seed)
+    firsts, lasts = names(rng, 6000, (2, 4)), names(rng, 60000, (2, 5))
+    first, last = zipf_choice(rng, firsts, count), zipf_choice(rng, lasts, count)
+    born = np.datetime64('1930-01-01') + rng.integers(0, 95 * 365, count)
+    phones = rng.integers(10 ** 9, 10 ** 10, count)
+    genders = rng.choice(['Male', 'Female'], count)
+    streets = rng.integers(1, 400, count)
+    rows = []
+    for i in range(count):
+        phone = f"0{phones[i] // 10 ** 6}-{phones[i] % 10 ** 6}"
+        rows.append((i + 1, first[i], last[i], genders[i], born[i].item(), phone,
+                     f"{first[i]}.{last[i]}{i}@mail.example".lower() if rng.random() < 0.6 else None,
+                     f"{streets[i]} {STREETS[i % len(STREETS)]}, {CITIES[i % len(CITIES)][0]}"))
+    originals = {}
+    for n, i in enumerate(rng.choice(count, duplicates, replace=False)):
+        patient_id = count + n + 1
+        rows.append(perturb(rng, rows[i], patient_id))
+        originals[patient_id] = int(i) + 1
+    return rows, originals
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark duplicate-patient detection on synthetic patients.")
+    parser.add_argument('--patients', type=int, default=1000000)
+    parser.add_argument('--duplicates', type=float, default=0.01, help="share of patients entered twice")
+    parser.add_argument('--lookups', type=int, default=200, help="Add Patient checks to time")
+    args = parser.parse_args()
+
+    rows, originals = synthetic(args.patients, int(args.patients * args.duplicates))
+    print(f"{len(rows):,} patients, {len(originals):,} of them entered twice")
+    index = DedupIndex()
+
+    # As refresh() does: encode chunk by chunk, then index once.
+    parts, encoding = timed(lambda: [encode(rows[start:start + CHUNK]) for start in range(0, len(rows), CHUNK)])
+    _, indexing = timed(index.add, concat(parts))
+    print(f"encode {encoding:6.1f} s · index {indexing:5.2f} s · {index.nbytes() / 2 ** 20:,.0f} MB held")
+    (a, b, score, stats), elapsed = timed(index.pairs, 0.0)
+    print(f"batch: {stats['pairs']:,} candidate pairs scored in {elapsed:.1f} s "
+          f"({', '.join(f'{k} {v:,}' for k, v in stats['candidates'].items())})")
+
+    ids = index.columns['id']
+    left, right = ids[a], ids[b]
+    true = np.array([originals.get(int(x)) == int(y) or originals.get(int(y)) == int(x)
+                     for x, y in zip(left, right)], bool)
+    print(f"  blocking recall {true.sum() / len(originals):.1%} (true pairs among the candidates)")
+    for threshold in (WARN_SCORE, REPORT_SCORE, 0.85):
+        kept = score >= threshold
+        found = (true & kept).sum()
+        print(f"  score >= {threshold:.2f}: {kept.sum():,} pairs, recall {found / len(originals):.1%}, "
+              f"precision {found / max(kept.sum(), 1):.1%}")
+
+    duplicates = [row for row in rows if row[0] in originals][:args.lookups]
+    times, hits = [], 0
+    for row in duplicates:
+        values = dict(zip(['FirstName', 'LastName', 'Gender', 'DateOfBirth', 'PhoneNumber', 'EmailID', 'Address'],
+                          row[1:]))
+        values['DateOfBirth'] = str(values['DateOfBirth'])
+        matches, elapsed = timed(index.similar, values)
+        times.append(elapsed * 1000)
+        hits += any(patient_id == originals[row[0]] for patient_id, _, _ in matches)
+    p50, p99 = np.percentile(times, [50, 99])
+    print(f"online check: p50 {p50:.2f} ms · p99 {p99:.2f} ms; original flagged for {hits / len(times):.1%} "
+          f"of {len(times)} re-entered patients")
+
+    # A refresh that reads back one newly saved patient.
+    next_id = len(rows) + 1
+    times = []
+    for row in duplicates:
+        _, elapsed = timed(index.add, encode([(next_id, *row[1:])]))
+        times.append(elapsed * 1000)
+        next_id += 1
+    print(f"single-patient catch-up: median {np.median(times):.2f} ms over {len(times)}")
+
+
+if __name__ == '__main__':
+    main()
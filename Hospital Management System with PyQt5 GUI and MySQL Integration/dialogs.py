@@ -1,10 +1,34 @@
 from PyQt5.QtWidgets import QDialog, QFormLayout, QLineEdit, QComboBox, QPushButton, QMessageBox
-from utils import get_connection
+from lookups import lookups
+from workers import run_task
+from write_queue import write_queue
+
+# The dialogs' saves; hms_service offers these as the patients/employees insert and update operations.
+PATIENT_UPDATE_SQL = """
+    UPDATE Patient SET FirstName=%s, LastName=%s, Gender=%s, DateOfBirth=%s,
+    PhoneNumber=%s, Address=%s WHERE PatientRegNo=%s
+"""
+PATIENT_INSERT_SQL = """
+    INSERT INTO Patient (PatientRegNo, FirstName, LastName, Gender, DateOfBirth,
+    PhoneNumber, Address) VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+EMPLOYEE_UPDATE_SQL = """
+    UPDATE EmployeeDetails SET FirstName=%s, LastName=%s, Gender=%s, PhoneNumber=%s, RoleID=%s,
+    Address=%s, NationalID=%s, DateOfBirth=%s, DateOfJoining=%s, Salary=%s
+    WHERE EmployeeID=%s
+"""
+EMPLOYEE_INSERT_SQL = """
+    INSERT INTO EmployeeDetails (EmployeeID, FirstName, LastName, Gender, PhoneNumber, RoleID,
+    Address, NationalID, DateOfBirth, DateOfJoining, Salary)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
 
 # --------------------- Add Patient Dialog ---------------------
 class AddPatientDialog(QDialog):
     def __init__(self, patient=None):
         super().__init__()
+        self.saved_key = None
+        self.checking = None
         self.setWindowTitle("Add / Edit Patient")
         self.setMinimumWidth(400)
         layout = QFormLayout()
@@ -34,10 +58,15 @@ class AddPatientDialog(QDialog):
                     widget.setText(str(patient.get(key, "")))
             self.fields['PatientRegNo'].setReadOnly(True)
 
-        save_btn = QPushButton("Save")
-        save_btn.clicked.connect(self.save_patient)
-        layout.addRow(save_btn)
+        self.save_btn = QPushButton("Save")
+        self.save_btn.clicked.connect(self.save_patient)
+        layout.addRow(self.save_btn)
         self.setLayout(layout)
+        if not patient:
+            # Catch the duplicate index up while the form is being filled in, so Save only waits for the lookup.
+            # Imported here: patient_dedup brings numpy, which the rest of startup does not need.
+            from patient_dedup import dedup_index
+            run_task(dedup_index.refresh, on_error=lambda message: print("Duplicate Check Error:", message))
 
     def save_patient(self):
         values = {key: widget.text().strip() if not isinstance(widget, QComboBox) else widget.currentText()
@@ -46,36 +75,54 @@ class AddPatientDialog(QDialog):
             QMessageBox.warning(self, "Validation Error", "All fields must be filled.")
             return
 
-        conn = get_connection()
-        if conn:
-            cur = conn.cursor()
-            if self.fields['PatientRegNo'].isReadOnly():
-                sql = """
-                    UPDATE Patient SET FirstName=%s, LastName=%s, Gender=%s, DateOfBirth=%s,
-                    PhoneNumber=%s, Address=%s WHERE PatientRegNo=%s
-                """
-                params = tuple(values[k] for k in list(values.keys())[1:]) + (values['PatientRegNo'],)
-            else:
-                sql = """
-                    INSERT INTO Patient (PatientRegNo, FirstName, LastName, Gender, DateOfBirth,
-                    PhoneNumber, Address) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """
-                params = tuple(values.values())
-
-            try:
-                cur.execute(sql, params)
-                conn.commit()
-                QMessageBox.information(self, "Success", "Patient saved successfully.")
-                self.accept()
-            except Exception as e:
-                QMessageBox.critical(self, "Database Error", str(e))
-            finally:
-                conn.close()
+        if self.fields['PatientRegNo'].isReadOnly():
+            sql = PATIENT_UPDATE_SQL
+            params = tuple(values[k] for k in list(values.keys())[1:]) + (values['PatientRegNo'],)
+        else:
+            sql = PATIENT_INSERT_SQL
+            params = tuple(values.values())
+            from patient_dedup import find_duplicates
+            self.checking = values
+            self.save_btn.setEnabled(False)
+            self.save_btn.setText("Checking for duplicates…")
+            run_task(find_duplicates, values, on_done=lambda matches: self.confirm_new(values, sql, params, matches),
+                     on_error=lambda message: self.confirm_new(values, sql, params, [], message))
+            return
+        self.submit(values, sql, params)
+
+    def confirm_new(self, values, sql, params, matches, error=None):
+        if self.checking is not values:
+            return
+        self.checking = None
+        self.save_btn.setEnabled(True)
+        self.save_btn.setText("Save")
+        if error:
+            # The check must not stand in the way of a save, which the write queue can hold while offline.
+            print("Duplicate Check Error:", error)
+        if matches:
+            listed = "\n".join(f"• {reg}  {name}, born {born}, phone {phone} — {score:.0%} ({said})"
+                                for reg, name, born, phone, score, said in matches)
+            question = f"This patient may already be registered:\n\n{listed}\n\nSave as a new patient anyway?"
+            if QMessageBox.question(self, "Possible Duplicate", question,
+                                    QMessageBox.Yes | QMessageBox.No) != QMessageBox.Yes:
+                return
+        self.submit(values, sql, params)
+
+    def submit(self, values, sql, params):
+        self.saved_key = values['PatientRegNo']
+        self.saved_values = values
+        write_queue.submit("Patient", "PatientRegNo", self.saved_key, sql, params, values)
+        self.accept()
+
+    def reject(self):
+        self.checking = None
+        super().reject()
 
 # --------------------- Add Employee Dialog ---------------------
 class AddEmployeeDialog(QDialog):
     def __init__(self, employee=None):
         super().__init__()
+        self.saved_key = None
         self.setWindowTitle("Add / Edit Employee")
         self.setMinimumWidth(400)
         layout = QFormLayout()
@@ -95,14 +142,8 @@ class AddEmployeeDialog(QDialog):
         }
 
         self.fields['Gender'].addItems(['Male', 'Female', 'Other'])
-        conn = get_connection()
-        if conn:
-            cur = conn.cursor()
-            cur.execute("SELECT RoleID, RoleDesc FROM Role")
-            self.roles = cur.fetchall()
-            for r in self.roles:
-                self.fields['RoleID'].addItem(f"{r[1]} (ID: {r[0]})", r[0])
-            conn.close()
+        self.editing = bool(employee)
+        self.role_id = None
 
         for label, widget in self.fields.items():
             layout.addRow(label + ":", widget)
@@ -110,53 +151,48 @@ class AddEmployeeDialog(QDialog):
         if employee:
             for key in self.fields:
                 val = employee.get(key, "")
-                if isinstance(self.fields[key], QComboBox):
-                    index = self.fields[key].findData(int(val)) if key == 'RoleID' else self.fields[key].findText(val)
+                if key == 'RoleID':
+                    self.role_id = int(val) if val not in (None, '') else None
+                elif isinstance(self.fields[key], QComboBox):
+                    index = self.fields[key].findText(val)
                     if index >= 0:
                         self.fields[key].setCurrentIndex(index)
                 else:
                     self.fields[key].setText(str(val))
             self.fields['EmployeeID'].setReadOnly(True)
+        # Before the roles are cached the box stays empty and is filled once they have been read.
+        self.fill_roles(lookups.get('Role', on_loaded=self.fill_roles))
 
-        save_btn = QPushButton("Save")
-        save_btn.clicked.connect(self.save_employee)
-        layout.addRow(save_btn)
+        self.save_btn = QPushButton("Save")
+        self.save_btn.clicked.connect(self.save_employee)
+        layout.addRow(self.save_btn)
         self.setLayout(layout)
 
+    def fill_roles(self, roles):
+        box = self.fields['RoleID']
+        box.clear()
+        for r in roles:
+            box.addItem(f"{r[1]} (ID: {r[0]})", r[0])
+        # An employee saved without a role shows none, so one has to be picked before saving.
+        box.setCurrentIndex(box.findData(self.role_id) if self.role_id is not None else -1 if self.editing else 0)
+
     def save_employee(self):
         values = {
             key: (widget.currentData() if key == 'RoleID' else widget.currentText() if isinstance(widget, QComboBox) else widget.text().strip())
             for key, widget in self.fields.items()
         }
 
-        if any(v == '' for k, v in values.items() if k != 'EmployeeID' or not self.fields[k].isReadOnly()):
+        if any(v in ('', None) for k, v in values.items() if k != 'EmployeeID' or not self.fields[k].isReadOnly()):
             QMessageBox.warning(self, "Validation Error", "All fields must be filled.")
             return
 
-        conn = get_connection()
-        if conn:
-            cur = conn.cursor()
-            if self.fields['EmployeeID'].isReadOnly():
-                sql = """
-                    UPDATE EmployeeDetails SET FirstName=%s, LastName=%s, Gender=%s, PhoneNumber=%s, RoleID=%s,
-                    Address=%s, NationalID=%s, DateOfBirth=%s, DateOfJoining=%s, Salary=%s
-                    WHERE EmployeeID=%s
-                """
-                params = tuple(values[k] for k in list(values.keys())[1:]) + (values['EmployeeID'],)
-            else:
-                sql = """
-                    INSERT INTO EmployeeDetails (EmployeeID, FirstName, LastName, Gender, PhoneNumber, RoleID,
-                    Address, NationalID, DateOfBirth, DateOfJoining, Salary)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """
-                params = tuple(values[k] for k in list(values.keys()))
-
-            try:
-                cur.execute(sql, params)
-                conn.commit()
-                QMessageBox.information(self, "Success", "Employee saved successfully.")
-                self.accept()
-            except Exception as e:
-                QMessageBox.critical(self, "Database Error", str(e))
-            finally:
-                conn.close()
+        if self.fields['EmployeeID'].isReadOnly():
+            sql = EMPLOYEE_UPDATE_SQL
+            params = tuple(values[k] for k in list(values.keys())[1:]) + (values['EmployeeID'],)
+        else:
+            sql = EMPLOYEE_INSERT_SQL
+            params = tuple(values[k] for k in list(values.keys()))
+
+        self.saved_key = values['EmployeeID']
+        write_queue.submit("EmployeeDetails", "EmployeeID", self.saved_key, sql, params, values)
+        self.accept()
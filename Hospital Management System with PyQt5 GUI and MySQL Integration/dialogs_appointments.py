@@ -1,10 +1,27 @@
 
+from datetime import datetime
 from PyQt5.QtWidgets import QDialog, QFormLayout, QLineEdit, QPushButton, QMessageBox
-from utils import get_connection
+from occupancy import BookingConflict, check_booking
+from write_queue import write_queue
+
+# DischargeON stays empty for a patient still admitted: the stay is open-ended until discharge.
+OPTIONAL_FIELDS = {'DischargeON'}
+
+# The dialog's saves; hms_service offers these as the appointments insert and update operations.
+APPOINTMENT_UPDATE_SQL = '''
+    UPDATE PatientRegister SET PatientID=%s, AdmittedON=%s, DischargeON=%s, PatientInsuranceID=%s,
+    RoomNumber=%s, CopayType=%s, CreatedBy=%s WHERE PatientRegisterID=%s
+'''
+APPOINTMENT_INSERT_SQL = '''
+    INSERT INTO PatientRegister (PatientRegisterID, PatientID, AdmittedON, DischargeON,
+    PatientInsuranceID, RoomNumber, CopayType, CreatedBy)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+'''
 
 class AddAppointmentDialog(QDialog):
     def __init__(self, appointment=None):
         super().__init__()
+        self.saved_key = None
         self.setWindowTitle("Add / Edit Appointment")
         self.setMinimumWidth(400)
         layout = QFormLayout()
@@ -25,44 +42,52 @@ class AddAppointmentDialog(QDialog):
 
         if appointment:
             for key, widget in self.fields.items():
-                widget.setText(str(appointment.get(key, "")))
+                value = appointment.get(key)
+                widget.setText("" if value is None else str(value))
             self.fields['PatientRegisterID'].setReadOnly(True)
 
-        save_btn = QPushButton("Save")
-        save_btn.clicked.connect(self.save_appointment)
-        layout.addRow(save_btn)
+        self.save_btn = QPushButton("Save")
+        self.save_btn.clicked.connect(self.save_appointment)
+        layout.addRow(self.save_btn)
         self.setLayout(layout)
 
     def save_appointment(self):
         values = {key: widget.text().strip() for key, widget in self.fields.items()}
-        if any(v == '' for k, v in values.items() if k != 'PatientRegisterID' or not self.fields[k].isReadOnly()):
-            QMessageBox.warning(self, "Validation Error", "All fields must be filled.")
+        if any(v == '' for k, v in values.items()
+               if k not in OPTIONAL_FIELDS and (k != 'PatientRegisterID' or not self.fields[k].isReadOnly())):
+            QMessageBox.warning(self, "Validation Error", "All fields except DischargeON must be filled.")
             return
+        values['DischargeON'] = values['DischargeON'] or None
 
-        conn = get_connection()
-        if conn:
-            cur = conn.cursor()
-            if self.fields['PatientRegisterID'].isReadOnly():
-                sql = '''
-                    UPDATE PatientRegister SET PatientID=%s, AdmittedON=%s, DischargeON=%s, PatientInsuranceID=%s,
-                    RoomNumber=%s, CopayType=%s, CreatedBy=%s WHERE PatientRegisterID=%s
-                '''
-                params = tuple(values[k] for k in list(values.keys())[1:]) + (values['PatientRegisterID'],)
-            else:
-                sql = '''
-                    INSERT INTO PatientRegister (PatientRegisterID, PatientID, AdmittedON, DischargeON,
-                    PatientInsuranceID, RoomNumber, CopayType, CreatedBy)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                '''
-                params = tuple(values[k] for k in list(values.keys()))
+        if self.fields['PatientRegisterID'].isReadOnly():
+            sql = APPOINTMENT_UPDATE_SQL
+            params = tuple(values[k] for k in list(values.keys())[1:]) + (values['PatientRegisterID'],)
+        else:
+            sql = APPOINTMENT_INSERT_SQL
+            params = tuple(values[k] for k in list(values.keys()))
+
+        try:
+            admitted = datetime.fromisoformat(values['AdmittedON'])
+            discharged = datetime.fromisoformat(values['DischargeON']) if values['DischargeON'] else None
+        except ValueError:
+            QMessageBox.warning(self, "Validation Error", "Dates must be in YYYY-MM-DD HH:MM:SS format.")
+            return
+        if discharged is not None and discharged <= admitted:
+            QMessageBox.warning(self, "Validation Error", "DischargeON must be after AdmittedON.")
+            return
+
+        # Clashes the room index already knows about are refused here; the rest are caught by the
+        # locking check when the queued save is applied.
+        try:
+            check_booking(values['PatientRegisterID'], values['RoomNumber'], admitted, discharged)
+        except BookingConflict as e:
+            QMessageBox.warning(self, "Room Unavailable", str(e))
+            return
 
-            try:
-                cur.execute(sql, params)
-                conn.commit()
-                QMessageBox.information(self, "Success", "Appointment saved successfully.")
-                self.accept()
-            except Exception as e:
-                QMessageBox.critical(self, "Database Error", str(e))
-            finally:
-                conn.close()
+        self.saved_key = values['PatientRegisterID']
+        write_queue.submit("PatientRegister", "PatientRegisterID", self.saved_key, sql, params, values,
+                           kind='booking', extra={'reg': values['PatientRegisterID'], 'room': values['RoomNumber'],
+                                                  'start': admitted.isoformat(),
+                                                  'end': discharged.isoformat() if discharged else None})
+        self.accept()
     
\ No newline at end of file
@@ -1,9 +1,20 @@
 from PyQt5.QtWidgets import QDialog, QFormLayout, QLineEdit, QComboBox, QPushButton, QMessageBox
-from utils import get_connection
+from write_queue import write_queue
+
+# The dialog's saves; hms_service offers these as the diseases insert and update operations.
+DISEASE_UPDATE_SQL = """
+    UPDATE Disease SET Name=%s, Description=%s, Severity=%s, Symptoms=%s, Complications=%s, Treatment=%s
+    WHERE DiseaseID=%s
+"""
+DISEASE_INSERT_SQL = """
+    INSERT INTO Disease (DiseaseID, Name, Description, Severity, Symptoms, Complications, Treatment)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
 
 class AddDiseaseDialog(QDialog):
     def __init__(self, disease=None):
         super().__init__()
+        self.saved_key = None
         self.setWindowTitle("Add / Edit Disease")
         self.setMinimumWidth(400)
         layout = QFormLayout()
@@ -33,9 +44,9 @@ class AddDiseaseDialog(QDialog):
                     widget.setText(str(disease[key]))
             self.fields['DiseaseID'].setReadOnly(True)
 
-        save_btn = QPushButton("Save")
-        save_btn.clicked.connect(self.save_disease)
-        layout.addRow(save_btn)
+        self.save_btn = QPushButton("Save")
+        self.save_btn.clicked.connect(self.save_disease)
+        layout.addRow(self.save_btn)
         self.setLayout(layout)
 
     def save_disease(self):
@@ -46,28 +57,13 @@ class AddDiseaseDialog(QDialog):
             QMessageBox.warning(self, "Validation Error", "All fields must be filled.")
             return
 
-        conn = get_connection()
-        if conn:
-            cur = conn.cursor()
-            if self.fields['DiseaseID'].isReadOnly():
-                sql = """
-                    UPDATE Disease SET Name=%s, Description=%s, Severity=%s, Symptoms=%s, Complications=%s, Treatment=%s
-                    WHERE DiseaseID=%s
-                """
-                params = tuple(values[k] for k in list(values.keys())[1:]) + (values['DiseaseID'],)
-            else:
-                sql = """
-                    INSERT INTO Disease (DiseaseID, Name, Description, Severity, Symptoms, Complications, Treatment)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """
-                params = tuple(values.values())
+        if self.fields['DiseaseID'].isReadOnly():
+            sql = DISEASE_UPDATE_SQL
+            params = tuple(values[k] for k in list(values.keys())[1:]) + (values['DiseaseID'],)
+        else:
+            sql = DISEASE_INSERT_SQL
+            params = tuple(values.values())
 
-            try:
-                cur.execute(sql, params)
-                conn.commit()
-                QMessageBox.information(self, "Success", "Disease saved successfully.")
-                self.accept()
-            except Exception as e:
-                QMessageBox.critical(self, "Database Error", str(e))
-            finally:
-                conn.close()
\ No newline at end of file
+        self.saved_key = values['DiseaseID']
+        write_queue.submit("Disease", "DiseaseID", self.saved_key, sql, params, values)
+        self.accept()
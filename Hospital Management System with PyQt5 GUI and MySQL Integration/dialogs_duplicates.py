@@ -0,0 +1,61 @@
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QFileDialog, QMessageBox
+from patient_dedup import RESULT_COLUMNS, dedup_index, duplicate_report, write_report
+from table_model import make_table
+from workers import run_task, show_db_error
+
+class DuplicatesDialog(QDialog):
+    # Batch mode of patient_dedup over the shared index: likely duplicate pairs, best first.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Possible Duplicate Patients")
+        self.setMinimumSize(1100, 500)
+        self.columns, self.rows = RESULT_COLUMNS, []
+        layout = QVBoxLayout()
+        self.table = make_table()
+        layout.addWidget(self.table)
+        self.status = QLabel()
+        self.status.setStyleSheet("font-size: 11pt; color: gray;")
+        layout.addWidget(self.status)
+
+        btns = QHBoxLayout()
+        self.buttons = []
+        for label, slot in [("🔁 Run Again", self.run), ("💾 Save CSV", self.save), ("Close", self.accept)]:
+            b = QPushButton(label)
+            b.setStyleSheet("font-size: 12pt; padding: 6px;")
+            b.clicked.connect(slot)
+            btns.addWidget(b)
+            self.buttons.append(b)
+        layout.addLayout(btns)
+        self.setLayout(layout)
+        self.run()
+
+    def run(self):
+        for b in self.buttons[:2]:
+            b.setEnabled(False)
+        self.status.setText("Reading patients…")
+        run_task(duplicate_report, dedup_index, on_done=self.show_report, on_error=self.failed,
+                 on_progress=lambda count: self.status.setText(f"Reading patients… {count:,}"))
+
+    def show_report(self, report):
+        self.columns, self.rows, stats = report
+        self.table.model().set_rows(self.columns, self.rows)
+        for b in self.buttons[:2]:
+            b.setEnabled(True)
+        self.status.setText(f"{len(self.rows):,} likely pairs among {stats['patients']:,} patients · "
+                            f"{stats.get('pairs', 0):,} candidate pairs compared · {stats['elapsed']:.1f} s")
+
+    def failed(self, message):
+        self.buttons[0].setEnabled(True)
+        self.status.setText(f"⚠️ {message}")
+        show_db_error(message)
+
+    def save(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save Duplicate Report", "duplicate_patients.csv",
+                                              "CSV Files (*.csv)")
+        if not path:
+            return
+        try:
+            write_report(path, self.columns, self.rows)
+        except OSError as e:
+            print("Duplicate Report Error:", e)
+            QMessageBox.critical(self, "Save Failed", str(e))
@@ -0,0 +1,76 @@
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QGridLayout, QLabel, QPushButton, QTabWidget,
+                             QMessageBox)
+from lab_reports_feature import LabReportModel
+from page_columns import RECORD_COLUMNS, format_value, to_bool
+from patient_record import patient_records
+from table_model import make_table
+from workers import run_task
+
+HEADER_FIELDS = [('PatientRegNo', "Reg No"), ('DateOfBirth', "Date of Birth"), ('Gender', "Gender"),
+                 ('BloodGroup', "Blood Group"), ('PhoneNumber', "Phone"), ('EmailID', "Email"),
+                 ('EmergencyContact', "Emergency Contact"), ('MaritalStatus', "Marital Status"),
+                 ('Height', "Height"), ('Weight', "Weight"), ('Allergies', "Allergies"), ('Address', "Address")]
+
+class PatientRecordDialog(QDialog):
+    def __init__(self, record, parent=None):
+        super().__init__(parent)
+        self.setMinimumSize(1100, 650)
+        layout = QVBoxLayout()
+        self.title = QLabel()
+        self.title.setStyleSheet("font-size: 16pt; font-weight: bold;")
+        layout.addWidget(self.title)
+        self.header = QGridLayout()
+        layout.addLayout(self.header)
+
+        self.tabs = QTabWidget()
+        self.tables = {
+            'admissions': make_table(spec=RECORD_COLUMNS['admissions']),
+            'labs': make_table(spec=RECORD_COLUMNS['labs'], model_class=LabReportModel),
+            'insurance': make_table(spec=RECORD_COLUMNS['insurance']),
+        }
+        for table in self.tables.values():
+            self.tabs.addTab(table, "")
+        layout.addWidget(self.tabs)
+
+        btns = QHBoxLayout()
+        self.status = QLabel()
+        btns.addWidget(self.status)
+        btns.addStretch()
+        for label, slot in [("🔁 Reload", self.reload), ("Close", self.accept)]:
+            b = QPushButton(label)
+            b.setStyleSheet("font-size: 12pt; padding: 6px;")
+            b.clicked.connect(slot)
+            btns.addWidget(b)
+        layout.addLayout(btns)
+        self.setLayout(layout)
+        self.show_record(record)
+
+    def show_record(self, record):
+        self.record = record
+        patient = record['patient']
+        name = f"{patient['FirstName']} {patient['LastName']}"
+        self.setWindowTitle(f"Patient Record - {name}")
+        self.title.setText(f"🩺 {name}")
+        while self.header.count():
+            self.header.takeAt(0).widget().deleteLater()
+        fields = [(label, format_value('text', patient.get(column))) for column, label in HEADER_FIELDS]
+        current = [row for row in record['insurance'][1] if to_bool(row[-1])]
+        fields.append(("Current Insurance", f"{current[0][1]} ({current[0][3]})" if current else "None"))
+        for i, (label, value) in enumerate(fields):
+            text = QLabel(value)
+            text.setWordWrap(True)
+            self.header.addWidget(QLabel(f"<b>{label}:</b>"), i // 3, (i % 3) * 2)
+            self.header.addWidget(text, i // 3, (i % 3) * 2 + 1)
+
+        for i, (section, title) in enumerate([('admissions', "Admissions"), ('labs', "Lab Results"),
+                                              ('insurance', "Insurance")]):
+            columns, rows = record[section]
+            self.tables[section].model().set_rows(columns, rows)
+            self.tabs.setTabText(i, f"{title} ({len(rows):,})")
+        self.status.setText(f"Loaded in {record['load_ms']:.0f} ms with {record['statements']} queries")
+
+    def reload(self):
+        patient_id = self.record['patient']['PatientID']
+        patient_records.invalidate([patient_id])
+        run_task(patient_records.get, patient_id, on_done=self.show_record,
+                 on_error=lambda message: QMessageBox.critical(self, "Patient Record", message))
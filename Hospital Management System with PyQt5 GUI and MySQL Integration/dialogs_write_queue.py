@@ -0,0 +1,54 @@
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QMessageBox
+from table_model import make_table
+from write_queue import write_queue
+
+QUEUE_COLUMNS = ["Id", "Table", "Key", "Status", "Attempts", "Queued", "Error"]
+
+class WriteQueueDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Queued Saves")
+        self.setMinimumSize(900, 400)
+        layout = QVBoxLayout()
+        self.table = make_table()
+        layout.addWidget(self.table)
+
+        btns = QHBoxLayout()
+        for label, slot in [("🔁 Retry", self.retry), ("🗑️ Discard", self.discard), ("Close", self.accept)]:
+            b = QPushButton(label)
+            b.setStyleSheet("font-size: 12pt; padding: 6px;")
+            b.clicked.connect(slot)
+            btns.addWidget(b)
+        layout.addLayout(btns)
+        self.setLayout(layout)
+
+        write_queue.changed.connect(self.load)
+        self.finished.connect(lambda _: write_queue.changed.disconnect(self.load))
+        self.load()
+
+    def load(self):
+        items = list(write_queue.items.values()) + list(reversed(write_queue.recent))
+        self.table.model().set_rows(QUEUE_COLUMNS, [
+            (item['id'], item['table'], item['row_key'], item['status'], item['attempts'], item['queued_at'],
+             item['error'] or "") for item in items])
+
+    def selected_ids(self):
+        model = self.table.model()
+        return {model.rows[i.row()][0] for i in self.table.selectionModel().selectedRows()}
+
+    def retry(self):
+        ids = self.selected_ids()
+        if not ids:
+            QMessageBox.warning(self, "No Selection", "Select the saves to retry.")
+            return
+        write_queue.retry(ids)
+
+    def discard(self):
+        ids = self.selected_ids()
+        if not ids:
+            QMessageBox.warning(self, "No Selection", "Select the saves to discard.")
+            return
+        confirm = QMessageBox.question(self, "Discard Saves",
+                                       f"Discard {len(ids)} unsaved change(s)? They will not reach the database.")
+        if confirm == QMessageBox.Yes:
+            write_queue.discard(ids)
@@ -1,21 +1,44 @@
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QMessageBox
-import pandas as pd
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QMessageBox, QLineEdit, QLabel
+from batch_ops import batch_delete, batch_edit
+from bulk_export import start_export
+from bulk_import import ENUMS
 from dialogs_disease import AddDiseaseDialog
-from utils import get_connection, style_table
+from lookups import invalidate_lookup
+from local_replica import load_cached
+from page_columns import PAGE_COLUMNS
+from symptom_index import symptom_index, search_diseases, reindex_diseases
+from table_model import make_table, load_table, open_selected
+from workers import run_task
+from write_queue import write_queue
+
+SEARCH_DELAY_MS = 250
 
 def build_disease_page():
     page = QWidget()
     layout = QVBoxLayout()
-    table = QTableWidget()
-    style_table(table)
+    table = make_table(spec=PAGE_COLUMNS['diseases'])
+    write_queue.track(table)
+    search = QLineEdit()
+    search.setPlaceholderText("🔍 Search symptoms, e.g. fever rash joint pain…")
+    search.setClearButtonEnabled(True)
+    search.setStyleSheet("font-size: 12pt; padding: 6px;")
+    results = make_table()
+    results.hide()
+    status = QLabel()
+    layout.addWidget(search)
     layout.addWidget(table)
+    layout.addWidget(results)
+    layout.addWidget(status)
 
     btns = QHBoxLayout()
     for label, slot in [
         ("➕ Add", lambda: add_disease(table)),
         ("✏️ Edit", lambda: edit_disease(table)),
         ("🗑️ Delete", lambda: delete_disease(table)),
-        ("🔁 Refresh", lambda: load_diseases(table))
+        ("🧮 Batch Edit", lambda: batch_edit_diseases(table)),
+        ("🔁 Refresh", lambda: load_diseases(table)),
+        ("📤 Export", lambda: start_export(table, 'diseases'))
     ]:
         b = QPushButton(label)
         b.setStyleSheet("font-size: 12pt; padding: 6px;")
@@ -24,57 +47,53 @@ def build_disease_page():
 
     layout.addLayout(btns)
     page.setLayout(layout)
-    load_diseases(table)
+    load_cached(table, "DiseaseID")
+
+    # Symptom search ranks diseases from the saved text index; the full list comes back when the box is cleared.
+    timer = QTimer(page)
+    timer.setSingleShot(True)
+    timer.setInterval(SEARCH_DELAY_MS)
+    run_search = lambda: search_symptoms(search.text().strip(), table, results, status)
+    timer.timeout.connect(run_search)
+    search.textChanged.connect(lambda _: timer.start())
+    search.returnPressed.connect(lambda: (timer.stop(), run_search()))
+    run_task(symptom_index.open, on_error=lambda message: status.setText(f"⚠️ Symptom search unavailable: {message}"))
     return page
 
-def load_diseases(table):
-    conn = get_connection()
-    if conn:
-        df = pd.read_sql("SELECT * FROM Disease", conn)
-        conn.close()
-        table.setRowCount(len(df))
-        table.setColumnCount(len(df.columns))
-        table.setHorizontalHeaderLabels(df.columns)
-        for row in range(len(df)):
-            for col in range(len(df.columns)):
-                table.setItem(row, col, QTableWidgetItem(str(df.iloc[row, col])))
+def search_symptoms(text, table, results, status):
+    if not text:
+        results.hide()
+        table.show()
+        status.clear()
+        return
+
+    def show(found):
+        columns, rows, elapsed_ms = found
+        results.model().set_rows(columns, rows)
+        table.hide()
+        results.show()
+        status.setText(f"{len(rows)} diseases match '{text}' ({elapsed_ms:.1f} ms)")
 
-def get_selected(table):
-    row = table.currentRow()
-    if row < 0:
-        return None
-    return {
-        table.horizontalHeaderItem(c).text(): table.item(row, c).text()
-        for c in range(table.columnCount())
-    }
+    status.setText("Searching…")
+    run_task(search_diseases, text, on_done=show, on_error=lambda message: status.setText(f"⚠️ {message}"))
+
+def load_diseases(table):
+    load_table(table)
 
 def add_disease(table):
-    dlg = AddDiseaseDialog()
-    if dlg.exec_():
-        load_diseases(table)
+    AddDiseaseDialog().exec_()
 
 def edit_disease(table):
-    selected = get_selected(table)
-    if not selected:
+    if not open_selected(table, "Disease", "DiseaseID", lambda disease: open_disease(table, disease)):
         QMessageBox.warning(None, "No Selection", "Select a disease to edit.")
-        return
-    dlg = AddDiseaseDialog(selected)
-    if dlg.exec_():
-        load_diseases(table)
+
+def open_disease(table, disease):
+    AddDiseaseDialog(disease).exec_()
 
 def delete_disease(table):
-    selected = get_selected(table)
-    if not selected:
-        QMessageBox.warning(None, "No Selection", "Select a disease to delete.")
-        return
-    confirm = QMessageBox.question(None, "Confirm Delete",
-                                   f"Delete disease '{selected['Name']}'?",
-                                   QMessageBox.Yes | QMessageBox.No)
-    if confirm == QMessageBox.Yes:
-        conn = get_connection()
-        if conn:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM Disease WHERE DiseaseID=%s", (selected['DiseaseID'],))
-            conn.commit()
-            conn.close()
-            load_diseases(table)
\ No newline at end of file
+    batch_delete(None, table, "Disease", "DiseaseID", "disease", lambda d: f"disease '{d['Name']}'",
+                 on_deleted=lambda keys: (invalidate_lookup('Disease'), reindex_diseases(keys)))
+
+def batch_edit_diseases(table):
+    batch_edit(None, table, "Disease", "DiseaseID", "disease", {'Severity': ENUMS['Severity']},
+               on_updated=lambda *_: invalidate_lookup('Disease'))
@@ -0,0 +1,361 @@
+import argparse
+import asyncio
+import hmac
+import json
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pymysql.cursors
+
+from config import POOL_CONFIG, SERVICE_CONFIG
+from service_client import dumps, error_payload, loads
+from service_operations import bind, operations, read_operations
+from utils import get_pool
+
+# Rows per line of a streamed read response.
+CHUNK_SIZE = 500
+# Read results up to this many rows are shared between clients for cache_ttl seconds.
+CACHE_MAX_ROWS = 2000
+CACHE_MAX_ENTRIES = 5000
+MAX_BODY = 64 * 1024 * 1024
+READ_TABLES = re.compile(r"\b(?:FROM|JOIN)\s+`?(\w+)", re.I)
+WRITE_TABLES = re.compile(r"\b(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\s+`?(\w+)", re.I)
+SESSION_PATH = re.compile(r"^/sessions/(\w+)/(.+)$")
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 409: "Conflict",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_request(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, path, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length') or 0)
+    if length > MAX_BODY:
+        raise HttpError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, path.split("?", 1)[0], headers, body
+
+
+def _response_head(status, extra):
+    return (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json\r\n"
+            f"{extra}\r\n").encode("latin-1")
+
+
+async def send_json(writer, payload, status=200):
+    data = dumps(payload)
+    writer.write(_response_head(status, f"Content-Length: {len(data)}\r\n") + data)
+    await writer.drain()
+
+
+class ChunkedWriter:
+    # JSON lines in an HTTP chunked response, so large results reach the client as they are read.
+    def __init__(self, writer):
+        self.writer = writer
+
+    async def start(self):
+        self.writer.write(_response_head(200, "Transfer-Encoding: chunked\r\n"))
+
+    async def line(self, payload):
+        data = dumps(payload) + b"\n"
+        self.writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+        await self.writer.drain()
+
+    async def end(self):
+        self.writer.write(b"0\r\n\r\n")
+        await self.writer.drain()
+
+
+class Session:
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = asyncio.Lock()
+        self.written = set()
+        self.used_at = time.monotonic()
+
+
+class HmsService:
+    # One process owns the database pool for every client. Database calls are blocking (pymysql),
+    # so they run on a thread pool sized to the connection pool; the event loop only moves bytes.
+    # Clients name an operation from service_operations and send its parameters; no SQL text is
+    # taken from the network.
+    def __init__(self, config=SERVICE_CONFIG):
+        if not config['token']:
+            raise ValueError("No service token: set HMS_SERVICE_TOKEN (SERVICE_CONFIG['token']) before starting.")
+        self.token = config['token']
+        self.cache_ttl = config['cache_ttl']
+        self.session_timeout = config['session_timeout']
+        self.executor = ThreadPoolExecutor(max_workers=POOL_CONFIG['max_size'] + 2, thread_name_prefix="hms-db")
+        self.cache = {}
+        self.sessions = {}
+        self.counters = {'requests': 0, 'queries': 0, 'cache_hits': 0, 'rows_sent': 0, 'sessions': 0,
+                         'commits': 0, 'rollbacks': 0, 'expired_sessions': 0, 'errors': 0}
+        self.clients = 0
+        self.slots = None
+
+    def _db(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def _acquire(self):
+        # Connections are handed out through a semaphore the size of the pool, so a burst of clients
+        # waits here instead of tying up every executor thread in a blocking acquire().
+        await self.slots.acquire()
+        try:
+            return await self._db(get_pool().acquire)
+        except Exception:
+            self.slots.release()
+            raise
+
+    async def _release(self, conn, broken=False):
+        try:
+            await self._db(conn.discard if broken else conn.close)
+        finally:
+            self.slots.release()
+
+    async def serve(self, host, port):
+        self.slots = asyncio.Semaphore(POOL_CONFIG['max_size'])
+        server = await asyncio.start_server(self.handle, host, port)
+        reaper = asyncio.ensure_future(self._reap_sessions())
+        print(f"HMS service listening on {', '.join(str(s.getsockname()) for s in server.sockets)}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            reaper.cancel()
+
+    async def handle(self, reader, writer):
+        self.clients += 1
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    await self.dispatch(*request, writer)
+                except HttpError as e:
+                    await send_json(writer, {'error': str(e), 'type': 'HttpError'}, e.status)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def dispatch(self, method, path, headers, body, writer):
+        self.counters['requests'] += 1
+        if not hmac.compare_digest(headers.get('authorization', ""), f"Bearer {self.token}"):
+            raise HttpError(401, "Missing or wrong service token")
+        try:
+            payload = loads(body) if body else {}
+        except ValueError:
+            raise HttpError(400, "Body is not valid JSON")
+        if method == "GET" and path == "/health":
+            await send_json(writer, {'ok': True})
+        elif method == "GET" and path == "/stats":
+            await send_json(writer, self.stats())
+        elif method == "POST" and path == "/sessions":
+            await self.open_session(writer)
+        elif method == "POST" and SESSION_PATH.match(path):
+            session_id, action = SESSION_PATH.match(path).groups()
+            if action not in ("commit", "rollback") and action not in operations():
+                raise HttpError(404, f"No such operation: {action}")
+            await self.session_action(session_id, action, payload, writer)
+        elif method == "POST" and path[1:] in operations():
+            if path[1:] not in read_operations():
+                raise HttpError(400, f"{path[1:]} writes or locks rows; run it inside a session")
+            await self.query(path[1:], payload, writer)
+        else:
+            raise HttpError(404, f"No such endpoint: {method} {path}")
+
+    # ---- reads ----
+
+    async def query(self, name, payload, writer):
+        params = payload.get('params')
+        try:
+            sql = bind(name, params)
+        except ValueError as e:
+            raise HttpError(400, str(e))
+        self.counters['queries'] += 1
+        key = (name, json.dumps(params, default=str))
+        cached = self.cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self.counters['cache_hits'] += 1
+            await self._send_rows(writer, cached[2], cached[3])
+            return
+        try:
+            conn = await self._acquire()
+        except Exception as e:
+            self.counters['errors'] += 1
+            await send_json(writer, error_payload(e), 500)
+            return
+        out = None
+        try:
+            cur = conn.cursor(pymysql.cursors.SSCursor)
+            await self._db(cur.execute, sql, params)
+            # The whole DB-API description, so the client's exports still see each column's type.
+            description = [list(d) for d in cur.description] if cur.description else []
+            out = ChunkedWriter(writer)
+            await out.start()
+            await out.line({'description': description})
+            kept, total = [], 0
+            while True:
+                rows = await self._db(cur.fetchmany, CHUNK_SIZE)
+                if not rows:
+                    break
+                total += len(rows)
+                if kept is not None:
+                    kept.extend(rows)
+                    if len(kept) > CACHE_MAX_ROWS:
+                        kept = None
+                await out.line({'rows': rows})
+            await out.line({'done': True, 'rowcount': total})
+            await out.end()
+        except (ConnectionError, asyncio.CancelledError):
+            await self._release(conn, broken=True)
+            raise
+        except Exception as e:
+            await self._release(conn, broken=True)
+            self.counters['errors'] += 1
+            if out is None:
+                await send_json(writer, error_payload(e), 400)
+            else:
+                await out.line(error_payload(e))
+                await out.end()
+            return
+        await self._release(conn)
+        self.counters['rows_sent'] += total
+        if kept is not None and self.cache_ttl > 0:
+            self._remember(key, set(READ_TABLES.findall(sql)), description, kept)
+
+    async def _send_rows(self, writer, description, rows):
+        out = ChunkedWriter(writer)
+        await out.start()
+        await out.line({'description': description})
+        for i in range(0, len(rows), CHUNK_SIZE):
+            await out.line({'rows': rows[i:i + CHUNK_SIZE]})
+        await out.line({'done': True, 'rowcount': len(rows)})
+        await out.end()
+        self.counters['rows_sent'] += len(rows)
+
+    def _remember(self, key, tables, description, rows):
+        if len(self.cache) >= CACHE_MAX_ENTRIES:
+            self.cache.pop(next(iter(self.cache)))
+        self.cache[key] = (time.monotonic() + self.cache_ttl, {t.lower() for t in tables}, description, rows)
+
+    def _invalidate(self, tables):
+        tables = {t.lower() for t in tables}
+        for key in [k for k, entry in self.cache.items() if entry[1] & tables]:
+            del self.cache[key]
+
+    # ---- write sessions ----
+
+    async def open_session(self, writer):
+        try:
+            conn = await self._acquire()
+        except Exception as e:
+            self.counters['errors'] += 1
+            await send_json(writer, error_payload(e), 500)
+            return
+        session_id = uuid.uuid4().hex
+        self.sessions[session_id] = Session(conn)
+        self.counters['sessions'] += 1
+        await send_json(writer, {'session': session_id})
+
+    async def session_action(self, session_id, action, payload, writer):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HttpError(409, "The transaction is no longer open (it timed out or was already ended).")
+        async with session.lock:
+            session.used_at = time.monotonic()
+            if action not in ("commit", "rollback"):
+                many = payload.get('many', False)
+                try:
+                    sql = operations()[action] if many else bind(action, payload.get('params'))
+                    result = await self._db(_execute, session.conn, sql, payload.get('params'), many)
+                except Exception as e:
+                    self.counters['errors'] += 1
+                    await send_json(writer, error_payload(e), 400)
+                    return
+                session.written.update(WRITE_TABLES.findall(sql))
+                await send_json(writer, result)
+                return
+            del self.sessions[session_id]
+            try:
+                if action == "commit":
+                    await self._db(session.conn.commit)
+                    self.counters['commits'] += 1
+                    self._invalidate(session.written)
+                else:
+                    await self._db(session.conn.rollback)
+                    self.counters['rollbacks'] += 1
+            except Exception as e:
+                await self._release(session.conn, broken=True)
+                self.counters['errors'] += 1
+                await send_json(writer, error_payload(e), 400)
+                return
+            await self._release(session.conn)
+        await send_json(writer, {'ok': True})
+
+    async def _reap_sessions(self):
+        # A client that vanished mid-transaction must not hold its locks and connection forever.
+        while True:
+            await asyncio.sleep(max(1, self.session_timeout / 4))
+            cutoff = time.monotonic() - self.session_timeout
+            for session_id, session in list(self.sessions.items()):
+                if session.used_at < cutoff and not session.lock.locked():
+                    del self.sessions[session_id]
+                    self.counters['expired_sessions'] += 1
+                    await self._release(session.conn, broken=True)
+
+    def stats(self):
+        return dict(self.counters, clients=self.clients, open_sessions=len(self.sessions),
+                    cached_results=len(self.cache), pool=get_pool().stats())
+
+
+def _execute(conn, sql, params, many):
+    cur = conn.cursor()
+    rowcount = cur.executemany(sql, params) if many else cur.execute(sql, params)
+    rows = [] if many or cur.description is None else cur.fetchall()
+    description = None if many or cur.description is None else [list(d) for d in cur.description]
+    return {'description': description, 'rows': [list(r) for r in rows], 'rowcount': rowcount, 'lastrowid': cur.lastrowid}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the hospital database to GUI clients over HTTP/JSON.")
+    parser.add_argument('--host', default=SERVICE_CONFIG['host'])
+    parser.add_argument('--port', type=int, default=SERVICE_CONFIG['port'])
+    parser.add_argument('--sqlite', metavar='PATH', help="serve a local SQLite stand-in instead of MySQL")
+    args = parser.parse_args()
+    try:
+        service = HmsService()
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if args.sqlite:
+        from sqlite_standin import use_sqlite
+        use_sqlite(args.sqlite)
+    operations()
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,31 @@
-from diseases_feature import build_disease_page
-from insurance_feature import build_insurance_page
-from appointments_feature import build_appointment_page
-import pandas as pd
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QPushButton, QLabel,
-    QStackedWidget, QListWidget, QTableWidgetItem, QMessageBox, QFrame
+    QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
+    QStackedWidget, QListWidget, QMessageBox, QFrame, QTableView, QGridLayout, QShortcut
 )
-from PyQt5.QtGui import QFont
+from PyQt5.QtGui import QFont, QKeySequence
+from batch_ops import batch_delete, batch_edit
+from bulk_export import start_export
+from bulk_import import ENUMS, start_import
+from dashboard_metrics import DashboardMetrics
+from config import REPLICA_CONFIG
 from dialogs import AddPatientDialog, AddEmployeeDialog
-from utils import get_connection, style_table
+from local_replica import replica, load_cached
+from lookups import lookups
+from page_columns import PAGE_COLUMNS
+from patient_record import patient_records
+from patient_search import PatientSearchBox, search_sql
+from table_model import make_table, load_table, get_selected, open_selected, refresh_changed
+from workers import run_task, cancel_load, show_db_error
+from write_queue import write_queue
+
+DASHBOARD_CARDS = [
+    ('patients', "👥 Patients", "#4CAF50"),
+    ('employees', "🧑‍⚕️ Employees", "#2196F3"),
+    ('admissions', "🛏️ Current Admissions", "#FF9800"),
+    ('occupancy', "🚪 Room Occupancy", "#9C27B0"),
+    ('labs_today', "🧪 Labs Today", "#009688"),
+    ('active_insurance', "🛡️ Active Insurance", "#607D8B"),
+]
 
 class HospitalSystem(QWidget):
     def __init__(self):
@@ -18,25 +35,110 @@ class HospitalSystem(QWidget):
         layout = QHBoxLayout()
         self.menu = QListWidget()
         self.menu.setStyleSheet("font-size: 14pt; background-color: #cce6ff;")
-        self.menu.addItems(["Dashboard", "Patients", "Employees", "Diseases", "Insurance", "Appointments"])
+        self.menu.addItems(["Dashboard", "Patients", "Employees", "Diseases", "Insurance", "Appointments",
+                            "Lab Reports", "Analytics"])
         self.menu.setFixedWidth(220)
         self.menu.currentRowChanged.connect(self.switch_page)
 
+        # Pages are built (and their first query issued) only when they are first opened.
+        # The last one, Performance, has no menu entry and is opened with Ctrl+Shift+P.
+        self.page_builders = [self.dashboard_page, self.patient_page, self.employee_page,
+                              self.disease_page, self.insurance_page, self.appointment_page,
+                              self.lab_reports_page, self.analytics_page, self.performance_page]
+        self.built_pages = set()
         self.stack = QStackedWidget()
-        self.stack.addWidget(self.dashboard_page())
-        self.stack.addWidget(self.patient_page())
-        self.stack.addWidget(self.employee_page())
-        self.stack.addWidget(build_disease_page())
-        self.stack.addWidget(build_insurance_page())
-        self.stack.addWidget(build_appointment_page())
+        for _ in self.page_builders:
+            self.stack.addWidget(QWidget())
+
+        # Shown while MySQL is unreachable and pages are reading from the local replica.
+        self.offline_banner = QLabel()
+        self.offline_banner.setStyleSheet("background-color: #c62828; color: white; font-size: 12pt; padding: 8px;")
+        self.offline_banner.hide()
+        # Appears while dialog saves are still queued or were rejected; opens the queue.
+        self.queue_button = QPushButton()
+        self.queue_button.setStyleSheet("font-size: 11pt; padding: 4px;")
+        self.queue_button.clicked.connect(self.show_write_queue)
+        self.queue_button.hide()
+        write_queue.changed.connect(self.show_queue_counts)
+        content = QVBoxLayout()
+        content.addWidget(self.offline_banner)
+        content.addWidget(self.stack)
+        content.addWidget(self.queue_button)
 
         layout.addWidget(self.menu)
-        layout.addWidget(self.stack)
+        layout.addLayout(content)
         self.setLayout(layout)
+        if REPLICA_CONFIG['enabled']:
+            replica.mode_changed.connect(self.show_offline)
+            replica.start()
+        write_queue.start()
+        self.switch_page(0)
+        QShortcut(QKeySequence("Ctrl+Shift+P"), self, self.show_performance)
+        # Reference tables are fetched once in the background so dialogs open without a query.
+        run_task(lookups.warm)
 
     def switch_page(self, index):
+        for table in self.stack.currentWidget().findChildren(QTableView):
+            cancel_load(table)
+        if index not in self.built_pages:
+            self.built_pages.add(index)
+            placeholder = self.stack.widget(index)
+            self.stack.insertWidget(index, self.page_builders[index]())
+            self.stack.removeWidget(placeholder)
+            placeholder.deleteLater()
         self.stack.setCurrentIndex(index)
 
+    def show_offline(self, offline):
+        if offline:
+            synced = replica.last_synced()
+            since = f" from {synced:%Y-%m-%d %H:%M}" if synced else ""
+            self.offline_banner.setText(f"⚠️ Offline — showing the local copy{since}; "
+                                        f"saves are queued until the database is back.")
+        else:
+            write_queue.retry()
+        self.offline_banner.setVisible(offline)
+
+    def show_queue_counts(self):
+        pending, failed = write_queue.counts()
+        parts = ([f"⏳ {pending} save{'s' * (pending != 1)} pending"] if pending else []) + \
+                ([f"⚠️ {failed} save{'s' * (failed != 1)} failed"] if failed else [])
+        self.queue_button.setText(" · ".join(parts))
+        self.queue_button.setVisible(bool(parts))
+
+    def show_write_queue(self):
+        from dialogs_write_queue import WriteQueueDialog
+        WriteQueueDialog(self).exec_()
+
+    def disease_page(self):
+        from diseases_feature import build_disease_page
+        return build_disease_page()
+
+    def insurance_page(self):
+        from insurance_feature import build_insurance_page
+        return build_insurance_page()
+
+    def appointment_page(self):
+        from appointments_feature import build_appointment_page
+        return build_appointment_page()
+
+    def lab_reports_page(self):
+        from lab_reports_feature import build_lab_reports_page
+        return build_lab_reports_page()
+
+    def analytics_page(self):
+        from analytics_feature import build_analytics_page
+        return build_analytics_page()
+
+    def performance_page(self):
+        from performance_page import build_performance_page
+        return build_performance_page()
+
+    def show_performance(self):
+        self.menu.blockSignals(True)
+        self.menu.setCurrentRow(-1)
+        self.menu.blockSignals(False)
+        self.switch_page(len(self.page_builders) - 1)
+
     def dashboard_page(self):
         page = QWidget()
         layout = QVBoxLayout()
@@ -45,23 +147,28 @@ class HospitalSystem(QWidget):
         label.setStyleSheet("padding: 10px; color: navy;")
         layout.addWidget(label)
 
-        stats_layout = QHBoxLayout()
-        conn = get_connection()
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM Patient")
-            patients = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(*) FROM EmployeeDetails")
-            employees = cursor.fetchone()[0]
-            conn.close()
-
-            stats_layout.addWidget(self.make_info_card("👥 Patients", patients, "#4CAF50"))
-            stats_layout.addWidget(self.make_info_card("🧑‍⚕️ Employees", employees, "#2196F3"))
+        stats_layout = QGridLayout()
+        self.metric_cards = {}
+        for i, (key, title, color) in enumerate(DASHBOARD_CARDS):
+            self.metric_cards[key] = self.make_info_card(title, "…", color)
+            stats_layout.addWidget(self.metric_cards[key], i // 3, i % 3)
 
         layout.addLayout(stats_layout)
+        layout.addStretch()
         page.setLayout(layout)
+        self.metrics = DashboardMetrics(page)
+        self.metrics.updated.connect(self.show_metrics)
         return page
 
+    def show_metrics(self, values):
+        for key, card in self.metric_cards.items():
+            if key == 'occupancy':
+                occupied, known = values['occupied_rooms'], values['known_rooms']
+                text = f"{occupied} / {known}" + (f" ({100 * occupied // known}%)" if known else "")
+            else:
+                text = f"{values[key]:,}"
+            card.value_label.setText(text)
+
     def make_info_card(self, title, count, color):
         card = QFrame()
         card.setStyleSheet(f"background-color: {color}; border-radius: 15px; padding: 25px; margin: 10px; color: white;")
@@ -73,18 +180,25 @@ class HospitalSystem(QWidget):
         layout.addWidget(label1)
         layout.addWidget(label2)
         card.setLayout(layout)
+        card.value_label = label2
         return card
 
     def patient_page(self):
         page = QWidget()
         layout = QVBoxLayout()
-        self.patient_table = QTableWidget()
-        style_table(self.patient_table)
+        self.patient_search = PatientSearchBox(on_search=self.search_patients)
+        layout.addWidget(self.patient_search)
+        self.patient_table = make_table(watermark_column="ModifiedON", spec=PAGE_COLUMNS['patients'])
+        write_queue.track(self.patient_table)
         layout.addWidget(self.patient_table)
 
         btns = QHBoxLayout()
         for label, slot in [("➕ Add", self.add_patient), ("✏️ Edit", self.edit_patient),
-                            ("🗑️ Delete", self.delete_patient), ("🔁 Refresh", self.load_patients)]:
+                            ("🗑️ Delete", self.delete_patient), ("🧮 Batch Edit", self.batch_edit_patients),
+                            ("🩺 Record", self.view_patient_record),
+                            ("🧬 Duplicates", self.find_duplicates), ("🔁 Refresh", self.refresh_patients),
+                            ("📥 Import", lambda: start_import(self, 'patients', self.patients_imported)),
+                            ("📤 Export", lambda: start_export(self, 'patients'))]:
             b = QPushButton(label)
             b.setStyleSheet("font-size: 12pt; padding: 6px;")
             b.clicked.connect(slot)
@@ -92,71 +206,85 @@ class HospitalSystem(QWidget):
 
         layout.addLayout(btns)
         page.setLayout(layout)
-        self.load_patients()
+        load_cached(self.patient_table, "PatientRegNo")
         return page
 
     def load_patients(self):
-        conn = get_connection()
-        if conn:
-            df = pd.read_sql("SELECT * FROM Patient", conn)
-            conn.close()
-            self.patient_table.setRowCount(len(df))
-            self.patient_table.setColumnCount(len(df.columns))
-            self.patient_table.setHorizontalHeaderLabels(df.columns)
-            for row in range(len(df)):
-                for col in range(len(df.columns)):
-                    self.patient_table.setItem(row, col, QTableWidgetItem(str(df.iloc[row, col])))
-
-    def get_selected_patient(self):
-        row = self.patient_table.currentRow()
-        if row < 0:
-            return None
-        return {
-            self.patient_table.horizontalHeaderItem(c).text(): self.patient_table.item(row, c).text()
-            for c in range(self.patient_table.columnCount())
-        }
+        load_table(self.patient_table)
+
+    def refresh_patients(self):
+        if self.patient_search.text().strip():
+            self.search_patients(self.patient_search.text().strip())
+        else:
+            refresh_changed(self.patient_table, "Patient", "PatientRegNo")
+
+    def patients_imported(self):
+        self.patient_search.reload_index()
+        self.search_patients(self.patient_search.text().strip())
+
+    def search_patients(self, text):
+        if text:
+            load_table(self.patient_table, *search_sql(text, self.patient_table.model().select_list()))
+        else:
+            self.load_patients()
 
     def add_patient(self):
         dlg = AddPatientDialog()
         if dlg.exec_():
-            self.load_patients()
+            self.patient_saved(dlg)
 
     def edit_patient(self):
-        patient = self.get_selected_patient()
-        if not patient:
+        if not open_selected(self.patient_table, "Patient", "PatientRegNo", self.open_patient):
             QMessageBox.warning(self, "No Selection", "Please select a patient to edit.")
-            return
+
+    def open_patient(self, patient):
         dlg = AddPatientDialog(patient)
         if dlg.exec_():
-            self.load_patients()
+            self.patient_saved(dlg)
 
-    def delete_patient(self):
-        patient = self.get_selected_patient()
-        if not patient:
-            QMessageBox.warning(self, "No Selection", "Please select a patient to delete.")
+    def find_duplicates(self):
+        from dialogs_duplicates import DuplicatesDialog
+        DuplicatesDialog(self).exec_()
+
+    def view_patient_record(self):
+        from dialogs_patient_record import PatientRecordDialog
+        selected = get_selected(self.patient_table)
+        if not selected:
+            QMessageBox.warning(self, "No Selection", "Please select a patient to view.")
             return
-        confirm = QMessageBox.question(self, "Confirm Delete",
-                                       f"Are you sure you want to delete {patient['FirstName']}?",
-                                       QMessageBox.Yes | QMessageBox.No)
-        if confirm == QMessageBox.Yes:
-            conn = get_connection()
-            if conn:
-                cur = conn.cursor()
-                cur.execute("DELETE FROM Patient WHERE PatientRegNo=%s", (patient['PatientRegNo'],))
-                conn.commit()
-                conn.close()
-                self.load_patients()
+        run_task(patient_records.get, selected['PatientID'],
+                 on_done=lambda record: PatientRecordDialog(record, self).exec_(), on_error=show_db_error)
+
+    def patient_saved(self, dlg):
+        values = dlg.saved_values
+        self.patient_search.index.upsert(dlg.saved_key, values['FirstName'], values['LastName'],
+                                         values['PhoneNumber'])
+
+    def delete_patient(self):
+        batch_delete(self, self.patient_table, "Patient", "PatientRegNo", "patient",
+                     lambda p: p['FirstName'], on_deleted=self.patients_deleted)
+
+    def patients_deleted(self, reg_nos):
+        for reg_no in reg_nos:
+            self.patient_search.index.remove(reg_no)
+
+    def batch_edit_patients(self):
+        batch_edit(self, self.patient_table, "Patient", "PatientRegNo", "patient",
+                   {'InsuranceStatus': ENUMS['InsuranceStatus'], 'MaritalStatus': ENUMS['MaritalStatus']})
 
     def employee_page(self):
         page = QWidget()
         layout = QVBoxLayout()
-        self.employee_table = QTableWidget()
-        style_table(self.employee_table)
+        self.employee_table = make_table(watermark_column="ModifiedON", spec=PAGE_COLUMNS['employees'])
+        write_queue.track(self.employee_table)
         layout.addWidget(self.employee_table)
 
         btns = QHBoxLayout()
         for label, slot in [("➕ Add", self.add_employee), ("✏️ Edit", self.edit_employee),
-                            ("🗑️ Delete", self.delete_employee), ("🔁 Refresh", self.load_employees)]:
+                            ("🗑️ Delete", self.delete_employee), ("🧮 Batch Edit", self.batch_edit_employees),
+                            ("🔁 Refresh", self.refresh_employees),
+                            ("📥 Import", lambda: start_import(self, 'employees', self.load_employees)),
+                            ("📤 Export", lambda: start_export(self, 'employees'))]:
             b = QPushButton(label)
             b.setStyleSheet("font-size: 12pt; padding: 6px;")
             b.clicked.connect(slot)
@@ -164,57 +292,34 @@ class HospitalSystem(QWidget):
 
         layout.addLayout(btns)
         page.setLayout(layout)
-        self.load_employees()
+        load_cached(self.employee_table, "EmployeeID")
         return page
 
     def load_employees(self):
-        conn = get_connection()
-        if conn:
-            df = pd.read_sql("SELECT * FROM EmployeeDetails", conn)
-            conn.close()
-            self.employee_table.setRowCount(len(df))
-            self.employee_table.setColumnCount(len(df.columns))
-            self.employee_table.setHorizontalHeaderLabels(df.columns)
-            for row in range(len(df)):
-                for col in range(len(df.columns)):
-                    self.employee_table.setItem(row, col, QTableWidgetItem(str(df.iloc[row, col])))
-
-    def get_selected_employee(self):
-        row = self.employee_table.currentRow()
-        if row < 0:
-            return None
-        return {
-            self.employee_table.horizontalHeaderItem(c).text(): self.employee_table.item(row, c).text()
-            for c in range(self.employee_table.columnCount())
-        }
+        load_table(self.employee_table)
+
+    def refresh_employees(self):
+        refresh_changed(self.employee_table, "EmployeeDetails", "EmployeeID")
 
     def add_employee(self):
-        dlg = AddEmployeeDialog()
-        if dlg.exec_():
-            self.load_employees()
+        AddEmployeeDialog().exec_()
 
     def edit_employee(self):
-        emp = self.get_selected_employee()
-        if not emp:
+        if not open_selected(self.employee_table, "EmployeeDetails", "EmployeeID", self.open_employee):
             QMessageBox.warning(self, "No Selection", "Please select an employee to edit.")
-            return
-        dlg = AddEmployeeDialog(emp)
-        if dlg.exec_():
-            self.load_employees()
+
+    def open_employee(self, emp):
+        AddEmployeeDialog(emp).exec_()
 
     def delete_employee(self):
-        emp = self.get_selected_employee()
-        if not emp:
-            QMessageBox.warning(self, "No Selection", "Please select an employee to delete.")
+        batch_delete(self, self.employee_table, "EmployeeDetails", "EmployeeID", "employee",
+                     lambda e: e['FirstName'])
+
+    def batch_edit_employees(self):
+        if not lookups.ready('Role'):
+            # Opened once the roles have been read: the choices must not be left empty (free text).
+            lookups.get('Role', on_loaded=lambda _: self.batch_edit_employees())
             return
-        confirm = QMessageBox.question(self, "Confirm Delete",
-                                       f"Are you sure you want to delete {emp['FirstName']}?",
-                                       QMessageBox.Yes | QMessageBox.No)
-        if confirm == QMessageBox.Yes:
-            conn = get_connection()
-            if conn:
-                cur = conn.cursor()
-                cur.execute("DELETE FROM EmployeeDetails WHERE EmployeeID=%s", (emp['EmployeeID'],))
-                conn.commit()
-                conn.close()
-                self.load_employees()
\ No newline at end of file
+        batch_edit(self, self.employee_table, "EmployeeDetails", "EmployeeID", "employee",
+                   lambda: {'RoleID': [(role_id, desc) for role_id, desc in lookups.get('Role')]})
+
@@ -1,18 +1,22 @@
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QMessageBox
-import pandas as pd
-from utils import get_connection, style_table
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton
+from batch_ops import batch_delete, batch_edit
+from bulk_export import start_export
+from local_replica import load_cached
+from page_columns import PAGE_COLUMNS
+from table_model import make_table, load_table, refresh_changed
 
 def build_insurance_page():
     page = QWidget()
     layout = QVBoxLayout()
-    table = QTableWidget()
-    style_table(table)
+    table = make_table(watermark_column="ModifiedON", spec=PAGE_COLUMNS['insurance'])
     layout.addWidget(table)
 
     btns = QHBoxLayout()
     for label, slot in [
-        ("🔁 Refresh", lambda: load_insurances(table)),
-        ("🗑️ Delete", lambda: delete_insurance(table))
+        ("🔁 Refresh", lambda: refresh_changed(table, "PatientInsurance", "PatientInsuranceID")),
+        ("🗑️ Delete", lambda: delete_insurance(table)),
+        ("🧮 Batch Edit", lambda: batch_edit_insurance(table)),
+        ("📤 Export", lambda: start_export(table, 'insurance'))
     ]:
         b = QPushButton(label)
         b.setStyleSheet("font-size: 12pt; padding: 6px;")
@@ -21,35 +25,17 @@ def build_insurance_page():
 
     layout.addLayout(btns)
     page.setLayout(layout)
-    load_insurances(table)
+    load_cached(table, "PatientInsuranceID")
     return page
 
 def load_insurances(table):
-    conn = get_connection()
-    if conn:
-        df = pd.read_sql("SELECT * FROM PatientInsurance", conn)
-        conn.close()
-        table.setRowCount(len(df))
-        table.setColumnCount(len(df.columns))
-        table.setHorizontalHeaderLabels(df.columns)
-        for row in range(len(df)):
-            for col in range(len(df.columns)):
-                table.setItem(row, col, QTableWidgetItem(str(df.iloc[row, col])))
+    load_table(table)
 
 def delete_insurance(table):
-    row = table.currentRow()
-    if row < 0:
-        QMessageBox.warning(None, "No Selection", "Select an insurance to delete.")
-        return
-    insurance_id = table.item(row, 0).text()
-    confirm = QMessageBox.question(None, "Confirm Delete",
-                                   f"Delete insurance ID {insurance_id}?",
-                                   QMessageBox.Yes | QMessageBox.No)
-    if confirm == QMessageBox.Yes:
-        conn = get_connection()
-        if conn:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM PatientInsurance WHERE PatientInsuranceID=%s", (insurance_id,))
-            conn.commit()
-            conn.close()
-            load_insurances(table)
\ No newline at end of file
+    batch_delete(None, table, "PatientInsurance", "PatientInsuranceID", "insurance",
+                 lambda i: f"insurance ID {i['PatientInsuranceID']}")
+
+def batch_edit_insurance(table):
+    batch_edit(None, table, "PatientInsurance", "PatientInsuranceID", "insurance",
+               {'IsCurrent': [(1, "Current"), (0, "Not current")]})
+
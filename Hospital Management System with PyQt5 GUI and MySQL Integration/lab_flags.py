@@ -0,0 +1,184 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pymysql.cursors
+
+from lookups import lookups
+from utils import get_connection
+
+SCAN_CHUNK = 200000        # report rows pulled and flagged per step of a full scan
+CRITICAL_MARGIN = 0.5      # beyond the limit by this fraction of the reference range -> critical
+RESCAN_CHUNK = 1000        # edited reports re-read per statement by a scan
+
+SCAN_SQL = ("SELECT PatientLabReportID, LabTestID, TestValue FROM PatientLabReport "
+            "WHERE PatientLabReportID > %s ORDER BY PatientLabReportID")
+RESCAN_SQL = "SELECT PatientLabReportID, LabTestID, TestValue FROM PatientLabReport WHERE PatientLabReportID IN (%s)"
+
+UNPARSED, NORMAL, LOW, HIGH, CRITICAL_LOW, CRITICAL_HIGH = -1, 0, 1, 2, 3, 4
+FLAG_LABELS = {UNPARSED: "", NORMAL: "Normal", LOW: "Low", HIGH: "High",
+               CRITICAL_LOW: "Critical low", CRITICAL_HIGH: "Critical high"}
+FLAG_COLORS = {LOW: "#fff3cd", HIGH: "#fff3cd", CRITICAL_LOW: "#f8d7da", CRITICAL_HIGH: "#f8d7da"}
+
+NUMBER = r"(-?\d+(?:\.\d+)?)"
+
+
+def parse_values(values):
+    # Plain numbers go through one to_numeric call; only the leftovers ("5.2 mg/dL", "<0.1")
+    # pay for the regex. Anything else stays NaN and is left unflagged.
+    series = pd.Series(values, dtype=object)
+    numbers = pd.to_numeric(series, errors='coerce')
+    missing = numbers.isna() & series.notna()
+    if missing.any():
+        extracted = series[missing].astype(str).str.extract(NUMBER, expand=False)
+        numbers[missing] = pd.to_numeric(extracted, errors='coerce')
+    return numbers.to_numpy(dtype=float)
+
+
+def range_arrays(lab_tests):
+    # LabTestID -> min/max as dense arrays, so the "join" is a single fancy-index per chunk.
+    size = max((row[0] for row in lab_tests), default=0) + 1
+    low = np.full(size, np.nan)
+    high = np.full(size, np.nan)
+    for test_id, _, min_value, max_value, _ in lab_tests:
+        low[test_id] = float(min_value)
+        high[test_id] = float(max_value)
+    return low, high
+
+
+def compute_flags(test_ids, values, low, high):
+    test_ids = np.asarray(test_ids, dtype=np.int64)
+    known = (test_ids >= 0) & (test_ids < len(low))
+    lo = np.where(known, low[np.where(known, test_ids, 0)], np.nan)
+    hi = np.where(known, high[np.where(known, test_ids, 0)], np.nan)
+    value = parse_values(values)
+    margin = (hi - lo) * CRITICAL_MARGIN
+    with np.errstate(invalid='ignore'):
+        return np.select(
+            [np.isnan(value) | np.isnan(lo),
+             value < lo - margin, value > hi + margin, value < lo, value > hi],
+            [UNPARSED, CRITICAL_LOW, CRITICAL_HIGH, LOW, HIGH],
+            default=NORMAL).astype(np.int8)
+
+
+class LabFlagCache:
+    # Flags keyed by PatientLabReportID. A report's flag depends only on its own value and its
+    # test's range, so each row is checked once; a change to the LabTest ranges clears everything.
+    # Saves and grid edits of a report invalidate it: it is flagged again when next shown, and the
+    # next scan re-reads it although it lies below scanned_upto.
+    def __init__(self):
+        self._flags = {}
+        self._stale = set()
+        self._ranges = None
+        self._tests = None
+        self.scanned_upto = 0
+        self._lock = threading.Lock()
+
+    def current_ranges(self):
+        tests = lookups.get('LabTest')
+        with self._lock:
+            if tests != self._tests:
+                self._tests = list(tests)
+                self._ranges = range_arrays(self._tests)
+                self._flags.clear()
+                self._stale.clear()
+                self.scanned_upto = 0
+            return self._ranges
+
+    def flag(self, report_ids, test_ids, values):
+        low, high = self.current_ranges()
+        with self._lock:
+            todo = [i for i, report_id in enumerate(report_ids) if report_id not in self._flags]
+        if todo:
+            codes = compute_flags([test_ids[i] for i in todo], [values[i] for i in todo], low, high)
+            with self._lock:
+                self._flags.update(zip((report_ids[i] for i in todo), codes.tolist()))
+        with self._lock:
+            return [self._flags.get(report_id, UNPARSED) for report_id in report_ids]
+
+    def store(self, report_ids, codes):
+        with self._lock:
+            self._flags.update(zip(report_ids, codes))
+            if report_ids:
+                self.scanned_upto = max(self.scanned_upto, max(report_ids))
+
+    def invalidate(self, report_ids=None):
+        with self._lock:
+            if report_ids is None:
+                self._flags.clear()
+                self._stale.clear()
+                self.scanned_upto = 0
+            else:
+                for report_id in map(int, report_ids):
+                    self._flags.pop(report_id, None)
+                    if report_id <= self.scanned_upto:
+                        self._stale.add(report_id)
+
+    def take_stale(self):
+        with self._lock:
+            stale, self._stale = sorted(self._stale), set()
+        return stale
+
+    def counts(self):
+        with self._lock:
+            codes = np.fromiter(self._flags.values(), dtype=np.int8, count=len(self._flags))
+        return {code: int((codes == code).sum()) for code in FLAG_LABELS}
+
+
+flags = LabFlagCache()
+
+
+def flag_rows(columns, rows):
+    if not rows:
+        return []
+    report_col = columns.index('PatientLabReportID')
+    test_col = columns.index('LabTestID')
+    value_col = columns.index('TestValue')
+    return flags.flag([r[report_col] for r in rows], [r[test_col] for r in rows], [r[value_col] for r in rows])
+
+
+def scan_reports(chunk_size=SCAN_CHUNK, progress=None):
+    # Only reports above the last scanned ID are read, plus those edited since they were scanned,
+    # so a repeat scan costs as much as the new and changed rows.
+    low, high = flags.current_ranges()
+    started = time.perf_counter()
+    scanned = 0
+    conn = get_connection()
+    if not conn:
+        raise ConnectionError("Could not connect to the database.")
+    try:
+        cur = conn.cursor()
+        stale = flags.take_stale()
+        for start in range(0, len(stale), RESCAN_CHUNK):
+            chunk = stale[start:start + RESCAN_CHUNK]
+            cur.execute(RESCAN_SQL.replace("%s", ", ".join(["%s"] * len(chunk))), chunk)
+            rows = cur.fetchall()
+            if rows:
+                report_ids, test_ids, values = zip(*rows)
+                flags.store(report_ids, compute_flags(test_ids, values, low, high).tolist())
+            scanned += len(rows)
+        cur = conn.cursor(pymysql.cursors.SSCursor)
+        cur.execute(SCAN_SQL, (flags.scanned_upto,))
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            report_ids, test_ids, values = zip(*rows)
+            flags.store(report_ids, compute_flags(test_ids, values, low, high).tolist())
+            scanned += len(rows)
+            if progress:
+                progress(scanned)
+    except Exception:
+        conn.discard()
+        raise
+    conn.close()
+    return {'scanned': scanned, 'elapsed': time.perf_counter() - started, 'counts': flags.counts()}
+
+
+def summary(result):
+    counts = result['counts']
+    abnormal = sum(counts[c] for c in (LOW, HIGH, CRITICAL_LOW, CRITICAL_HIGH))
+    return (f"{result['scanned']:,} new reports checked in {result['elapsed']:.1f} s.\n"
+            f"{abnormal:,} abnormal: {counts[LOW]:,} low, {counts[HIGH]:,} high, "
+            f"{counts[CRITICAL_LOW] + counts[CRITICAL_HIGH]:,} critical.")
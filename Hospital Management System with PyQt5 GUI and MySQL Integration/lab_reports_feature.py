@@ -1,18 +1,83 @@
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QMessageBox
-import pandas as pd
-from utils import get_connection, style_table
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QMessageBox
+from batch_ops import batch_delete, batch_edit
+from bulk_export import start_export
+from bulk_import import start_import
+from lookups import lookups
+from page_columns import PAGE_COLUMNS
+from paging import KeysetPager, make_pager_bar
+from table_model import RowTableModel, make_table
+from workers import run_task, show_db_error
+
+
+class LabReportModel(RowTableModel):
+    # Raw PatientLabReport rows plus a computed Flag column, coloured when out of range.
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.colors = {}
+        self._awaiting_ranges = False
+
+    def set_rows(self, columns, rows):
+        self.colors = {}
+        super().set_rows(list(columns) + ["Flag"], self._with_flags(columns, rows))
+
+    def append_rows(self, rows):
+        super().append_rows(self._with_flags(self.columns[:-1], rows))
+
+    def patch_rows(self, key_column, rows):
+        super().patch_rows(key_column, self._with_flags(self.columns[:-1], rows))
+
+    def _with_flags(self, columns, rows):
+        if not rows:
+            return []
+        # lab_flags brings pandas with it, so it loads with the first rows to flag rather than with
+        # this module (which the patient record window imports too).
+        if not lookups.ready('LabTest'):
+            # The reference ranges are still being read, which the GUI thread doesn't wait for:
+            # the rows are flagged once they are in.
+            if not self._awaiting_ranges:
+                self._awaiting_ranges = True
+                lookups.get('LabTest', on_loaded=lambda _: self._reflag())
+            return [tuple(r) + ("",) for r in rows]
+        from lab_flags import FLAG_LABELS, FLAG_COLORS, flag_rows
+        codes = flag_rows(list(columns), rows)
+        report_col = list(columns).index('PatientLabReportID')
+        self.colors.update((r[report_col], FLAG_COLORS.get(c)) for r, c in zip(rows, codes))
+        return [tuple(r) + (FLAG_LABELS[c],) for r, c in zip(rows, codes)]
+
+    def _reflag(self):
+        self._awaiting_ranges = False
+        if not self.rows:
+            return
+        self.colors = {}
+        self.rows = self._with_flags(self.columns[:-1], [r[:-1] for r in self.rows])
+        self.dataChanged.emit(self.index(0, 0), self.index(self.rowCount() - 1, len(self.columns) - 1))
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.BackgroundRole and index.isValid():
+            report_id = self.rows[index.row()][self.columns.index('PatientLabReportID')]
+            color = self.colors.get(report_id)
+            return QColor(color) if color else None
+        return super().data(index, role)
+
 
 def build_lab_reports_page():
     page = QWidget()
     layout = QVBoxLayout()
-    table = QTableWidget()
-    style_table(table)
+    table = make_table(spec=PAGE_COLUMNS['lab_reports'], model_class=LabReportModel)
+    table.pager = KeysetPager(table, "PatientLabReport", "PatientLabReportID")
     layout.addWidget(table)
+    layout.addLayout(make_pager_bar(table.pager))
 
     btns = QHBoxLayout()
     for label, slot in [
         ("🔁 Refresh", lambda: load_lab_reports(table)),
-        ("🗑️ Delete", lambda: delete_lab_report(table))
+        ("🗑️ Delete", lambda: delete_lab_report(table)),
+        ("🧮 Batch Edit", lambda: batch_edit_lab_reports(table)),
+        ("⚠️ Check Ranges", lambda: check_ranges(table)),
+        ("📥 Import", lambda: start_import(table, 'lab_results', lambda: load_lab_reports(table))),
+        ("📤 Export", lambda: start_export(table, 'lab_reports'))
     ]:
         b = QPushButton(label)
         b.setStyleSheet("font-size: 12pt; padding: 6px;")
@@ -25,31 +90,21 @@ def build_lab_reports_page():
     return page
 
 def load_lab_reports(table):
-    conn = get_connection()
-    if conn:
-        df = pd.read_sql("SELECT * FROM PatientLabReport", conn)
-        conn.close()
-        table.setRowCount(len(df))
-        table.setColumnCount(len(df.columns))
-        table.setHorizontalHeaderLabels(df.columns)
-        for row in range(len(df)):
-            for col in range(len(df.columns)):
-                table.setItem(row, col, QTableWidgetItem(str(df.iloc[row, col])))
+    table.pager.refresh_estimate()
+    table.pager.reload()
 
 def delete_lab_report(table):
-    row = table.currentRow()
-    if row < 0:
-        QMessageBox.warning(None, "No Selection", "Select a lab report to delete.")
-        return
-    report_id = table.item(row, 0).text()
-    confirm = QMessageBox.question(None, "Confirm Delete",
-                                   f"Delete lab report ID {report_id}?",
-                                   QMessageBox.Yes | QMessageBox.No)
-    if confirm == QMessageBox.Yes:
-        conn = get_connection()
-        if conn:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM PatientLabReport WHERE PatientLabReportID=%s", (report_id,))
-            conn.commit()
-            conn.close()
-            load_lab_reports(table)
\ No newline at end of file
+    batch_delete(None, table, "PatientLabReport", "PatientLabReportID", "lab report",
+                 lambda r: f"lab report ID {r['PatientLabReportID']}")
+
+def batch_edit_lab_reports(table):
+    batch_edit(None, table, "PatientLabReport", "PatientLabReportID", "lab report", {'Comment': None})
+
+def check_ranges(table):
+    from lab_flags import scan_reports, summary
+
+    def done(result):
+        table.viewport().update()
+        QMessageBox.information(None, "Lab Range Check", summary(result))
+
+    run_task(scan_reports, on_done=done, on_error=show_db_error)
@@ -0,0 +1,275 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+import pymysql.cursors
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+import utils
+from config import POOL_CONFIG, REPLICA_CONFIG
+from migrate import migration_columns, migration_indexes
+from page_columns import select_sql
+from query_stats import instrument
+from sqlite_standin import StandinConnection, StandinCursor, StandinPool, add_functions, schema_statements, translate
+from table_model import load_table, refresh_changed
+from utils import PoolTimeout, get_pool
+from workers import run_task, start_load
+
+# Tables copied to the local replica as (table, key, watermark). Tables with a ModifiedON column
+# are pulled incrementally; the rest are small and copied whole on every sync.
+REPLICATED = [
+    ('Patient', 'PatientID', 'ModifiedON'),
+    ('EmployeeDetails', 'EmployeeDetailsID', 'ModifiedON'),
+    ('PatientInsurance', 'PatientInsuranceID', 'ModifiedON'),
+    ('Disease', 'DiseaseID', None),
+]
+SYNC_BATCH = 2000
+READ_SQL = re.compile(r"\s*(?:\(\s*)*(?:SELECT|WITH|EXPLAIN)\b", re.I)
+META_SQL = "CREATE TABLE IF NOT EXISTS replica_meta (TableName TEXT PRIMARY KEY, SyncedAt DATETIME, RowCount INTEGER)"
+
+
+class OfflineError(Exception):
+    pass
+
+
+class ReplicaCursor(StandinCursor):
+    # Reads only: anything else is refused up front with a message the dialogs can show as is.
+    def execute(self, sql, params=None):
+        if not READ_SQL.match(sql):
+            raise OfflineError("The database can't be reached; changes can't be saved while offline.")
+        try:
+            return super().execute(sql, params)
+        except sqlite3.OperationalError as e:
+            missing = re.match(r"no such table: (\w+)", str(e))
+            if missing:
+                raise OfflineError(f"{missing.group(1)} is not available offline.") from e
+            raise
+
+    def executemany(self, sql, rows):
+        raise OfflineError("The database can't be reached; changes can't be saved while offline.")
+
+
+class ReplicaConnection(StandinConnection):
+    def __init__(self, path):
+        super().__init__(path, read_only=True)
+
+    def cursor(self, cursor_class=None):
+        return ReplicaCursor(self._conn)
+
+
+class ReplicaPool(StandinPool):
+    def _connect(self):
+        conn = ReplicaConnection(self.config['path'])
+        self._count('creates')
+        return conn
+
+
+def replica_schema():
+    # The app's own DDL for the replicated tables, without foreign keys (their targets aren't copied)
+    # and without the ModifiedON triggers: the replica keeps the server's timestamps.
+    names = {table for table, _, _ in REPLICATED}
+    statements = [META_SQL]
+    for statement in schema_statements() + migration_columns() + migration_indexes():
+        match = re.match(r"(CREATE TABLE|CREATE INDEX|ALTER TABLE) (\w+)(?: ON (\w+))?", statement)
+        if not match or (match.group(3) or match.group(2)) not in names:
+            continue
+        kind = match.group(1)
+        if kind == "ALTER TABLE":
+            statements.append(translate(statement))
+            continue
+        statement = "\n".join(line for line in statement.split("\n") if "FOREIGN KEY" not in line)
+        statement = re.sub(r",(\s*\))$", r"\1", statement)
+        statements.append(statement.replace(f"{kind} ", f"{kind} IF NOT EXISTS ", 1))
+    return statements
+
+
+def sync_sql(table, key, watermark, columns):
+    # The statements a sync reads the server with: every row, rows changed since a watermark,
+    # the row count and every key.
+    select = f"SELECT {', '.join(f'`{c}`' for c in columns)} FROM {table}"
+    return {'all': select, 'since': f"{select} WHERE {watermark} >= %s", 'count': f"SELECT COUNT(*) FROM {table}",
+            'keys': f"SELECT {key} FROM {table}"}
+
+
+def _sync_table(remote, local, table, key, watermark):
+    columns = [row[1] for row in local.execute(f"PRAGMA table_info({table})")]
+    sql = sync_sql(table, key, watermark, columns)
+    since = local.execute(f"SELECT MAX({watermark}) FROM {table}").fetchone()[0] if watermark else None
+    cur = remote.cursor(pymysql.cursors.SSCursor)
+    if since is None:
+        local.execute(f"DELETE FROM {table}")
+        cur.execute(sql['all'])
+    else:
+        cur.execute(sql['since'], (since,))
+    insert = f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    changed = 0
+    while True:
+        rows = cur.fetchmany(SYNC_BATCH)
+        if not rows:
+            break
+        local.executemany(insert, rows)
+        changed += len(rows)
+    cur.close()
+
+    # Deletions leave no watermark behind. Once the upsert above has run the replica holds every
+    # server row, so a count mismatch means rows were deleted; only then are the keys compared.
+    cur = remote.cursor()
+    cur.execute(sql['count'])
+    total = cur.fetchone()[0]
+    removed = 0
+    if local.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] != total:
+        local.execute("CREATE TEMP TABLE IF NOT EXISTS replica_keys (Id INTEGER PRIMARY KEY)")
+        local.execute("DELETE FROM replica_keys")
+        cur = remote.cursor(pymysql.cursors.SSCursor)
+        cur.execute(sql['keys'])
+        while True:
+            rows = cur.fetchmany(SYNC_BATCH)
+            if not rows:
+                break
+            local.executemany("INSERT INTO replica_keys VALUES (?)", rows)
+        cur.close()
+        removed = local.execute(f"DELETE FROM {table} WHERE {key} NOT IN (SELECT Id FROM replica_keys)").rowcount
+    local.execute("INSERT OR REPLACE INTO replica_meta VALUES (?, ?, ?)", (table, datetime.now(), total))
+    local.commit()
+    return {'changed': changed, 'removed': removed, 'rows': total}
+
+
+class LocalReplica(QObject):
+    # True when the app switched to the replica because MySQL is unreachable, False when it is back.
+    mode_changed = pyqtSignal(bool)
+    synced = pyqtSignal(object)
+
+    def __init__(self, config=REPLICA_CONFIG):
+        super().__init__()
+        self.path = config['path']
+        self.interval_ms = config['sync_interval_ms']
+        self.offline = False
+        self.synced_at = {}
+        self._pool = None
+        self._lock = threading.Lock()
+        self._syncing = False
+        self._timer = None
+
+    def start(self):
+        # Reads fall back to the replica from here on; the timer keeps it current and, while
+        # offline, is what notices the server is back.
+        self._read_meta()
+        utils.set_fallback(self)
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.sync)
+        self._timer.start(self.interval_ms)
+        self.sync()
+
+    def _read_meta(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            try:
+                self.synced_at = {table: datetime.fromisoformat(at)
+                                  for table, at in conn.execute("SELECT TableName, SyncedAt FROM replica_meta")}
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print("Replica Error:", e)
+
+    def has(self, table):
+        return table in self.synced_at
+
+    def last_synced(self):
+        return min(self.synced_at.values()) if self.synced_at else None
+
+    def connect(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ReplicaPool(self.path, **POOL_CONFIG)
+        return self._pool.acquire()
+
+    def reader(self):
+        try:
+            return instrument(self.connect())
+        except Exception as e:
+            print("Replica Error:", e)
+            return None
+
+    def go_offline(self, error):
+        # Called from get_connection() when MySQL can't be reached. An exhausted pool is not an
+        # outage, and without a replica there is nothing to fall back to.
+        if isinstance(error, PoolTimeout) or not self.synced_at:
+            return False
+        if not self.offline:
+            self.offline = True
+            self.mode_changed.emit(True)
+        return True
+
+    def _go_online(self):
+        if self.offline:
+            self.offline = False
+            self.mode_changed.emit(False)
+
+    def sync(self):
+        if self._syncing:
+            return
+        self._syncing = True
+        run_task(self.pull, on_done=self._synced, on_error=self._sync_failed)
+
+    def _synced(self, result):
+        self._syncing = False
+        if result is not None:
+            self.synced.emit(result)
+
+    def _sync_failed(self, message):
+        self._syncing = False
+        print("Replica Error:", message)
+
+    def pull(self):
+        try:
+            remote = instrument(get_pool().acquire())
+        except Exception as e:
+            print("Connection Error:", e)
+            self.go_offline(e)
+            return None
+        local = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES)
+        add_functions(local)
+        local.execute("PRAGMA journal_mode=WAL")
+        try:
+            for statement in replica_schema():
+                try:
+                    local.execute(statement)
+                except sqlite3.OperationalError as e:
+                    # Columns added by migrations have no IF NOT EXISTS; a replica made earlier has them.
+                    if "duplicate column" not in str(e):
+                        raise
+            result = {table: _sync_table(remote, local, table, key, watermark)
+                      for table, key, watermark in REPLICATED}
+        except Exception:
+            remote.discard()
+            raise
+        finally:
+            local.close()
+        remote.close()
+        self.synced_at.update({table: datetime.now() for table in result})
+        self._go_online()
+        return result
+
+
+replica = LocalReplica()
+
+
+def load_cached(table, key_column):
+    # Shows the replica's copy straight away, then brings it up to date from MySQL: only rows with
+    # a newer ModifiedON where the page tracks one, otherwise a full reload.
+    model = table.model()
+    source = model.spec['table']
+    if replica.offline or not replica.has(source):
+        load_table(table)
+        return
+
+    def catch_up(_total):
+        if not replica.offline:
+            refresh_changed(table, source, key_column)
+
+    start_load(table, select_sql(model.spec), on_columns=model.begin_stream, on_chunk=model.append_rows,
+               on_done=catch_up, on_error=lambda _: load_table(table), connect=replica.reader)
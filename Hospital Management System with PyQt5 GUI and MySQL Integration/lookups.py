@@ -0,0 +1,109 @@
+import threading
+import time
+
+from utils import db_connection
+from workers import run_task
+
+MAX_AGE = 600   # seconds before a cached table is re-read even without an explicit invalidation
+
+LOOKUP_QUERIES = {
+    'Role': "SELECT RoleID, RoleDesc FROM Role",
+    'Department': "SELECT DepartmentID, DepartmentName FROM Department",
+    'LabTest': "SELECT LabTestID, TestName, `MinValue`, `MaxValue`, CalcUnit FROM LabTest",
+    'Disease': "SELECT DiseaseID, Name, Severity FROM Disease",
+}
+
+
+class LookupCache:
+    # Small, rarely written reference tables kept in memory; warm() reads them at startup, off the
+    # GUI thread. get() never waits for MySQL on the GUI thread: before a table is cached it answers
+    # empty and passes the rows to on_loaded once a worker has read them. After that it always
+    # answers from memory: a copy that writers invalidated, or that is older than MAX_AGE to catch
+    # changes made outside this app, is returned as is while a worker re-reads it.
+    def __init__(self, queries=LOOKUP_QUERIES, max_age=MAX_AGE):
+        self.queries = queries
+        self.max_age = max_age
+        self._entries = {}
+        self._versions = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'stale': 0, 'invalidations': 0}
+
+    def get(self, name, on_loaded=None):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                self._counters['misses'] += 1
+            elif time.monotonic() - entry[0] < self.max_age:
+                self._counters['hits'] += 1
+                return entry[1]
+            else:
+                self._counters['stale'] += 1
+                stale_refresh = name not in self._refreshing
+                self._refreshing.add(name)
+        if entry is None:
+            if threading.current_thread() is not threading.main_thread():
+                return self.refresh(name) or []
+            run_task(lambda: self.refresh(name) or [], on_done=on_loaded,
+                     on_error=lambda message: print("Lookup Error:", message))
+            return []
+        if stale_refresh:
+            run_task(self.refresh, name, on_error=lambda message: print("Lookup Error:", message))
+        return entry[1]
+
+    def refresh(self, name):
+        with self._lock:
+            self._refreshing.add(name)
+            version = self._versions.get(name, 0)
+        try:
+            rows = self._fetch(name)
+        finally:
+            with self._lock:
+                self._refreshing.discard(name)
+        if rows is not None:
+            with self._lock:
+                # Invalidated while reading: keep the rows but leave them stale so they are read again.
+                fresh = self._versions.get(name, 0) == version
+                self._entries[name] = (time.monotonic() if fresh else float('-inf'), rows)
+        return rows
+
+    def ready(self, name):
+        with self._lock:
+            return name in self._entries
+
+    def invalidate(self, name=None):
+        with self._lock:
+            self._counters['invalidations'] += 1
+            for key in (list(self._entries) if name is None else [name]):
+                self._versions[key] = self._versions.get(key, 0) + 1
+                if key in self._entries:
+                    self._entries[key] = (float('-inf'), self._entries[key][1])
+
+    def warm(self):
+        for name in self.queries:
+            self.refresh(name)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, cached=sorted(self._entries))
+
+    def _fetch(self, name):
+        with db_connection() as conn:
+            if not conn:
+                return None
+            cur = conn.cursor()
+            cur.execute(self.queries[name])
+            return list(cur.fetchall())
+
+
+lookups = LookupCache()
+
+
+def invalidate_lookup(name):
+    # Mark the copy stale now and re-read it off the GUI thread; dialogs opened meanwhile use the old rows.
+    lookups.invalidate(name)
+    run_task(lookups.refresh, name, on_error=lambda message: print("Lookup Error:", message))
+
+
+def lookup_stats():
+    return lookups.stats()
@@ -1,10 +1,60 @@
+import argparse
 import sys
+import time
+
+_started = time.perf_counter()
+from PyQt5.QtCore import QObject, QEvent, QTimer
 from PyQt5.QtWidgets import QApplication
 from hospital_app import HospitalSystem
+_imported = time.perf_counter()
+
+
+class FirstPaintProbe(QObject):
+    def __init__(self, app, timings):
+        super().__init__()
+        self.app = app
+        self.timings = timings
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and 'first_paint' not in self.timings:
+            self.timings['first_paint'] = time.perf_counter()
+            QTimer.singleShot(0, self.report)
+        return False
+
+    def report(self):
+        from lookups import lookup_stats
+        from utils import pool_stats
+        t = self.timings
+        print("Startup profile (ms):")
+        print(f"  imports       {1000 * (_imported - _started):8.1f}")
+        print(f"  construction  {1000 * (t['constructed'] - t['app']):8.1f}")
+        print(f"  first paint   {1000 * (t['first_paint'] - t['shown']):8.1f}")
+        print(f"  total         {1000 * (t['first_paint'] - _started):8.1f}")
+        print("  pool:", pool_stats())
+        print("  lookups:", lookup_stats())
+        self.app.quit()
 
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="Hospital Management System")
+    parser.add_argument('--profile-startup', action='store_true', help="print where start-up time goes and quit")
+    parser.add_argument('--service', metavar='URL',
+                        help="talk to hms_service.py instead of straight to MySQL (default: SERVICE_CONFIG['url'])")
+    # Anything else (-style, -platform, ...) is left for Qt.
+    args, qt_args = parser.parse_known_args()
+    from config import SERVICE_CONFIG
+    if args.service:
+        SERVICE_CONFIG['url'] = args.service
+    if SERVICE_CONFIG['url']:
+        from service_client import use_service
+        use_service(SERVICE_CONFIG['url'], SERVICE_CONFIG['token'])
+    app = QApplication(sys.argv[:1] + qt_args)
+    timings = {'app': time.perf_counter()}
     win = HospitalSystem()
+    timings['constructed'] = time.perf_counter()
+    if args.profile_startup:
+        probe = FirstPaintProbe(app, timings)
+        win.installEventFilter(probe)
     win.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    timings['shown'] = time.perf_counter()
+    sys.exit(app.exec_())
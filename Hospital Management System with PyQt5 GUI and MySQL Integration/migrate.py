@@ -0,0 +1,126 @@
+import argparse
+import os
+import re
+import sqlite3
+import sys
+
+import pymysql
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+VERSION_SQL = """
+    CREATE TABLE IF NOT EXISTS SchemaVersion (
+        Version INT PRIMARY KEY,
+        Name VARCHAR(100) NOT NULL,
+        AppliedON DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+# MySQL errors for ADD COLUMN / CREATE INDEX on a name that already exists, DROP INDEX on one that does not
+DUPLICATE_COLUMN_NAME = 1060
+DUPLICATE_KEY_NAME = 1061
+CANT_DROP_KEY = 1091
+
+
+def migrations(directory=MIGRATIONS_DIR):
+    # NNNN_name.sql, applied in version order on top of HospitalManagementSystemDATABASE.sql.
+    found = []
+    for name in os.listdir(directory):
+        match = re.match(r"(\d+)_(\w+)\.sql$", name)
+        if match:
+            found.append((int(match.group(1)), match.group(2), os.path.join(directory, name)))
+    return sorted(found)
+
+
+def statements(path):
+    with open(path, encoding="utf-8") as f:
+        script = "\n".join(line for line in f if not line.lstrip().startswith("--"))
+    return [s.strip() for s in script.split(";") if s.strip()]
+
+
+def migration_indexes():
+    # The CREATE INDEX of every index the migrations leave in place (added and not dropped again),
+    # for copies of the schema such as the local replica.
+    indexes = {}
+    for _, _, path in migrations():
+        for statement in statements(path):
+            match = re.match(r"(CREATE|DROP) INDEX (\w+)", statement, re.I)
+            if match and match.group(1).upper() == "CREATE":
+                indexes[match.group(2)] = statement
+            elif match:
+                indexes.pop(match.group(2), None)
+    return list(indexes.values())
+
+
+def migration_columns():
+    # The ALTER TABLE ... ADD COLUMN of every column the migrations add, for the same copies.
+    return [statement for _, _, path in migrations() for statement in statements(path)
+            if re.match(r"ALTER TABLE \w+ ADD COLUMN ", statement, re.I)]
+
+
+def _already_exists(error):
+    # A migration interrupted half way (MySQL commits each DDL statement) can simply be run again.
+    if isinstance(error, pymysql.err.OperationalError):
+        return error.args[0] in (DUPLICATE_COLUMN_NAME, DUPLICATE_KEY_NAME, CANT_DROP_KEY)
+    return isinstance(error, sqlite3.OperationalError) and ("already exists" in str(error)
+                                                            or "duplicate column" in str(error))
+
+
+def applied_versions(conn):
+    cur = conn.cursor()
+    cur.execute(VERSION_SQL)
+    cur.execute("SELECT Version FROM SchemaVersion")
+    return {row[0] for row in cur.fetchall()}
+
+
+def migrate(conn, target=None, progress=print):
+    done = applied_versions(conn)
+    applied = []
+    for version, name, path in migrations():
+        if version in done or (target is not None and version > target):
+            continue
+        cur = conn.cursor()
+        for statement in statements(path):
+            try:
+                cur.execute(statement)
+            except Exception as e:
+                if not _already_exists(e):
+                    conn.rollback()
+                    raise RuntimeError(f"Migration {version:04d}_{name} failed on:\n{statement}\n{e}") from e
+        cur.execute("INSERT INTO SchemaVersion (Version, Name) VALUES (%s, %s)", (version, name))
+        conn.commit()
+        applied.append(version)
+        if progress:
+            progress(f"Applied {version:04d}_{name}")
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument('--sqlite', metavar='PATH', help="migrate a local SQLite stand-in instead of MySQL")
+    parser.add_argument('--to', type=int, metavar='VERSION', help="stop after this version")
+    parser.add_argument('--status', action='store_true', help="list migrations and whether they are applied")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        from sqlite_standin import use_sqlite
+        use_sqlite(args.sqlite, create=False)
+    from utils import get_pool
+    conn = get_pool().acquire()
+    try:
+        if args.status:
+            done = applied_versions(conn)
+            for version, name, _ in migrations():
+                print(f"{version:04d}_{name:<40}{'applied' if version in done else 'pending'}")
+            return 0
+        applied = migrate(conn, args.to)
+        if not applied:
+            print("Schema is up to date.")
+    except Exception as e:
+        conn.discard()
+        print("Migration Error:", e)
+        return 1
+    conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,27 @@
+-- Indexes for how the app actually reads; plan_check.py shows which statements use each one.
+
+-- Catch-up loads and replica syncs read WHERE ModifiedON >= <last sync>
+CREATE INDEX idx_patient_modified ON Patient (ModifiedON);
+CREATE INDEX idx_empdetails_modified ON EmployeeDetails (ModifiedON);
+CREATE INDEX idx_insurance_modified ON PatientInsurance (ModifiedON);
+
+-- Date-range exports (bulk_export.py --from/--to)
+CREATE INDEX idx_patient_created ON Patient (CreatedON);
+CREATE INDEX idx_empdetails_joining ON EmployeeDetails (DateOfJoining);
+CREATE INDEX idx_insurance_start ON PatientInsurance (StartDate);
+CREATE INDEX idx_register_admitted ON PatientRegister (AdmittedON);
+
+-- A patient's current policy. It leads with the foreign key column, so MySQL drops the implicit
+-- foreign key index for it.
+CREATE INDEX idx_insurance_patient_current ON PatientInsurance (PatientID, IsCurrent);
+
+-- Patients page search: prefix LIKEs on each name (Reg No has its UNIQUE key)
+CREATE INDEX idx_patient_name ON Patient (LastName, FirstName);
+CREATE INDEX idx_patient_first_name ON Patient (FirstName);
+
+-- Dashboard: current admissions and occupied rooms (DischargeON IS NULL), labs taken today
+CREATE INDEX idx_register_discharge ON PatientRegister (DischargeON, RoomNumber);
+CREATE INDEX idx_labreport_date ON PatientLabReport (DateOfTest);
+
+-- Room-booking overlap check: the stays of one room
+CREATE INDEX idx_register_room ON PatientRegister (RoomNumber, AdmittedON);
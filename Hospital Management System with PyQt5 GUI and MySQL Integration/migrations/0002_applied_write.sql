@@ -0,0 +1,8 @@
+-- Idempotency keys of queued dialog saves already applied (write_queue.py), so a save retried
+-- after a lost commit acknowledgement is not applied twice. Keys older than the write queue's
+-- keep_days are purged by AppliedON.
+CREATE TABLE IF NOT EXISTS AppliedWrite (
+    WriteKey CHAR(36) PRIMARY KEY,
+    AppliedON DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_appliedwrite_date ON AppliedWrite (AppliedON);
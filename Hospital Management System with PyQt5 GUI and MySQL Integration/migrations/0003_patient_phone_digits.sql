@@ -0,0 +1,5 @@
+-- Patients page search: phones are matched on their digits, as the type-ahead index does, so
+-- "010-1234" and "(010) 1234" find the same patient. The column is computed, so no save changes,
+-- and INVISIBLE keeps it out of SELECT * (exports, the edit dialogs). Needs MySQL 8.0.23 or later.
+ALTER TABLE Patient ADD COLUMN PhoneDigits VARCHAR(20) AS (REGEXP_REPLACE(PhoneNumber, '[^0-9]', '')) VIRTUAL INVISIBLE;
+CREATE INDEX idx_patient_phone_digits ON Patient (PhoneDigits);
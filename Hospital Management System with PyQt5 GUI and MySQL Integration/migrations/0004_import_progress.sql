@@ -0,0 +1,12 @@
+-- Checkpoints of interrupted bulk imports (bulk_import.py). Each batch moves its file's row here
+-- in the same transaction as its inserts, so a resumed import never replays a committed batch.
+-- The row is deleted once the file has been read to the end.
+CREATE TABLE IF NOT EXISTS ImportProgress (
+    ImportKey CHAR(40) PRIMARY KEY,
+    Kind VARCHAR(20) NOT NULL,
+    SourcePath VARCHAR(500) NOT NULL,
+    RowsDone INT NOT NULL,
+    Inserted INT NOT NULL,
+    Rejected INT NOT NULL,
+    UpdatedON DATETIME DEFAULT CURRENT_TIMESTAMP
+);
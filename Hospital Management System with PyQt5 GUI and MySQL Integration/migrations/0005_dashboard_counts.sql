@@ -0,0 +1,9 @@
+-- Exact dashboard totals (dashboard_counts.py). The write paths move them in the same transaction
+-- as the rows they count, so the dashboard reads three primary-key rows instead of counting tables.
+CREATE TABLE IF NOT EXISTS DashboardCount (
+    Name VARCHAR(30) PRIMARY KEY,
+    Value BIGINT NOT NULL
+);
+REPLACE INTO DashboardCount (Name, Value) SELECT 'patients', COUNT(*) FROM Patient;
+REPLACE INTO DashboardCount (Name, Value) SELECT 'employees', COUNT(*) FROM EmployeeDetails;
+REPLACE INTO DashboardCount (Name, Value) SELECT 'active_insurance', COUNT(*) FROM PatientInsurance WHERE IsCurrent = 1;
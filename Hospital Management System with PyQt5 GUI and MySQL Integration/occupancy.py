@@ -0,0 +1,261 @@
+import bisect
+import threading
+import time
+from datetime import datetime
+
+from utils import db_connection
+
+MAX_AGE = 300            # seconds before the index is rebuilt to pick up bookings made elsewhere
+OPEN_END = datetime.max  # end of a stay with no DischargeON yet
+STAYS_SQL = "SELECT PatientRegisterID, RoomNumber, AdmittedON, DischargeON FROM PatientRegister"
+# Locking read run with each booking save; BOOKING_UNTIL_SQL narrows it when the stay has an end.
+BOOKING_CHECK_SQL = ("SELECT PatientRegisterID FROM PatientRegister WHERE RoomNumber=%s "
+                     "AND (DischargeON IS NULL OR DischargeON > %s) AND PatientRegisterID <> %s")
+BOOKING_UNTIL_SQL = " AND AdmittedON < %s"
+
+
+class BookingConflict(ValueError):
+    pass
+
+
+class _Room:
+    # One room's stays sorted by AdmittedON, with a max-segment tree over their ends. Legacy
+    # PatientRegister rows can overlap, so ends are not sorted; the stays starting before t are a
+    # prefix of the lists, and the tree finds one among them still running at s in O(log n) steps
+    # however long an earlier (or open-ended) stay runs. spans are the room's occupied periods
+    # with overlapping stays merged, so a room is counted once however many stays it holds.
+    __slots__ = ('starts', 'ends', 'regs', 'tree', 'size', 'spans')
+
+    def __init__(self):
+        self.starts, self.ends, self.regs = [], [], []
+        self.tree, self.size, self.spans = [], 0, []
+
+    def rebuild(self):
+        size = 1
+        while size < len(self.ends):
+            size *= 2
+        tree = [datetime.min] * size + self.ends + [datetime.min] * (size - len(self.ends))
+        for node in range(size - 1, 0, -1):
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+        self.tree, self.size = tree, size
+        spans = []
+        for start, end in zip(self.starts, self.ends):
+            if spans and start < spans[-1][1]:
+                spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+            else:
+                spans.append((start, end))
+        self.spans = spans
+
+    def overlapping(self, start, end, exclude):
+        # Descends only into subtrees of stays beginning before end whose latest end is past start;
+        # each excluded stay found costs one more root-to-leaf path.
+        limit = bisect.bisect_left(self.starts, end)
+        tree, size = self.tree, self.size
+        stack = [(1, 0, size)]
+        while stack:
+            node, lo, width = stack.pop()
+            if lo >= limit or tree[node] <= start:
+                continue
+            if node >= size:
+                if self.regs[lo] not in exclude:
+                    return self.regs[lo]
+                continue
+            half = width // 2
+            stack.append((2 * node + 1, lo + half, half))
+            stack.append((2 * node, lo, half))
+        return None
+
+
+class RoomIndex:
+    # Per room a _Room; two global sorted lists of the starts and ends of every room's merged
+    # spans answer "how many rooms are occupied at t" with two bisects.
+    def __init__(self):
+        self._rooms = {}
+        self._stays = {}
+        self._starts = []
+        self._ends = []
+        self._lock = threading.RLock()
+        self.loaded_at = None
+
+    def build(self, rows):
+        with self._lock:
+            self._rooms, self._stays = {}, {}
+            stays = sorted((self._normalize(*row) for row in rows if row[1] and row[2]), key=lambda s: s[2])
+            for reg, room, start, end in stays:
+                entry = self._rooms.get(room)
+                if entry is None:
+                    entry = self._rooms[room] = _Room()
+                entry.starts.append(start)
+                entry.ends.append(end)
+                entry.regs.append(reg)
+                self._stays[reg] = (room, start, end)
+            for entry in self._rooms.values():
+                entry.rebuild()
+            spans = [span for entry in self._rooms.values() for span in entry.spans]
+            self._starts = sorted(s[0] for s in spans)
+            self._ends = sorted(s[1] for s in spans)
+            self.loaded_at = time.monotonic()
+
+    def invalidate(self):
+        # Stays were removed without their ids (a patient delete cascades to their stays); the
+        # next ensure_loaded rebuilds, and check_booking leaves the check to the locking read.
+        self.loaded_at = None
+
+    @staticmethod
+    def _normalize(reg, room, start, end):
+        return str(reg), str(room).strip(), start, end or OPEN_END
+
+    def _respan(self, entry, old):
+        # Only the merged spans that changed move in the global lists.
+        new = set(entry.spans)
+        for start, end in set(old) - new:
+            del self._starts[bisect.bisect_left(self._starts, start)]
+            del self._ends[bisect.bisect_left(self._ends, end)]
+        for start, end in new - set(old):
+            bisect.insort(self._starts, start)
+            bisect.insort(self._ends, end)
+
+    def add(self, reg, room, start, end=None):
+        reg, room, start, end = self._normalize(reg, room, start, end)
+        with self._lock:
+            self.remove(reg)
+            entry = self._rooms.setdefault(room, _Room())
+            old = entry.spans
+            i = bisect.bisect_right(entry.starts, start)
+            entry.starts.insert(i, start)
+            entry.ends.insert(i, end)
+            entry.regs.insert(i, reg)
+            entry.rebuild()
+            self._respan(entry, old)
+            self._stays[reg] = (room, start, end)
+
+    def remove(self, reg):
+        reg = str(reg)
+        with self._lock:
+            stay = self._stays.pop(reg, None)
+            if stay is None:
+                return
+            room, start, end = stay
+            entry = self._rooms[room]
+            old = entry.spans
+            i = bisect.bisect_left(entry.starts, start)
+            while entry.regs[i] != reg:
+                i += 1
+            del entry.starts[i], entry.ends[i], entry.regs[i]
+            entry.rebuild()
+            self._respan(entry, old)
+
+    def stay(self, reg):
+        return self._stays.get(str(reg))
+
+    def conflict(self, room, start, end=None, exclude=()):
+        # Returns the PatientRegisterID of a stay overlapping [start, end) in this room, or None.
+        end = end or OPEN_END
+        with self._lock:
+            entry = self._rooms.get(str(room).strip())
+            if entry is None:
+                return None
+            return entry.overlapping(start, end, {str(e) for e in exclude})
+
+    def free_rooms(self, start, end=None):
+        with self._lock:
+            return sorted(room for room in self._rooms if self.conflict(room, start, end) is None)
+
+    def occupied_at(self, moment):
+        with self._lock:
+            return bisect.bisect_right(self._starts, moment) - bisect.bisect_right(self._ends, moment)
+
+    def occupancy_series(self, start, end, step):
+        points = []
+        moment = start
+        while moment < end:
+            points.append((moment, self.occupied_at(moment)))
+            moment += step
+        return points
+
+    def rooms(self):
+        with self._lock:
+            return sorted(self._rooms)
+
+
+rooms = RoomIndex()
+
+
+def load_rooms():
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        cur = conn.cursor()
+        cur.execute(STAYS_SQL)
+        rows = cur.fetchall()
+    rooms.build(rows)
+    return rooms
+
+
+def ensure_loaded():
+    if rooms.loaded_at is None or time.monotonic() - rooms.loaded_at > MAX_AGE:
+        load_rooms()
+    return rooms
+
+
+def _describe(reg):
+    room, start, end = rooms.stay(reg)
+    until = "open" if end == OPEN_END else f"{end:%Y-%m-%d %H:%M}"
+    return f"Room {room} is already booked by registration {reg} ({start:%Y-%m-%d %H:%M} – {until})."
+
+
+def check_booking(reg, room, start, end, exclude=()):
+    # Against the in-memory index only, so it is safe on the GUI thread; until the index has been
+    # built the locking read in write_booking is the only check.
+    if rooms.loaded_at is None:
+        return
+    clash = rooms.conflict(room, start, end, exclude={str(reg), *exclude})
+    if clash is not None:
+        raise BookingConflict(_describe(clash))
+
+
+def write_booking(cur, sql, params, reg, room, start, end):
+    # Runs inside the save's transaction: the locking read catches bookings made by other clients
+    # since the index was built.
+    sql_check = BOOKING_CHECK_SQL
+    check_params = [room, start, reg]
+    if end:
+        sql_check += BOOKING_UNTIL_SQL
+        check_params.append(end)
+    cur.execute(sql_check + " FOR UPDATE", check_params)
+    clash = cur.fetchone()
+    if clash:
+        raise BookingConflict(f"Room {room} was booked by registration {clash[0]} from another workstation.")
+    cur.execute(sql, params)
+    return cur.lastrowid
+
+
+def check_room_change(keys, column, value):
+    # Batch edit hook: moving several stays into one room must not clash with that room's
+    # bookings or with each other.
+    if column != 'RoomNumber' or not value:
+        return
+    ensure_loaded()
+    stays = {str(k): rooms.stay(k) for k in keys}
+    moving = sorted((stay[1], stay[2], reg) for reg, stay in stays.items() if stay)
+    for (start, end, reg), (next_start, _, next_reg) in zip(moving, moving[1:]):
+        if next_start < end:
+            raise BookingConflict(f"Registrations {reg} and {next_reg} overlap and can't share room {value}.")
+    for start, end, reg in moving:
+        clash = rooms.conflict(value, start, end, exclude=keys)
+        if clash is not None:
+            raise BookingConflict(_describe(clash))
+
+
+def rooms_moved(keys, column, value):
+    if column != 'RoomNumber':
+        return
+    for key in keys:
+        stay = rooms.stay(key)
+        if stay:
+            rooms.add(key, value, stay[1], stay[2])
+
+
+def bookings_removed(keys):
+    for key in keys:
+        rooms.remove(key)
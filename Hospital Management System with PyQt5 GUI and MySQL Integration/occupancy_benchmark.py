@@ -0,0 +1,105 @@
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from occupancy import RoomIndex, OPEN_END
+
+
+def synthetic_stays(room_count, years, seed=7):
+    # Back-to-back stays of 1-14 nights with 0-3 day gaps in every room, the latest left open.
+    rng = random.Random(seed)
+    origin = datetime(2020, 1, 1, 14)
+    horizon = origin + timedelta(days=365 * years)
+    rows, reg = [], 1
+    for room in range(1, room_count + 1):
+        moment = origin + timedelta(hours=rng.randint(0, 72))
+        while moment < horizon:
+            end = moment + timedelta(days=rng.randint(1, 14), hours=rng.randint(-4, 4))
+            rows.append((reg, f"R{room:03d}", moment, end if end < horizon else None))
+            reg += 1
+            moment = end + timedelta(days=rng.randint(0, 3), hours=rng.randint(1, 6))
+    return rows, origin, horizon
+
+
+def linear_conflict(rows, room, start, end):
+    for reg, r, s, e in rows:
+        if r == room and s < end and (e or OPEN_END) > start:
+            return reg
+    return None
+
+
+def linear_occupied(rows, moment):
+    return len({r for _, r, s, e in rows if s <= moment < (e or OPEN_END)})
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the room occupancy index on synthetic stays.")
+    parser.add_argument('--rooms', type=int, default=300)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--legacy', action='store_true',
+                        help="also give every room an open-ended stay from the first day, overlapping the rest")
+    args = parser.parse_args()
+
+    rows, origin, horizon = synthetic_stays(args.rooms, args.years)
+    if args.legacy:
+        rows += [(len(rows) + room, f"R{room:03d}", origin, None) for room in range(1, args.rooms + 1)]
+    print(f"{len(rows):,} stays in {args.rooms} rooms over {args.years} years")
+
+    index = RoomIndex()
+    started = time.perf_counter()
+    index.build(rows)
+    print(f"build:               {time.perf_counter() - started:8.3f} s")
+
+    rng = random.Random(11)
+    span = int((horizon - origin).total_seconds())
+    probes = [(f"R{rng.randint(1, args.rooms):03d}", origin + timedelta(seconds=rng.randrange(span)))
+              for _ in range(args.queries)]
+    nights = timedelta(days=3)
+
+    # Spot-check against a brute-force scan before timing anything.
+    for room, start in probes[:200]:
+        clash = index.conflict(room, start, start + nights)
+        assert (clash is None) == (linear_conflict(rows, room, start, start + nights) is None)
+        assert index.occupied_at(start) == linear_occupied(rows, start)
+
+    started = time.perf_counter()
+    for room, start in probes:
+        index.conflict(room, start, start + nights)
+    indexed = (time.perf_counter() - started) / len(probes)
+    room, start = probes[0]
+    scan = timed(lambda: linear_conflict(rows, room, start, start + nights), 20)
+    print(f"conflict check:      {indexed * 1e6:8.1f} µs   (linear scan {scan * 1e3:.1f} ms, {scan / indexed:,.0f}x)")
+
+    started = time.perf_counter()
+    for _, start in probes:
+        index.occupied_at(start)
+    indexed = (time.perf_counter() - started) / len(probes)
+    scan = timed(lambda: linear_occupied(rows, probes[0][1]), 20)
+    print(f"occupied at t:       {indexed * 1e6:8.1f} µs   (linear scan {scan * 1e3:.1f} ms, {scan / indexed:,.0f}x)")
+
+    moment = probes[0][1]
+    free = timed(lambda: index.free_rooms(moment, moment + nights), 50)
+    print(f"free rooms, 3 nights:{free * 1e3:8.2f} ms   ({len(index.free_rooms(moment, moment + nights))} free)")
+
+    series = timed(lambda: index.occupancy_series(origin, horizon, timedelta(days=1)), 5)
+    print(f"daily series {args.years}y:   {series * 1e3:8.2f} ms")
+
+    reg = len(rows) + 1
+    started = time.perf_counter()
+    for room, start in probes:
+        index.add(reg, room, start, start + nights)
+        index.remove(reg)
+    print(f"add + remove:        {(time.perf_counter() - started) / len(probes) * 1e6:8.1f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+# Grid columns per page as (column, kind). Only these are selected; kinds drive formatting,
+# alignment and sorting in the view, so values stay in their native Python types.
+# Kinds: text, int, decimal, date, datetime, bool, long. "long" columns are sent as NULL in
+# the page query and fetched separately for the rows that are actually on screen.
+PAGE_COLUMNS = {
+    'patients': {
+        'table': 'Patient', 'key': 'PatientRegNo',
+        'columns': [
+            ('PatientID', 'int'), ('PatientRegNo', 'text'), ('FirstName', 'text'), ('LastName', 'text'),
+            ('DateOfBirth', 'date'), ('Gender', 'text'), ('PhoneNumber', 'text'), ('EmailID', 'text'),
+            ('Height', 'decimal'), ('Weight', 'decimal'), ('BloodGroup', 'text'), ('MaritalStatus', 'text'),
+            ('InsuranceStatus', 'text'), ('Allergies', 'long'), ('Address', 'long'), ('ModifiedON', 'datetime'),
+        ],
+    },
+    'employees': {
+        'table': 'EmployeeDetails', 'key': 'EmployeeID',
+        'columns': [
+            ('EmployeeID', 'int'), ('FirstName', 'text'), ('LastName', 'text'), ('Gender', 'text'),
+            ('DateOfBirth', 'date'), ('PhoneNumber', 'text'), ('RoleID', 'int'), ('NationalID', 'text'),
+            ('DateOfJoining', 'date'), ('Salary', 'decimal'), ('Address', 'long'), ('ModifiedON', 'datetime'),
+        ],
+    },
+    'diseases': {
+        'table': 'Disease', 'key': 'DiseaseID',
+        'columns': [
+            ('DiseaseID', 'int'), ('Name', 'text'), ('Severity', 'text'), ('Treatment', 'text'),
+            ('Description', 'long'), ('Symptoms', 'long'), ('Complications', 'long'),
+        ],
+    },
+    'insurance': {
+        'table': 'PatientInsurance', 'key': 'PatientInsuranceID',
+        'columns': [
+            ('PatientInsuranceID', 'int'), ('PatientID', 'int'), ('ProviderName', 'text'),
+            ('GroupNumber', 'text'), ('InsuranceNumber', 'text'), ('InNetworkCoPay', 'decimal'),
+            ('OutNetworkCoPay', 'decimal'), ('StartDate', 'date'), ('EndDate', 'date'), ('IsCurrent', 'bool'),
+            ('ModifiedON', 'datetime'),
+        ],
+    },
+    'appointments': {
+        'table': 'PatientRegister', 'key': 'PatientRegisterID',
+        'columns': [
+            ('PatientRegisterID', 'int'), ('PatientID', 'int'), ('AdmittedON', 'datetime'),
+            ('DischargeON', 'datetime'), ('PatientInsuranceID', 'int'), ('RoomNumber', 'text'),
+            ('CopayType', 'text'), ('CreatedBy', 'int'),
+        ],
+    },
+    'lab_reports': {
+        'table': 'PatientLabReport', 'key': 'PatientLabReportID',
+        'columns': [
+            ('PatientLabReportID', 'int'), ('PatientRegisterID', 'int'), ('LabTestID', 'int'),
+            ('TestValue', 'text'), ('DateOfTest', 'datetime'), ('Comment', 'long'),
+        ],
+    },
+}
+
+# Tabs of the patient record view (patient_record.py). Columns past the table's own are
+# assembled from related rows: names from the lookups, per-stay diagnoses and attendants.
+RECORD_COLUMNS = {
+    'admissions': {
+        'table': 'PatientRegister', 'key': 'PatientRegisterID',
+        'columns': [
+            ('PatientRegisterID', 'int'), ('AdmittedON', 'datetime'), ('DischargeON', 'datetime'),
+            ('RoomNumber', 'text'), ('CopayType', 'text'), ('PatientInsuranceID', 'int'), ('Diseases', 'text'),
+            ('Attendants', 'text'), ('LabResults', 'int'),
+        ],
+    },
+    'labs': {
+        'table': 'PatientLabReport', 'key': 'PatientLabReportID',
+        'columns': [
+            ('PatientLabReportID', 'int'), ('PatientRegisterID', 'int'), ('DateOfTest', 'datetime'),
+            ('LabTestID', 'int'), ('TestName', 'text'), ('TestValue', 'text'), ('CalcUnit', 'text'),
+            ('Range', 'text'), ('Comment', 'text'),
+        ],
+    },
+    'insurance': {
+        'table': 'PatientInsurance', 'key': 'PatientInsuranceID',
+        'columns': [
+            ('PatientInsuranceID', 'int'), ('ProviderName', 'text'), ('GroupNumber', 'text'),
+            ('InsuranceNumber', 'text'), ('InNetworkCoPay', 'decimal'), ('OutNetworkCoPay', 'decimal'),
+            ('StartDate', 'date'), ('EndDate', 'date'), ('IsCurrent', 'bool'),
+        ],
+    },
+}
+
+NUMERIC_KINDS = ('int', 'decimal')
+LONG_PREVIEW = 80
+
+
+def select_list(spec):
+    return ", ".join(f"NULL AS `{name}`" if kind == 'long' else f"`{name}`" for name, kind in spec['columns'])
+
+
+def select_sql(spec):
+    return f"SELECT {select_list(spec)} FROM {spec['table']}"
+
+
+def long_columns(spec):
+    return [name for name, kind in spec['columns'] if kind == 'long']
+
+
+def to_bool(value):
+    # BIT(1) arrives as b'\x00' / b'\x01'.
+    if isinstance(value, (bytes, bytearray)):
+        return value != b'\x00' * len(value)
+    return bool(value)
+
+
+def format_value(kind, value):
+    if value is None:
+        return ""
+    if kind == 'decimal' and isinstance(value, (Decimal, float)):
+        return f"{value:,.2f}"
+    if kind == 'datetime' and isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M")
+    if kind == 'date' and isinstance(value, date):
+        return value.strftime("%Y-%m-%d")
+    if kind == 'bool':
+        return "Yes" if to_bool(value) else "No"
+    if kind == 'long':
+        text = str(value)
+        first_line = text.split("\n", 1)[0]
+        return first_line[:LONG_PREVIEW] + ("…" if len(first_line) > LONG_PREVIEW or first_line != text else "")
+    return str(value)
+
+
+def parse_value(kind, text):
+    # Text typed into a dialog, as the native type the database would hand back for this kind.
+    parse = {'int': int, 'decimal': Decimal, 'date': date.fromisoformat, 'datetime': datetime.fromisoformat}.get(kind)
+    if parse is None or text is None or text == "":
+        return text
+    try:
+        return parse(text)
+    except (ValueError, TypeError, ArithmeticError):
+        return text
+
+
+def sort_key(kind, column):
+    if kind == 'bool':
+        return lambda row: to_bool(row[column])
+    return lambda row: row[column]
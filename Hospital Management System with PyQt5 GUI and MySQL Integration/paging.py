@@ -0,0 +1,149 @@
+from PyQt5.QtWidgets import QHBoxLayout, QPushButton, QLabel, QComboBox, QLineEdit
+from utils import db_connection
+from workers import start_load, run_task, show_db_error
+
+PAGE_SIZES = [100, 500, 1000, 5000]
+DEFAULT_PAGE_SIZE = 500
+# The pager's statements after "SELECT <columns> FROM <table>"; each takes its bounds and a LIMIT.
+KEYSET_SQL = {
+    'first': "ORDER BY {key} LIMIT %s",
+    'next': "WHERE {key} > %s ORDER BY {key} LIMIT %s",
+    'previous': "WHERE {key} < %s ORDER BY {key} DESC LIMIT %s",
+    'jump': "WHERE {key} >= %s ORDER BY {key} LIMIT %s",
+}
+# information_schema.TABLES.TABLE_ROWS is InnoDB's running estimate: free, unlike COUNT(*).
+ESTIMATE_SQL = ("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s")
+
+
+class KeysetPager:
+    # Pages through a table by primary key (WHERE key > last ORDER BY key LIMIT n), so a page
+    # costs the same at row 10 as at row 10 million and only one page is held in memory.
+    def __init__(self, table, source, key_column, page_size=DEFAULT_PAGE_SIZE):
+        self.table = table
+        self.source = source
+        self.key = key_column
+        self.page_size = page_size
+        self.first_key = None
+        self.last_key = None
+        self.has_next = False
+        self.has_previous = False
+        self.estimate = None
+        self.on_change = None
+        self._buffer = []
+        self._columns = []
+
+    def _sql(self, step):
+        return f"SELECT {self.table.model().select_list()} FROM {self.source} " + KEYSET_SQL[step].format(key=self.key)
+
+    def first(self):
+        self._load(self._sql('first'), (self.page_size + 1,), backwards=False, at_start=True)
+
+    def next(self):
+        if self.has_next:
+            self._load(self._sql('next'), (self.last_key, self.page_size + 1), backwards=False)
+
+    def previous(self):
+        if self.has_previous:
+            self._load(self._sql('previous'), (self.first_key, self.page_size + 1), backwards=True)
+
+    def jump_to(self, key):
+        self._load(self._sql('jump'), (key, self.page_size + 1), backwards=False)
+
+    def reload(self):
+        if self.first_key is None:
+            self.first()
+        else:
+            self.jump_to(self.first_key)
+
+    def set_page_size(self, size):
+        self.page_size = size
+        self.reload()
+
+    def refresh_estimate(self):
+        run_task(estimate_row_count, self.source, on_done=self._set_estimate)
+
+    def _set_estimate(self, estimate):
+        self.estimate = estimate
+        self._changed()
+
+    def _load(self, sql, params, backwards, at_start=False):
+        self._buffer = []
+        start_load(self.table, sql, params,
+                   on_columns=self._set_columns, on_chunk=self._buffer.extend,
+                   on_done=lambda _: self._show(backwards, at_start), on_error=show_db_error)
+
+    def _set_columns(self, columns):
+        self._columns = columns
+
+    def _show(self, backwards, at_start):
+        rows = self._buffer
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if backwards:
+            rows.reverse()
+            self.has_previous = more
+            self.has_next = True
+        else:
+            self.has_next = more
+            self.has_previous = not at_start
+        if rows:
+            key_index = self._columns.index(self.key)
+            self.first_key = rows[0][key_index]
+            self.last_key = rows[-1][key_index]
+        self.table.model().set_rows(self._columns, rows)
+        self._changed()
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+    def describe(self):
+        shown = self.table.model().rows
+        text = f"{self.key} {self.first_key}–{self.last_key} ({len(shown)} rows)" if shown else "No rows"
+        if self.estimate is not None:
+            text += f" · ~{self.estimate:,} total"
+        return text
+
+
+def estimate_row_count(source):
+    with db_connection() as conn:
+        if not conn:
+            return None
+        cur = conn.cursor()
+        cur.execute(ESTIMATE_SQL, (source,))
+        row = cur.fetchone()
+    return int(row[0] or 0) if row else None
+
+
+def make_pager_bar(pager):
+    bar = QHBoxLayout()
+    first_btn = QPushButton("⏮ First")
+    prev_btn = QPushButton("◀ Previous")
+    next_btn = QPushButton("Next ▶")
+    size_box = QComboBox()
+    for size in PAGE_SIZES:
+        size_box.addItem(f"{size} / page", size)
+    size_box.setCurrentIndex(PAGE_SIZES.index(pager.page_size))
+    jump_edit = QLineEdit()
+    jump_edit.setPlaceholderText(f"Go to {pager.key}")
+    jump_edit.setFixedWidth(180)
+    status = QLabel()
+
+    first_btn.clicked.connect(pager.first)
+    prev_btn.clicked.connect(pager.previous)
+    next_btn.clicked.connect(pager.next)
+    size_box.currentIndexChanged.connect(lambda i: pager.set_page_size(size_box.itemData(i)))
+    jump_edit.returnPressed.connect(lambda: jump_edit.text().strip() and pager.jump_to(jump_edit.text().strip()))
+
+    def update():
+        prev_btn.setEnabled(pager.has_previous)
+        next_btn.setEnabled(pager.has_next)
+        status.setText(pager.describe())
+
+    pager.on_change = update
+    for w in (first_btn, prev_btn, next_btn, size_box, jump_edit):
+        bar.addWidget(w)
+    bar.addWidget(status, 1)
+    update()
+    return bar
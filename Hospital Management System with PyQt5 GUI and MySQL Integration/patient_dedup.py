@@ -0,0 +1,502 @@
+import argparse
+import csv
+import re
+import threading
+import time
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+import pymysql.cursors
+
+from patient_search import normalize, phone_digits
+from utils import get_connection
+
+CHUNK = 200000          # patients streamed and encoded per step
+SCORE_CHUNK = 1000000   # candidate pairs scored per step
+IN_CHUNK = 1000         # patients fetched per statement for display
+MAX_BLOCK = 50          # a blocking key shared by more patients than this (a clinic phone, a placeholder) is skipped
+RESORT = 50000          # patients added or edited since the last sort before the lookup keys are re-sorted
+PHONE_DIGITS = 9        # trailing digits compared, so "+20 10..." and "010..." agree
+MIN_PHONE_DIGITS = 7
+REPORT_SCORE = 0.75     # batch report threshold
+WARN_SCORE = 0.7        # Add Patient warns at or above this; a false alarm there costs one click
+MAX_MATCHES = 5
+MISSING = int(np.iinfo(np.int32).min)   # no date of birth
+NAME_WIDTH, ADDRESS_WIDTH = 24, 40      # characters of a name / address that go into its signature
+# Weight of each field's agreement (-1 disagree .. 1 agree). A perfect match on the first five scores 1;
+# a shared e-mail only adds evidence and a gender mismatch only takes it away.
+WEIGHTS = {'first': 2, 'last': 3, 'dob': 3, 'phone': 2, 'address': 1, 'email': 2, 'gender': 2}
+MAX_SCORE = sum(WEIGHTS[field] for field in ('first', 'last', 'dob', 'phone', 'address'))
+GENDERS = {'male': 1, 'female': 2, 'other': 3}
+NOT_LETTERS = re.compile(r"[^a-z]+")
+SOUNDEX = str.maketrans("abcdefghijklmnopqrstuvwxyz", "01230120022455012623010202")
+PATIENT_SQL = ("SELECT PatientID, FirstName, LastName, Gender, DateOfBirth, PhoneNumber, EmailID, Address, "
+               "ModifiedON FROM Patient")
+LOAD_SQL = f"{PATIENT_SQL} ORDER BY PatientID"
+SINCE_SQL = f"{PATIENT_SQL} WHERE ModifiedON >= %s"
+DETAILS_SQL = ("SELECT PatientID, PatientRegNo, FirstName, LastName, DateOfBirth, PhoneNumber FROM Patient "
+               "WHERE PatientID IN (%s)")
+RESULT_COLUMNS = ["Score", "RegNo A", "Name A", "Born A", "Phone A", "RegNo B", "Name B", "Born B", "Phone B",
+                  "Evidence"]
+
+
+def clean_name(text):
+    text = str(text or "").lower()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode()
+    return " ".join(NOT_LETTERS.sub(" ", text).split())
+
+
+def soundex(name):
+    # American Soundex of the whole name, packed as letter * 1000 + three digits; 0 for no letters.
+    letters = name.replace(" ", "")
+    if not letters:
+        return 0
+    digits = letters.translate(SOUNDEX)
+    code, last = "", digits[0]
+    for letter, digit in zip(letters[1:], digits[1:]):
+        if digit != '0' and digit != last:
+            code += digit
+            if len(code) == 3:
+                break
+        if letter not in 'hw':
+            last = digit
+    return (ord(letters[0]) - 96) * 1000 + int(code.ljust(3, '0'))
+
+
+def signatures(texts, width):
+    # Padded character bigrams hashed into 128 bits, so comparing two strings is an AND and two
+    # popcounts on a pair of uint64s - vectorised over millions of pairs at once.
+    padded = np.array([f"^{t}$".encode() if t else b"" for t in texts], dtype=f"S{width}")
+    chars = padded.view(np.uint8).reshape(len(texts), width).astype(np.uint32)
+    valid = (chars[:, :-1] != 0) & (chars[:, 1:] != 0)
+    bits = ((chars[:, :-1] << 8 | chars[:, 1:]) * np.uint32(0x9E3779B1)) >> 25
+    ones = np.where(valid, np.left_shift(np.uint64(1), (bits & 63).astype(np.uint64)), np.uint64(0))
+    sig = np.empty((len(texts), 2), np.uint64)
+    sig[:, 0] = np.bitwise_or.reduce(np.where(bits < 64, ones, np.uint64(0)), axis=1)
+    sig[:, 1] = np.bitwise_or.reduce(np.where(bits >= 64, ones, np.uint64(0)), axis=1)
+    return sig
+
+
+@lru_cache(maxsize=2 ** 18)
+def name_key(text):
+    cleaned = clean_name(text)
+    return cleaned, soundex(cleaned)
+
+
+def name_columns(texts):
+    # Names repeat a lot, so each distinct one is cleaned, coded and signed once.
+    distinct = {}
+    inverse = np.array([distinct.setdefault(t, len(distinct)) for t in texts], np.int64)
+    keys = [name_key(t) for t in distinct]
+    return (signatures([cleaned for cleaned, _ in keys], NAME_WIDTH)[inverse],
+            np.array([code for _, code in keys], np.int16)[inverse])
+
+
+def encode(rows):
+    # (PatientID, FirstName, LastName, Gender, DateOfBirth, PhoneNumber, EmailID, Address) -> columns.
+    ids, firsts, lasts, genders, births, phones, emails, addresses = zip(*rows) if rows else [()] * 8
+    first, first_code = name_columns(firsts)
+    last, last_code = name_columns(lasts)
+    phones = [phone_digits(p)[-PHONE_DIGITS:] for p in phones]
+    born = np.array([b or None for b in births], dtype='datetime64[D]').astype(np.int64)
+    return {
+        'id': np.array(ids, np.int32),
+        'first': first,
+        'last': last,
+        'first_code': first_code,
+        'last_code': last_code,
+        'dob': np.where(born == np.iinfo(np.int64).min, MISSING, born).astype(np.int32),
+        'phone': np.array([int(p) if len(p) >= MIN_PHONE_DIGITS else 0 for p in phones], np.int64),
+        'email': np.array([hash(e.strip().lower()) or 1 if e and e.strip() else 0 for e in emails], np.int64),
+        'gender': np.array([GENDERS.get(str(g or "").lower(), 0) for g in genders], np.int8),
+        'address': signatures([normalize(a) for a in addresses], ADDRESS_WIDTH),
+    }
+
+
+def parse_date(text):
+    try:
+        return np.datetime64(str(text).strip(), 'D') if text else None
+    except ValueError:
+        return None
+
+
+def take(columns, positions):
+    return {name: column[positions] for name, column in columns.items()}
+
+
+def concat(parts):
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def block_keys(columns):
+    # int64 per blocking key and patient; 0 where the key is missing. Two patients are compared only if
+    # they share at least one, and each survives a different kind of error: a typo in either name
+    # (birth date with the other name's Soundex), a mistyped birth date (both names with the year, or
+    # with the day), a new phone or e-mail.
+    dob = columns['dob'].astype(np.int64)
+    first, last = columns['first_code'].astype(np.int64), columns['last_code'].astype(np.int64)
+    known = dob != MISSING
+    born = np.where(known, dob, 0).astype('datetime64[D]')
+    year = born.astype('datetime64[Y]').astype(np.int64) + 1024
+    month = born.astype('datetime64[M]')
+    day_of_year = (month.astype(np.int64) % 12) * 32 + (born - month).astype(np.int64) + 1
+    names = np.where((first > 0) & (last > 0), first * 27000 + last, 0)
+    dated = known & (names > 0)
+    return {
+        'dob_last': np.where(known & (last > 0), (dob + 2 ** 20) << 16 | last, 0),
+        'dob_first': np.where(known & (first > 0), (dob + 2 ** 20) << 16 | first, 0),
+        'names_year': np.where(dated, names << 12 | year, 0),
+        'names_day': np.where(dated, names << 10 | day_of_year, 0),
+        'phone': columns['phone'],
+        'email': columns['email'],
+    }
+
+
+def block_pairs(keys, max_block=MAX_BLOCK):
+    # Patients sorted by key, then pairs (i, i + d) of equal keys for d = 1, 2, ... until no block is
+    # that large: every pair inside every block, without a Python loop over blocks.
+    positions = np.flatnonzero(keys)
+    order = positions[np.argsort(keys[positions])]
+    ordered = keys[order]
+    starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]]) if len(order) else np.zeros(0, np.int64)
+    sizes = np.diff(np.r_[starts, len(order)])
+    keep = np.repeat(sizes <= max_block, sizes)
+    skipped = int(sizes[sizes > max_block].sum())
+    order, ordered = order[keep], ordered[keep]
+    left, right = [np.zeros(0, np.int64)], [np.zeros(0, np.int64)]
+    for d in range(1, max_block):
+        same = np.flatnonzero(ordered[d:] == ordered[:-d])
+        if not len(same):
+            break
+        left.append(order[same])
+        right.append(order[same + d])
+    return np.concatenate(left), np.concatenate(right), skipped
+
+
+def _dice(a, b):
+    # Dice coefficient of two bigram signatures; NaN when either string is empty.
+    counts_a, counts_b = np.bitwise_count(a).sum(1, dtype=np.int32), np.bitwise_count(b).sum(1, dtype=np.int32)
+    both = np.bitwise_count(a & b).sum(1, dtype=np.int32)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where((counts_a > 0) & (counts_b > 0), 2 * both / (counts_a + counts_b), np.nan)
+
+
+def _similar(similarity, neutral, floor=-1.0):
+    # Bigram similarity -> agreement: `neutral` says nothing, 1 is identical, unknown is 0.
+    return np.nan_to_num(np.clip((similarity - neutral) / (1 - neutral), floor, 1), nan=0.0)
+
+
+def _ymd(days):
+    born = days.astype('datetime64[D]')
+    month = born.astype('datetime64[M]')
+    return born.astype('datetime64[Y]').astype(np.int64), month.astype(np.int64) % 12 + 1, \
+        (born - month).astype(np.int64) + 1
+
+
+def agreements(left, right):
+    # Per-field agreement of each pair, each between -1 and 1.
+    first, last = _dice(left['first'], right['first']), _dice(left['last'], right['last'])
+    crossed = _dice(left['first'], right['last']), _dice(left['last'], right['first'])
+    # First and last name entered the wrong way round.
+    swap = np.nan_to_num(crossed[0] + crossed[1]) > np.nan_to_num(first + last) + 0.5
+    first, last = np.where(swap, crossed[0], first), np.where(swap, crossed[1], last)
+
+    dob_a, dob_b = left['dob'], right['dob']
+    (ya, ma, da), (yb, mb, db) = _ymd(dob_a), _ymd(dob_b)
+    # One of year, month, day mistyped, or day and month the wrong way round.
+    near = ((ya == yb).astype(np.int8) + (ma == mb) + (da == db) == 2) | ((ya == yb) & (ma == db) & (da == mb))
+    dob = np.where(dob_a == dob_b, 1.0, np.where(near, 0.5, -1.0))
+    dob[(dob_a == MISSING) | (dob_b == MISSING)] = 0
+
+    phone_a, phone_b = left['phone'], right['phone']
+    email_a, email_b = left['email'], right['email']
+    gender_a, gender_b = left['gender'], right['gender']
+    return {
+        'first': _similar(first, 0.5),
+        'last': _similar(last, 0.5),
+        'dob': dob,
+        # People change numbers, so a different phone is weak evidence against.
+        'phone': np.where((phone_a == 0) | (phone_b == 0), 0.0, np.where(phone_a == phone_b, 1.0, -0.25)),
+        'address': _similar(_dice(left['address'], right['address']), 0.5, -0.5),
+        'email': ((email_a != 0) & (email_a == email_b)).astype(np.float64),
+        'gender': -((gender_a != 0) & (gender_b != 0) & (gender_a != gender_b)).astype(np.float64),
+        'swapped': swap,
+    }
+
+
+def combine(parts):
+    total = sum(WEIGHTS[field] * parts[field] for field in WEIGHTS)
+    return np.clip(total / MAX_SCORE, 0, 1)
+
+
+def evidence(parts, i):
+    said = []
+    for field, label in [('first', "first name"), ('last', "last name"), ('dob', "birth date"), ('phone', "phone"),
+                         ('address', "address"), ('email', "e-mail"), ('gender', "gender")]:
+        value = parts[field][i]
+        if value >= 0.99:
+            said.append(f"same {label}")
+        elif value > 0:
+            said.append(f"similar {label}")
+        elif value < 0:
+            said.append(f"different {label}")
+    if parts['swapped'][i]:
+        said.append("names swapped")
+    return ", ".join(said)
+
+
+class DedupIndex:
+    # Every patient reduced to ~80 bytes of columns: bigram signatures of the names and address,
+    # Soundex codes, birth date, phone tail, e-mail hash and gender. Batch mode joins the patients on
+    # each blocking key; the online check looks a new patient's keys up in sorted copies of them.
+    # Refreshes read only rows with a newer ModifiedON; deleted patients drop out when their details
+    # are fetched for display.
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.columns = None
+        self.id_order = np.zeros(0, np.int64)
+        self.blocks = {}
+        self.recent = np.zeros(0, np.int64)
+        self.recent_keys = {}
+        self.watermark = None
+
+    @property
+    def size(self):
+        return len(self.columns['id']) if self.columns else 0
+
+    def refresh(self, chunk_size=CHUNK, rebuild=False, progress=None):
+        started = time.perf_counter()
+        conn = get_connection()
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        with self._lock:
+            try:
+                if rebuild:
+                    self._reset()
+                read = self._catch_up(conn, chunk_size, progress)
+            except Exception:
+                conn.discard()
+                self._reset()
+                raise
+            conn.close()
+            return {'read': read, 'patients': self.size, 'elapsed': time.perf_counter() - started,
+                    'memory_mb': self.nbytes() / 2 ** 20}
+
+    def _catch_up(self, conn, chunk_size, progress):
+        cur = conn.cursor(pymysql.cursors.SSCursor)
+        if self.watermark is None:
+            cur.execute(LOAD_SQL)
+        else:
+            # >= as well as the newest stamp seen: rows saved later in that same second are not missed.
+            cur.execute(SINCE_SQL, (self.watermark,))
+        parts, read = [], 0
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            stamps = [row[-1] for row in rows if row[-1] is not None]
+            if stamps:
+                self.watermark = max(stamps + ([self.watermark] if self.watermark is not None else []))
+            parts.append(encode([row[:-1] for row in rows]))
+            read += len(rows)
+            if progress:
+                progress(read)
+        if parts:
+            self.add(concat(parts))
+        return read
+
+    def add(self, columns):
+        # Upsert encoded patients by PatientID.
+        with self._lock:
+            if not self.columns:
+                self.columns = columns
+                self.id_order = np.argsort(columns['id'], kind='stable')
+                self._sort()
+                return
+            ids = self.columns['id'][self.id_order]
+            at = np.minimum(np.searchsorted(ids, columns['id']), max(len(ids) - 1, 0))
+            found = ids[at] == columns['id']
+            edited = self.id_order[at[found]]
+            for name, column in self.columns.items():
+                column[edited] = columns[name][found]
+            start, highest = self.size, ids[-1] if len(ids) else 0
+            self.columns = concat([self.columns, take(columns, ~found)])
+            added = self.columns['id'][start:]
+            if len(added) and (added.min() <= highest or np.any(np.diff(added) < 0)):
+                self.id_order = np.argsort(self.columns['id'], kind='stable')
+            else:
+                # New patients get higher PatientIDs, so they simply extend the order.
+                self.id_order = np.r_[self.id_order, np.arange(start, self.size)]
+            self.recent = np.union1d(self.recent, np.r_[edited, np.arange(start, self.size)])
+            if len(self.recent) > RESORT:
+                self._sort()
+            else:
+                self.recent_keys = block_keys(take(self.columns, self.recent))
+
+    def _sort(self):
+        self.blocks = {}
+        for name, keys in block_keys(self.columns).items():
+            order = np.argsort(keys)
+            self.blocks[name] = (keys[order], order)
+        self.recent = np.zeros(0, np.int64)
+        self.recent_keys = {}
+
+    def nbytes(self):
+        held = sum(c.nbytes for c in self.columns.values()) if self.columns else 0
+        return held + self.id_order.nbytes + sum(k.nbytes + o.nbytes for k, o in self.blocks.values())
+
+    def pairs(self, min_score=REPORT_SCORE, progress=None):
+        # Batch mode: every candidate pair from the blocking keys, scored, best first.
+        with self._lock:
+            if not self.columns:
+                return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0), {}
+            stats = {'candidates': {}, 'skipped': {}}
+            found = []
+            for name, keys in block_keys(self.columns).items():
+                left, right, stats['skipped'][name] = block_pairs(keys)
+                stats['candidates'][name] = len(left)
+                found.append(np.minimum(left, right) << 32 | np.maximum(left, right))
+            found = np.unique(np.concatenate(found))
+            stats['pairs'] = len(found)
+            kept_a, kept_b, kept_score = [np.zeros(0, np.int64)], [np.zeros(0, np.int64)], [np.zeros(0)]
+            for start in range(0, len(found), SCORE_CHUNK):
+                chunk = found[start:start + SCORE_CHUNK]
+                a, b = chunk >> 32, chunk & 0xFFFFFFFF
+                score = combine(agreements(take(self.columns, a), take(self.columns, b)))
+                keep = score >= min_score
+                kept_a.append(a[keep])
+                kept_b.append(b[keep])
+                kept_score.append(score[keep])
+                if progress:
+                    progress(min(start + SCORE_CHUNK, len(found)))
+            a, b, score = np.concatenate(kept_a), np.concatenate(kept_b), np.concatenate(kept_score)
+            order = np.argsort(-score, kind='stable')
+            return a[order], b[order], score[order], stats
+
+    def similar(self, values, min_score=WARN_SCORE, limit=MAX_MATCHES):
+        # Online mode: patients sharing a blocking key with `values` (the Add Patient fields), scored.
+        record = encode([(0, values.get('FirstName'), values.get('LastName'), values.get('Gender'),
+                          parse_date(values.get('DateOfBirth')), values.get('PhoneNumber'), values.get('EmailID'),
+                          values.get('Address'))])
+        with self._lock:
+            if not self.columns:
+                return []
+            found = []
+            for name, keys in block_keys(record).items():
+                key = keys[0]
+                if not key:
+                    continue
+                ordered, order = self.blocks[name]
+                lo, hi = np.searchsorted(ordered, key, 'left'), np.searchsorted(ordered, key, 'right')
+                if hi - lo <= MAX_BLOCK:
+                    found.append(order[lo:hi])
+                if self.recent_keys:
+                    found.append(self.recent[self.recent_keys[name] == key])
+            if not found:
+                return []
+            positions = np.unique(np.concatenate(found))
+            candidates = take(self.columns, positions)
+            parts = agreements(take(record, np.zeros(len(positions), np.int64)), candidates)
+            score = combine(parts)
+            best = [i for i in np.argsort(-score, kind='stable') if score[i] >= min_score][:limit]
+            return [(int(candidates['id'][i]), float(score[i]), evidence(parts, i)) for i in best]
+
+
+def fetch_patients(cur, patient_ids):
+    details = {}
+    patient_ids = list(dict.fromkeys(patient_ids))
+    for i in range(0, len(patient_ids), IN_CHUNK):
+        chunk = patient_ids[i:i + IN_CHUNK]
+        cur.execute(DETAILS_SQL.replace("IN (%s)", f"IN ({', '.join(['%s'] * len(chunk))})"), chunk)
+        for patient_id, reg, first, last, born, phone in cur.fetchall():
+            details[patient_id] = (reg, f"{first} {last}", str(born or ""), phone or "")
+    return details
+
+
+dedup_index = DedupIndex()
+
+
+def find_duplicates(values, min_score=WARN_SCORE, limit=MAX_MATCHES):
+    # Worker side of the Add Patient check: -> [(RegNo, name, born, phone, score, evidence)].
+    dedup_index.refresh()
+    matches = dedup_index.similar(values, min_score, limit)
+    if not matches:
+        return []
+    conn = get_connection()
+    if not conn:
+        raise ConnectionError("Could not connect to the database.")
+    try:
+        details = fetch_patients(conn.cursor(), [patient_id for patient_id, _, _ in matches])
+    except Exception:
+        conn.discard()
+        raise
+    conn.close()
+    return [(*details[patient_id], score, said) for patient_id, score, said in matches if patient_id in details]
+
+
+def duplicate_report(index, min_score=REPORT_SCORE, limit=None, progress=None):
+    # Batch mode -> (RESULT_COLUMNS, rows best first, stats).
+    started = time.perf_counter()
+    loaded = index.refresh(progress=progress)
+    a, b, score, stats = index.pairs(min_score)
+    if limit:
+        a, b, score = a[:limit], b[:limit], score[:limit]
+    rows = []
+    if len(a):
+        ids = index.columns['id']
+        parts = agreements(take(index.columns, a), take(index.columns, b))
+        conn = get_connection()
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        try:
+            details = fetch_patients(conn.cursor(), np.r_[ids[a], ids[b]].tolist())
+        except Exception:
+            conn.discard()
+            raise
+        conn.close()
+        for i, (x, y) in enumerate(zip(ids[a].tolist(), ids[b].tolist())):
+            if x in details and y in details:
+                rows.append((round(float(score[i]), 3), *details[x], *details[y], evidence(parts, i)))
+    stats.update(patients=loaded['patients'], reported=len(rows), memory_mb=loaded['memory_mb'],
+                 load_s=loaded['elapsed'], elapsed=time.perf_counter() - started)
+    return RESULT_COLUMNS, rows, stats
+
+
+def write_report(path, columns, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report likely duplicate patients, best candidates first.")
+    parser.add_argument('path', help="CSV file to write")
+    parser.add_argument('--min-score', type=float, default=REPORT_SCORE)
+    parser.add_argument('--limit', type=int, help="keep only the best N pairs")
+    parser.add_argument('--sqlite', metavar='PATH', help="read a local SQLite stand-in instead of MySQL")
+    args = parser.parse_args()
+    if args.sqlite:
+        from sqlite_standin import use_sqlite
+        use_sqlite(args.sqlite)
+
+    columns, rows, stats = duplicate_report(DedupIndex(), args.min_score, args.limit,
+                                            lambda n: print(f"\r{n:,} patients read", end='', flush=True))
+    print()
+    write_report(args.path, columns, rows)
+    print(f"{stats['patients']:,} patients read in {stats['load_s']:.1f} s ({stats['memory_mb']:,.0f} MB) · "
+          f"{stats.get('pairs', 0):,} candidate pairs · {stats['reported']:,} at or above {args.min_score} · "
+          f"{stats['elapsed']:.1f} s in all")
+    for name, count in stats.get('candidates', {}).items():
+        skipped = stats['skipped'][name]
+        print(f"  {name:10} {count:>12,} pairs" + (f" ({skipped:,} patients in oversized blocks skipped)"
+                                                    if skipped else ""))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+
+from lookups import lookups
+from page_columns import RECORD_COLUMNS
+from utils import db_connection
+
+MAX_AGE = 300       # seconds before a cached record is re-read even without an explicit invalidation
+MAX_RECORDS = 200   # most recently opened records kept
+
+# One statement per related table, each keyed on the patient (through PatientRegister for the
+# per-stay tables), so the number of round trips is the same for 1 admission or 500.
+RECORD_SQL = {
+    'patient': "SELECT * FROM Patient WHERE PatientID = %s",
+    'insurance': "SELECT PatientInsuranceID, ProviderName, GroupNumber, InsuranceNumber, InNetworkCoPay, "
+                 "OutNetworkCoPay, StartDate, EndDate, IsCurrent FROM PatientInsurance "
+                 "WHERE PatientID = %s ORDER BY IsCurrent DESC, StartDate DESC",
+    'admissions': "SELECT PatientRegisterID, AdmittedON, DischargeON, RoomNumber, CopayType, PatientInsuranceID "
+                  "FROM PatientRegister WHERE PatientID = %s ORDER BY AdmittedON DESC",
+    'diseases': "SELECT d.PatientRegisterID, d.DiseaseID FROM PatientRegister r "
+                "JOIN PatientDisease d ON d.PatientRegisterID = r.PatientRegisterID WHERE r.PatientID = %s",
+    'attendants': "SELECT a.PatientRegisterID, e.FirstName, e.LastName FROM PatientRegister r "
+                  "JOIN PatientAttendant a ON a.PatientRegisterID = r.PatientRegisterID "
+                  "JOIN Employee e ON e.EmployeeID = a.EmployeeID WHERE r.PatientID = %s",
+    'labs': "SELECT l.PatientLabReportID, l.PatientRegisterID, l.DateOfTest, l.LabTestID, l.TestValue, l.Comment "
+            "FROM PatientRegister r JOIN PatientLabReport l ON l.PatientRegisterID = r.PatientRegisterID "
+            "WHERE r.PatientID = %s ORDER BY l.DateOfTest DESC",
+}
+# Tables a record holds rows of, by the key the app writes them with.
+RECORD_KEYS = {'Patient': 'PatientRegNo', 'PatientInsurance': 'PatientInsuranceID',
+               'PatientRegister': 'PatientRegisterID', 'PatientLabReport': 'PatientLabReportID'}
+# Link rows and names shown in every record: a write to these drops all cached records.
+SHARED_TABLES = {'PatientDisease', 'PatientAttendant', 'Disease', 'LabTest', 'Employee'}
+
+
+def load_patient_record(patient_id):
+    started = time.perf_counter()
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        cur = conn.cursor()
+        results = {}
+        for name, sql in RECORD_SQL.items():
+            cur.execute(sql, (patient_id,))
+            results[name] = (cur.description, cur.fetchall())
+    description, rows = results['patient']
+    if not rows:
+        raise LookupError(f"Patient {patient_id} no longer exists.")
+    patient = dict(zip([d[0] for d in description], rows[0]))
+
+    diseases = {row[0]: row[1] for row in lookups.get('Disease')}
+    tests = {row[0]: row[1:] for row in lookups.get('LabTest')}
+    diagnoses, attendants, lab_counts = {}, {}, {}
+    for register_id, disease_id in results['diseases'][1]:
+        diagnoses.setdefault(register_id, []).append(diseases.get(disease_id, f"#{disease_id}"))
+    for register_id, first, last in results['attendants'][1]:
+        attendants.setdefault(register_id, []).append(f"{first or ''} {last or ''}".strip())
+
+    labs = []
+    for report_id, register_id, tested_on, test_id, value, comment in results['labs'][1]:
+        name, low, high, unit = tests.get(test_id, (f"#{test_id}", None, None, None))
+        labs.append((report_id, register_id, tested_on, test_id, name, value, unit,
+                     f"{low} – {high}" if low is not None else "", comment))
+        lab_counts[register_id] = lab_counts.get(register_id, 0) + 1
+    admissions = [tuple(row) + (", ".join(diagnoses.get(row[0], [])), ", ".join(attendants.get(row[0], [])),
+                                lab_counts.get(row[0], 0))
+                  for row in results['admissions'][1]]
+
+    keys = {('Patient', str(patient['PatientRegNo']))}
+    keys.update(('PatientInsurance', str(row[0])) for row in results['insurance'][1])
+    keys.update(('PatientRegister', str(row[0])) for row in admissions)
+    keys.update(('PatientLabReport', str(row[0])) for row in labs)
+    return {
+        'patient': patient,
+        'insurance': ([c for c, _ in RECORD_COLUMNS['insurance']['columns']], list(results['insurance'][1])),
+        'admissions': ([c for c, _ in RECORD_COLUMNS['admissions']['columns']], admissions),
+        'labs': ([c for c, _ in RECORD_COLUMNS['labs']['columns']], labs),
+        'keys': keys,
+        'statements': len(RECORD_SQL),
+        'load_ms': (time.perf_counter() - started) * 1000,
+    }
+
+
+class PatientRecordCache:
+    # Assembled records by PatientID, least recently opened evicted first. Saves call written();
+    # MAX_AGE catches changes made on other workstations.
+    def __init__(self, max_records=MAX_RECORDS, max_age=MAX_AGE):
+        self.max_records = max_records
+        self.max_age = max_age
+        self._records = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, patient_id):
+        with self._lock:
+            entry = self._records.get(patient_id)
+            if entry and time.monotonic() - entry[0] < self.max_age:
+                self._records.move_to_end(patient_id)
+                self._counters['hits'] += 1
+                return entry[1]
+            self._counters['misses'] += 1
+            generation = self._generation
+        record = load_patient_record(patient_id)
+        with self._lock:
+            # A write that landed while this load ran may not be in it; serve it once, don't keep it.
+            if generation == self._generation:
+                self._records[patient_id] = (time.monotonic(), record)
+                self._records.move_to_end(patient_id)
+                while len(self._records) > self.max_records:
+                    self._records.popitem(last=False)
+        return record
+
+    def invalidate(self, patient_ids=None):
+        with self._lock:
+            self._counters['invalidations'] += 1
+            self._generation += 1
+            if patient_ids is None:
+                self._records.clear()
+            else:
+                for patient_id in patient_ids:
+                    self._records.pop(patient_id, None)
+
+    def written(self, table, keys=None):
+        # Drops the records holding the written rows. A key no cached record holds may be a new
+        # stay, policy or lab result of any patient, so for those tables everything goes.
+        if table in SHARED_TABLES or (table in RECORD_KEYS and keys is None):
+            self.invalidate()
+            return
+        if table not in RECORD_KEYS:
+            return
+        wanted = {(table, str(key)) for key in keys}
+        with self._lock:
+            holding = [pid for pid, (_, record) in self._records.items() if record['keys'] & wanted]
+            found = set().union(*(self._records[pid][1]['keys'] & wanted for pid in holding))
+        if table != 'Patient' and found != wanted:
+            self.invalidate()
+        elif holding:
+            self.invalidate(holding)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, cached=len(self._records))
+
+
+patient_records = PatientRecordCache()
@@ -0,0 +1,247 @@
+import re
+
+from PyQt5.QtCore import Qt, QTimer, QStringListModel
+from PyQt5.QtWidgets import QLineEdit, QCompleter
+
+from utils import db_connection
+from workers import run_task
+
+SUGGESTION_DELAY_MS = 120
+SEARCH_DELAY_MS = 350
+MAX_SUGGESTIONS = 15
+MAX_RESULTS = 500
+# Words of a search split into "last first" / "first last" (one statement shape per count, which
+# hms_service offers by name); words past these stay in the prefix half.
+MAX_SPLIT_WORDS = 4
+KEY_KINDS = 4            # Reg No, "last first", "first last", phone digits
+LOAD_CHUNK = 50000       # patients per statement while the type-ahead index loads
+PREFIX_LOAD_SQL = ("SELECT PatientID, PatientRegNo, FirstName, LastName, PhoneNumber FROM Patient "
+                   "WHERE PatientID > %s ORDER BY PatientID LIMIT %s")
+
+
+NON_DIGITS = re.compile(r"\D")
+
+
+def normalize(text):
+    return " ".join(str(text or "").lower().split())
+
+
+def phone_digits(text):
+    return NON_DIGITS.sub("", str(text or ""))
+
+
+class PrefixIndex:
+    # Search keys answered by binary search, so a prefix lookup is O(log n + matches) and needs no
+    # round trip to MySQL. Keys: Reg No, "last first", "first last", phone digits. Patients are
+    # held as numpy byte-string columns and each kind of key as an int32 sort order over them; a
+    # key is derived from the columns when it is compared, so the index costs the text itself plus
+    # 16 bytes a patient instead of a Python string per key. Saves and deletes since the load sit
+    # in a small overlay that searches read as well.
+    def __init__(self):
+        self._columns = None
+        self._orders = []
+        self._changed = {}      # reg -> (first, last, phone) saved since the load, None once deleted
+        self.ready = False
+
+    def build(self, chunks):
+        # chunks: lists of (reg, first, last, phone) rows, as load_prefix_index reads them.
+        # Not imported with the module: numpy is only needed once the index is loaded.
+        import numpy as np
+        parts = [[], [], [], []]
+        for rows in chunks:
+            for part, values in zip(parts, zip(*rows)):
+                part.append(np.array([str(v or "").encode() for v in values], dtype=bytes))
+        self._columns = [np.concatenate(part) if part else np.zeros(0, "S1") for part in parts]
+        patients = list(zip(*([value.decode() for value in column.tolist()] for column in self._columns)))
+        self._orders = []
+        for kind in range(KEY_KINDS):
+            keys = [self._index_keys(*patient)[kind] for patient in patients]
+            self._orders.append(np.array(sorted(range(len(keys)), key=keys.__getitem__), np.int32))
+        self.ready = True
+
+    def upsert(self, reg, first, last, phone):
+        self._changed[str(reg)] = (first, last, phone)
+
+    def remove(self, reg):
+        self._changed[str(reg)] = None
+
+    def _patient(self, row):
+        return [value.decode() for value in (column[row] for column in self._columns)]
+
+    def _key(self, kind, row):
+        return self._index_keys(*self._patient(row))[kind]
+
+    def _first_at_least(self, kind, key):
+        order = self._orders[kind]
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(kind, order[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _matches(self, prefix, limit):
+        # (key, reg) of up to limit keys of each kind starting with prefix, overlay included.
+        found = []
+        for kind, order in enumerate(self._orders):
+            i, taken = self._first_at_least(kind, prefix), 0
+            while i < len(order) and taken < limit:
+                key = self._key(kind, order[i])
+                if not key.startswith(prefix):
+                    break
+                reg = self._columns[0][order[i]].decode()
+                if reg not in self._changed:
+                    found.append((key, reg))
+                    taken += 1
+                i += 1
+        for reg, patient in self._changed.items():
+            if patient is not None:
+                found += [(key, reg) for key in self._index_keys(reg, *patient) if key and key.startswith(prefix)]
+        return sorted(found)
+
+    def search(self, text, limit=MAX_SUGGESTIONS):
+        prefixes = {normalize(text)}
+        digits = phone_digits(text)
+        if len(digits) >= 3:
+            prefixes.add(digits)
+        found = []
+        for prefix in prefixes:
+            if not prefix:
+                continue
+            for _, reg in self._matches(prefix, limit):
+                if len(found) == limit:
+                    break
+                if reg not in found:
+                    found.append(reg)
+        return found[:limit]
+
+    def label(self, reg):
+        reg = str(reg)
+        patient = self._changed[reg] if reg in self._changed else self._loaded(reg)
+        if patient is None:
+            return reg
+        first, last, phone = patient
+        return f"{last}, {first} — {reg} — {phone or ''}"
+
+    def _loaded(self, reg):
+        # (first, last, phone) of a patient as loaded, found through the Reg No order.
+        if not self._orders:
+            return None
+        order = self._orders[0]
+        i = self._first_at_least(0, reg.lower())
+        while i < len(order) and self._key(0, order[i]) == reg.lower():
+            patient = self._patient(order[i])
+            if patient[0] == reg:
+                return tuple(patient[1:])
+            i += 1
+        return None
+
+    @staticmethod
+    def _index_keys(reg, first, last, phone):
+        # One key of each kind, in KEY_KINDS order; a patient without a phone has an empty digits key.
+        return [reg.lower(), f"{last} {first}".lower(), f"{first} {last}".lower(),
+                phone_digits(phone) if phone else ""]
+
+
+def load_prefix_index():
+    # Built on a worker thread, LOAD_CHUNK patients per statement (keyset on PatientID), so the
+    # rows are never all held as Python objects at once.
+    with db_connection() as conn:
+        if not conn:
+            return None
+        index = PrefixIndex()
+        index.build(_patient_chunks(conn.cursor()))
+    return index
+
+
+def _patient_chunks(cur):
+    after = 0
+    while True:
+        cur.execute(PREFIX_LOAD_SQL, (after, LOAD_CHUNK))
+        rows = cur.fetchall()
+        if not rows:
+            return
+        yield [row[1:] for row in rows]
+        after = rows[-1][0]
+
+
+def _like_prefix(text):
+    return re.sub(r"([%_\\])", r"\\\1", text) + "%"
+
+
+def search_sql(text, columns="*"):
+    # Finds what PrefixIndex suggests for the same text: a Reg No or name prefix, "last first" or
+    # "first last" (the leading words one name in full, the rest a prefix of the other, at every
+    # split of the words), or a prefix of the phone's digits. Each branch is a prefix match on its
+    # own index (PatientRegNo UNIQUE, idx_patient_name, idx_patient_first_name,
+    # idx_patient_phone_digits); OR-ing them would force a full scan.
+    terms = normalize(text).split()
+    whole = " ".join(terms)
+    where = [("PatientRegNo LIKE %s", (_like_prefix(whole),)),
+             ("LastName LIKE %s", (_like_prefix(whole),)),
+             ("FirstName LIKE %s", (_like_prefix(whole),))]
+    for i in range(1, min(len(terms), MAX_SPLIT_WORDS)):
+        head, tail = " ".join(terms[:i]), _like_prefix(" ".join(terms[i:]))
+        where.append(("LastName = %s AND FirstName LIKE %s", (head, tail)))
+        where.append(("FirstName = %s AND LastName LIKE %s", (head, tail)))
+    digits = phone_digits(text)
+    if len(digits) >= 3:
+        where.append(("PhoneDigits LIKE %s", (digits + "%",)))
+    branches = "\n        UNION ".join(f"(SELECT {columns} FROM Patient WHERE {condition})" for condition, _ in where)
+    sql = f"""
+        {branches}
+        LIMIT {MAX_RESULTS}
+    """
+    return sql, tuple(param for _, params in where for param in params)
+
+
+class PatientSearchBox(QLineEdit):
+    def __init__(self, on_search, parent=None):
+        super().__init__(parent)
+        self.setPlaceholderText("🔍 Search by Reg No, name or phone…")
+        self.setClearButtonEnabled(True)
+        self.setStyleSheet("font-size: 12pt; padding: 6px;")
+        self.on_search = on_search
+        self.index = PrefixIndex()
+
+        self.suggestions = QStringListModel(self)
+        completer = QCompleter(self.suggestions, self)
+        completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        completer.setCaseSensitivity(Qt.CaseInsensitive)
+        completer.activated[str].connect(self._pick)
+        self.setCompleter(completer)
+
+        self.suggest_timer = self._debounce(SUGGESTION_DELAY_MS, self._suggest)
+        self.search_timer = self._debounce(SEARCH_DELAY_MS, lambda: self.on_search(self.text().strip()))
+        self.textEdited.connect(lambda _: (self.suggest_timer.start(), self.search_timer.start()))
+        self.textChanged.connect(lambda text: text or self.search_timer.start())
+        self.returnPressed.connect(lambda: (self.search_timer.stop(), self.on_search(self.text().strip())))
+
+        self.reload_index()
+
+    def reload_index(self):
+        run_task(load_prefix_index, on_done=self._set_index)
+
+    def _debounce(self, delay, slot):
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+        timer.setInterval(delay)
+        timer.timeout.connect(slot)
+        return timer
+
+    def _set_index(self, index):
+        if index:
+            self.index = index
+
+    def _suggest(self):
+        if self.index.ready:
+            self.suggestions.setStringList([self.index.label(r) for r in self.index.search(self.text())])
+
+    def _pick(self, label):
+        reg = label.split(" — ")[1] if " — " in label else label
+        self.search_timer.stop()
+        # The completer writes the full label into the box after this slot; replace it afterwards.
+        QTimer.singleShot(0, lambda: self.setText(reg))
+        self.on_search(reg)
@@ -0,0 +1,382 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication, QMessageBox, QTableView
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perf_baseline.json")
+SETTLE_TIMEOUT = 600        # seconds one scenario step may take before the run is abandoned
+NOISE_FLOOR_MS = 2.0        # p50 differences below this are never reported as regressions
+MEMORY_FLOOR_KB = 1024
+PERCENTILES = (50, 90, 95, 99)
+PAGES = {'patients': 1, 'employees': 2, 'diseases': 3, 'insurance': 4, 'appointments': 5, 'lab_reports': 6}
+NEEDS_INSERTED = {'patient_update', 'appointment_save', 'patient_delete'}
+COUNTED_TABLES = ['Patient', 'EmployeeDetails', 'PatientInsurance', 'PatientRegister', 'PatientLabReport']
+
+
+def percentile(samples, p):
+    # Nearest rank: with 20 samples p95 is the 19th slowest, never an interpolated value.
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))]
+
+
+def rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Bench:
+    # Drives the real window and dialogs offscreen. Every step ends with settle(), which pumps the
+    # event loop until each worker has finished and its result has been handled on the GUI thread,
+    # so a timing covers the query, the model update and the repaint. Saves count once the write
+    # queue has applied them.
+    def __init__(self, app):
+        self.app = app
+        self.window = None
+        self.saved = 0
+        self.inserted = []
+        self.bookings = []
+
+    def settle(self):
+        from workers import pending_tasks
+        from write_queue import write_queue
+        deadline = time.monotonic() + SETTLE_TIMEOUT
+        while True:
+            self.app.processEvents()
+            if not pending_tasks() and not write_queue.busy():
+                self.app.processEvents()
+                if not pending_tasks():
+                    failed = write_queue.failed()
+                    if failed:
+                        sys.exit(f"Save rejected: {failed[0]['error']}")
+                    return
+            if time.monotonic() > deadline:
+                raise TimeoutError("Background work did not finish in time.")
+            time.sleep(0.0005)
+
+    def table(self, page):
+        return self.window.stack.widget(PAGES[page]).findChild(QTableView)
+
+    def open_window(self):
+        from hospital_app import HospitalSystem
+        if self.window is not None:
+            self.window.close()
+            self.window.deleteLater()
+        self.window = HospitalSystem()
+        self.window.show()
+        self.settle()
+
+    def show_page(self, page):
+        self.window.switch_page(PAGES[page])
+        self.settle()
+
+    def startup(self):
+        from lookups import lookups
+        lookups.invalidate()
+        self.open_window()
+
+    def dashboard(self):
+        self.window.switch_page(0)
+        self.window.metrics.refresh(force=True)
+        self.settle()
+
+    def load_page(self, page):
+        if page == 'patients':
+            self.window.load_patients()
+        elif page == 'employees':
+            self.window.load_employees()
+        elif page == 'diseases':
+            from diseases_feature import load_diseases
+            load_diseases(self.table(page))
+        elif page == 'insurance':
+            from insurance_feature import load_insurances
+            load_insurances(self.table(page))
+        elif page == 'appointments':
+            from appointments_feature import load_appointments
+            load_appointments(self.table(page))
+        else:
+            from lab_reports_feature import load_lab_reports
+            load_lab_reports(self.table(page))
+        self.settle()
+
+    def patient_insert(self):
+        from dialogs import AddPatientDialog
+        self.saved += 1
+        reg_no = f"BENCH{os.getpid()}-{self.saved}"
+        dlg = AddPatientDialog()
+        for key, text in [('PatientRegNo', reg_no), ('FirstName', "Bench"), ('LastName', f"Patient{self.saved}"),
+                          ('DateOfBirth', "1990-01-01"), ('PhoneNumber', f"555-9{self.saved:06d}"),
+                          ('Address', "1 Benchmark Rd")]:
+            dlg.fields[key].setText(text)
+        dlg.save_patient()
+        self.settle()
+        self.window.patient_saved(dlg)
+        self.settle()
+        self.inserted.append(reg_no)
+
+    def patient_update(self):
+        from dialogs import AddPatientDialog
+        from table_model import fetch_record
+        reg_no = self.inserted[self.saved % len(self.inserted)]
+        self.saved += 1
+        dlg = AddPatientDialog(fetch_record("Patient", "PatientRegNo", reg_no))
+        dlg.fields['PhoneNumber'].setText(f"555-8{self.saved:06d}")
+        dlg.save_patient()
+        self.settle()
+        self.window.patient_saved(dlg)
+        self.settle()
+
+    def patient_delete(self):
+        # The confirmed half of batch_delete: one DELETE, then the model and search index updates.
+        from batch_ops import delete_rows
+        from workers import run_task
+        keys = [self.inserted.pop()]
+
+        def done(_):
+            self.window.patient_table.model().remove_rows("PatientRegNo", keys)
+            self.window.patients_deleted(keys)
+
+        run_task(delete_rows, "Patient", "PatientRegNo", keys, on_done=done)
+        self.settle()
+
+    def appointment_save(self):
+        from dialogs_appointments import AddAppointmentDialog
+        from table_model import fetch_record
+        if not self.bookings:
+            self.booking_base = self.next_id("PatientRegister", "PatientRegisterID") + 1000
+            self.patient_id = fetch_record("Patient", "PatientRegNo", self.inserted[0])['PatientID']
+            # Both foreign keys are nullable but the dialog insists on text, so point them at real rows.
+            self.insurance_id = self.first_id("PatientInsurance", "PatientInsuranceID")
+            self.employee_id = self.first_id("Employee", "EmployeeID")
+        reg = self.booking_base + len(self.bookings)
+        admitted = datetime.now().replace(microsecond=0) + timedelta(days=365)
+        dlg = AddAppointmentDialog()
+        for key, text in [('PatientRegisterID', reg), ('PatientID', self.patient_id),
+                          ('AdmittedON', admitted), ('DischargeON', admitted + timedelta(days=2)),
+                          ('PatientInsuranceID', self.insurance_id), ('RoomNumber', f"BenchRoom{reg}"),
+                          ('CopayType', "Standard"), ('CreatedBy', self.employee_id)]:
+            dlg.fields[key].setText(str(text))
+        dlg.save_appointment()
+        self.settle()
+        self.bookings.append(reg)
+
+    def pick_record_patient(self):
+        # The patient with the most stays, for the patient record scenario.
+        self.record_patient = self._scalar(
+            "SELECT PatientID FROM PatientRegister GROUP BY PatientID ORDER BY COUNT(*) DESC LIMIT 1")
+
+    def patient_record(self):
+        # Cold open: the record is assembled from the database, then the dialog built and filled.
+        from dialogs_patient_record import PatientRecordDialog
+        from patient_record import patient_records
+        from workers import run_task
+        patient_records.invalidate()
+        run_task(patient_records.get, self.record_patient,
+                 on_done=lambda record: PatientRecordDialog(record, self.window).deleteLater())
+        self.settle()
+
+    def lab_scan(self):
+        from lab_flags import flags, scan_reports
+        from workers import run_task
+        flags.invalidate()
+        run_task(scan_reports)
+        self.settle()
+
+    def cleanup(self):
+        from batch_ops import delete_rows
+        from occupancy import bookings_removed
+        if self.bookings:
+            delete_rows("PatientRegister", "PatientRegisterID", self.bookings)
+            bookings_removed(self.bookings)
+        if self.inserted:
+            delete_rows("Patient", "PatientRegNo", self.inserted)
+
+    @staticmethod
+    def _scalar(sql):
+        from utils import db_connection
+        with db_connection() as conn:
+            if not conn:
+                raise ConnectionError("Could not connect to the database.")
+            cur = conn.cursor()
+            cur.execute(sql)
+            return cur.fetchone()[0]
+
+    def next_id(self, table, column):
+        return int(self._scalar(f"SELECT COALESCE(MAX({column}), 0) FROM {table}"))
+
+    def first_id(self, table, column):
+        return self._scalar(f"SELECT MIN({column}) FROM {table}")
+
+    def row_counts(self):
+        return {table: int(self._scalar(f"SELECT COUNT(*) FROM {table}")) for table in COUNTED_TABLES}
+
+
+def scenarios(bench):
+    # name -> (setup, step). Setup runs once, untimed, before the repetitions of step.
+    table = {
+        'startup': (None, bench.startup),
+        'dashboard': (None, bench.dashboard),
+        'patient_insert': (lambda: bench.show_page('patients'), bench.patient_insert),
+        'patient_update': (None, bench.patient_update),
+        'appointment_save': (None, bench.appointment_save),
+        'patient_delete': (None, bench.patient_delete),
+        'lab_scan': (None, bench.lab_scan),
+        'patient_record': (bench.pick_record_patient, bench.patient_record),
+    }
+    for page in PAGES:
+        table[f"load_{page}"] = ((lambda p=page: bench.show_page(p)), (lambda p=page: bench.load_page(p)))
+    order = ['startup', 'dashboard'] + [f"load_{page}" for page in PAGES] + [
+        'patient_insert', 'patient_update', 'appointment_save', 'patient_delete', 'lab_scan', 'patient_record']
+    return [(name, *table[name]) for name in order]
+
+
+def run_scenario(step, repeat, warmup):
+    from query_stats import stats
+    for _ in range(warmup):
+        step()
+    statements = stats.total
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        step()
+        samples.append((time.perf_counter() - started) * 1000)
+    statements = (stats.total - statements) / repeat
+    # One more pass under tracemalloc for the Python heap peak; it is too slow to time with.
+    tracemalloc.start()
+    step()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result = {f"p{p}": percentile(samples, p) for p in PERCENTILES}
+    result.update(mean=sum(samples) / len(samples), max=max(samples), runs=len(samples),
+                  statements=statements, peak_kb=peak // 1024, rss_kb=rss_kb())
+    return result
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, now in results['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if not before:
+            continue
+        slower = now['p50'] - before['p50']
+        if slower > NOISE_FLOOR_MS and now['p50'] > before['p50'] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {before['p50']:.1f} → {now['p50']:.1f} ms")
+        grown = now['peak_kb'] - before['peak_kb']
+        if grown > MEMORY_FLOOR_KB and now['peak_kb'] > before['peak_kb'] * (1 + tolerance):
+            regressions.append(f"{name}: peak {before['peak_kb']:,} → {now['peak_kb']:,} KB")
+    return regressions
+
+
+def print_report(results, baseline=None):
+    print(f"{'scenario':<20}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}{'SQL':>6}  {'peak KB':>9}{'RSS MB':>8}"
+          + ("   vs baseline p50" if baseline else ""))
+    for name, r in results['scenarios'].items():
+        line = (f"{name:<20}{r['p50']:9.1f}{r['p90']:9.1f}{r['p95']:9.1f}{r['p99']:9.1f}{r['max']:9.1f}"
+                f"{r.get('statements', 0):6.1f}  {r['peak_kb']:9,}{r['rss_kb'] / 1024:8.0f}")
+        before = baseline and baseline['scenarios'].get(name)
+        if before:
+            line += f"   {(r['p50'] / before['p50'] - 1) * 100 if before['p50'] else 0:+6.1f}%"
+        print(line)
+
+
+def headless_app(sqlite=None, generate=None, replica_path=None):
+    from config import REPLICA_CONFIG
+    from write_queue import write_queue
+    REPLICA_CONFIG['enabled'] = bool(replica_path)
+    # A journal of its own, so saves left queued by the app are never replayed against the benchmark database.
+    write_queue.path = os.path.join(tempfile.mkdtemp(prefix="hms-bench-"), "write_queue.db")
+    if replica_path:
+        from local_replica import replica
+        replica.path = replica_path
+
+    if sqlite:
+        from sqlite_standin import use_sqlite
+        use_sqlite(sqlite)
+    if generate:
+        from synthetic_data import generate as fill
+        fill(generate, progress=lambda table, count, elapsed: print(f"  {table}: {count:,} rows"))
+
+    app = QApplication(sys.argv)
+    # Success/confirmation boxes are modal and would block an unattended run.
+    QMessageBox.information = staticmethod(lambda *a, **k: QMessageBox.Ok)
+    QMessageBox.question = staticmethod(lambda *a, **k: QMessageBox.Yes)
+    QMessageBox.critical = staticmethod(lambda parent, title, text, *a, **k: sys.exit(f"{title}: {text}"))
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless end-to-end benchmark of the hospital GUI.")
+    parser.add_argument('--sqlite', metavar='PATH', help="run against a local SQLite stand-in instead of MySQL")
+    parser.add_argument('--generate', type=int, metavar='PATIENTS',
+                        help="first fill the database with this many synthetic patients")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--only', help="comma-separated scenario names")
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown before failing (0.25 = 25%%)")
+    parser.add_argument('--json', metavar='PATH', help="also write the results here")
+    parser.add_argument('--replica', metavar='PATH',
+                        help="start pages from a local replica at PATH (off by default so runs measure MySQL)")
+    args = parser.parse_args()
+
+    app = headless_app(args.sqlite, args.generate, args.replica)
+    bench = Bench(app)
+    wanted = set(args.only.split(",")) if args.only else None
+    results = {'created': datetime.now().isoformat(timespec='seconds'),
+               'target': f"sqlite:{args.sqlite}" if args.sqlite else "mysql",
+               'python': platform.python_version(), 'machine': platform.machine(),
+               'rows': bench.row_counts(), 'scenarios': {}}
+    print(f"Target {results['target']}, rows: " + ", ".join(f"{t} {n:,}" for t, n in results['rows'].items()))
+    try:
+        bench.open_window()
+        if wanted and wanted & NEEDS_INSERTED:
+            # Updates, bookings and deletes work on the patients the insert scenario created.
+            wanted.add('patient_insert')
+        for name, setup, step in scenarios(bench):
+            if wanted and name not in wanted:
+                continue
+            if setup:
+                setup()
+            results['scenarios'][name] = run_scenario(step, max(args.repeat, 1), args.warmup)
+    finally:
+        bench.cleanup()
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if baseline is None:
+        print("No baseline yet; run again with --save-baseline to store one.")
+        return 0
+    if baseline.get('rows') != results['rows']:
+        print("Note: row counts differ from the baseline, so timings are not directly comparable.")
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print("REGRESSION", line)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
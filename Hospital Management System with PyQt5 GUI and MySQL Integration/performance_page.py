@@ -0,0 +1,120 @@
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QFont
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QSpinBox, QCheckBox,
+                             QFileDialog, QMessageBox, QSplitter)
+from query_stats import stats
+from table_model import make_table
+from utils import pool_stats
+
+REFRESH_MS = 1000
+BAR_WIDTH = 40
+STATEMENT_COLUMNS = ["Statement", "Calls", "Total ms", "Mean ms", "Max ms", "Rows", "KB (est.)", "Callers"]
+SLOW_COLUMNS = ["At", "ms", "Rows", "Caller", "Statement", "Plan"]
+
+
+def build_performance_page():
+    page = QWidget()
+    layout = QVBoxLayout()
+    title = QLabel("⏱️ Performance")
+    title.setFont(QFont("Arial", 22))
+    title.setStyleSheet("padding: 10px; color: navy;")
+    layout.addWidget(title)
+
+    summary = QLabel()
+    summary.setStyleSheet("font-size: 12pt;")
+    histogram = QLabel()
+    histogram.setFont(QFont("Monospace", 10))
+    top = QHBoxLayout()
+    top.addWidget(summary, 1)
+    top.addWidget(histogram, 1)
+    layout.addLayout(top)
+
+    statements = make_table()
+    slow = make_table()
+    detail = QLabel("Select a slow statement to see its SQL, parameters and plan.")
+    detail.setWordWrap(True)
+    detail.setTextInteractionFlags(Qt.TextSelectableByMouse)
+    splitter = QSplitter(Qt.Vertical)
+    for widget in (statements, slow, detail):
+        splitter.addWidget(widget)
+    layout.addWidget(splitter, 1)
+
+    controls = QHBoxLayout()
+    threshold = QSpinBox()
+    threshold.setRange(1, 600000)
+    threshold.setSuffix(" ms")
+    threshold.setValue(int(stats.slow_ms))
+    threshold.valueChanged.connect(lambda ms: stats.configure(slow_ms=ms))
+    explain = QCheckBox("EXPLAIN slow statements")
+    explain.setChecked(stats.explain_slow)
+    explain.toggled.connect(lambda on: stats.configure(explain_slow=on))
+    controls.addWidget(QLabel("Slow query threshold:"))
+    controls.addWidget(threshold)
+    controls.addWidget(explain)
+    controls.addStretch()
+    state = {'total': None, 'slow': []}
+
+    def refresh(force=False):
+        if not page.isVisible() and not force:
+            return
+        snap = stats.snapshot()
+        pct = snap['percentiles']
+        fmt = lambda v: "–" if v is None else f"{v:,.1f} ms"
+        pool = pool_stats()
+        summary.setText(
+            f"<b>{snap['total']:,}</b> statements recorded, last {snap['window']:,} in the window<br>"
+            f"p50 {fmt(pct['p50'])} · p90 {fmt(pct['p90'])} · p95 {fmt(pct['p95'])} · p99 {fmt(pct['p99'])}<br>"
+            f"Slow (≥ {snap['slow_query_ms']:,} ms): <b>{len(snap['slow'])}</b><br>"
+            f"Pool: {pool['size']} open, {pool['idle']} idle, {pool['waits']} waits, {pool['timeouts']} timeouts")
+        peak = max((count for _, count in snap['histogram']), default=0) or 1
+        histogram.setText("\n".join(f"{label:>11} {'█' * round(BAR_WIDTH * count / peak):<{BAR_WIDTH}} {count:,}"
+                                    for label, count in snap['histogram']))
+        if snap['total'] == state['total'] and not force:
+            return
+        state['total'] = snap['total']
+        statements.model().set_rows(STATEMENT_COLUMNS, [
+            (s['statement'], s['calls'], round(s['total_ms'], 1), round(s['total_ms'] / s['calls'], 2),
+             round(s['max_ms'], 1), s['rows'], round(s['est_bytes'] / 1024, 1), ", ".join(s['callers']))
+            for s in snap['statements']])
+        state['slow'] = snap['slow']
+        slow.model().set_rows(SLOW_COLUMNS, [
+            (s['at'], s['ms'], s['rows'], s['caller'], s['statement'], (s['plan'] or "").split("\n", 1)[0])
+            for s in snap['slow']])
+
+    def show_detail(current, _previous):
+        if not current.isValid() or current.row() >= len(state['slow']):
+            return
+        s = state['slow'][current.row()]
+        detail.setText(f"{s['at']} · {s['ms']:,} ms ({s['exec_ms']:,} ms to execute) · {s['rows']:,} rows · "
+                       f"{s['caller']} on {s['thread']}\n\n{s['sql']}\n\nParameters: {s['params']}"
+                       + (f"\n\nPlan:\n{s['plan']}" if s['plan'] else ""))
+
+    def reset():
+        stats.reset()
+        refresh(force=True)
+
+    def export():
+        path, _ = QFileDialog.getSaveFileName(page, "Export query statistics", "query_stats.json", "JSON (*.json)")
+        if not path:
+            return
+        try:
+            count = stats.export_json(path)
+        except OSError as e:
+            QMessageBox.critical(page, "Export Failed", str(e))
+            return
+        QMessageBox.information(page, "Exported", f"Summary and {count:,} recent statements written to {path}.")
+
+    slow.selectionModel().currentRowChanged.connect(show_detail)
+    for label, slot in [("🔁 Refresh", lambda: refresh(force=True)), ("🧹 Reset", reset), ("📤 Export JSON", export)]:
+        b = QPushButton(label)
+        b.setStyleSheet("font-size: 12pt; padding: 6px;")
+        b.clicked.connect(slot)
+        controls.addWidget(b)
+    layout.addLayout(controls)
+    page.setLayout(layout)
+
+    timer = QTimer(page)
+    timer.timeout.connect(refresh)
+    timer.start(REFRESH_MS)
+    refresh(force=True)
+    return page
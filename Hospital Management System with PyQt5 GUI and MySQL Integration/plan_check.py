@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from datetime import date, timedelta
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from perf_benchmark import Bench, headless_app, scenarios
+
+# Smaller tables are read whole as fast as through an index; their scans are not reported.
+MIN_ROWS = 10000
+# Statements with nothing to plan (plain inserts, transaction control) or no plan worth checking.
+SKIP_SQL = re.compile(r"^\s*(?:INSERT|SAVEPOINT|ROLLBACK|RELEASE|CREATE|EXPLAIN)\b|information_schema", re.I)
+TABLE_REF = re.compile(r"\b(?:FROM|JOIN|UPDATE)\s+`?(\w+)`?(?:\s+(?:AS\s+)?(?!(?:WHERE|ON|USING|JOIN|LEFT|RIGHT|"
+                       r"INNER|CROSS|ORDER|GROUP|LIMIT|UNION|SET|FOR|HAVING)\b)(\w+))?", re.I)
+FILTER = re.compile(r"\b(?:WHERE|ON|USING)\b", re.I)
+# SQLite: "SCAN Patient", "SCAN Patient USING COVERING INDEX x", "SEARCH Patient USING INDEX x (...)"
+SQLITE_ACCESS = re.compile(r"^(SCAN|SEARCH) (?:TABLE )?(\w+)(?: AS \w+)?(?: USING (?:COVERING )?(?:INDEX (\w+)|"
+                           r"(INTEGER PRIMARY KEY)|PRIMARY KEY))?")
+EXPORT_DAYS = 30
+
+
+def scanned(sql, alias):
+    # Plan rows may name an alias; map it back to the table. Anything that is not a table of the
+    # statement (a derived table, SQLite's CONSTANT ROW) gives None.
+    for match in TABLE_REF.finditer(sql):
+        if alias in (match.group(1), match.group(2)):
+            return match.group(1)
+    return None
+
+
+def whole_reads(sql, table):
+    # How many FROM/JOINs of table have no WHERE or ON at their own nesting level: a grid load, a
+    # lookup list or a plain count, where reading every row is the plan.
+    count = 0
+    for match in TABLE_REF.finditer(sql):
+        if match.group(1).lower() != table.lower():
+            continue
+        depth, level = 0, []
+        for ch in sql[match.end():]:
+            depth += ch == "("
+            depth -= ch == ")"
+            if depth < 0:
+                break
+            level.append(ch if depth == 0 and ch != ")" else " ")
+        count += not FILTER.search("".join(level))
+    return count
+
+
+def accesses(cur, sql, params):
+    # (table, 'scan' or 'search', index) for every table the statement reads, from EXPLAIN on
+    # MySQL or EXPLAIN QUERY PLAN on the SQLite stand-in.
+    cur.execute("EXPLAIN " + sql, params)
+    names = [d[0].lower() for d in cur.description]
+    found = []
+    for row in cur.fetchall():
+        row = dict(zip(names, row))
+        if 'detail' in row:
+            match = SQLITE_ACCESS.match(row['detail'])
+            if match:
+                index = match.group(3) or ("PRIMARY" if match.group(4) or "PRIMARY KEY" in row['detail'] else None)
+                found.append((scanned(sql, match.group(2)), match.group(1).lower(), index))
+        elif row.get('table'):
+            kind = 'scan' if row['type'] in ('ALL', 'index') else 'search'
+            found.append((scanned(sql, row['table']), kind, row['key']))
+    return [access for access in found if access[0]]
+
+
+def exercise(bench):
+    # The benchmark scenarios once each, then the paths they don't reach: search, catch-up loads,
+    # paging both ways, editing a record of every page and date-range exports.
+    from bulk_export import EXPORT_SOURCES, export_table
+    from table_model import fetch_record, refresh_changed
+    for _, setup, step in scenarios(bench):
+        if setup:
+            setup()
+        step()
+
+    bench.show_page('patients')
+    for text in ("Sa", "555"):
+        bench.window.search_patients(text)
+        bench.settle()
+    bench.window.search_patients("")
+    bench.settle()
+    for page in ('patients', 'employees', 'insurance'):
+        bench.show_page(page)
+        table = bench.table(page)
+        refresh_changed(table, table.model().spec['table'], table.model().spec['key'])
+        bench.settle()
+    for page in ('appointments', 'lab_reports'):
+        bench.show_page(page)
+        pager = bench.table(page).pager
+        pager.next()
+        bench.settle()
+        pager.previous()
+        bench.settle()
+    for page in ('patients', 'employees', 'diseases', 'insurance', 'appointments', 'lab_reports'):
+        bench.show_page(page)
+        model = bench.table(page).model()
+        if model.rows:
+            spec = model.spec
+            fetch_record(spec['table'], spec['key'], model.rows[0][model.columns.index(spec['key'])])
+    folder = tempfile.mkdtemp(prefix="hms-plans-")
+    for kind, (_, column) in EXPORT_SOURCES.items():
+        if column:
+            export_table(kind, os.path.join(folder, f"{kind}.csv"),
+                         date_from=date.today() - timedelta(days=EXPORT_DAYS), date_to=date.today())
+
+
+def check(examples, callers, min_rows):
+    from utils import get_pool
+    conn = get_pool().acquire()
+    counts, plans, problems = {}, [], []
+    try:
+        cur = conn.cursor()
+        for key, (sql, params, batch) in examples.items():
+            if SKIP_SQL.match(sql):
+                continue
+            if batch is not None:
+                params = params[0] if params else None
+            try:
+                found = accesses(cur, sql, params)
+            except Exception as e:
+                plans.append({'statement': key, 'error': str(e), 'callers': callers.get(key, [])})
+                continue
+            plan = {'statement': key, 'access': found, 'callers': callers.get(key, [])}
+            scans = {}
+            for table, kind, index in found:
+                if kind == 'scan':
+                    scans.setdefault(table, []).append(index)
+            # A plan row can't be tied to one FROM of a table read several times (the dashboard's
+            # subqueries), so a table only fails when it is scanned more often than it is read whole.
+            for table, indexes in scans.items():
+                if table not in counts:
+                    cur.execute(f"SELECT COUNT(*) FROM {table}")
+                    counts[table] = cur.fetchone()[0]
+                if counts[table] >= min_rows and len(indexes) > whole_reads(sql, table):
+                    problems.append((key, table, indexes[-1], counts[table], plan['callers']))
+            plans.append(plan)
+        conn.close()
+    except Exception:
+        conn.discard()
+        raise
+    return plans, problems
+
+
+def index_usage(plans):
+    from migrate import migration_indexes
+    used = {}
+    for plan in plans:
+        for _, _, index in plan.get('access', []):
+            used[index] = used.get(index, 0) + 1
+    names = [re.match(r"CREATE INDEX (\w+)", s, re.I).group(1) for s in migration_indexes()]
+    return {name: used.get(name, 0) for name in names}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="EXPLAIN every statement the app issues and fail if a filtered read scans a large table.")
+    parser.add_argument('--sqlite', metavar='PATH', help="check against a local SQLite stand-in instead of MySQL")
+    parser.add_argument('--generate', type=int, metavar='PATIENTS',
+                        help="first fill the database with this many synthetic patients")
+    parser.add_argument('--min-rows', type=int, default=MIN_ROWS, help="ignore scans of tables smaller than this")
+    parser.add_argument('--json', metavar='PATH', help="also write every plan here")
+    args = parser.parse_args()
+
+    from query_stats import stats
+    app = headless_app(args.sqlite, args.generate)
+    bench = Bench(app)
+    stats.reset()
+    try:
+        bench.open_window()
+        exercise(bench)
+    finally:
+        bench.cleanup()
+    callers = {s['statement']: s['callers'] for s in stats.snapshot()['statements']}
+    plans, problems = check(stats.examples(), callers, args.min_rows)
+
+    failed = [p for p in plans if 'error' in p]
+    print(f"{len(plans)} statements explained, {len(failed)} could not be, {len(problems)} full scans")
+    for plan in failed:
+        print(f"EXPLAIN FAILED  {plan['statement'][:150]}\n    {plan['error']}")
+    for statement, table, index, rows, where in problems:
+        how = f"full scan of {index}" if index else "full table scan"
+        print(f"FULL SCAN  {table} ({rows:,} rows, {how})  from {', '.join(where) or 'unknown'}\n    {statement[:300]}")
+    print("Migration indexes (statements using each):")
+    for name, count in index_usage(plans).items():
+        print(f"  {name:<36}{count if count else 'unused'}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'plans': plans, 'problems': problems}, f, indent=2, default=str)
+    # A statement that can't be explained is unchecked, so it fails the run like a scan does.
+    return 1 if problems or failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
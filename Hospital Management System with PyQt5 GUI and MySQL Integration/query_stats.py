@@ -0,0 +1,336 @@
+import json
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+from config import PERF_CONFIG
+
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+SLOW_LOG_SIZE = 200
+# Modules that only pass queries through; the caller shown is the first frame outside them.
+PLUMBING = {'utils', 'query_stats', 'workers', 'table_model', 'paging', 'batch_ops', 'lookups',
+            'contextlib', 'threading', 'sqlite_standin'}
+SELECT_SQL = re.compile(r"\s*\(?\s*SELECT\b", re.I)
+
+_local = threading.local()
+
+
+def current_origin():
+    origin = getattr(_local, 'origin', None)
+    if origin:
+        return origin
+    frame = sys._getframe(1)
+    outermost = "unknown"
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        outermost = f"{module}.{_function_name(frame)}"
+        if module not in PLUMBING:
+            return outermost
+        frame = frame.f_back
+    # Called straight from a Qt signal into plumbing code (e.g. a pager button).
+    return outermost
+
+
+def _function_name(frame):
+    # Class.method where the frame has a self or cls (co_qualname would say so, but only from Python 3.11).
+    name = frame.f_code.co_name
+    for owner in ('self', 'cls'):
+        if owner in frame.f_code.co_varnames[:frame.f_code.co_argcount] and owner in frame.f_locals:
+            value = frame.f_locals[owner]
+            return f"{(value if isinstance(value, type) else type(value)).__name__}.{name}"
+    return name
+
+
+@contextmanager
+def query_origin(origin):
+    # Worker threads run with the origin captured when the task was queued on the GUI thread.
+    previous = getattr(_local, 'origin', None)
+    _local.origin = origin
+    try:
+        yield
+    finally:
+        _local.origin = previous
+
+
+@lru_cache(maxsize=2048)
+def normalize(sql):
+    # One entry per statement shape: literals and IN lists collapse, whitespace is squeezed.
+    sql = re.sub(r"'(?:[^'\\]|\\.)*'", "?", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))+\s*\)", "(…)", sql)
+    return " ".join(sql.split())
+
+
+def _row_bytes(row):
+    # Sizes are estimates: each fetch counts its first row's size times its row count, so wide
+    # text columns of varying length are not walked row by row.
+    return sum(len(v) if isinstance(v, (str, bytes, bytearray)) else 8 for v in row)
+
+
+class QueryRecord:
+    __slots__ = ('sql', 'params', 'origin', 'thread', 'started', 'exec_ms', 'fetch_ms', 'rows', 'fetched',
+                 'bytes', 'batch')
+
+    def __init__(self, sql, params, origin, batch=None):
+        self.sql = sql
+        self.params = params
+        self.origin = origin
+        self.thread = threading.current_thread().name
+        self.started = time.time()
+        self.exec_ms = 0.0
+        self.fetch_ms = 0.0
+        self.rows = 0
+        self.fetched = 0
+        self.bytes = 0
+        self.batch = batch
+
+
+class QueryStats:
+    def __init__(self, config=PERF_CONFIG):
+        self.slow_ms = config['slow_query_ms']
+        self.explain_slow = config['explain_slow']
+        self._recent = deque(maxlen=config['history'])
+        self._slow = deque(maxlen=SLOW_LOG_SIZE)
+        self._statements = {}
+        self._plans = {}
+        self._examples = {}
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def finish(self, record):
+        elapsed = record.exec_ms + record.fetch_ms
+        rows = max(record.rows, record.fetched)
+        key = normalize(record.sql)
+        explain = False
+        with self._lock:
+            self.total += 1
+            self._recent.append((record.started, elapsed, rows, record.bytes, record.origin, key))
+            entry = self._statements.get(key)
+            if entry is None:
+                entry = self._statements[key] = {'statement': key, 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                                  'rows': 0, 'est_bytes': 0, 'callers': set()}
+                self._examples[key] = (record.sql, record.params, record.batch)
+            entry['calls'] += 1
+            entry['total_ms'] += elapsed
+            entry['max_ms'] = max(entry['max_ms'], elapsed)
+            entry['rows'] += rows
+            entry['est_bytes'] += record.bytes
+            entry['callers'].add(record.origin)
+            if elapsed >= self.slow_ms:
+                self._slow.append({'at': datetime.fromtimestamp(record.started).isoformat(timespec='milliseconds'),
+                                   'ms': round(elapsed, 2), 'exec_ms': round(record.exec_ms, 2), 'rows': rows,
+                                   'est_bytes': record.bytes, 'caller': record.origin, 'thread': record.thread,
+                                   'statement': key, 'sql': " ".join(record.sql.split()),
+                                   'params': repr(record.params)[:500], 'batch': record.batch})
+                explain = (self.explain_slow and key not in self._plans and record.batch is None
+                           and SELECT_SQL.match(record.sql) is not None)
+                if explain:
+                    self._plans[key] = "pending…"
+        if explain:
+            threading.Thread(target=self._explain, args=(key, record.sql, record.params), daemon=True).start()
+
+    def _explain(self, key, sql, params):
+        # A raw pool connection: the statement being explained may still be streaming on its own.
+        from utils import get_pool
+        try:
+            conn = get_pool().acquire()
+        except Exception as e:
+            plan = f"EXPLAIN failed: {e}"
+        else:
+            try:
+                cur = conn.cursor()
+                cur.execute("EXPLAIN " + sql, params)
+                names = [d[0] for d in cur.description]
+                plan = "\n".join(", ".join(f"{n}={v}" for n, v in zip(names, row) if v is not None)
+                                 for row in cur.fetchall())
+                conn.close()
+            except Exception as e:
+                conn.discard()
+                plan = f"EXPLAIN failed: {e}"
+        with self._lock:
+            self._plans[key] = plan
+
+    def configure(self, slow_ms=None, explain_slow=None):
+        with self._lock:
+            if slow_ms is not None:
+                self.slow_ms = slow_ms
+            if explain_slow is not None:
+                self.explain_slow = explain_slow
+
+    def reset(self):
+        with self._lock:
+            self._recent.clear()
+            self._slow.clear()
+            self._statements.clear()
+            self._plans.clear()
+            self._examples.clear()
+            self.total = 0
+
+    def examples(self):
+        # The first SQL and parameters seen for each statement shape, e.g. to EXPLAIN them later.
+        with self._lock:
+            return dict(self._examples)
+
+    def snapshot(self):
+        with self._lock:
+            recent = list(self._recent)
+            slow = [dict(entry, plan=self._plans.get(entry['statement'])) for entry in reversed(self._slow)]
+            statements = [dict(entry, callers=sorted(entry['callers'])) for entry in self._statements.values()]
+            total = self.total
+        timings = sorted(r[1] for r in recent)
+        counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        for ms in timings:
+            counts[_bucket(ms)] += 1
+        labels = [f"≤{b:,} ms" for b in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]:,} ms"]
+        statements.sort(key=lambda s: s['total_ms'], reverse=True)
+        return {
+            'taken': datetime.now().isoformat(timespec='seconds'),
+            'slow_query_ms': self.slow_ms, 'explain_slow': self.explain_slow,
+            'total': total, 'window': len(timings),
+            'percentiles': {f"p{p}": _percentile(timings, p) for p in (50, 90, 95, 99)},
+            'histogram': list(zip(labels, counts)),
+            'statements': statements, 'slow': slow,
+        }
+
+    def export_json(self, path):
+        snapshot = self.snapshot()
+        with self._lock:
+            snapshot['recent'] = [{'at': datetime.fromtimestamp(r[0]).isoformat(timespec='milliseconds'),
+                                   'ms': round(r[1], 3), 'rows': r[2], 'est_bytes': r[3], 'caller': r[4],
+                                   'statement': r[5]} for r in self._recent]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, indent=2, default=str)
+        return len(snapshot['recent'])
+
+
+def _bucket(ms):
+    for i, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+        if ms <= bound:
+            return i
+    return len(HISTOGRAM_BOUNDS_MS)
+
+
+def _percentile(ordered, p):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+stats = QueryStats()
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor, origin):
+        self._cursor = cursor
+        self._origin = origin
+        self._record = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def _run(self, method, sql, params, batch=None):
+        self.finish()
+        record = QueryRecord(sql, params, self._origin, batch)
+        started = time.perf_counter()
+        try:
+            result = method(sql, params)
+        finally:
+            record.exec_ms = (time.perf_counter() - started) * 1000
+            self._record = record
+        # pymysql returns affected rows for writes and the row count for buffered SELECTs;
+        # streaming cursors return 0 and are counted as they are fetched.
+        record.rows = result if isinstance(result, int) else 0
+        return result
+
+    def execute(self, sql, params=None):
+        return self._run(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, rows):
+        rows = rows if isinstance(rows, list) else list(rows)
+        return self._run(self._cursor.executemany, sql, rows, batch=len(rows))
+
+    def _fetched(self, rows, started, done):
+        record = self._record
+        if record is None:
+            return
+        record.fetch_ms += (time.perf_counter() - started) * 1000
+        if rows:
+            record.fetched += len(rows)
+            record.bytes += _row_bytes(rows[0]) * len(rows)
+        if done:
+            self.finish()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched([row] if row is not None else [], started, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(size) if size else self._cursor.fetchmany()
+        self._fetched(rows, started, not rows)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(rows, started, True)
+        return rows
+
+    def finish(self):
+        record, self._record = self._record, None
+        if record is not None:
+            stats.finish(record)
+
+    def close(self):
+        self.finish()
+        self._cursor.close()
+
+
+class InstrumentedConnection:
+    # Wraps a pooled connection; every cursor it hands out records its statements in stats.
+    def __init__(self, conn):
+        self._conn = conn
+        self._cursors = []
+        self.origin = current_origin()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args):
+        cursor = InstrumentedCursor(self._conn.cursor(*args), self.origin)
+        self._cursors.append(cursor)
+        return cursor
+
+    def _finish_all(self):
+        for cursor in self._cursors:
+            cursor.finish()
+        self._cursors = []
+
+    def commit(self):
+        for cursor in self._cursors:
+            cursor.finish()
+        self._conn.commit()
+
+    def close(self):
+        self._finish_all()
+        self._conn.close()
+
+    def discard(self):
+        self._finish_all()
+        self._conn.discard()
+
+
+def instrument(conn):
+    if conn is None or not PERF_CONFIG['enabled']:
+        return conn
+    return InstrumentedConnection(conn)
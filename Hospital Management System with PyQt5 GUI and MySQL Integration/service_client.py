@@ -0,0 +1,278 @@
+import base64
+import http.client
+import json
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from urllib.parse import urlsplit
+
+import pymysql
+
+import utils
+from service_operations import is_read, operation_name
+from utils import ConnectionPool
+
+REQUEST_TIMEOUT = 60
+# A connection used this recently is taken to be alive without a /health round trip.
+PING_INTERVAL = 5
+
+
+class ServiceError(Exception):
+    pass
+
+
+def _encode(value):
+    if isinstance(value, Decimal):
+        return {'$decimal': str(value)}
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, timedelta):
+        return {'$seconds': value.total_seconds()}
+    if isinstance(value, (bytes, bytearray)):
+        return {'$bytes': base64.b64encode(value).decode()}
+    raise TypeError(f"{type(value).__name__} can't be sent to the service")
+
+
+DECODERS = {
+    '$decimal': Decimal,
+    '$datetime': datetime.fromisoformat,
+    '$date': date.fromisoformat,
+    '$seconds': lambda v: timedelta(seconds=v),
+    '$bytes': base64.b64decode,
+}
+
+
+def _decode(obj):
+    if len(obj) == 1:
+        (name, value), = obj.items()
+        if name in DECODERS:
+            return DECODERS[name](value)
+    return obj
+
+
+def dumps(payload):
+    # Values the database hands back (Decimal, dates, BIT bytes) survive the trip with their types.
+    return json.dumps(payload, default=_encode, separators=(",", ":")).encode()
+
+
+def loads(data):
+    return json.loads(data, object_hook=_decode)
+
+
+def error_payload(error):
+    args = [a if isinstance(a, (int, str)) else str(a) for a in error.args]
+    return {'error': str(error), 'type': type(error).__name__, 'args': args}
+
+
+def raise_error(payload):
+    # pymysql error classes are rebuilt with their (code, message) args so callers such as the
+    # write queue can still tell a deadlock from a constraint violation.
+    cls = getattr(pymysql.err, payload.get('type', ''), None)
+    if isinstance(cls, type) and issubclass(cls, Exception):
+        raise cls(*payload.get('args', [payload['error']]))
+    raise ServiceError(payload['error'])
+
+
+def _operation(sql):
+    # Only the app's own statements have a service operation; anything else needs MySQL directly.
+    name = operation_name(sql)
+    if name is None:
+        raise ServiceError("The service has no operation for this statement; it only runs the app's own, "
+                           "as named in service_operations.py.")
+    return name
+
+
+class RemoteCursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._rows = deque()
+        self._stream = None
+        self.description = None
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def execute(self, sql, params=None):
+        self._end_stream()
+        self._rows.clear()
+        name = _operation(sql)
+        if self._conn.session is None and is_read(sql):
+            # Streamed like pymysql's SSCursor: rows are read off the response as they are fetched.
+            self._stream = self._conn.request("POST", f"/{name}", {'params': params}, stream=True)
+            self._set_description(self._read_line()['description'])
+            self.rowcount = -1
+            return 0
+        result = self._conn.session_execute(name, params)
+        self._set_description(result['description'])
+        self._rows.extend(result['rows'])
+        self.rowcount, self.lastrowid = result['rowcount'], result['lastrowid']
+        return result['rowcount']
+
+    def executemany(self, sql, rows):
+        self._end_stream()
+        self._rows.clear()
+        result = self._conn.session_execute(_operation(sql), list(rows), many=True)
+        self.rowcount, self.lastrowid = result['rowcount'], result['lastrowid']
+        return result['rowcount']
+
+    def _set_description(self, description):
+        self.description = [tuple(d) for d in description] if description else None
+
+    def _read_line(self):
+        line = self._stream.readline()
+        if not line:
+            self._stream = None
+            self._conn.reset()
+            raise ConnectionError("The service closed the connection mid-result.")
+        message = loads(line)
+        if 'error' in message:
+            self._finish()
+            raise_error(message)
+        return message
+
+    def _finish(self):
+        # Reads the end of the chunked body so the kept-alive connection is free for the next request.
+        self._stream.read()
+        self._stream = None
+
+    def _fill(self, size):
+        while self._stream is not None and (size is None or len(self._rows) < size):
+            message = self._read_line()
+            if message.get('done'):
+                self._finish()
+                self.rowcount = message['rowcount']
+            else:
+                self._rows.extend(message['rows'])
+
+    def _end_stream(self):
+        # Unread rows are still on the wire; drop the HTTP connection rather than drain it.
+        if self._stream is not None:
+            self._stream = None
+            self._conn.reset()
+
+    def fetchone(self):
+        self._fill(1)
+        return tuple(self._rows.popleft()) if self._rows else None
+
+    def fetchmany(self, size=1):
+        self._fill(size)
+        return [tuple(self._rows.popleft()) for _ in range(min(size, len(self._rows)))]
+
+    def fetchall(self):
+        self._fill(None)
+        rows = [tuple(r) for r in self._rows]
+        self._rows.clear()
+        return rows
+
+    def close(self):
+        self._end_stream()
+        self._rows.clear()
+
+
+class RemoteConnection:
+    # Enough of the pymysql connection interface for ConnectionPool and the app's queries, spoken to
+    # hms_service over HTTP/JSON. The service holds the database credentials, not this client.
+    remote = True   # runs only the service's named statements
+
+    def __init__(self, url, token=""):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.token = token
+        self.session = None
+        self.open = True
+        self._http = None
+        self._streaming = None
+        self._used_at = 0.0
+
+    def reset(self):
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+
+    def request(self, method, path, body=None, stream=False):
+        if self._streaming is not None:
+            # A cursor left a result half read (fetchone on a big result); drop it with the connection.
+            if not self._streaming.isclosed():
+                self.reset()
+            self._streaming = None
+        headers = {'Content-Type': "application/json"}
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        data = dumps(body) if body is not None else None
+        # A kept-alive connection the service has since closed fails on first use; idempotent
+        # requests outside a session are sent once more on a fresh connection.
+        for attempt in range(2):
+            if self._http is None:
+                self._http = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+            try:
+                self._http.request(method, path, body=data, headers=headers)
+                response = self._http.getresponse()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                self.reset()
+                if attempt or self.session is not None or path.startswith("/sessions"):
+                    raise ConnectionError(f"Service unreachable: {e}") from e
+        self._used_at = time.monotonic()
+        if response.status != 200:
+            payload = response.read()
+            try:
+                message = loads(payload)
+            except ValueError:
+                raise ServiceError(f"HTTP {response.status}: {payload[:200]!r}")
+            raise_error(message)
+        if stream:
+            self._streaming = response
+            return response
+        return loads(response.read())
+
+    def session_execute(self, name, params, many=False):
+        if self.session is None:
+            self.session = self.request("POST", "/sessions")['session']
+        return self.request("POST", f"/sessions/{self.session}/{name}", {'params': params, 'many': many})
+
+    def _end_session(self, action):
+        session, self.session = self.session, None
+        if session is not None:
+            self.request("POST", f"/sessions/{session}/{action}")
+
+    def cursor(self, cursor_class=None):
+        return RemoteCursor(self)
+
+    def commit(self):
+        self._end_session("commit")
+
+    def rollback(self):
+        self._end_session("rollback")
+
+    def ping(self, reconnect=False):
+        if self._http is None or time.monotonic() - self._used_at > PING_INTERVAL:
+            self.request("GET", "/health")
+
+    def close(self):
+        self.open = False
+        try:
+            self.rollback()
+        finally:
+            self.reset()
+
+
+class ServicePool(ConnectionPool):
+    def __init__(self, url, token="", **kwargs):
+        super().__init__({'url': url, 'token': token}, **kwargs)
+
+    def _connect(self):
+        conn = RemoteConnection(self.config['url'], self.config['token'])
+        conn.ping()
+        self._count('creates')
+        return conn
+
+
+def use_service(url, token=""):
+    # Points every get_connection()/db_connection() in the app at hms_service instead of MySQL.
+    with utils._pool_lock:
+        if utils._pool is not None:
+            utils._pool.close_all()
+        utils._pool = ServicePool(url, token, **utils.POOL_CONFIG)
+    return utils._pool
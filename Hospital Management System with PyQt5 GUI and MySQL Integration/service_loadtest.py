@@ -0,0 +1,210 @@
+import argparse
+import os
+import random
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from config import SERVICE_CONFIG
+from dashboard_metrics import METRICS_SQL
+from dialogs import PATIENT_INSERT_SQL
+from lookups import LOOKUP_QUERIES
+from page_columns import PAGE_COLUMNS, select_list, select_sql
+from paging import KEYSET_SQL
+from service_client import RemoteConnection
+
+# What one front-desk client does, weighted: mostly lookups, dashboard refreshes and opening records,
+# now and then a grid page, a full grid load or a patient save. Every statement is one the GUI
+# issues, since the service runs nothing else.
+MIX = [('lookup', 30), ('dashboard', 15), ('open_record', 25), ('page_jump', 15), ('page_load', 5),
+       ('patient_save', 8), ('patient_update', 2)]
+PATIENTS = PAGE_COLUMNS['patients']
+PAGE_SQL = f"SELECT {select_list(PATIENTS)} FROM Patient " + KEYSET_SQL['jump'].format(key=PATIENTS['key'])
+PERCENTILES = (50, 95, 99)
+FETCH_BATCH = 500
+TEST_PREFIX = "LOAD"
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))]
+
+
+class Client(threading.Thread):
+    def __init__(self, number, url, token, reg_nos, deadline, seed):
+        super().__init__(daemon=True)
+        self.number = number
+        self.conn = RemoteConnection(url, token)
+        self.reg_nos = reg_nos
+        self.deadline = deadline
+        self.rng = random.Random(seed + number)
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.messages = set()
+        self.saved = []
+
+    def run(self):
+        names = [name for name, _ in MIX]
+        weights = [weight for _, weight in MIX]
+        while time.monotonic() < self.deadline:
+            name = self.rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                getattr(self, name)()
+            except Exception as e:
+                self.errors[name] += 1
+                self.messages.add(f"{name}: {type(e).__name__}: {e}"[:160])
+                try:
+                    self.conn.rollback()
+                except Exception:
+                    self.conn.reset()
+                continue
+            self.timings[name].append(time.perf_counter() - started)
+        self.conn.close()
+
+    def _fetch_all(self, sql, params=None):
+        cur = self.conn.cursor()
+        cur.execute(sql, params)
+        rows = 0
+        while True:
+            chunk = cur.fetchmany(FETCH_BATCH)
+            if not chunk:
+                break
+            rows += len(chunk)
+        cur.close()
+        return rows
+
+    def lookup(self):
+        self._fetch_all(self.rng.choice(list(LOOKUP_QUERIES.values())))
+
+    def dashboard(self):
+        self._fetch_all(METRICS_SQL)
+
+    def open_record(self):
+        self._fetch_all("SELECT * FROM Patient WHERE PatientRegNo=%s", (self.rng.choice(self.reg_nos),))
+
+    def page_jump(self):
+        self._fetch_all(PAGE_SQL, (self.rng.choice(self.reg_nos), 500))
+
+    def page_load(self):
+        self._fetch_all(select_sql(PAGE_COLUMNS[self.rng.choice(['patients', 'employees', 'diseases'])]))
+
+    def patient_save(self):
+        reg_no = f"{TEST_PREFIX}{os.getpid()}-{self.number}-{len(self.saved) + 1}"
+        cur = self.conn.cursor()
+        cur.execute(PATIENT_INSERT_SQL, (reg_no, "Load", f"Client{self.number}", "Other", "1990-01-01", "555-0000", "1 Load Test Rd"))
+        self.conn.commit()
+        self.saved.append(reg_no)
+
+    def patient_update(self):
+        if not self.saved:
+            return self.patient_save()
+        cur = self.conn.cursor()
+        # The batch edit statement, for one patient.
+        cur.execute("UPDATE Patient SET `Address`=%s WHERE PatientRegNo IN (%s)",
+                    (f"{self.rng.randint(1, 999)} Load Test Rd", self.rng.choice(self.saved)))
+        self.conn.commit()
+
+
+def start_service(sqlite_path, port, token):
+    # A separate process, so the service's event loop doesn't share a GIL with the simulated clients.
+    here = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen([sys.executable, os.path.join(here, "hms_service.py"), "--sqlite", sqlite_path,
+                                "--host", "127.0.0.1", "--port", str(port)], cwd=here,
+                               env=dict(os.environ, HMS_SERVICE_TOKEN=token))
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        if process.poll() is not None:
+            raise SystemExit("The service exited on startup.")
+        try:
+            RemoteConnection(url, token).request("GET", "/health")
+            return process, url
+        except (ConnectionError, OSError):
+            time.sleep(0.1)
+    process.terminate()
+    raise SystemExit("The service did not come up.")
+
+
+def cleanup(url, token, saved):
+    conn = RemoteConnection(url, token)
+    try:
+        cur = conn.cursor()
+        for i in range(0, len(saved), 500):
+            chunk = saved[i:i + 500]
+            cur.execute(f"DELETE FROM Patient WHERE PatientRegNo IN ({', '.join(['%s'] * len(chunk))})", chunk)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive hms_service with many simulated GUI clients.")
+    parser.add_argument('--url', default=SERVICE_CONFIG['url'] or f"http://127.0.0.1:{SERVICE_CONFIG['port']}")
+    parser.add_argument('--token', default=SERVICE_CONFIG['token'])
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=30, help="seconds of load")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--sqlite', metavar='PATH', help="start a service on this SQLite stand-in for the run")
+    parser.add_argument('--port', type=int, default=18765, help="port for the service started by --sqlite")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        # A service started for the run gets a throwaway token.
+        args.token = args.token or secrets.token_hex(16)
+        process, url = start_service(args.sqlite, args.port, args.token)
+    else:
+        process, url = None, args.url
+    try:
+        probe = RemoteConnection(url, args.token)
+        cur = probe.cursor()
+        cur.execute(f"SELECT {select_list(PATIENTS)} FROM Patient " + KEYSET_SQL['first'].format(key=PATIENTS['key']),
+                    (5000,))
+        reg_col = [d[0] for d in cur.description].index('PatientRegNo')
+        reg_nos = [row[reg_col] for row in cur.fetchall()]
+        probe.close()
+        if not reg_nos:
+            raise SystemExit("The database has no patients; load synthetic data first.")
+
+        deadline = time.monotonic() + args.duration
+        clients = [Client(n, url, args.token, reg_nos, deadline, args.seed) for n in range(args.clients)]
+        started = time.perf_counter()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - started
+
+        timings, errors, messages = defaultdict(list), defaultdict(int), set()
+        for client in clients:
+            messages |= client.messages
+            for name, samples in client.timings.items():
+                timings[name].extend(samples)
+            for name, count in client.errors.items():
+                errors[name] += count
+        total = sum(len(samples) for samples in timings.values())
+        print(f"{args.clients} clients for {elapsed:.1f} s: {total:,} operations, {total / elapsed:,.0f}/s")
+        print(f"{'operation':<16}{'count':>8}{'errors':>8}" + "".join(f"{'p%d ms' % p:>10}" for p in PERCENTILES))
+        for name, _ in MIX:
+            samples = timings.get(name)
+            if not samples:
+                continue
+            print(f"{name:<16}{len(samples):>8}{errors.get(name, 0):>8}"
+                  + "".join(f"{percentile(samples, p) * 1000:>10.1f}" for p in PERCENTILES))
+        for message in sorted(messages):
+            print("  error:", message)
+
+        saved = [reg_no for client in clients for reg_no in client.saved]
+        if saved:
+            cleanup(url, args.token, saved)
+        print("service:", RemoteConnection(url, args.token).request("GET", "/stats"))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+import re
+import sqlite3
+from functools import lru_cache
+
+# Statements that may run on any service connection. The rest (writes, SAVEPOINT, locking reads)
+# only run inside a session, which keeps one database connection until commit or rollback.
+READ_SQL = re.compile(r"\s*(?:\(\s*)*(?:SELECT|WITH|EXPLAIN)\b", re.I)
+FOR_UPDATE = re.compile(r"\bFOR\s+UPDATE\b", re.I)
+# A key list of any length is one operation; hms_service sizes IN (%s) to the parameters it gets.
+IN_LIST = re.compile(r"\bIN \((?:%s, )*%s\)")
+MAX_IN_KEYS = 5000
+# Statements plan_check.py can EXPLAIN through the service, and the tables it counts.
+EXPLAINED = re.compile(r"\s*(?:\(\s*)*(?:SELECT|WITH|UPDATE|DELETE|REPLACE)\b", re.I)
+TABLES = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+`?(\w+)", re.I)
+
+
+def normalize(sql):
+    return IN_LIST.sub("IN (%s)", " ".join(sql.split()))
+
+
+def _page_operations(page, spec):
+    from page_columns import long_columns, select_list, select_sql
+    from paging import KEYSET_SQL
+    table, key, select = spec['table'], spec['key'], select_list(spec)
+    ops = {'list': select_sql(spec),
+           'row': f"SELECT {select} FROM {table} WHERE {key}=%s",
+           'rows': f"SELECT {select} FROM {table} WHERE {key} IN (%s)",
+           'record': f"SELECT * FROM {table} WHERE {key}=%s",
+           'delete': f"DELETE FROM {table} WHERE {key} IN (%s)"}
+    for step, tail in KEYSET_SQL.items():
+        ops[step] = f"SELECT {select} FROM {table} " + tail.format(key=key)
+    columns = [name for name, _ in spec['columns']]
+    if 'ModifiedON' in columns:
+        ops['changed'] = f"SELECT {select} FROM {table} WHERE ModifiedON >= %s"
+    names = long_columns(spec)
+    if names:
+        ops['long'] = f"SELECT {key}, {', '.join(f'`{c}`' for c in names)} FROM {table} WHERE {key} IN (%s)"
+    for column in columns:
+        if column not in (key, 'ModifiedON'):
+            ops[f'edit/{column}'] = f"UPDATE {table} SET `{column}`=%s WHERE {key} IN (%s)"
+    return {f"pages/{page}/{name}": sql for name, sql in ops.items()}
+
+
+def _replica_operations():
+    from local_replica import REPLICATED, replica_schema, sync_sql
+    from sqlite_standin import add_functions
+    schema = sqlite3.connect(":memory:")
+    add_functions(schema)
+    for statement in replica_schema():
+        schema.execute(statement)
+    ops = {}
+    for table, key, watermark in REPLICATED:
+        columns = [row[1] for row in schema.execute(f"PRAGMA table_info({table})")]
+        for name, sql in sync_sql(table, key, watermark, columns).items():
+            if watermark or name != 'since':
+                ops[f"replica/{table}/{name}"] = sql
+    schema.close()
+    return ops
+
+
+def _search_operations():
+    from page_columns import PAGE_COLUMNS, select_list
+    from patient_search import MAX_SPLIT_WORDS, PREFIX_LOAD_SQL, search_sql
+    ops = {'search/prefix_load': PREFIX_LOAD_SQL}
+    columns = select_list(PAGE_COLUMNS['patients'])
+    for words in range(1, MAX_SPLIT_WORDS + 1):
+        ops[f"search/words{words}"] = search_sql(" ".join(["a"] * words), columns)[0]
+        ops[f"search/words{words}_phone"] = search_sql(" ".join(["a"] * (words - 1) + ["555"]), columns)[0]
+    return ops
+
+
+def _export_operations():
+    from datetime import date
+    from bulk_export import COLUMNS_SQL, EXPORT_SOURCES, build_query
+    ops = {}
+    for kind, (table, date_column) in EXPORT_SOURCES.items():
+        ops[f"exports/{kind}/columns"] = COLUMNS_SQL.format(table=table)
+        ops[f"exports/{kind}/all"] = build_query(kind)[0]
+        if date_column:
+            day = date.today()
+            ops[f"exports/{kind}/from"] = build_query(kind, date_from=day)[0]
+            ops[f"exports/{kind}/to"] = build_query(kind, date_to=day)[0]
+            ops[f"exports/{kind}/between"] = build_query(kind, date_from=day, date_to=day)[0]
+    return ops
+
+
+def _explain_operations(ops):
+    explained = {f"explain/{name}": "EXPLAIN " + sql for name, sql in ops.items() if EXPLAINED.match(sql)}
+    tables = {table for sql in ops.values() for table in TABLES.findall(sql) if table != 'information_schema'}
+    explained.update({f"tables/{table}/count": f"SELECT COUNT(*) FROM {table}" for table in tables})
+    return explained
+
+
+@lru_cache(maxsize=None)
+def _core_operations():
+    # The statements the GUI issues all the time: grid list/page/row reads, dialog saves, deletes
+    # and batch edits, the dashboard, lookups, patient records, the write queue's bookkeeping,
+    # room checks, replica syncs, patient search and exports.
+    from dashboard_counts import ADJUST_SQL, count_sql
+    from dashboard_metrics import METRICS_SQL
+    from dialogs import EMPLOYEE_INSERT_SQL, EMPLOYEE_UPDATE_SQL, PATIENT_INSERT_SQL, PATIENT_UPDATE_SQL
+    from dialogs_appointments import APPOINTMENT_INSERT_SQL, APPOINTMENT_UPDATE_SQL
+    from dialogs_disease import DISEASE_INSERT_SQL, DISEASE_UPDATE_SQL
+    from lookups import LOOKUP_QUERIES
+    from occupancy import BOOKING_CHECK_SQL, BOOKING_UNTIL_SQL, STAYS_SQL
+    from page_columns import PAGE_COLUMNS
+    from paging import ESTIMATE_SQL
+    from patient_record import RECORD_SQL
+    from write_queue import APPLIED_KEY_SQL, PURGE_APPLIED_SQL, ROLLBACK_SAVEPOINT_SQL, SAVEPOINT_SQL
+
+    ops = {f"lookups/{name}": sql for name, sql in LOOKUP_QUERIES.items()}
+    ops.update({'dashboard/metrics': METRICS_SQL, 'dashboard/adjust': ADJUST_SQL, 'tables/estimate': ESTIMATE_SQL})
+    for page, spec in PAGE_COLUMNS.items():
+        ops.update(_page_operations(page, spec))
+        counts = count_sql(spec['table'], spec['key'])
+        ops.update({f"dashboard/count/{page}/{name}": sql for name, sql in counts.items()})
+    for page, insert, update in [('patients', PATIENT_INSERT_SQL, PATIENT_UPDATE_SQL),
+                                 ('employees', EMPLOYEE_INSERT_SQL, EMPLOYEE_UPDATE_SQL),
+                                 ('appointments', APPOINTMENT_INSERT_SQL, APPOINTMENT_UPDATE_SQL),
+                                 ('diseases', DISEASE_INSERT_SQL, DISEASE_UPDATE_SQL)]:
+        ops[f"pages/{page}/insert"], ops[f"pages/{page}/update"] = insert, update
+    ops.update({f"records/{name}": sql for name, sql in RECORD_SQL.items()})
+    ops.update({'rooms/stays': STAYS_SQL,
+                'rooms/check': BOOKING_CHECK_SQL + " FOR UPDATE",
+                'rooms/check_until': BOOKING_CHECK_SQL + BOOKING_UNTIL_SQL + " FOR UPDATE"})
+    ops.update({'writes/savepoint': SAVEPOINT_SQL, 'writes/undo': ROLLBACK_SAVEPOINT_SQL,
+                'writes/key': APPLIED_KEY_SQL, 'writes/purge': PURGE_APPLIED_SQL})
+    ops.update(_replica_operations())
+    ops.update(_search_operations())
+    ops.update(_export_operations())
+    return {name: normalize(sql) for name, sql in ops.items()}
+
+
+@lru_cache(maxsize=None)
+def _tool_operations():
+    # The statements of the numpy/pandas-backed tools (lab flags, analytics, duplicate finder,
+    # symptom search), bulk imports and plan checks. Built on first use, so a GUI in service mode
+    # imports none of those modules at startup.
+    from bulk_import import IMPORT_SPECS, PROGRESS_CLEAR_SQL, PROGRESS_LOAD_SQL, PROGRESS_SAVE_SQL, insert_sql
+    from clinical_analytics import DIAGNOSES_IN_SQL, DIAGNOSES_RANGE_SQL, STAYS_AFTER_SQL, STAYS_IN_SQL
+    from lab_flags import RESCAN_SQL, SCAN_SQL
+    from patient_dedup import DETAILS_SQL, LOAD_SQL, SINCE_SQL
+    from symptom_index import DOC_SQL, DOCS_IN_SQL, SIGNATURE_SQL
+    from symptom_index import DETAILS_SQL as DISEASE_DETAILS_SQL
+
+    ops = {'labs/scan': SCAN_SQL, 'labs/rescan': RESCAN_SQL,
+           'analytics/stays': STAYS_AFTER_SQL, 'analytics/diagnoses': DIAGNOSES_RANGE_SQL,
+           'analytics/restays': STAYS_IN_SQL, 'analytics/rediagnoses': DIAGNOSES_IN_SQL,
+           'dedup/load': LOAD_SQL, 'dedup/since': SINCE_SQL, 'dedup/details': DETAILS_SQL,
+           'symptoms/docs': DOC_SQL, 'symptoms/signatures': SIGNATURE_SQL, 'symptoms/redocs': DOCS_IN_SQL,
+           'symptoms/details': DISEASE_DETAILS_SQL,
+           'imports/progress': PROGRESS_LOAD_SQL, 'imports/checkpoint': PROGRESS_SAVE_SQL,
+           'imports/clear': PROGRESS_CLEAR_SQL}
+    ops.update({f"imports/{kind}": insert_sql(kind) for kind in IMPORT_SPECS})
+    ops = {name: normalize(sql) for name, sql in ops.items()}
+    ops.update(_explain_operations({**_core_operations(), **ops}))
+    return ops
+
+
+@lru_cache(maxsize=None)
+def operations():
+    # Everything hms_service will run, by name, built from the statements the app itself issues.
+    return {**_core_operations(), **_tool_operations()}
+
+
+@lru_cache(maxsize=None)
+def _names(group):
+    names = {}
+    for name, sql in group().items():
+        names.setdefault(sql, name)
+    return names
+
+
+@lru_cache(maxsize=None)
+def read_operations():
+    return frozenset(name for name, sql in operations().items() if is_read(sql))
+
+
+def is_read(sql):
+    return bool(READ_SQL.match(sql)) and not FOR_UPDATE.search(sql)
+
+
+def operation_name(sql):
+    # The operation a statement of the app's is offered as, or None for anything else. The GUI's
+    # own statements are looked up first, without building the tools' ones.
+    sql = normalize(sql)
+    return _names(_core_operations).get(sql) or _names(operations).get(sql)
+
+
+def bind(name, params):
+    # The operation's fixed statement, with its key list sized to the parameters.
+    sql = operations()[name]
+    if "IN (%s)" in sql:
+        keys = len(params or ()) - sql.count("%s") + 1
+        if not 0 < keys <= MAX_IN_KEYS:
+            raise ValueError(f"{name} takes 1 to {MAX_IN_KEYS} keys, got {keys}")
+        sql = sql.replace("IN (%s)", f"IN ({', '.join(['%s'] * keys)})")
+    return sql
@@ -0,0 +1,214 @@
+import os
+import re
+import sqlite3
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+
+import utils
+from migrate import migrate
+from utils import ConnectionPool
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "HospitalManagementSystemDATABASE.sql")
+
+# The app's SQL is written for MySQL; these rewrites cover the handful of constructs it uses
+# that SQLite spells differently. Anything else is passed through unchanged.
+REWRITES = [
+    (re.compile(r"\s+FOR UPDATE\s*$", re.I), ""),
+    (re.compile(r"^EXPLAIN (?!QUERY PLAN)", re.I), "EXPLAIN QUERY PLAN "),
+    (re.compile(r"CURDATE\(\)\s*\+\s*INTERVAL\s+(\d+)\s+DAY", re.I), r"date('now', '+\1 day')"),
+    (re.compile(r"CURDATE\(\)", re.I), "date('now')"),
+    (re.compile(r"\bNOW\(\)", re.I), "datetime('now')"),
+    (re.compile(r"TIMESTAMPDIFF\(MINUTE,\s*'1970-01-01',\s*([\w.]+)\)", re.I), r"(unixepoch(\1) / 60)"),
+    (re.compile(r"^INSERT IGNORE\b", re.I), "INSERT OR IGNORE"),
+    (re.compile(r"^DROP INDEX (\w+) ON \w+$", re.I), r"DROP INDEX IF EXISTS \1"),
+    # Added text columns compare like the script's (NOCASE); SQLite has no invisible columns.
+    (re.compile(r"^(ALTER TABLE \w+ ADD COLUMN \w+ (?:VAR)?CHAR\(\d+\))", re.I), r"\1 COLLATE NOCASE"),
+    (re.compile(r"\bVIRTUAL INVISIBLE\b", re.I), "VIRTUAL"),
+    # MySQL allows parenthesised UNION branches, SQLite does not.
+    (re.compile(r"\(\s*(SELECT\b[^()]*?)\)(?=\s*(?:UNION|LIMIT|$))", re.I | re.S), r"\1"),
+]
+ESTIMATE_SQL = re.compile(r"FROM information_schema\.TABLES", re.I)
+
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_adapter(datetime, lambda v: v.isoformat(" "))
+sqlite3.register_adapter(date, lambda v: v.isoformat())
+
+
+def _converter(parse):
+    # Values typed in by hand may not parse; MySQL would have rejected them, here they stay text.
+    def convert(raw):
+        text = raw.decode()
+        try:
+            return parse(text)
+        except (ValueError, ArithmeticError):
+            return text
+    return convert
+
+
+sqlite3.register_converter("DECIMAL", _converter(Decimal))
+sqlite3.register_converter("DATE", _converter(lambda v: date.fromisoformat(v[:10])))
+sqlite3.register_converter("DATETIME", _converter(datetime.fromisoformat))
+
+
+def _regexp_replace(text, pattern, replacement):
+    return None if text is None else re.sub(pattern, replacement, str(text))
+
+
+def _concat_ws(separator, *values):
+    # MySQL skips NULL values, and a NULL separator makes the whole result NULL.
+    return None if separator is None else str(separator).join(str(v) for v in values if v is not None)
+
+
+def _crc32(text):
+    return None if text is None else zlib.crc32(str(text).encode())
+
+
+def add_functions(conn):
+    # MySQL functions the schema (generated columns) and the app's statements use, for any sqlite3
+    # connection to it. SQLite only has CONCAT_WS from 3.44 on.
+    conn.create_function("REGEXP_REPLACE", 3, _regexp_replace, deterministic=True)
+    conn.create_function("CONCAT_WS", -1, _concat_ws, deterministic=True)
+    conn.create_function("CRC32", 1, _crc32, deterministic=True)
+
+
+def translate(sql):
+    for pattern, replacement in REWRITES:
+        sql = pattern.sub(replacement, sql.strip())
+    return sql.replace("%s", "?")
+
+
+def schema_statements(path=SCHEMA_FILE):
+    # CREATE TABLE / CREATE INDEX from the MySQL script, rewritten for SQLite. ON UPDATE
+    # CURRENT_TIMESTAMP becomes a trigger so ModifiedON watermarks keep working, and foreign keys
+    # get the index InnoDB would create for them, so query plans match the server's.
+    with open(path, encoding="utf-8") as f:
+        script = f.read()
+    statements = []
+    for body in re.findall(r"CREATE TABLE .*?\n\);", script, re.S):
+        table = re.match(r"CREATE TABLE (\w+)", body).group(1)
+        touched = re.findall(r"^\s*(\w+) DATETIME .*ON UPDATE CURRENT_TIMESTAMP", body, re.M)
+        leading = re.findall(r"PRIMARY KEY \((\w+)", body)
+        foreign = [c for c in re.findall(r"FOREIGN KEY \((\w+)\)", body) if c not in leading]
+        body = re.sub(r"\bINT PRIMARY KEY AUTO_INCREMENT", "INTEGER PRIMARY KEY AUTOINCREMENT", body)
+        body = re.sub(r"\bENUM\([^)]*\)", "TEXT", body)
+        body = re.sub(r"\bBIT\(1\)", "INTEGER", body)
+        body = re.sub(r"\bVARBINARY\(\d+\)", "BLOB", body)
+        body = body.replace(" ON UPDATE CURRENT_TIMESTAMP", "")
+        # MySQL compares text case-insensitively; with NOCASE columns the prefix LIKEs of the
+        # patient search can use their indexes here too.
+        body = re.sub(r"\b((?:VAR)?CHAR\(\d+\)|TEXT)(?=[\s,])", r"\1 COLLATE NOCASE", body)
+        statements.append(body.rstrip(";"))
+        for column in touched:
+            statements.append(
+                f"CREATE TRIGGER {table}_{column}_touch AFTER UPDATE ON {table} FOR EACH ROW "
+                f"WHEN NEW.{column} IS OLD.{column} BEGIN "
+                f"UPDATE {table} SET {column} = datetime('now', 'localtime') WHERE rowid = NEW.rowid; END")
+        statements += [f"CREATE INDEX fk_{table}_{column} ON {table} ({column})" for column in foreign]
+    statements += re.findall(r"^CREATE INDEX [^;]+", script, re.M)
+    return statements
+
+
+class StandinCursor:
+    def __init__(self, conn):
+        self._cur = conn.cursor()
+
+    def execute(self, sql, params=None):
+        if ESTIMATE_SQL.search(sql):
+            # The table name arrives as a parameter (possibly from a service client): only a bare name is used.
+            if not re.fullmatch(r"\w+", str(params[0])):
+                raise sqlite3.OperationalError(f"no such table: {params[0]}")
+            sql, params = f"SELECT COUNT(*) FROM {params[0]}", None
+        self._cur.execute(translate(sql), tuple(params) if params else ())
+        return max(self._cur.rowcount, 0)
+
+    def executemany(self, sql, rows):
+        self._cur.executemany(translate(sql), rows)
+        return max(self._cur.rowcount, 0)
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cur.fetchmany(size or self._cur.arraysize)
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def close(self):
+        self._cur.close()
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+
+class StandinConnection:
+    # Enough of the pymysql connection interface for ConnectionPool and the app's queries.
+    def __init__(self, path, read_only=False):
+        target = f"file:{path}?mode=ro" if read_only else path
+        self._conn = sqlite3.connect(target, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+                                     timeout=30, uri=read_only)
+        add_functions(self._conn)
+        if not read_only:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self.open = True
+
+    def cursor(self, cursor_class=None):
+        # cursor_class (pymysql's SSCursor) is ignored: sqlite3 cursors already stream.
+        return StandinCursor(self._conn)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def ping(self, reconnect=False):
+        self._conn.execute("SELECT 1")
+
+    def close(self):
+        self.open = False
+        self._conn.close()
+
+
+class StandinPool(ConnectionPool):
+    def __init__(self, path, **kwargs):
+        super().__init__({'path': path}, **kwargs)
+
+    def _connect(self):
+        conn = StandinConnection(self.config['path'])
+        self._count('creates')
+        return conn
+
+
+def create_database(path):
+    conn = StandinConnection(path)
+    cur = conn.cursor()
+    for statement in schema_statements():
+        cur.execute(statement.replace("CREATE TABLE ", "CREATE TABLE IF NOT EXISTS ", 1)
+                    .replace("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS ", 1)
+                    .replace("CREATE TRIGGER ", "CREATE TRIGGER IF NOT EXISTS ", 1))
+    conn.commit()
+    migrate(conn, progress=None)
+    conn.close()
+
+
+def use_sqlite(path, create=True):
+    # Points every get_connection()/db_connection() in the app at a local SQLite file.
+    if create:
+        create_database(path)
+    with utils._pool_lock:
+        if utils._pool is not None:
+            utils._pool.close_all()
+        utils._pool = StandinPool(path, **utils.POOL_CONFIG)
+    return utils._pool
@@ -0,0 +1,91 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from symptom_index import SymptomIndex
+from synthetic_data import CONDITIONS, ORGANS, QUALIFIERS, SYMPTOMS
+
+QUERIES = ["fever rash joint pain", "chest pain shortness of breath", "headache blurred vision nausea",
+           "jaundice abdominal pain", "itching", "night sweats weight loss fever cough", "chronic renal"]
+
+
+def synthetic(count, vocabulary, seed=11, first_id=1):
+    # Names and symptom lists from the synthetic_data word lists, prose drawn Zipf-like from a
+    # made-up vocabulary so there are a few very common terms and a long tail of rare ones.
+    rng = np.random.default_rng(seed + first_id)
+    words = [f"w{i:05d}" for i in range(vocabulary)]
+    weights = 1 / np.arange(1, vocabulary + 1)
+    weights /= weights.sum()
+    prose = rng.choice(vocabulary, (count, 60), p=weights)
+    rows = []
+    for i in range(count):
+        name = f"{QUALIFIERS[i % len(QUALIFIERS)]} {ORGANS[i // 8 % len(ORGANS)]} " \
+               f"{CONDITIONS[i // 120 % len(CONDITIONS)]} {first_id + i}"
+        symptoms = ", ".join(SYMPTOMS[j] for j in rng.choice(len(SYMPTOMS), rng.integers(3, 7), replace=False))
+        description = " ".join(words[j] for j in prose[i, :40])
+        complications = " ".join(words[j] for j in prose[i, 40:])
+        texts = (name, symptoms, description, complications)
+        rows.append((first_id + i, *texts, sum(len(t) for t in texts)))
+    return rows
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the symptom search index on a synthetic catalogue.")
+    parser.add_argument('--diseases', type=int, default=120000)
+    parser.add_argument('--vocabulary', type=int, default=30000)
+    parser.add_argument('--updates', type=int, default=20, help="single-disease saves to time")
+    args = parser.parse_args()
+
+    rows = synthetic(args.diseases, args.vocabulary)
+    path = os.path.join(tempfile.mkdtemp(prefix="hms-symptoms-"), "index.npz")
+    index = SymptomIndex(path)
+    _, build = timed(lambda: (index.update(rows), index.compact()))
+    _, save = timed(index.save)
+    loaded = SymptomIndex(path)
+    _, load = timed(loaded.load)
+    stats = loaded.stats()
+    print(f"{stats['diseases']:,} diseases, {stats['terms']:,} terms, {stats['postings']:,} postings")
+    print(f"build {build:6.2f} s · save {save:5.2f} s ({os.path.getsize(path) / 2 ** 20:,.0f} MB) · "
+          f"load {load:5.2f} s")
+
+    times = []
+    for _ in range(20):
+        for query in QUERIES:
+            hits, elapsed = timed(loaded.search, query)
+            times.append(elapsed * 1000)
+    p50, p99 = np.percentile(times, [50, 99])
+    print(f"queries: p50 {p50:.2f} ms · p99 {p99:.2f} ms · max {max(times):.2f} ms over {len(times)} runs")
+    for query in QUERIES[:3]:
+        top = loaded.search(query, 3)
+        print(f"  {query!r}: " + ", ".join(f"#{d} ({m} terms, {s:.2f})" for d, s, m in top))
+
+    changed = synthetic(args.updates, args.vocabulary, first_id=1)
+    update_times, save_times = [], []
+    for row in changed:
+        _, elapsed = timed(loaded.update, [row])
+        update_times.append(elapsed * 1000)
+        _, elapsed = timed(loaded.save)
+        save_times.append(elapsed * 1000)
+    hits, elapsed = timed(loaded.search, QUERIES[0])
+    print(f"single-disease re-index: {np.median(update_times):.2f} ms, then save {np.median(save_times):.0f} ms "
+          f"(median of {len(changed)}); next query {elapsed * 1000:.2f} ms")
+    rebuilt = SymptomIndex()
+    rebuilt.update(rows[len(changed):] + changed)
+    rebuilt.compact()
+    for query in QUERIES:
+        # Diseases tied on score may come back in another order; the scores themselves must agree.
+        assert [h[1:] for h in rebuilt.search(query, 20)] == [h[1:] for h in loaded.search(query, 20)], query
+    print("incrementally updated index ranks the same as a fresh build")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+import os
+import string
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+from config import SEARCH_CONFIG
+from utils import db_connection
+from workers import run_task
+
+FORMAT = 2          # bumped when the saved layout changes; older files are rebuilt
+K1 = 1.2            # BM25 term-frequency saturation
+B = 0.75            # BM25 length normalisation
+MAX_RESULTS = 50
+IN_CHUNK = 1000     # diseases re-read per statement
+MAX_EMPTY = 0.1     # share of empty slots above which compact() renumbers them away
+# A term in the name or the symptom list says more about a disease than one in its prose.
+FIELDS = {'Name': 3, 'Symptoms': 2, 'Description': 1, 'Complications': 1}
+SEPARATORS = str.maketrans({c: " " for c in string.punctuation + "‘’“”–—…·•"})  # then split() on whitespace
+STOP_WORDS = frozenset("a an and are as at be by can for from has have in into is it its may of on or than that "
+                       "the their to with without".split())
+# Checksum of the indexed text, compared at startup to find diseases edited since the index was
+# saved. COALESCE keeps each column in its place, since CONCAT_WS skips NULLs.
+SIGNATURE = "CRC32(CONCAT_WS(CHAR(31), " + ", ".join(f"COALESCE({column}, '')" for column in FIELDS) + "))"
+DOC_SQL = f"SELECT DiseaseID, {', '.join(FIELDS)}, {SIGNATURE} FROM Disease"
+SIGNATURE_SQL = f"SELECT DiseaseID, {SIGNATURE} FROM Disease"
+DOCS_IN_SQL = f"{DOC_SQL} WHERE DiseaseID IN (%s)"
+DETAILS_SQL = "SELECT DiseaseID, Name, Severity, Symptoms FROM Disease WHERE DiseaseID IN (%s)"
+RESULT_COLUMNS = ["DiseaseID", "Name", "Severity", "Matched", "Score", "Symptoms"]
+
+
+@lru_cache(maxsize=1 << 18)
+def fold(word):
+    # Plurals only ("rashes", "pains", "allergies"); anything cleverer mangles medical terms.
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('shes', 'sses', 'xes', 'zes')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [fold(word) for word in str(text or "").lower().translate(SEPARATORS).split() if word not in STOP_WORDS]
+
+
+def analyse(texts):
+    # Weighted term frequencies of one disease, texts in FIELDS order. The weights are whole
+    # numbers, so a field's tokens are simply counted that many times.
+    tokens = []
+    for weight, text in zip(FIELDS.values(), texts):
+        tokens += tokenize(text) * weight
+    return Counter(tokens)
+
+
+class SymptomIndex:
+    # BM25 over the Disease text columns. Postings are CSR arrays (term -> slots and weighted
+    # term frequencies), so a query is one vectorised pass per term. Updates replace single
+    # postings rows and leave the slots of re-indexed or deleted diseases empty; save() merges
+    # it all back into the arrays and writes them to SEARCH_CONFIG['path'].
+    def __init__(self, path=None):
+        self.path = path
+        self.ready = False
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self.terms = []
+        self.vocab = {}
+        self.offsets = np.zeros(1, np.int64)      # postings of term t: docs/tfs[offsets[t]:offsets[t + 1]]
+        self.docs = np.zeros(0, np.int32)
+        self.tfs = np.zeros(0, np.float32)
+        self.doc_offsets = np.zeros(1, np.int64)  # term ids of slot s: doc_terms[doc_offsets[s]:...]
+        self.doc_terms = np.zeros(0, np.int32)
+        self.ids = np.zeros(0, np.int32)          # DiseaseID per slot, -1 for an empty slot
+        self.lengths = np.zeros(0, np.float32)
+        self.signatures = np.zeros(0, np.int64)
+        self.slots = {}
+        self.total_length = 0.0
+        self.saved_at = None
+        self._postings = {}
+        self._doc_terms = {}
+
+    def _row(self, tid):
+        if tid in self._postings:
+            return self._postings[tid]
+        if tid < len(self.offsets) - 1:
+            start, end = self.offsets[tid], self.offsets[tid + 1]
+            return self.docs[start:end], self.tfs[start:end]
+        return np.zeros(0, np.int32), np.zeros(0, np.float32)
+
+    def _terms_of(self, slot):
+        if slot in self._doc_terms:
+            return self._doc_terms[slot]
+        if slot < len(self.doc_offsets) - 1:
+            return self.doc_terms[self.doc_offsets[slot]:self.doc_offsets[slot + 1]]
+        return np.zeros(0, np.int32)
+
+    def update(self, rows, removed=()):
+        # rows as DOC_SQL returns them; a DiseaseID already indexed is replaced.
+        with self._lock:
+            dropped = [self.slots.pop(int(i)) for i in [row[0] for row in rows] + list(removed)
+                       if int(i) in self.slots]
+            by_term = {}
+            for slot in dropped:
+                for tid in self._terms_of(slot).tolist():
+                    by_term.setdefault(tid, []).append(slot)
+                self._doc_terms[slot] = np.zeros(0, np.int32)
+            for tid, slots in by_term.items():
+                docs, tfs = self._row(tid)
+                keep = ~np.isin(docs, slots)
+                self._postings[tid] = (docs[keep], tfs[keep])
+            if dropped:
+                self.total_length -= float(self.lengths[dropped].sum())
+                self.ids[dropped] = -1
+                self.lengths[dropped] = 0
+
+            vocab, first = self.vocab, len(self.ids)
+            tids, slots, tfs, lengths, bounds = [], [], [], [], [0]
+            for slot, row in enumerate(rows, first):
+                counts = analyse(row[1:-1])
+                for term in counts:
+                    if term not in vocab:
+                        vocab[term] = len(vocab)
+                tids += map(vocab.__getitem__, counts)
+                slots += [slot] * len(counts)
+                tfs += counts.values()
+                lengths.append(sum(counts.values()))
+                bounds.append(len(tids))
+                self.slots[int(row[0])] = slot
+            self.terms.extend(list(vocab)[len(self.terms):])
+            tids = np.array(tids, np.int32)
+            for slot, start, end in zip(range(first, first + len(rows)), bounds, bounds[1:]):
+                self._doc_terms[slot] = tids[start:end]
+            # New postings grouped by term with one sort, then appended to each term's row.
+            order = np.argsort(tids, kind='stable')
+            grouped, slots, tfs = tids[order], np.array(slots, np.int32)[order], np.array(tfs, np.float32)[order]
+            starts = np.flatnonzero(np.diff(grouped, prepend=-1))
+            for tid, start, end in zip(grouped[starts].tolist(), starts.tolist(), [*starts[1:].tolist(), len(order)]):
+                docs, old = self._row(tid)
+                self._postings[tid] = (np.concatenate([docs, slots[start:end]]), np.concatenate([old, tfs[start:end]]))
+            self.ids = np.concatenate([self.ids, np.array([row[0] for row in rows], np.int32)])
+            self.lengths = np.concatenate([self.lengths, np.array(lengths, np.float32)])
+            self.signatures = np.concatenate([self.signatures, np.array([row[-1] for row in rows], np.int64)])
+            self.total_length += float(sum(lengths))
+
+    def compact(self):
+        # Merges the replaced rows into the CSR arrays. Empty slots are only renumbered away once
+        # there are enough of them to matter, since that re-sorts every posting.
+        with self._lock:
+            if not self._postings and not self._doc_terms:
+                return
+            if (self.ids < 0).mean() <= MAX_EMPTY:
+                self.offsets, (self.docs, self.tfs) = _splice(self.offsets, (self.docs, self.tfs), self._postings,
+                                                               len(self.terms))
+                self.doc_offsets, (self.doc_terms,) = _splice(self.doc_offsets, (self.doc_terms,),
+                                                              {slot: (t,) for slot, t in self._doc_terms.items()},
+                                                              len(self.ids))
+                self._postings, self._doc_terms = {}, {}
+                return
+            base_tid = np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets))
+            changed = np.fromiter(self._postings, np.int64, len(self._postings))
+            keep = ~np.isin(base_tid, changed)
+            rows = [self._postings[tid] for tid in changed.tolist()]
+            tid = np.concatenate([base_tid[keep], np.repeat(changed, [len(r[0]) for r in rows]).astype(np.int64)])
+            docs = np.concatenate([self.docs[keep]] + [r[0] for r in rows])
+            tfs = np.concatenate([self.tfs[keep]] + [r[1] for r in rows])
+
+            live = self.ids >= 0
+            docs = (np.cumsum(live) - 1)[docs]
+            self.ids, self.lengths, self.signatures = self.ids[live], self.lengths[live], self.signatures[live]
+            by_term = np.argsort(tid, kind='stable')
+            self.docs, self.tfs = docs[by_term].astype(np.int32), tfs[by_term].astype(np.float32)
+            self.offsets = np.concatenate([[0], np.cumsum(np.bincount(tid, minlength=len(self.terms)))])
+            by_slot = np.argsort(docs, kind='stable')
+            self.doc_terms = tid[by_slot].astype(np.int32)
+            self.doc_offsets = np.concatenate([[0], np.cumsum(np.bincount(docs, minlength=len(self.ids)))])
+            self.slots = dict(zip(self.ids.tolist(), range(len(self.ids))))
+            self._postings, self._doc_terms = {}, {}
+
+    def search(self, text, limit=MAX_RESULTS):
+        # (DiseaseID, score, query terms matched) best first: diseases matching more of the
+        # terms come first, BM25 orders those matching as many.
+        terms = list(dict.fromkeys(tokenize(text)))
+        with self._lock:
+            count = len(self.slots)
+            if not count or not terms:
+                return []
+            average = self.total_length / count
+            scores = np.zeros(len(self.ids), np.float32)
+            matched = np.zeros(len(self.ids), np.int16)
+            for term in terms:
+                if term not in self.vocab:
+                    continue
+                docs, tfs = self._row(self.vocab[term])
+                idf = np.log1p((count - len(docs) + 0.5) / (len(docs) + 0.5))
+                norm = K1 * (1 - B + B * self.lengths[docs] / average)
+                scores[docs] += idf * tfs * (K1 + 1) / (tfs + norm)
+                matched[docs] += 1
+            hits = np.flatnonzero(matched)
+            rank = matched[hits] * 1e6 + scores[hits].astype(np.float64)
+            if len(hits) > limit:
+                top = np.argpartition(-rank, limit - 1)[:limit]
+                hits, rank = hits[top], rank[top]
+            hits = hits[np.argsort(-rank, kind='stable')]
+            return [(int(self.ids[s]), round(float(scores[s]), 3), int(matched[s])) for s in hits]
+
+    def signature_of(self, disease_id):
+        slot = self.slots.get(disease_id)
+        return None if slot is None else int(self.signatures[slot])
+
+    def save(self):
+        with self._lock:
+            self.compact()
+            self.saved_at = time.time()
+            arrays = dict(format=np.array([FORMAT]), saved_at=np.array([self.saved_at]),
+                          terms=np.array(self.terms, dtype=str), offsets=self.offsets, docs=self.docs, tfs=self.tfs,
+                          doc_offsets=self.doc_offsets, doc_terms=self.doc_terms, ids=self.ids,
+                          lengths=self.lengths, signatures=self.signatures)
+        # Written beside the old file and swapped in, so a crash never leaves half an index.
+        temp = f"{self.path}.tmp"
+        with open(temp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(temp, self.path)
+
+    def load(self):
+        try:
+            with np.load(self.path, allow_pickle=False) as saved:
+                if int(saved['format'][0]) != FORMAT:
+                    return False
+                arrays = {name: saved[name] for name in saved.files}
+        except (OSError, ValueError, KeyError) as e:
+            if os.path.exists(self.path):
+                print("Symptom Index Error:", e)
+            return False
+        with self._lock:
+            self._clear()
+            for name in ('offsets', 'docs', 'tfs', 'doc_offsets', 'doc_terms', 'ids', 'lengths', 'signatures'):
+                setattr(self, name, arrays[name])
+            self.terms = arrays['terms'].tolist()
+            self.vocab = {term: tid for tid, term in enumerate(self.terms)}
+            # Saved without renumbering, so empty slots (id -1) may be in the file.
+            self.slots = {i: slot for slot, i in enumerate(self.ids.tolist()) if i >= 0}
+            self.total_length = float(self.lengths.sum(dtype=np.float64))
+            self.saved_at = float(arrays['saved_at'][0])
+        return True
+
+    def open(self):
+        # The saved index, brought up to date with the diseases added, edited or deleted since
+        # (by their signatures); built from scratch only when there is no usable file.
+        with self._lock:
+            if self.ready:
+                return
+            self._catch_up(self.path and self.load())
+            self.ready = True
+
+    def refresh(self):
+        # For diseases written without their IDs being known (bulk imports): found by their
+        # signatures, as when the index is opened.
+        with self._lock:
+            if self.ready:
+                self._catch_up(True)
+            else:
+                self.open()
+
+    def _catch_up(self, loaded):
+        with db_connection() as conn:
+            if not conn:
+                raise ConnectionError("Could not connect to the database.")
+            cur = conn.cursor()
+            if loaded:
+                cur.execute(SIGNATURE_SQL)
+                current = dict(cur.fetchall())
+                stale = [i for i, signature in current.items() if self.signature_of(i) != signature]
+                gone = [i for i in self.slots if i not in current]
+                rows = _fetch(cur, stale)
+            else:
+                cur.execute(DOC_SQL)
+                rows, gone = cur.fetchall(), []
+        if rows or gone or not loaded:
+            self.update(rows, gone)
+            if self.path:
+                self.save()
+            else:
+                self.compact()
+
+    def reindex(self, disease_ids):
+        # Re-reads the given diseases after a save or delete; those no longer there are dropped.
+        with self._lock:
+            if not self.ready:
+                self.open()
+                return
+            with db_connection() as conn:
+                if not conn:
+                    raise ConnectionError("Could not connect to the database.")
+                rows = _fetch(conn.cursor(), disease_ids)
+            found = {row[0] for row in rows}
+            self.update(rows, [i for i in map(int, disease_ids) if i not in found])
+            if self.path:
+                self.save()
+
+    def stats(self):
+        with self._lock:
+            return {'diseases': len(self.slots), 'terms': len(self.terms), 'postings': len(self.docs),
+                    'pending_terms': len(self._postings), 'saved_at': self.saved_at}
+
+
+def _fetch(cur, disease_ids):
+    rows = []
+    disease_ids = [int(i) for i in disease_ids]
+    for i in range(0, len(disease_ids), IN_CHUNK):
+        chunk = disease_ids[i:i + IN_CHUNK]
+        cur.execute(DOCS_IN_SQL.replace("IN (%s)", f"IN ({', '.join(['%s'] * len(chunk))})"), chunk)
+        rows += cur.fetchall()
+    return rows
+
+
+def _splice(offsets, columns, replaced, count):
+    # CSR rows in `replaced` (row -> one array per column) swapped into `columns`, copying the
+    # untouched runs between them once. Rows past the end are appended; the result has `count` rows.
+    sizes = np.zeros(count, np.int64)
+    sizes[:len(offsets) - 1] = np.diff(offsets)
+    pieces = [[] for _ in columns]
+    start = 0
+    for row in sorted(replaced):
+        end = offsets[row] if row < len(offsets) - 1 else offsets[-1]
+        for piece, column, new in zip(pieces, columns, replaced[row]):
+            piece += [column[start:end], new]
+        sizes[row] = len(replaced[row][0])
+        start = offsets[row + 1] if row < len(offsets) - 1 else end
+    for piece, column in zip(pieces, columns):
+        piece.append(column[start:])
+    return (np.concatenate([[0], np.cumsum(sizes)]),
+            [np.concatenate(piece).astype(column.dtype) for piece, column in zip(pieces, columns)])
+
+
+symptom_index = SymptomIndex(SEARCH_CONFIG['path'])
+
+
+def search_diseases(text, limit=MAX_RESULTS):
+    # Worker side of the Diseases page search: ranked IDs from the index, then one query for
+    # what the result grid shows of them.
+    symptom_index.open()
+    started = time.perf_counter()
+    hits = symptom_index.search(text, limit)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    details = {}
+    if hits:
+        with db_connection() as conn:
+            if not conn:
+                raise ConnectionError("Could not connect to the database.")
+            cur = conn.cursor()
+            ids = [hit[0] for hit in hits]
+            cur.execute(DETAILS_SQL.replace("IN (%s)", f"IN ({', '.join(['%s'] * len(ids))})"), ids)
+            details = {row[0]: row[1:] for row in cur.fetchall()}
+    terms = len(set(tokenize(text)))
+    rows = [(disease_id, details[disease_id][0], details[disease_id][1], f"{matched}/{terms}", score,
+             details[disease_id][2]) for disease_id, score, matched in hits if disease_id in details]
+    return RESULT_COLUMNS, rows, elapsed_ms
+
+
+def reindex_diseases(disease_ids):
+    # Called on the GUI thread once a disease save or delete has landed.
+    run_task(symptom_index.reindex, list(disease_ids),
+             on_error=lambda message: print("Symptom Index Error:", message))
@@ -0,0 +1,382 @@
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from dashboard_counts import recount
+from utils import db_connection
+
+BATCH_SIZE = 10000          # rows per executemany and per commit
+STAYS_PER_PATIENT = 2       # average registrations per patient over the generated span
+EXTRA_INSURANCE_SHARE = 0.3 # patients who also have an expired policy on file
+REPORTS_PER_STAY = 4        # average lab reports per registration
+DISEASES_PER_STAY = 1.5
+FEEDBACK_PER_PATIENT = 0.3
+PATIENTS_PER_EMPLOYEE = 50
+MIN_EMPLOYEES = 20
+AVERAGE_STAY_DAYS = 7.5     # 1-14 nights
+AVERAGE_GAP_DAYS = 2        # turnover between stays in one room
+
+ROLES = ['Manager', 'Nurse', 'Doctor', 'Lab Technician', 'Receptionist', 'Pharmacist']
+DEPARTMENTS = ['Emergency', 'Cardiology', 'Neurology', 'Oncology', 'Pediatrics', 'Orthopedics',
+               'Radiology', 'Laboratory', 'Pharmacy', 'Administration']
+LAB_TESTS = [
+    ('Hemoglobin', 12.0, 17.5, 'g/dL'), ('White Blood Cells', 4.0, 11.0, '10^9/L'),
+    ('Platelets', 150.0, 450.0, '10^9/L'), ('Glucose (fasting)', 70.0, 100.0, 'mg/dL'),
+    ('HbA1c', 4.0, 5.6, '%'), ('Creatinine', 0.6, 1.3, 'mg/dL'), ('Urea', 7.0, 20.0, 'mg/dL'),
+    ('Sodium', 135.0, 145.0, 'mmol/L'), ('Potassium', 3.5, 5.1, 'mmol/L'), ('ALT', 7.0, 56.0, 'U/L'),
+    ('AST', 10.0, 40.0, 'U/L'), ('Bilirubin', 0.1, 1.2, 'mg/dL'), ('TSH', 0.4, 4.0, 'mIU/L'),
+    ('Cholesterol', 125.0, 200.0, 'mg/dL'), ('CRP', 0.0, 10.0, 'mg/L'), ('Troponin', 0.0, 0.04, 'ng/mL'),
+]
+FIRST_NAMES = ['Ahmed', 'Mona', 'Farah', 'Dana', 'Omar', 'Layla', 'Youssef', 'Nour', 'Karim', 'Salma',
+               'James', 'Mary', 'John', 'Linda', 'David', 'Sarah', 'Ali', 'Hana', 'Adam', 'Maya',
+               'Lucas', 'Emma', 'Noah', 'Olivia', 'Yara', 'Rami', 'Tariq', 'Aisha', 'Zain', 'Lina']
+LAST_NAMES = ['Aly', 'Ahmed', 'Ibrahim', 'Said', 'Hassan', 'Mahmoud', 'Khalil', 'Nasser', 'Saleh', 'Farouk',
+              'Smith', 'Johnson', 'Brown', 'Taylor', 'Wilson', 'Davies', 'Evans', 'Thomas', 'Roberts', 'Walker',
+              'Haddad', 'Mansour', 'Darwish', 'Sabry', 'Fahmy', 'Rashid', 'Zaki', 'Shawky', 'Kamel', 'Gamal']
+CITIES = [('Cairo', 'Cairo'), ('Giza', 'Giza'), ('Alexandria', 'Alexandria'), ('Mansoura', 'Dakahlia'),
+          ('Tanta', 'Gharbia'), ('Aswan', 'Aswan'), ('Luxor', 'Luxor'), ('Suez', 'Suez')]
+STREETS = ['Nile St', 'Tahrir Sq', 'Pyramids Rd', 'Corniche', 'Salah Salem', 'Abbas St', 'Orabi St']
+OCCUPATIONS = ['Engineer', 'Teacher', 'Student', 'Driver', 'Accountant', 'Farmer', 'Retired', 'Nurse', 'Clerk']
+ALLERGIES = ['Penicillin', 'Peanuts', 'Latex', 'Pollen', 'Shellfish', 'Aspirin', 'Dust']
+PROVIDERS = ['Misr Insurance', 'AXA', 'Allianz', 'MetLife', 'Bupa', 'GIG', 'Cigna']
+COPAY_TYPES = ['Standard', 'VIP', 'Economy']
+
+# Disease names are qualifier + organ + condition, so every name is unique and three words long
+# (the sample script's diseases have shorter names and never collide).
+QUALIFIERS = ['Acute', 'Chronic', 'Recurrent', 'Congenital', 'Idiopathic', 'Viral', 'Bacterial', 'Autoimmune']
+ORGANS = ['Renal', 'Hepatic', 'Cardiac', 'Pulmonary', 'Gastric', 'Dermal', 'Neural', 'Ocular',
+          'Thyroid', 'Pancreatic', 'Bronchial', 'Vascular', 'Articular', 'Splenic', 'Urinary']
+CONDITIONS = ['Inflammation', 'Insufficiency', 'Infection', 'Fibrosis', 'Syndrome', 'Obstruction',
+              'Hypertrophy', 'Stenosis', 'Lesion', 'Dysfunction', 'Edema', 'Ulceration']
+SYMPTOMS = ['fever', 'fatigue', 'cough', 'headache', 'nausea', 'vomiting', 'dizziness', 'rash',
+            'chest pain', 'shortness of breath', 'abdominal pain', 'joint pain', 'swelling', 'weight loss',
+            'night sweats', 'blurred vision', 'itching', 'palpitations', 'back pain', 'loss of appetite',
+            'muscle weakness', 'confusion', 'jaundice', 'chills', 'sore throat', 'numbness']
+TREATMENTS = ['Antibiotics', 'Antivirals', 'Corticosteroids', 'Surgery', 'Physiotherapy', 'Dialysis',
+              'Rest and hydration', 'Immunotherapy', 'Lifestyle changes', 'Pain management']
+
+
+# Columns inserted after the name for reference tables that carry more than a name.
+REFERENCE_EXTRA = {
+    'LabTest': ['MinValue', 'MaxValue', 'CalcUnit'],
+    'Disease': ['Description', 'Severity', 'Symptoms', 'Complications', 'Treatment'],
+}
+
+# Tables whose IDs are assigned here, continuing after whatever is already in the database.
+ID_COLUMNS = {
+    'Employee': 'EmployeeID', 'EmployeeDetails': 'EmployeeDetailsID', 'Address': 'AddressID',
+    'Patient': 'PatientID', 'PatientInsurance': 'PatientInsuranceID', 'PatientRegister': 'PatientRegisterID',
+    'PatientLabReport': 'PatientLabReportID', 'Feedback': 'FeedbackID',
+}
+
+
+def _chunks(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _ensure_named(cur, table, key, name_col, rows):
+    # Reference rows are matched by name, so a second run adds nothing and existing data is reused.
+    cur.execute(f"SELECT `{name_col}` FROM {table}")
+    existing = {r[0] for r in cur.fetchall()}
+    missing = [row for row in rows if row[0] not in existing]
+    if missing:
+        cols = [name_col] + REFERENCE_EXTRA.get(table, [])
+        marks = ", ".join(["%s"] * len(cols))
+        cur.executemany(f"INSERT INTO {table} ({', '.join(f'`{c}`' for c in cols)}) VALUES ({marks})", missing)
+    cur.execute(f"SELECT {key} FROM {table} ORDER BY {key}")
+    return [r[0] for r in cur.fetchall()]
+
+
+class SyntheticData:
+    # Every generator re-seeds from (seed, name), so a pass over the stays can be replayed to
+    # derive diseases, attendants and lab reports without holding millions of stays in memory.
+    def __init__(self, patients, seed=1, years=5, now=None):
+        self.patients = patients
+        self.seed = seed
+        self.end = (now or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.start = self.end - timedelta(days=365 * years)
+        self.employees = max(MIN_EMPLOYEES, patients // PATIENTS_PER_EMPLOYEE)
+        stays_per_room = (self.end - self.start).days / (AVERAGE_STAY_DAYS + AVERAGE_GAP_DAYS)
+        self.room_count = max(1, round(patients * STAYS_PER_PATIENT / stays_per_room))
+        self.offsets = {table: 0 for table in ID_COLUMNS}
+        self.room_offset = 0
+        self.roles, self.departments, self.lab_tests, self.diseases = [], [], {}, []
+
+    def rng(self, name):
+        return random.Random(f"{self.seed}-{name}")
+
+    def _moment(self, rng):
+        return self.start + timedelta(seconds=rng.randrange(int((self.end - self.start).total_seconds())))
+
+    def disease_rows(self):
+        rng = self.rng('diseases')
+        for qualifier in QUALIFIERS:
+            for organ in ORGANS:
+                for condition in CONDITIONS:
+                    symptoms = rng.sample(SYMPTOMS, rng.randint(3, 6))
+                    yield (f"{qualifier} {organ} {condition}",
+                           f"{qualifier} {condition.lower()} affecting the {organ.lower()} system.",
+                           rng.choice(['Mild', 'Moderate', 'Severe']), ", ".join(symptoms),
+                           f"Untreated, may lead to {rng.choice(CONDITIONS).lower()} of adjacent tissue.",
+                           rng.choice(TREATMENTS))
+
+    def load_reference(self, cur):
+        self.roles = _ensure_named(cur, 'Role', 'RoleID', 'RoleDesc', [(r,) for r in ROLES])
+        self.departments = _ensure_named(cur, 'Department', 'DepartmentID', 'DepartmentName',
+                                         [(d,) for d in DEPARTMENTS])
+        _ensure_named(cur, 'LabTest', 'LabTestID', 'TestName', LAB_TESTS)
+        cur.execute("SELECT LabTestID, `MinValue`, `MaxValue` FROM LabTest")
+        self.lab_tests = {r[0]: (float(r[1]), float(r[2])) for r in cur.fetchall()}
+        self.diseases = _ensure_named(cur, 'Disease', 'DiseaseID', 'Name', list(self.disease_rows()))
+        for table, column in ID_COLUMNS.items():
+            cur.execute(f"SELECT COALESCE(MAX({column}), 0) FROM {table}")
+            self.offsets[table] = int(cur.fetchone()[0])
+        # New rooms rather than existing ones, so generated stays never overlap earlier bookings.
+        cur.execute("SELECT COUNT(DISTINCT RoomNumber) FROM PatientRegister")
+        self.room_offset = int(cur.fetchone()[0])
+
+    def _id(self, table, n):
+        return self.offsets[table] + n
+
+    def employee_rows(self):
+        rng = self.rng('employees')
+        for n in range(1, self.employees + 1):
+            emp_id = self._id('Employee', n)
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            dob = self._moment(rng).date() - timedelta(days=365 * rng.randint(25, 60))
+            yield (emp_id, f"E{emp_id:07d}", f"{first}.{last}.{emp_id}@hospital.example".lower(), b"synthetic",
+                   first, last, rng.choice(['Male', 'Female']), dob, self._moment(rng).date(),
+                   'Active' if rng.random() < 0.95 else 'Inactive')
+
+    def employee_detail_rows(self):
+        rng = self.rng('employee-details')
+        for n in range(1, self.employees + 1):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            joined = self._moment(rng)
+            yield (self._id('EmployeeDetails', n), self._id('Employee', n), first, last,
+                   joined.date() - timedelta(days=365 * rng.randint(25, 60)), rng.choice(['Male', 'Female']),
+                   f"010{rng.randrange(10 ** 8):08d}", rng.choice(self.roles),
+                   f"{rng.randint(1, 200)} {rng.choice(STREETS)}, {rng.choice(CITIES)[0]}",
+                   f"{rng.randrange(10 ** 14):014d}", joined.date(),
+                   Decimal(rng.randint(6000, 60000)), joined, joined)
+
+    def employee_department_rows(self):
+        rng = self.rng('employee-departments')
+        for n in range(1, self.employees + 1):
+            for dept in rng.sample(self.departments, rng.choice([1, 1, 1, 2])):
+                yield (self._id('Employee', n), dept, 1)
+
+    def address_rows(self):
+        rng = self.rng('addresses')
+        for n in range(1, self.employees + 1):
+            city, state = rng.choice(CITIES)
+            yield (self._id('Address', n), f"{rng.randint(1, 200)} {rng.choice(STREETS)}", None, city,
+                   f"{rng.randint(11000, 99999)}", state, 'Egypt')
+
+    def employee_address_rows(self):
+        for n in range(1, self.employees + 1):
+            yield (self._id('EmployeeDetails', n), self._id('Address', n), 1)
+
+    def patient_rows(self):
+        rng = self.rng('patients')
+        for n in range(1, self.patients + 1):
+            patient_id = self._id('Patient', n)
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            created = self._moment(rng)
+            yield (patient_id, f"SYN{patient_id:08d}", first, last,
+                   created.date() - timedelta(days=rng.randint(0, 90 * 365)), rng.choice(['Male', 'Female', 'Other']),
+                   f"555-{rng.randrange(10 ** 7):07d}", f"{first}.{last}{patient_id}@mail.example".lower(),
+                   Decimal(rng.randint(14000, 20000)) / 100, Decimal(rng.randint(4000, 12000)) / 100,
+                   rng.choice(['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']),
+                   f"555-{rng.randrange(10 ** 7):07d}", f"{rng.randint(1, 200)} {rng.choice(STREETS)}, "
+                   f"{rng.choice(CITIES)[0]}", rng.choice(ALLERGIES) if rng.random() < 0.2 else None,
+                   rng.choice(['Single', 'Married', 'Divorced']), rng.choice(OCCUPATIONS),
+                   'Active' if rng.random() < 0.85 else 'Inactive', created, created)
+
+    def current_insurance(self, patient_id):
+        # Every patient has exactly one current policy, numbered in patient order.
+        return self._id('PatientInsurance', patient_id - self.offsets['Patient'])
+
+    def insurance_rows(self):
+        rng = self.rng('insurance')
+        for n in range(1, self.patients + 1):
+            start = self._moment(rng).date()
+            yield (self._id('PatientInsurance', n), self._id('Patient', n), rng.choice(PROVIDERS),
+                   f"G{rng.randrange(10 ** 6):06d}", f"INS{self._id('PatientInsurance', n):09d}",
+                   Decimal(rng.choice([0, 10, 20, 50])), Decimal(rng.choice([50, 100, 150])),
+                   start, start + timedelta(days=365 * rng.randint(1, 5)), 1)
+        n = self.patients
+        for patient in range(1, self.patients + 1):
+            if rng.random() < EXTRA_INSURANCE_SHARE:
+                n += 1
+                ended = self._moment(rng).date()
+                yield (self._id('PatientInsurance', n), self._id('Patient', patient), rng.choice(PROVIDERS),
+                       f"G{rng.randrange(10 ** 6):06d}", f"INS{self._id('PatientInsurance', n):09d}",
+                       Decimal(rng.choice([0, 10, 20])), Decimal(rng.choice([50, 100])),
+                       ended - timedelta(days=365 * rng.randint(1, 3)), ended, 0)
+
+    def stays(self):
+        # Back-to-back stays per room, so no room is ever double-booked; the last stay in a room is
+        # left open when it runs past today.
+        rng = self.rng('stays')
+        reg = 0
+        for room in range(1, self.room_count + 1):
+            moment = self.start + timedelta(hours=rng.randint(0, 96))
+            while moment < self.end:
+                reg += 1
+                end = moment + timedelta(days=rng.randint(1, 14), hours=rng.randint(-4, 4))
+                patient = self._id('Patient', rng.randint(1, self.patients))
+                yield (self._id('PatientRegister', reg), patient, f"Room{1000 + self.room_offset + room}", moment,
+                       end if end < self.end else None)
+                moment = end + timedelta(days=rng.randint(0, 2 * AVERAGE_GAP_DAYS), hours=rng.randint(1, 6))
+
+    def register_rows(self):
+        rng = self.rng('register')
+        first, last = self._id('Employee', 1), self._id('Employee', self.employees)
+        for reg, patient, room, start, end in self.stays():
+            insurance = self.current_insurance(patient) if rng.random() < 0.85 else None
+            yield (reg, patient, start, end, insurance, room, rng.choice(COPAY_TYPES),
+                   rng.randint(first, last), start)
+
+    def patient_disease_rows(self):
+        rng = self.rng('patient-diseases')
+        for reg, *_ in self.stays():
+            count = min(len(self.diseases), rng.randint(1, round(2 * DISEASES_PER_STAY - 1)))
+            for disease in rng.sample(self.diseases, count):
+                yield (reg, disease)
+
+    def attendant_rows(self):
+        rng = self.rng('attendants')
+        first, last = self._id('Employee', 1), self._id('Employee', self.employees)
+        for reg, *_ in self.stays():
+            for emp in {rng.randint(first, last) for _ in range(rng.randint(1, 3))}:
+                yield (reg, emp)
+
+    def lab_value(self, rng, test_id):
+        low, high = self.lab_tests[test_id]
+        roll = rng.random()
+        if roll < 0.01:
+            return "see comment"
+        span = high - low or 1.0
+        if roll < 0.08:
+            value = low - span * rng.uniform(0.05, 1.0)
+        elif roll < 0.15:
+            value = high + span * rng.uniform(0.05, 1.0)
+        else:
+            value = rng.uniform(low, high)
+        text = f"{value:.2f}"
+        return f"{text} {rng.choice(['', 'mg/dL'])}".strip() if roll > 0.97 else text
+
+    def lab_report_rows(self):
+        rng = self.rng('lab-reports')
+        tests = sorted(self.lab_tests)
+        n = 0
+        for reg, _, _, start, end in self.stays():
+            window = int(((end or self.end) - start).total_seconds())
+            for _ in range(rng.randint(0, 2 * REPORTS_PER_STAY)):
+                n += 1
+                test_id = rng.choice(tests)
+                value = self.lab_value(rng, test_id)
+                comment = "Repeat requested" if value == "see comment" else (
+                    "Reviewed" if rng.random() < 0.05 else None)
+                yield (self._id('PatientLabReport', n), reg, test_id, value, comment,
+                       start + timedelta(seconds=rng.randrange(max(window, 1))))
+
+    def feedback_rows(self):
+        rng = self.rng('feedback')
+        first, last = self._id('Employee', 1), self._id('Employee', self.employees)
+        for n in range(1, int(self.patients * FEEDBACK_PER_PATIENT) + 1):
+            rating = rng.choice(['1', '2', '3', '4', '5', '5', '4'])
+            yield (self._id('Feedback', n), self._id('Patient', rng.randint(1, self.patients)),
+                   rng.randint(first, last), rng.choice(['Very helpful', 'Long wait', 'Friendly staff',
+                                                         'Clean room', 'Could be better', None]),
+                   rating, self._moment(rng))
+
+    def tables(self):
+        # Parent tables first so foreign keys hold at every commit.
+        return [
+            ('Employee', ['EmployeeID', 'EmployeeNumber', 'EmailID', 'Password', 'FirstName', 'LastName', 'Gender',
+                          'DateOfBirth', 'DateOfJoining', 'Status'], self.employee_rows),
+            ('EmployeeDetails', ['EmployeeDetailsID', 'EmployeeID', 'FirstName', 'LastName', 'DateOfBirth', 'Gender',
+                                 'PhoneNumber', 'RoleID', 'Address', 'NationalID', 'DateOfJoining', 'Salary',
+                                 'CreatedON', 'ModifiedON'], self.employee_detail_rows),
+            ('EmployeeDepartment', ['EmployeeID', 'DepartmentID', 'IsActive'], self.employee_department_rows),
+            ('Address', ['AddressID', 'Address1', 'Address2', 'City', 'Zipcode', 'State', 'Country'],
+             self.address_rows),
+            ('EmployeeAddressMapping', ['EmployeeDetailsID', 'AddressID', 'IsActive'], self.employee_address_rows),
+            ('Patient', ['PatientID', 'PatientRegNo', 'FirstName', 'LastName', 'DateOfBirth', 'Gender', 'PhoneNumber',
+                         'EmailID', 'Height', 'Weight', 'BloodGroup', 'EmergencyContact', 'Address', 'Allergies',
+                         'MaritalStatus', 'Occupation', 'InsuranceStatus', 'CreatedON', 'ModifiedON'],
+             self.patient_rows),
+            ('PatientInsurance', ['PatientInsuranceID', 'PatientID', 'ProviderName', 'GroupNumber', 'InsuranceNumber',
+                                  'InNetworkCoPay', 'OutNetworkCoPay', 'StartDate', 'EndDate', 'IsCurrent'],
+             self.insurance_rows),
+            ('PatientRegister', ['PatientRegisterID', 'PatientID', 'AdmittedON', 'DischargeON', 'PatientInsuranceID',
+                                 'RoomNumber', 'CopayType', 'CreatedBy', 'CreatedON'], self.register_rows),
+            ('PatientDisease', ['PatientRegisterID', 'DiseaseID'], self.patient_disease_rows),
+            ('PatientAttendant', ['PatientRegisterID', 'EmployeeID'], self.attendant_rows),
+            ('PatientLabReport', ['PatientLabReportID', 'PatientRegisterID', 'LabTestID', 'TestValue', 'Comment',
+                                  'DateOfTest'], self.lab_report_rows),
+            ('Feedback', ['FeedbackID', 'FromPatientID', 'ToEmployeeID', 'Comment', 'Rating', 'CreatedON'],
+             self.feedback_rows),
+        ]
+
+
+def generate(patients, seed=1, years=5, batch_size=BATCH_SIZE, progress=None):
+    data = SyntheticData(patients, seed, years)
+    counts = {}
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        cur = conn.cursor()
+        data.load_reference(cur)
+        conn.commit()
+        for table, columns, rows in data.tables():
+            started = time.perf_counter()
+            sql = (f"INSERT INTO {table} ({', '.join(columns)}) "
+                   f"VALUES ({', '.join(['%s'] * len(columns))})")
+            counts[table] = 0
+            for batch in _chunks(rows(), batch_size):
+                cur.executemany(sql, batch)
+                conn.commit()
+                counts[table] += len(batch)
+            if progress:
+                progress(table, counts[table], time.perf_counter() - started)
+        # The bulk inserts go around the dashboard totals, so they are counted once at the end.
+        recount(cur)
+        conn.commit()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the hospital schema with consistent synthetic data.")
+    parser.add_argument('--patients', type=int, default=10000, help="patients to create (10k to 5M)")
+    parser.add_argument('--years', type=int, default=5, help="span of admissions, ending today")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--sqlite', metavar='PATH', help="write to a local SQLite stand-in instead of MySQL")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        from sqlite_standin import use_sqlite
+        use_sqlite(args.sqlite)
+
+    def report(table, count, elapsed):
+        print(f"{table:<24}{count:>12,} rows  {elapsed:7.1f} s  ({count / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    started = time.perf_counter()
+    counts = generate(args.patients, args.seed, args.years, args.batch_size, progress=report)
+    print(f"{sum(counts.values()):,} rows in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,381 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QTableView, QAbstractItemView
+from page_columns import NUMERIC_KINDS, select_list, select_sql, long_columns, format_value, parse_value, sort_key
+from utils import db_connection, style_table
+from workers import start_load, run_task, show_db_error
+
+# Rows handed to the view per fetchMore() call; the view only asks for more as the user scrolls.
+FETCH_BATCH = 200
+# Long-text cells requested while painting are collected for this long and fetched in one query.
+LONG_TEXT_DELAY_MS = 30
+# Row backgrounds for saves still queued or rejected (see write_queue).
+STATUS_COLORS = {'pending': "#fff3cd", 'failed': "#f8d7da"}
+
+_NOT_FETCHED = object()
+
+
+class RowTableModel(QAbstractTableModel):
+    def __init__(self, parent=None, watermark_column=None, spec=None):
+        super().__init__(parent)
+        self.columns = []
+        self.kinds = []
+        self.rows = []
+        self.loaded = 0
+        self.watermark_column = watermark_column
+        self.watermark = None
+        self.spec = spec
+        self._key_index = None
+        self._sort = None
+        self.long_text = {}
+        self._long_wanted = set()
+        self._long_requested = set()
+        self._long_timer = QTimer(self)
+        self._long_timer.setSingleShot(True)
+        self._long_timer.setInterval(LONG_TEXT_DELAY_MS)
+        self._long_timer.timeout.connect(self._fetch_long_text)
+        # Optional key -> (status, message) callback marking rows with unsaved changes.
+        self.row_status = None
+
+    def select_list(self):
+        return select_list(self.spec) if self.spec else "*"
+
+    def set_rows(self, columns, rows):
+        self.beginResetModel()
+        self.columns = list(columns)
+        kinds = dict(self.spec['columns']) if self.spec else {}
+        self.kinds = [kinds.get(c, 'text') for c in self.columns]
+        self.rows = list(rows)
+        if self._sort:
+            self._apply_sort()
+        self.loaded = min(FETCH_BATCH, len(self.rows))
+        self._key_index = None
+        self.watermark = None
+        self.long_text = {}
+        self._long_requested = set()
+        self._track_watermark(self.rows)
+        self.endResetModel()
+
+    def begin_stream(self, columns):
+        # A streamed load arrives in many chunks; re-sorting each one would be quadratic, so it starts unsorted.
+        self._sort = None
+        self.set_rows(columns, [])
+
+    def append_rows(self, rows):
+        self.rows.extend(rows)
+        self._key_index = None
+        self._track_watermark(rows)
+        # Fill the first screenful straight away; the rest waits for the view to ask via fetchMore().
+        if self.loaded < FETCH_BATCH:
+            self.fetchMore()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        kind = self.kinds[index.column()]
+        value = self.rows[index.row()][index.column()]
+        if self.row_status is not None and role in (Qt.BackgroundRole, Qt.ToolTipRole):
+            status = self.row_status(self.rows[index.row()][self.columns.index(self.spec['key'])])
+            if status is not None:
+                return QColor(STATUS_COLORS[status[0]]) if role == Qt.BackgroundRole else status[1]
+        if kind == 'long' and role in (Qt.DisplayRole, Qt.ToolTipRole):
+            value = self._long_value(index.row(), index.column())
+            if value is _NOT_FETCHED:
+                return "…" if role == Qt.DisplayRole else None
+            return format_value(kind, value) if role == Qt.DisplayRole else value
+        if role == Qt.DisplayRole:
+            return format_value(kind, value)
+        if role == Qt.TextAlignmentRole and kind in NUMERIC_KINDS:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role == Qt.UserRole:
+            return value
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.columns[section] if section < len(self.columns) else None
+        return section + 1
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if column < 0 or column >= len(self.columns) or self.kinds[column] == 'long':
+            self._sort = None
+            return
+        self.beginResetModel()
+        self._sort = (column, order)
+        self._apply_sort()
+        self._key_index = None
+        self.endResetModel()
+
+    def _apply_sort(self):
+        # Sorts the native values (numbers as numbers, dates as dates); empty cells go last both ways.
+        column, order = self._sort
+        key = sort_key(self.kinds[column], column)
+        present = [r for r in self.rows if r[column] is not None]
+        missing = [r for r in self.rows if r[column] is None]
+        present.sort(key=key, reverse=order == Qt.DescendingOrder)
+        self.rows = present + missing
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loaded < len(self.rows)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        count = min(FETCH_BATCH, len(self.rows) - self.loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.loaded += count
+        self.endInsertRows()
+
+    def find_row(self, key_column, key):
+        if self._key_index is None or self._key_index[0] != key_column:
+            col = self.columns.index(key_column)
+            self._key_index = (key_column, {str(r[col]): i for i, r in enumerate(self.rows)})
+        return self._key_index[1].get(str(key))
+
+    def patch_rows(self, key_column, rows):
+        col = self.columns.index(key_column)
+        for row in rows:
+            self._forget_long_text(row[col])
+            i = self.find_row(key_column, row[col])
+            if i is None:
+                self.rows.append(row)
+                self._key_index[1][str(row[col])] = len(self.rows) - 1
+                if self.loaded == len(self.rows) - 1:
+                    self.beginInsertRows(QModelIndex(), self.loaded, self.loaded)
+                    self.loaded += 1
+                    self.endInsertRows()
+            else:
+                self.rows[i] = row
+                if i < self.loaded:
+                    self.dataChanged.emit(self.index(i, 0), self.index(i, len(self.columns) - 1))
+        self._track_watermark(rows)
+
+    def patch_values(self, key_column, key, values):
+        # Overlays values typed into a dialog on the row (or a new one) until the saved row is re-read.
+        i = self.find_row(key_column, key)
+        row = list(self.rows[i]) if i is not None else [None] * len(self.columns)
+        previous = self.long_text.get(str(key), {})
+        long_values = {}
+        for col, (name, kind) in enumerate(zip(self.columns, self.kinds)):
+            if kind == 'long':
+                long_values[name] = values.get(name, previous.get(name))
+            elif name in values:
+                row[col] = parse_value(kind, values[name])
+        self.patch_rows(key_column, [tuple(row)])
+        if long_values:
+            self.long_text[str(key)] = long_values
+
+    def repaint_row(self, key_column, key):
+        i = self.find_row(key_column, key)
+        if i is not None and i < self.loaded:
+            self.dataChanged.emit(self.index(i, 0), self.index(i, len(self.columns) - 1))
+
+    def remove_row(self, key_column, key):
+        i = self.find_row(key_column, key)
+        if i is None:
+            return
+        visible = i < self.loaded
+        if visible:
+            self.beginRemoveRows(QModelIndex(), i, i)
+        del self.rows[i]
+        self._key_index = None
+        if visible:
+            self.loaded -= 1
+            self.endRemoveRows()
+
+    def remove_rows(self, key_column, keys):
+        found = sorted({i for i in (self.find_row(key_column, k) for k in keys) if i is not None})
+        # Remove contiguous runs from the bottom up, so one signal covers each run and the
+        # indices still to be removed stay valid.
+        runs = []
+        for i in found:
+            if runs and runs[-1][1] == i - 1:
+                runs[-1][1] = i
+            else:
+                runs.append([i, i])
+        for first, last in reversed(runs):
+            visible = min(last, self.loaded - 1) - first + 1
+            if visible > 0:
+                self.beginRemoveRows(QModelIndex(), first, first + visible - 1)
+            del self.rows[first:last + 1]
+            if visible > 0:
+                self.loaded -= visible
+                self.endRemoveRows()
+        self._key_index = None
+
+    def _track_watermark(self, rows):
+        if self.watermark_column not in self.columns:
+            return
+        col = self.columns.index(self.watermark_column)
+        newest = max((r[col] for r in rows if r[col] is not None), default=None)
+        if newest is not None and (self.watermark is None or newest > self.watermark):
+            self.watermark = newest
+
+    def row_dict(self, row):
+        return {col: "" if val is None else str(val) for col, val in zip(self.columns, self.rows[row])}
+
+    def _long_value(self, row, column):
+        # Returns the cached text, or _NOT_FETCHED after queueing the row for the next batch fetch.
+        key = str(self.rows[row][self.columns.index(self.spec['key'])])
+        cached = self.long_text.get(key)
+        if cached is not None:
+            return cached[self.columns[column]]
+        if key not in self._long_requested:
+            self._long_wanted.add(key)
+            self._long_timer.start()
+        return _NOT_FETCHED
+
+    def _forget_long_text(self, key):
+        self.long_text.pop(str(key), None)
+        self._long_requested.discard(str(key))
+
+    def _fetch_long_text(self):
+        keys, self._long_wanted = list(self._long_wanted), set()
+        self._long_requested.update(keys)
+        names = long_columns(self.spec)
+        run_task(fetch_long_text, self.spec['table'], self.spec['key'], names, keys,
+                 on_done=self._store_long_text, on_error=show_db_error)
+
+    def _store_long_text(self, texts):
+        self.long_text.update(texts)
+        rows = [i for i in (self.find_row(self.spec['key'], k) for k in texts) if i is not None and i < self.loaded]
+        if rows:
+            first = min(self.columns.index(n) for n in long_columns(self.spec))
+            last = max(self.columns.index(n) for n in long_columns(self.spec))
+            self.dataChanged.emit(self.index(min(rows), first), self.index(max(rows), last))
+
+
+def make_table(watermark_column=None, spec=None, model_class=RowTableModel):
+    table = QTableView()
+    table.setModel(model_class(table, watermark_column, spec))
+    table.setSelectionBehavior(QAbstractItemView.SelectRows)
+    table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+    if spec:
+        table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        table.setSortingEnabled(True)
+    style_table(table)
+    return table
+
+
+def load_table(table, sql=None, params=None):
+    model = table.model()
+    if table.isSortingEnabled():
+        table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+    start_load(table, sql or select_sql(model.spec), params, on_columns=model.begin_stream,
+               on_chunk=model.append_rows, on_error=show_db_error)
+
+
+def refresh_row(table, source, key_column, key):
+    model = table.model()
+
+    def apply(row):
+        if not model.columns:
+            return
+        if row is None:
+            model.remove_row(key_column, key)
+        else:
+            model.patch_rows(key_column, [row])
+
+    run_task(fetch_row, source, key_column, key, model.select_list(), on_done=apply, on_error=show_db_error)
+
+
+def refresh_changed(table, source, key_column):
+    # Pulls only rows whose ModifiedON moved since the last sync. Rows deleted elsewhere are not
+    # seen this way; they drop out on the next full load.
+    model = table.model()
+    if not model.columns or model.watermark is None:
+        load_table(table, f"SELECT {model.select_list()} FROM {source}")
+        return
+    start_load(table, f"SELECT {model.select_list()} FROM {source} WHERE {model.watermark_column} >= %s",
+               (model.watermark,), on_chunk=lambda rows: model.patch_rows(key_column, rows), on_error=show_db_error)
+
+
+def fetch_row(source, key_column, key, columns="*"):
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        cur = conn.cursor()
+        cur.execute(f"SELECT {columns} FROM {source} WHERE {key_column}=%s", (key,))
+        return cur.fetchone()
+
+
+def fetch_record(source, key_column, key):
+    # The whole row as strings, for the edit dialogs; the grid itself only holds the projected columns.
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        cur = conn.cursor()
+        cur.execute(f"SELECT * FROM {source} WHERE {key_column}=%s", (key,))
+        row = cur.fetchone()
+        if row is None:
+            raise LookupError("The selected record no longer exists.")
+        return {d[0]: "" if v is None else str(v) for d, v in zip(cur.description, row)}
+
+
+def open_selected(table, source, key_column, on_record):
+    selected = get_selected(table)
+    if not selected:
+        return False
+    run_task(fetch_record, source, key_column, selected[key_column], on_done=on_record, on_error=show_db_error)
+    return True
+
+
+def fetch_long_text(source, key_column, columns, keys):
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        cur = conn.cursor()
+        names = ", ".join(f"`{c}`" for c in columns)
+        cur.execute(f"SELECT {key_column}, {names} FROM {source} "
+                    f"WHERE {key_column} IN ({', '.join(['%s'] * len(keys))})", keys)
+        return {str(row[0]): dict(zip(columns, row[1:])) for row in cur.fetchall()}
+
+
+def refresh_rows(table, source, key_column, keys):
+    model = table.model()
+
+    def apply(rows):
+        if not model.columns:
+            return
+        model.patch_rows(key_column, rows)
+        col = model.columns.index(key_column)
+        found = {str(r[col]) for r in rows}
+        model.remove_rows(key_column, [k for k in keys if str(k) not in found])
+
+    run_task(fetch_rows, source, key_column, keys, model.select_list(), on_done=apply, on_error=show_db_error)
+
+
+def fetch_rows(source, key_column, keys, columns="*", chunk=1000):
+    rows = []
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        cur = conn.cursor()
+        for i in range(0, len(keys), chunk):
+            part = keys[i:i + chunk]
+            cur.execute(f"SELECT {columns} FROM {source} WHERE {key_column} IN ({', '.join(['%s'] * len(part))})",
+                        part)
+            rows.extend(cur.fetchall())
+    return rows
+
+
+def get_selected(table):
+    index = table.currentIndex()
+    if not index.isValid():
+        return None
+    return table.model().row_dict(index.row())
+
+
+def get_selected_rows(table):
+    model = table.model()
+    return [model.row_dict(row) for row in sorted(i.row() for i in table.selectionModel().selectedRows())]
@@ -0,0 +1,125 @@
+import csv
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+
+from bulk_import import IMPORT_SPECS, RowError, _import_key, convert, import_file, validate
+from sqlite_standin import use_sqlite
+from synthetic_data import generate
+from utils import db_connection
+
+HEADER = ['PatientRegNo', 'FirstName', 'LastName', 'Gender', 'DateOfBirth', 'Height']
+
+
+def query(sql, params=None):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+
+class ConvertTest(unittest.TestCase):
+    def test_values_are_parsed_or_rejected(self):
+        self.assertEqual(convert('Gender', 'Gender', " female "), "Female")
+        self.assertEqual(convert('DateOfBirth', 'date', "31/12/1980"), date(1980, 12, 31))
+        self.assertEqual(convert('DateOfTest', 'datetime', "2024-05-01 08:30"), datetime(2024, 5, 1, 8, 30))
+        self.assertEqual(convert('RoleID', 'int', "3.0"), 3)
+        self.assertEqual(convert('Height', 'decimal', "172.5"), Decimal("172.5"))
+        self.assertIsNone(convert('Height', 'decimal', "  "))
+        for column, kind, value in [('Gender', 'Gender', "M"), ('RoleID', 'int', "three"),
+                                    ('Height', 'decimal', "tall"), ('DateOfBirth', 'date', "1980-13-01")]:
+            with self.assertRaises(RowError):
+                convert(column, kind, value)
+
+    def test_required_columns(self):
+        spec = IMPORT_SPECS['diseases']
+        self.assertEqual(validate(spec, {'Name': "Flu", 'Severity': "mild"}), ("Flu", None, "Mild", None, None, None))
+        with self.assertRaisesRegex(RowError, "Name is required"):
+            validate(spec, {'Name': " ", 'Severity': "Mild"})
+
+
+class ImportFileTest(unittest.TestCase):
+    # Patient files imported into the stand-in in small batches: rejects, counters and resuming.
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp(prefix="hms-test-")
+        use_sqlite(os.path.join(cls.folder, "hms.db"))
+        generate(20)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def write(self, name, rows):
+        path = os.path.join(self.folder, name)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(HEADER)
+            writer.writerows(rows)
+        return path
+
+    def patients(self, prefix, count):
+        return [(f"{prefix}{n:04d}", f"First{n}", f"Last{n}", "Male" if n % 2 else "female", "1980-01-02", "170")
+                for n in range(count)]
+
+    def count(self, prefix):
+        return query("SELECT COUNT(*) FROM Patient WHERE PatientRegNo LIKE %s", (f"{prefix}%",))[0][0]
+
+    def progress(self, path):
+        return query("SELECT RowsDone, Inserted, Rejected FROM ImportProgress WHERE ImportKey=%s",
+                     (_import_key(path, 'patients'),))
+
+    def test_bad_rows_go_to_the_rejects_file(self):
+        existing = query("SELECT PatientRegNo FROM Patient ORDER BY PatientID LIMIT 1")[0][0]
+        rows = self.patients("BAD", 25)
+        rows[3] = rows[3][:3] + ("Unknown",) + rows[3][4:]
+        rows[11] = (rows[11][0], "", *rows[11][2:])
+        rows[17] = (existing, *rows[17][1:])
+        path = self.write("bad.csv", rows)
+        counted = query("SELECT Value FROM DashboardCount WHERE Name='patients'")[0][0]
+
+        result = import_file('patients', path, batch_size=10)
+        self.assertEqual((result['rows_done'], result['inserted'], result['rejected']), (25, 22, 3))
+        self.assertFalse(result['stopped'])
+        self.assertEqual(self.count("BAD"), 22)
+        self.assertEqual(query("SELECT Value FROM DashboardCount WHERE Name='patients'")[0][0], counted + 22)
+        self.assertEqual(self.progress(path), [])
+        with open(result['rejects_file'], newline='', encoding='utf-8') as f:
+            rejects = list(csv.reader(f))
+        self.assertEqual(rejects[0], ['line', 'error'] + HEADER)
+        # Lines as the file numbers them, header being line 1.
+        self.assertEqual([row[0] for row in rejects[1:]], ["5", "13", "19"])
+        self.assertIn("Gender", rejects[1][1])
+        self.assertIn("FirstName is required", rejects[2][1])
+
+    def test_stopped_import_resumes_where_it_left_off(self):
+        path = self.write("resume.csv", self.patients("RES", 35))
+        stop = threading.Event()
+        stop.set()
+        result = import_file('patients', path, stop_event=stop, batch_size=10)
+        self.assertTrue(result['stopped'])
+        self.assertEqual((result['rows_done'], result['inserted']), (10, 10))
+        self.assertEqual(self.progress(path), [(10, 10, 0)])
+
+        result = import_file('patients', path, batch_size=10)
+        self.assertEqual((result['rows_done'], result['inserted'], result['rejected']), (35, 35, 0))
+        self.assertEqual(self.count("RES"), 35)
+        self.assertEqual(self.progress(path), [])
+
+    def test_restart_ignores_saved_progress(self):
+        path = self.write("restart.csv", self.patients("RST", 20))
+        stop = threading.Event()
+        stop.set()
+        import_file('patients', path, stop_event=stop, batch_size=10)
+        result = import_file('patients', path, resume=False, batch_size=10)
+        # The first ten are read again and refused as duplicates of what the stopped run saved.
+        self.assertEqual((result['rows_done'], result['inserted'], result['rejected']), (20, 10, 10))
+        self.assertEqual(self.count("RST"), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+from datetime import datetime, timedelta
+
+from clinical_analytics import READMIT_DAYS, ClinicalAnalytics
+from lookups import lookups
+from sqlite_standin import use_sqlite
+from synthetic_data import generate
+from utils import db_connection
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def minutes(moment):
+    return None if moment is None else int((moment - EPOCH).total_seconds() // 60)
+
+
+def read(sql):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(sql)
+        return cur.fetchall()
+
+
+def execute(sql, params):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        return cur.lastrowid
+
+
+def tables(result):
+    return {name: result[name] for name in ('length_of_stay', 'prevalence', 'diseases', 'readmissions')}
+
+
+class ClinicalAnalyticsTest(unittest.TestCase):
+    # Metrics over the stand-in's stays against the same figures counted one stay at a time.
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp(prefix="hms-test-")
+        use_sqlite(os.path.join(cls.folder, "hms.db"))
+        generate(300)
+        # The refresh runs on a worker in the app, where a lookup miss reads the table; here it is read first.
+        lookups.refresh('Disease')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def stays(self):
+        rows = read("SELECT PatientRegisterID, PatientID, AdmittedON, DischargeON FROM PatientRegister")
+        return [(reg, patient, minutes(admitted), minutes(discharged)) for reg, patient, admitted, discharged in rows]
+
+    def now(self):
+        return EPOCH + timedelta(minutes=max(admitted for _, _, admitted, _ in self.stays() if admitted) + 60)
+
+    def test_all_time_figures_match_a_stay_by_stay_count(self):
+        stays = self.stays()
+        now = self.now()
+        result = ClinicalAnalytics()
+        result.refresh()
+        result = result.metrics(now=now)
+
+        done = [discharged - admitted for _, _, admitted, discharged in stays
+                if admitted is not None and discharged is not None and discharged >= admitted]
+        _, rows = result['length_of_stay']
+        self.assertEqual(rows[0][1], len(done))
+        self.assertAlmostEqual(rows[0][2], sum(done) / len(done) / 1440, delta=0.01)
+        self.assertEqual(sum(rows[0][5:]), len(done))
+
+        _, rows = result['prevalence']
+        self.assertEqual(sum(row[1] for row in rows), sum(admitted is not None for _, _, admitted, _ in stays))
+
+        admitted = {reg for reg, _, moment, _ in stays if moment is not None}
+        cases = Counter(disease for reg, disease in read("SELECT PatientRegisterID, DiseaseID FROM PatientDisease")
+                        if reg in admitted)
+        _, rows = result['diseases']
+        self.assertEqual({row[0]: row[3] for row in rows}, dict(cases))
+
+        # A discharge counts once its follow-up window has passed; it was a readmission if the
+        # patient's next admission started within READMIT_DAYS of it.
+        ordered = sorted((s for s in stays if s[2] is not None), key=lambda s: (s[1], s[2], s[0]))
+        cutoff = minutes(now) - READMIT_DAYS * 1440
+        discharges = readmitted = 0
+        for stay, following in zip(ordered, ordered[1:] + [None]):
+            _, patient, start, end = stay
+            if end is None or end < start or end > cutoff:
+                continue
+            discharges += 1
+            readmitted += (following is not None and following[1] == patient
+                           and 0 <= following[2] - end <= READMIT_DAYS * 1440)
+        _, rows = result['readmissions']
+        self.assertEqual(rows[0][1:3], (discharges, readmitted))
+        self.assertGreater(readmitted, 0)
+
+    def test_months_limit_the_period(self):
+        now = self.now()
+        analytics = ClinicalAnalytics()
+        analytics.refresh()
+        _, rows = analytics.metrics(months=3, now=now)['prevalence']
+        self.assertEqual(len(rows), 3)
+        start = datetime(now.year, now.month, 1)
+        for _ in range(2):
+            start = (start - timedelta(days=1)).replace(day=1)
+        expected = sum(start <= EPOCH + timedelta(minutes=admitted) <= now
+                       for _, _, admitted, _ in self.stays() if admitted is not None)
+        self.assertEqual(sum(row[1] for row in rows), expected)
+
+    def test_refresh_catches_up_like_a_rebuild(self):
+        analytics = ClinicalAnalytics()
+        analytics.refresh()
+        now = self.now()
+        before = analytics.metrics(now=now)
+
+        reg, patient, admitted, _ = next(s for s in self.stays() if s[3] is None and s[2] is not None)
+        admitted = EPOCH + timedelta(minutes=admitted)
+        execute("UPDATE PatientRegister SET DischargeON=%s WHERE PatientRegisterID=%s",
+                (admitted + timedelta(days=4), reg))
+        # Readmitted a week after that discharge, with a diagnosis.
+        added = execute("INSERT INTO PatientRegister (PatientID, AdmittedON, DischargeON) VALUES (%s, %s, %s)",
+                        (patient, admitted + timedelta(days=11), admitted + timedelta(days=13)))
+        execute("INSERT INTO PatientDisease (PatientRegisterID, DiseaseID) VALUES (%s, %s)",
+                (added, lookups.get('Disease')[0][0]))
+        later = max(now, admitted + timedelta(days=13 + READMIT_DAYS + 1))
+
+        refreshed = analytics.refresh()
+        self.assertEqual(refreshed['added'], 1)
+        self.assertGreaterEqual(refreshed['changed'], 1)
+        self.assertNotEqual(tables(analytics.metrics(now=now)), tables(before))
+        rebuilt = ClinicalAnalytics()
+        rebuilt.refresh()
+        self.assertEqual(tables(analytics.metrics(now=later)), tables(rebuilt.metrics(now=later)))
+        self.assertEqual(tables(analytics.metrics(months=2, now=later)), tables(rebuilt.metrics(months=2, now=later)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import pymysql
+
+from sqlite_standin import StandinPool, create_database
+from utils import PoolTimeout
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    # utils.ConnectionPool through its SQLite stand-in subclass, which only changes how a raw
+    # connection is opened.
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp(prefix="hms-test-")
+        cls.path = os.path.join(cls.folder, "hms.db")
+        create_database(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def pool(self, **kwargs):
+        pool = StandinPool(self.path, **{'min_size': 1, 'max_size': 2, 'acquire_timeout': 1, **kwargs})
+        self.addCleanup(pool.close_all)
+        return pool
+
+    def test_released_connection_is_reused(self):
+        pool = self.pool()
+        first = pool.acquire()
+        raw = first._raw
+        first.close()
+        second = pool.acquire()
+        self.assertIs(second._raw, raw)
+        second.close()
+        stats = pool.stats()
+        self.assertEqual((stats['creates'], stats['hits'], stats['size'], stats['idle']), (1, 1, 1, 1))
+
+    def test_exhausted_pool_times_out(self):
+        pool = self.pool(max_size=1, acquire_timeout=0.2)
+        held = pool.acquire()
+        started = time.monotonic()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        held.close()
+
+    def test_waiter_gets_the_released_connection(self):
+        pool = self.pool(max_size=1)
+        held = pool.acquire()
+        threading.Timer(0.1, held.close).start()
+        conn = pool.acquire()
+        self.assertIsNotNone(conn._raw)
+        conn.close()
+        stats = pool.stats()
+        self.assertEqual((stats['waits'], stats['creates'], stats['size']), (1, 1, 1))
+
+    def test_dead_connection_is_replaced(self):
+        pool = self.pool()
+        conn = pool.acquire()
+        conn.close()
+        # The server dropped the idle connection; the ping on acquire notices.
+        pool._idle[0][0]._conn.close()
+        conn = pool.acquire()
+        conn.cursor().execute("SELECT 1")
+        conn.close()
+        self.assertEqual(pool.stats()['reconnects'], 1)
+
+    def test_idle_connections_expire_down_to_min_size(self):
+        pool = self.pool(min_size=1, idle_timeout=0)
+        first, second = pool.acquire(), pool.acquire()
+        first.close()
+        second.close()
+        time.sleep(0.01)
+        pool.acquire().close()
+        stats = pool.stats()
+        self.assertEqual((stats['expired'], stats['size']), (1, 1))
+
+    def test_release_rolls_back_an_open_transaction(self):
+        pool = self.pool(max_size=1)
+        conn = pool.acquire()
+        conn.cursor().execute("INSERT INTO Role (RoleDesc) VALUES (%s)", ("Pool test",))
+        conn.close()
+        conn = pool.acquire()
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM Role WHERE RoleDesc=%s", ("Pool test",))
+        self.assertEqual(cur.fetchone()[0], 0)
+        conn.close()
+
+    def test_returned_wrapper_cannot_be_used(self):
+        pool = self.pool()
+        conn = pool.acquire()
+        conn.close()
+        with self.assertRaises(pymysql.err.InterfaceError):
+            conn.cursor()
+        conn.close()
+        self.assertEqual(pool.stats()['idle'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import lab_flags
+from lab_flags import (CRITICAL_HIGH, CRITICAL_LOW, HIGH, LOW, NORMAL, UNPARSED, LabFlagCache, compute_flags,
+                       flag_rows, range_arrays, scan_reports)
+from lookups import lookups
+from sqlite_standin import use_sqlite
+from synthetic_data import generate
+from utils import db_connection
+
+# (LabTestID, name, min, max, unit) as the LabTest lookup holds them.
+TESTS = [(1, "Glucose", 70, 100, "mg/dL"), (3, "Sodium", 135, 145, "mmol/L")]
+
+
+def expected_flag(value, low, high):
+    # The rule spelled out: beyond the range by more than half its width is critical.
+    try:
+        value = float(str(value).split()[0].lstrip("<>"))
+    except (ValueError, IndexError):
+        return UNPARSED
+    margin = (high - low) * lab_flags.CRITICAL_MARGIN
+    if value < low - margin:
+        return CRITICAL_LOW
+    if value > high + margin:
+        return CRITICAL_HIGH
+    if value < low:
+        return LOW
+    if value > high:
+        return HIGH
+    return NORMAL
+
+
+class ComputeFlagsTest(unittest.TestCase):
+    def test_values_against_reference_ranges(self):
+        low, high = range_arrays(TESTS)
+        cases = [(1, "85"), (1, "69.5"), (1, "101"), (1, "50"), (1, "116"), (1, "5.2 mg/dL"), (1, "<0.1"),
+                 (3, "140"), (3, "129"), (3, "131"), (3, "150.1"), (1, "positive"), (1, None), (1, ""),
+                 (2, "85"), (99, "85")]
+        codes = compute_flags([t for t, _ in cases], [v for _, v in cases], low, high).tolist()
+        ranges = {test_id: (low_value, high_value) for test_id, _, low_value, high_value, _ in TESTS}
+        for (test_id, value), code in zip(cases, codes):
+            if test_id in ranges and value:
+                self.assertEqual(code, expected_flag(value, *ranges[test_id]), (test_id, value))
+            else:
+                self.assertEqual(code, UNPARSED, (test_id, value))
+
+    def test_cache_flags_each_report_once(self):
+        cache = LabFlagCache()
+        cache.current_ranges = lambda: range_arrays(TESTS)
+        self.assertEqual(cache.flag([10, 11], [1, 1], ["200", "80"]), [CRITICAL_HIGH, NORMAL])
+        # A cached report keeps its flag until it is invalidated.
+        self.assertEqual(cache.flag([10], [1], ["80"]), [CRITICAL_HIGH])
+        cache.store([12], [LOW])
+        cache.invalidate([10, 12])
+        self.assertEqual(cache.take_stale(), [10, 12])
+        self.assertEqual(cache.flag([10], [1], ["80"]), [NORMAL])
+
+
+class ScanReportsTest(unittest.TestCase):
+    # scan_reports against the stand-in: every report flagged as compute_flags would, re-scans
+    # reading only new and edited reports.
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp(prefix="hms-test-")
+        use_sqlite(os.path.join(cls.folder, "hms.db"))
+        generate(80)
+        # The scan runs on a worker in the app, where a lookup miss reads the table; here it is read first.
+        lookups.refresh('LabTest')
+        lab_flags.flags = LabFlagCache()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def reports(self):
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT PatientLabReportID, LabTestID, TestValue FROM PatientLabReport")
+            return cur.fetchall()
+
+    def test_scan_then_rescan(self):
+        rows = self.reports()
+        result = scan_reports(chunk_size=100)
+        self.assertEqual(result['scanned'], len(rows))
+        low, high = range_arrays(lookups.get('LabTest'))
+        expected = compute_flags([r[1] for r in rows], [r[2] for r in rows], low, high).tolist()
+        columns = ['PatientLabReportID', 'LabTestID', 'TestValue']
+        self.assertEqual(flag_rows(columns, rows), expected)
+        self.assertEqual(sum(result['counts'].values()), len(rows))
+        self.assertGreater(result['counts'][NORMAL], 0)
+
+        self.assertEqual(scan_reports()['scanned'], 0)
+        edited = rows[5][0]
+        with db_connection() as conn:
+            conn.cursor().execute("UPDATE PatientLabReport SET TestValue=%s WHERE PatientLabReportID=%s",
+                                  ("99999", edited))
+        lab_flags.flags.invalidate([edited])
+        self.assertEqual(scan_reports()['scanned'], 1)
+        self.assertEqual(flag_rows(columns, [(edited, rows[5][1], "99999")]), [CRITICAL_HIGH])
+
+
+if __name__ == '__main__':
+    unittest.main()
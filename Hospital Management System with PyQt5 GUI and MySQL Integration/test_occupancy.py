@@ -0,0 +1,122 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from datetime import timedelta
+
+from occupancy import BOOKING_CHECK_SQL, BOOKING_UNTIL_SQL, OPEN_END, RoomIndex, load_rooms
+from occupancy_benchmark import linear_conflict, linear_occupied, synthetic_stays
+from sqlite_standin import use_sqlite
+from synthetic_data import generate
+from utils import db_connection
+
+
+def overlapping_stays(seed=3):
+    # Legacy rows: double bookings and stays that outlast later ones in the same room.
+    rows, origin, horizon = synthetic_stays(6, 1, seed=seed)
+    rng = random.Random(seed)
+    reg = len(rows) + 1
+    for _ in range(40):
+        start = origin + timedelta(days=rng.randint(0, 360), hours=rng.randint(0, 23))
+        end = None if rng.random() < 0.1 else start + timedelta(days=rng.randint(1, 60))
+        rows.append((reg, f"R{rng.randint(1, 6):03d}", start, end))
+        reg += 1
+    return rows, origin, horizon
+
+
+def moments(origin, horizon, count, seed=5):
+    rng = random.Random(seed)
+    span = int((horizon - origin).total_seconds())
+    return [origin + timedelta(seconds=rng.randint(-86400, span)) for _ in range(count)]
+
+
+class RoomIndexTest(unittest.TestCase):
+    # RoomIndex answers against a linear scan of the same stays.
+    def test_conflicts_match_a_linear_scan(self):
+        rows, origin, horizon = overlapping_stays()
+        index = RoomIndex()
+        index.build(rows)
+        for start in moments(origin, horizon, 300):
+            for room in ("R001", "R004"):
+                for end in (start + timedelta(hours=6), start + timedelta(days=9), None):
+                    found = index.conflict(room, start, end)
+                    expected = linear_conflict(rows, room, start, end or OPEN_END)
+                    self.assertEqual(found is None, expected is None, (room, start, end))
+                    if found is not None:
+                        self.assertEqual(index.stay(found)[0], room)
+
+    def test_occupied_counts_rooms_not_stays(self):
+        rows, origin, horizon = overlapping_stays()
+        index = RoomIndex()
+        index.build(rows)
+        for moment in moments(origin, horizon, 300):
+            self.assertEqual(index.occupied_at(moment), linear_occupied(rows, moment), moment)
+
+    def test_updates_match_a_rebuild(self):
+        rows, origin, horizon = overlapping_stays()
+        rng = random.Random(11)
+        index = RoomIndex()
+        index.build(rows)
+        current = {str(row[0]): row for row in rows}
+        for reg in rng.sample(sorted(current), 60):
+            index.remove(reg)
+            del current[reg]
+        for reg, _, start, end in rng.sample(list(current.values()), 60):
+            moved = (reg, f"R{rng.randint(1, 8):03d}", start + timedelta(hours=rng.randint(-48, 48)), end)
+            index.add(*moved)
+            current[str(reg)] = moved
+        rebuilt = RoomIndex()
+        rebuilt.build(list(current.values()))
+        self.assertEqual(index.rooms(), rebuilt.rooms())
+        for moment in moments(origin, horizon, 200):
+            self.assertEqual(index.occupied_at(moment), rebuilt.occupied_at(moment), moment)
+            for room in index.rooms():
+                self.assertEqual(index.conflict(room, moment, moment + timedelta(days=2)) is None,
+                                 rebuilt.conflict(room, moment, moment + timedelta(days=2)) is None)
+
+    def test_exclude_skips_the_stay_being_edited(self):
+        rows, origin, _ = synthetic_stays(1, 1)
+        index = RoomIndex()
+        index.build(rows)
+        reg, room, start, end = rows[3]
+        self.assertEqual(index.conflict(room, start, end), str(reg))
+        self.assertIsNone(index.conflict(room, start, end, exclude=[reg]))
+        self.assertEqual(index.free_rooms(start, end), [])
+        self.assertEqual(index.free_rooms(origin - timedelta(days=30), origin - timedelta(days=29)), [room])
+
+
+class LoadedRoomsTest(unittest.TestCase):
+    # The index as load_rooms() builds it from PatientRegister agrees with the booking check query.
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp(prefix="hms-test-")
+        use_sqlite(os.path.join(cls.folder, "hms.db"))
+        generate(150)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def test_index_agrees_with_the_booking_check(self):
+        index = load_rooms()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT PatientRegisterID, RoomNumber, AdmittedON, DischargeON FROM PatientRegister "
+                        "WHERE RoomNumber IS NOT NULL ORDER BY PatientRegisterID")
+            stays = cur.fetchall()
+            clashes = 0
+            for reg, room, start, end in stays[::3]:
+                # Re-saving the stay with other dates: does it run into another stay of its room?
+                for probe_start, probe_end in [(start, end), (start - timedelta(days=3), start + timedelta(hours=1)),
+                                               (start + timedelta(days=2), None)]:
+                    cur.execute(BOOKING_CHECK_SQL + BOOKING_UNTIL_SQL, (room, probe_start, reg, probe_end or OPEN_END))
+                    clash = cur.fetchone()
+                    clashes += clash is not None
+                    self.assertEqual(index.conflict(room, probe_start, probe_end, exclude=[reg]) is None,
+                                     clash is None, (reg, probe_start, probe_end))
+            self.assertGreater(clashes, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
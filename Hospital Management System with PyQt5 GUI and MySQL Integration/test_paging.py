@@ -0,0 +1,102 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+
+from page_columns import PAGE_COLUMNS
+from paging import KeysetPager
+from sqlite_standin import use_sqlite
+from synthetic_data import generate
+from table_model import make_table
+from utils import db_connection
+from workers import pending_tasks
+
+PAGE = 100
+
+
+def report_ids():
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT PatientLabReportID FROM PatientLabReport ORDER BY PatientLabReportID")
+        return [row[0] for row in cur.fetchall()]
+
+
+class KeysetPagerTest(unittest.TestCase):
+    # The Lab Reports pager against a stand-in of a few hundred reports, loads run on the worker pool.
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication(sys.argv)
+        cls.folder = tempfile.mkdtemp(prefix="hms-test-")
+        use_sqlite(os.path.join(cls.folder, "hms.db"))
+        generate(60)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def setUp(self):
+        self.table = make_table(spec=PAGE_COLUMNS['lab_reports'])
+        self.pager = KeysetPager(self.table, "PatientLabReport", "PatientLabReportID", page_size=PAGE)
+
+    def settle(self):
+        deadline = time.monotonic() + 10
+        while pending_tasks() and time.monotonic() < deadline:
+            self.app.processEvents()
+            time.sleep(0.005)
+        self.app.processEvents()
+
+    def shown(self):
+        model = self.table.model()
+        key = model.columns.index('PatientLabReportID')
+        return [row[key] for row in model.rows]
+
+    def step(self, move, *args):
+        move(*args)
+        self.settle()
+        return self.shown()
+
+    def test_pages_forward_cover_every_row_once(self):
+        ids = report_ids()
+        self.assertGreater(len(ids), 3 * PAGE)
+        seen = self.step(self.pager.first)
+        self.assertFalse(self.pager.has_previous)
+        while self.pager.has_next:
+            seen += self.step(self.pager.next)
+            self.assertTrue(self.pager.has_previous)
+        self.assertEqual(seen, ids)
+
+    def test_previous_returns_the_page_in_order(self):
+        ids = report_ids()
+        self.step(self.pager.first)
+        self.step(self.pager.next)
+        self.assertEqual(self.step(self.pager.next), ids[2 * PAGE:3 * PAGE])
+        self.assertEqual(self.step(self.pager.previous), ids[PAGE:2 * PAGE])
+        self.assertTrue(self.pager.has_previous)
+        self.assertEqual(self.step(self.pager.previous), ids[:PAGE])
+        self.assertFalse(self.pager.has_previous)
+        self.assertTrue(self.pager.has_next)
+
+    def test_jump_starts_at_the_first_key_at_or_after(self):
+        ids = report_ids()
+        target = ids[PAGE + 7]
+        self.assertEqual(self.step(self.pager.jump_to, target), ids[PAGE + 7:2 * PAGE + 7])
+        self.assertEqual(self.pager.describe().split(" (")[0], f"PatientLabReportID {target}–{ids[2 * PAGE + 6]}")
+
+    def test_rows_deleted_behind_do_not_shift_the_next_page(self):
+        ids = report_ids()
+        self.step(self.pager.first)
+        with db_connection() as conn:
+            conn.cursor().execute("DELETE FROM PatientLabReport WHERE PatientLabReportID IN (%s, %s)",
+                                  (ids[0], ids[1]))
+        # An OFFSET pager would now skip two rows; the keyset one continues after the last key shown.
+        self.assertEqual(self.step(self.pager.next), ids[PAGE:2 * PAGE])
+
+
+if __name__ == '__main__':
+    unittest.main()
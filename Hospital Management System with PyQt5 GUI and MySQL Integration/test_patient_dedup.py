@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from itertools import combinations
+
+import numpy as np
+
+import patient_dedup
+from patient_dedup import (REPORT_SCORE, WARN_SCORE, DedupIndex, agreements, block_pairs, combine,
+                           duplicate_report, encode, find_duplicates)
+from sqlite_standin import use_sqlite
+from synthetic_data import generate
+from utils import db_connection
+
+PATIENT = (1, "Margaret", "Holloway", "Female", "1961-04-12", "+20 100 555 1234", "m.holloway@example.com",
+           "12 Nile Street, Cairo")
+
+
+def score(a, b):
+    parts = agreements(encode([a]), encode([b]))
+    return float(combine(parts)[0]), bool(parts['swapped'][0])
+
+
+class BlockingTest(unittest.TestCase):
+    def test_block_pairs_are_every_pair_of_small_blocks(self):
+        rng = np.random.default_rng(2)
+        keys = rng.integers(0, 40, 600)
+        keys[:80] = 7       # one block over the limit
+        left, right, skipped = block_pairs(keys, max_block=50)
+        sizes = {key: int((keys == key).sum()) for key in set(keys.tolist()) if key}
+        expected = {(i, j) for i, j in combinations(range(len(keys)), 2)
+                    if keys[i] == keys[j] and keys[i] and sizes[keys[i]] <= 50}
+        found = {(min(i, j), max(i, j)) for i, j in zip(left.tolist(), right.tolist())}
+        self.assertEqual(len(found), len(left))
+        self.assertEqual(found, expected)
+        self.assertEqual(skipped, sum(size for size in sizes.values() if size > 50))
+
+    def test_no_keys_no_pairs(self):
+        left, right, skipped = block_pairs(np.zeros(10, np.int64))
+        self.assertEqual((len(left), len(right), skipped), (0, 0, 0))
+
+
+class ScoringTest(unittest.TestCase):
+    def test_same_person_with_typos_scores_high(self):
+        self.assertAlmostEqual(score(PATIENT, PATIENT)[0], 1.0)
+        typo = (2, "Margret", "Holloway", "Female", "1961-04-21", "0100 555 1234", "", "12 Nile St, Cairo")
+        self.assertGreaterEqual(score(PATIENT, typo)[0], REPORT_SCORE)
+
+    def test_swapped_names_are_recognised(self):
+        swapped = (2, "Holloway", "Margaret", "Female", "1961-04-12", "", "", "")
+        found, was_swapped = score(PATIENT, swapped)
+        self.assertTrue(was_swapped)
+        self.assertGreaterEqual(found, WARN_SCORE)
+
+    def test_different_people_score_low(self):
+        other = (2, "Ahmed", "Mansour", "Male", "1990-11-02", "+20 122 987 6543", "", "4 Tahrir Square, Giza")
+        self.assertLess(score(PATIENT, other)[0], 0.1)
+        namesake = (3, "Margaret", "Holloway", "Female", "1985-09-30", "+20 111 222 3333", "", "Alexandria")
+        self.assertLess(score(PATIENT, namesake)[0], WARN_SCORE)
+
+
+class DuplicatesTest(unittest.TestCase):
+    # Near-duplicates planted among synthetic patients in the stand-in are reported and warned about.
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp(prefix="hms-test-")
+        use_sqlite(os.path.join(cls.folder, "hms.db"))
+        generate(300)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def add_patient(self, reg, first, last, born, gender, phone):
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("INSERT INTO Patient (PatientRegNo, FirstName, LastName, DateOfBirth, Gender, PhoneNumber, "
+                        "ModifiedON) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                        (reg, first, last, born, gender, phone, datetime.now()))
+
+    def patient(self, offset):
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT PatientRegNo, FirstName, LastName, DateOfBirth, Gender, PhoneNumber FROM Patient "
+                        "WHERE DateOfBirth IS NOT NULL ORDER BY PatientID LIMIT 1 OFFSET %s", (offset,))
+            return cur.fetchone()
+
+    def test_planted_duplicate_is_reported_and_found_later(self):
+        index = DedupIndex()
+        reg, first, last, born, gender, phone = self.patient(10)
+        # A doubled letter in the last name and the phone written with the country code.
+        self.add_patient("DUP-1", first, last + last[-1], born, gender, "+20 " + phone)
+        _, rows, stats = duplicate_report(index, min_score=WARN_SCORE)
+        pairs = {frozenset((row[1], row[5])) for row in rows}
+        self.assertIn(frozenset((reg, "DUP-1")), pairs)
+        self.assertEqual(stats['patients'], index.size)
+
+        # Another one added afterwards, names swapped: the refresh reads only it (and the newest row
+        # again), and the online check finds both through the shared phone.
+        reg, first, last, born, gender, phone = self.patient(20)
+        self.add_patient("DUP-2", last, first, born, gender, phone)
+        self.assertLessEqual(index.refresh()['read'], 2)
+        matches = index.similar({'FirstName': first, 'LastName': last, 'DateOfBirth': str(born),
+                                 'PhoneNumber': phone, 'Gender': gender})
+        found = {patient_id for patient_id, _, _ in matches}
+        self.assertEqual(len(found), 2)
+        self.assertTrue(any("names swapped" in said for _, _, said in matches))
+
+    def test_add_patient_check_returns_details(self):
+        patient_dedup.dedup_index = DedupIndex()
+        reg, first, last, born, _, phone = self.patient(30)
+        matches = find_duplicates({'FirstName': first.upper(), 'LastName': last, 'DateOfBirth': str(born),
+                                   'PhoneNumber': phone})
+        self.assertEqual(matches[0][:2], (reg, f"{first} {last}"))
+        self.assertGreaterEqual(matches[0][4], REPORT_SCORE)
+        self.assertEqual(find_duplicates({'FirstName': "Zzyzx", 'LastName': "Qwerty"}), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
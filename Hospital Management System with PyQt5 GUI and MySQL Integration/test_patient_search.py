@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from patient_search import MAX_RESULTS, PrefixIndex, load_prefix_index, phone_digits, search_sql
+from sqlite_standin import use_sqlite
+from synthetic_data import generate
+from utils import db_connection
+
+
+def sql_search(text):
+    sql, params = search_sql(text, "PatientRegNo")
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        return {row[0] for row in cur.fetchall()}
+
+
+class PrefixSearchTest(unittest.TestCase):
+    # The type-ahead index and the Patients page query must find the same patients for a text.
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp(prefix="hms-test-")
+        use_sqlite(os.path.join(cls.folder, "hms.db"))
+        generate(400)
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT PatientRegNo, FirstName, LastName, PhoneNumber FROM Patient ORDER BY PatientID")
+            cls.patients = cur.fetchall()
+        cls.index = load_prefix_index()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def assertSameMatches(self, text):
+        found = set(self.index.search(text, limit=len(self.patients)))
+        expected = sql_search(text)
+        self.assertLess(len(expected), MAX_RESULTS, text)
+        self.assertEqual(found, expected, text)
+        return found
+
+    def test_reg_no_prefix(self):
+        reg = self.patients[17][0]
+        self.assertIn(reg, self.assertSameMatches(reg))
+        self.assertSameMatches(reg[:-1])
+
+    def test_name_in_either_order(self):
+        for reg, first, last, _ in self.patients[:25:5]:
+            self.assertIn(reg, self.assertSameMatches(f"{last} {first}"))
+            self.assertIn(reg, self.assertSameMatches(f"{first} {last[:2]}"))
+            self.assertSameMatches(last[:3])
+
+    def test_case_and_spacing_are_ignored(self):
+        reg, first, last, _ = self.patients[3]
+        self.assertIn(reg, self.assertSameMatches(f"  {last.upper()}   {first.lower()} "))
+
+    def test_phone_digits_however_written(self):
+        reg, _, _, phone = next(p for p in self.patients if len(phone_digits(p[3])) >= 7)
+        digits = phone_digits(phone)
+        self.assertIn(reg, self.assertSameMatches(digits[:6]))
+        self.assertIn(reg, self.assertSameMatches(f"{digits[:3]}-{digits[3:7]}"))
+
+    def test_build_from_several_chunks(self):
+        rows = [(reg, first, last, phone) for reg, first, last, phone in self.patients]
+        index = PrefixIndex()
+        index.build([rows[:150], rows[150:300], rows[300:]])
+        reg, first, last, _ = rows[200]
+        self.assertEqual(index.search(reg), self.index.search(reg))
+        self.assertIn(reg, index.search(f"{first} {last}", limit=len(rows)))
+        self.assertEqual(index.label(reg), self.index.label(reg))
+
+    def test_overlay_of_saves_and_deletes(self):
+        index = PrefixIndex()
+        index.build([list(self.patients)])
+        reg, first, last, phone = self.patients[9]
+        index.upsert(reg, "Zebulon", last, phone)
+        self.assertIn(reg, index.search("zebulon"))
+        self.assertNotIn(reg, index.search(f"{first} {last}", limit=len(self.patients)))
+        self.assertEqual(index.label(reg), f"{last}, Zebulon — {reg} — {phone}")
+        index.upsert("NEW-1", "Quentin", "Quill", "")
+        self.assertEqual(index.search("quill q"), ["NEW-1"])
+        index.remove(reg)
+        self.assertEqual(index.search(reg), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import unittest
+
+from lab_flags import RESCAN_SQL
+from page_columns import PAGE_COLUMNS, select_list
+from patient_search import MAX_SPLIT_WORDS, search_sql
+from service_client import RemoteConnection, ServiceError
+from service_loadtest import start_service
+from service_operations import MAX_IN_KEYS, bind, is_read, operation_name, operations
+from sqlite_standin import add_functions, create_database, translate, use_sqlite
+from symptom_index import DOCS_IN_SQL
+from synthetic_data import generate
+
+COLUMNS = select_list(PAGE_COLUMNS['patients'])
+
+
+def marks(sql, count):
+    return sql.replace("IN (%s)", f"IN ({', '.join(['%s'] * count)})")
+
+
+class OperationNameTest(unittest.TestCase):
+    def test_app_statements_have_names(self):
+        self.assertEqual(operation_name(search_sql("smith", COLUMNS)[0]), "search/words1")
+        self.assertEqual(operation_name(search_sql("smith john", COLUMNS)[0]), "search/words2")
+        self.assertEqual(operation_name(search_sql("john 5551234", COLUMNS)[0]), "search/words2_phone")
+        # Longer texts are split at most MAX_SPLIT_WORDS ways, so they are still one of the operations.
+        long_text = " ".join(["ab"] * (MAX_SPLIT_WORDS + 3))
+        self.assertEqual(operation_name(search_sql(long_text, COLUMNS)[0]), f"search/words{MAX_SPLIT_WORDS}")
+        for count in (1, 7, 1000):
+            self.assertEqual(operation_name(marks(RESCAN_SQL, count)), "labs/rescan")
+            self.assertEqual(operation_name(marks(DOCS_IN_SQL, count)), "symptoms/redocs")
+        self.assertEqual(operation_name(f"  {RESCAN_SQL}\n"), "labs/rescan")
+
+    def test_other_statements_have_none(self):
+        for sql in ["SELECT 1", "DROP TABLE Patient", "SELECT PatientID FROM Patient WHERE 1=1", RESCAN_SQL + " OR 1=1"]:
+            self.assertIsNone(operation_name(sql), sql)
+
+    def test_bind_sizes_the_key_list(self):
+        self.assertEqual(bind("labs/rescan", [4, 5, 6]), marks(RESCAN_SQL, 3))
+        edit = bind("pages/patients/edit/FirstName", ["Ann", "SYN1", "SYN2"])
+        self.assertTrue(edit.endswith("WHERE PatientRegNo IN (%s, %s)"), edit)
+        self.assertEqual(bind("search/words1", ["a%"] * 3), operations()["search/words1"])
+        for keys in (0, MAX_IN_KEYS + 1):
+            with self.assertRaises(ValueError):
+                bind("labs/rescan", list(range(keys)))
+
+    def test_reads(self):
+        self.assertTrue(is_read(RESCAN_SQL))
+        self.assertTrue(is_read(" (SELECT 1) UNION (SELECT 2)"))
+        self.assertFalse(is_read(operations()["rooms/check"]))
+        self.assertFalse(is_read(operations()["pages/patients/delete"]))
+
+
+class CompileTest(unittest.TestCase):
+    # Every operation is a statement the schema accepts: compiled, not run, against a fresh stand-in.
+    def test_every_operation_compiles(self):
+        folder = tempfile.mkdtemp(prefix="hms-test-")
+        self.addCleanup(shutil.rmtree, folder, True)
+        path = os.path.join(folder, "hms.db")
+        create_database(path)
+        conn = sqlite3.connect(path)
+        self.addCleanup(conn.close)
+        add_functions(conn)
+        failed = {}
+        for name, sql in operations().items():
+            if name.endswith("tables/estimate"):
+                continue    # information_schema, answered by the stand-in's cursor itself
+            sql = translate(bind(name, [None] * (sql.count("%s") + 1) if "IN (%s)" in sql else None))
+            try:
+                conn.execute(sql if sql.startswith("EXPLAIN") else "EXPLAIN " + sql, [None] * sql.count("?"))
+            except sqlite3.Error as e:
+                failed[name] = str(e)
+        self.assertEqual(failed, {})
+
+
+class ServiceTest(unittest.TestCase):
+    # hms_service in its own process over a stand-in, spoken to the way the GUI does in service mode.
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp(prefix="hms-test-")
+        path = os.path.join(cls.folder, "hms.db")
+        use_sqlite(path)
+        generate(50)
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        cls.process, cls.url = start_service(path, port, "test-token")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.process.terminate()
+        cls.process.wait(10)
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def setUp(self):
+        self.conn = RemoteConnection(self.url, "test-token")
+        self.addCleanup(self.conn.close)
+
+    def read(self, sql, params):
+        cur = self.conn.cursor()
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+    def names(self, regs):
+        sql = marks(operations()["pages/patients/rows"], len(regs))
+        return {row[1]: row[2] for row in self.read(sql, regs)}
+
+    def test_search_runs_remotely(self):
+        sql, params = search_sql("SYN0000001", COLUMNS)
+        rows = self.read(sql, params)
+        self.assertEqual(sorted(row[1] for row in rows), [f"SYN000000{n}" for n in range(10, 20)])
+
+    def test_session_writes_commit_and_roll_back(self):
+        regs = ["SYN00000002", "SYN00000003"]
+        before = self.names(regs)
+        edit = "UPDATE Patient SET `FirstName`=%s WHERE PatientRegNo IN (%s, %s)"
+        self.conn.cursor().execute(edit, ["Zelda", *regs])
+        self.conn.rollback()
+        self.assertEqual(self.names(regs), before)
+        self.conn.cursor().execute(edit, ["Zelda", *regs])
+        self.conn.commit()
+        self.assertEqual(self.names(regs), dict.fromkeys(regs, "Zelda"))
+
+    def test_unnamed_and_oversized_statements_are_refused(self):
+        with self.assertRaisesRegex(ServiceError, "no operation"):
+            self.read("SELECT PatientRegNo, Address FROM Patient", None)
+        keys = list(range(MAX_IN_KEYS + 1))
+        with self.assertRaises(ServiceError):
+            self.read(marks(RESCAN_SQL, len(keys)), keys)
+
+
+if __name__ == '__main__':
+    unittest.main()
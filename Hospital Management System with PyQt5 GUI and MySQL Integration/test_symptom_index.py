@@ -0,0 +1,159 @@
+import math
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import symptom_index as module
+from sqlite_standin import use_sqlite
+from symptom_index import B, K1, MAX_EMPTY, SymptomIndex, analyse, tokenize
+from synthetic_data import generate
+from utils import db_connection
+
+WORDS = ("fever cough rash headache nausea fatigue chills wheezing swelling itching dizziness cramps "
+         "bleeding numbness jaundice palpitations insomnia tremor").split()
+QUERIES = ["fever", "fever cough", "severe headaches and nausea", "rash itching swelling", "jaundice", "tremors",
+           "unknownword", "cough wheezing chills fatigue"]
+
+
+def corpus(count, seed=1):
+    rng = random.Random(seed)
+    sample = lambda n: " ".join(rng.choice(WORDS) for _ in range(n))
+    return [(i, f"{sample(2).title()} syndrome", ", ".join(sample(1) for _ in range(rng.randint(1, 5))),
+             sample(rng.randint(0, 12)), sample(rng.randint(0, 3)), i * 7919) for i in range(1, count + 1)]
+
+
+def reference(rows, text):
+    # Okapi BM25 over analyse()'s weighted term counts, written out per disease.
+    counts = {row[0]: analyse(row[1:-1]) for row in rows}
+    average = sum(sum(c.values()) for c in counts.values()) / len(counts)
+    scores = {}
+    for term in dict.fromkeys(tokenize(text)):
+        having = [i for i, c in counts.items() if term in c]
+        idf = math.log1p((len(counts) - len(having) + 0.5) / (len(having) + 0.5))
+        for i in having:
+            tf, length = counts[i][term], sum(counts[i].values())
+            score, matched = scores.get(i, (0.0, 0))
+            scores[i] = (score + idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average)), matched + 1)
+    return scores
+
+
+def built(rows):
+    index = SymptomIndex()
+    index.update(rows)
+    index.compact()
+    return index
+
+
+class SymptomIndexTest(unittest.TestCase):
+    def assertRanked(self, index, rows, text):
+        hits = index.search(text, limit=len(rows))
+        expected = reference(rows, text)
+        self.assertEqual({i for i, _, _ in hits}, set(expected), text)
+        for disease_id, score, matched in hits:
+            self.assertEqual(matched, expected[disease_id][1])
+            self.assertAlmostEqual(score, expected[disease_id][0], places=2)
+        # More of the query's terms first, then BM25.
+        ranks = [(matched, score) for _, score, matched in hits]
+        self.assertEqual(ranks, sorted(ranks, reverse=True), text)
+
+    def test_ranking_matches_bm25(self):
+        rows = corpus(60)
+        index = built(rows)
+        for text in QUERIES:
+            self.assertRanked(index, rows, text)
+
+    def test_limit_keeps_the_best(self):
+        rows = corpus(60)
+        index = built(rows)
+        self.assertEqual(index.search("fever cough", limit=5), index.search("fever cough", limit=60)[:5])
+
+    def test_updates_match_a_fresh_build(self):
+        rows = corpus(80)
+        rng = random.Random(4)
+        edited = {row[0]: row for row in corpus(80, seed=9)}
+        for edits, removed in ((2, 3), (10, 30)):
+            index = built(rows)
+            current = {row[0]: row for row in rows}
+            changed = [edited[i] for i in rng.sample(sorted(current), edits)]
+            gone = rng.sample([i for i in current if i not in {row[0] for row in changed}], removed)
+            added = [(i, *edited[i - 100][1:]) for i in range(101, 106)]
+            index.update(changed + added, gone)
+            current.update({row[0]: row for row in changed + added})
+            for i in gone:
+                del current[i]
+            final = list(current.values())
+            for text in QUERIES:
+                self.assertRanked(index, final, text)
+            # Few empty slots are merged in place; many are renumbered away.
+            index.compact()
+            self.assertEqual(len(index.ids) > len(final), edits + removed <= MAX_EMPTY * len(index.ids))
+            self.assertEqual(index.stats()['pending_terms'], 0)
+            for text in QUERIES:
+                self.assertRanked(index, final, text)
+                fresh = built(final).search(text, limit=len(final))
+                self.assertEqual(sorted(index.search(text, limit=len(final))), sorted(fresh))
+
+    def test_saved_index_loads_the_same(self):
+        folder = tempfile.mkdtemp(prefix="hms-test-")
+        self.addCleanup(shutil.rmtree, folder, True)
+        rows = corpus(40)
+        index = built(rows)
+        index.path = os.path.join(folder, "symptoms.npz")
+        index.update([(7, "Wheezing fever", "tremor", "", "", 1)], [8])
+        index.save()
+        loaded = SymptomIndex(index.path)
+        self.assertTrue(loaded.load())
+        for text in QUERIES:
+            self.assertEqual(loaded.search(text), index.search(text))
+        self.assertEqual(loaded.signature_of(7), 1)
+        self.assertIsNone(loaded.signature_of(8))
+
+
+class OpenedIndexTest(unittest.TestCase):
+    # open() and refresh() against the stand-in's Disease table, signatures and all.
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp(prefix="hms-test-")
+        use_sqlite(os.path.join(cls.folder, "hms.db"))
+        generate(20)
+        cls.path = os.path.join(cls.folder, "symptoms.npz")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def execute(self, sql, params=None):
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            return cur.lastrowid
+
+    def test_reopening_picks_up_edits_made_elsewhere(self):
+        index = SymptomIndex(self.path)
+        index.open()
+        disease_id = index.search("fever")[0][0]
+        self.execute("UPDATE Disease SET Symptoms=%s WHERE DiseaseID=%s", ("xylophonia, fever", disease_id))
+        added = self.execute("INSERT INTO Disease (Name, Severity, Symptoms) VALUES (%s, %s, %s)",
+                             ("Quuxitis", "Mild", "xylophonia"))
+        self.assertEqual(index.search("xylophonia"), [])
+
+        reopened = SymptomIndex(self.path)
+        reopened.open()
+        self.assertEqual({i for i, _, _ in reopened.search("xylophonia")}, {disease_id, added})
+
+        self.execute("DELETE FROM Disease WHERE DiseaseID=%s", (added,))
+        reopened.refresh()
+        self.assertEqual([i for i, _, _ in reopened.search("xylophonia")], [disease_id])
+
+    def test_search_diseases_returns_details(self):
+        module.symptom_index = SymptomIndex()
+        columns, rows, _ = module.search_diseases("fever cough", limit=3)
+        self.assertEqual(columns, module.RESULT_COLUMNS)
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(all("fever" in row[5] or "cough" in row[5] for row in rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import uuid
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pymysql
+
+from sqlite_standin import use_sqlite
+from utils import db_connection
+from write_queue import APPLIERS, WRITE_QUEUE_CONFIG, WriteQueue, apply_batch, purge_applied
+
+INSERT_PATIENT = "INSERT INTO Patient (PatientRegNo, FirstName, LastName, Gender) VALUES (%s, %s, %s, %s)"
+
+
+def patient_write(item_id, reg_no, kind='write'):
+    return {'id': item_id, 'key': str(uuid.uuid4()), 'kind': kind, 'table': "Patient", 'key_column': "PatientRegNo",
+            'row_key': reg_no, 'sql': INSERT_PATIENT, 'params': [reg_no, "Test", "Patient", "Male"], 'extra': None,
+            'attempts': 0}
+
+
+def scalar(sql, params=None):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        return cur.fetchone()[0]
+
+
+def patients(reg_no):
+    return scalar("SELECT COUNT(*) FROM Patient WHERE PatientRegNo=%s", (reg_no,))
+
+
+def applied_key(key):
+    return scalar("SELECT COUNT(*) FROM AppliedWrite WHERE WriteKey=%s", (key,))
+
+
+class ApplyBatchTest(unittest.TestCase):
+    # apply_batch against a fresh SQLite stand-in of the schema, migrations included.
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp(prefix="hms-test-")
+        use_sqlite(os.path.join(cls.folder, "hms.db"))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def tearDown(self):
+        APPLIERS.pop('flaky', None)
+
+    def test_replayed_batch_is_applied_once(self):
+        item = patient_write(1, "WQ-REPLAY")
+        self.assertEqual(apply_batch([item]), {1: ('applied', None)})
+        # The commit landed but its acknowledgement was lost: the journal sends the same batch again.
+        self.assertEqual(apply_batch([item]), {1: ('applied', None)})
+        self.assertEqual(patients("WQ-REPLAY"), 1)
+
+    def test_failed_item_does_not_block_later_ones(self):
+        apply_batch([patient_write(1, "WQ-TAKEN")])
+        rejected, later = patient_write(2, "WQ-TAKEN"), patient_write(3, "WQ-LATER")
+        outcomes = apply_batch([rejected, later])
+        self.assertEqual(outcomes[2][0], 'failed')
+        self.assertEqual(outcomes[3], ('applied', None))
+        self.assertEqual(patients("WQ-TAKEN"), 1)
+        self.assertEqual(patients("WQ-LATER"), 1)
+        # The rejected save's key went with its savepoint, so a corrected retry is not skipped.
+        self.assertEqual(applied_key(rejected['key']), 0)
+
+    def test_failed_item_holds_later_saves_of_its_row(self):
+        apply_batch([patient_write(1, "WQ-HELD")])
+        rejected, behind = patient_write(2, "WQ-HELD"), patient_write(3, "WQ-HELD")
+        behind['sql'] = "UPDATE Patient SET FirstName=%s WHERE PatientRegNo=%s"
+        behind['params'] = ["Changed", "WQ-HELD"]
+        outcomes = apply_batch([rejected, behind])
+        self.assertEqual(outcomes[2][0], 'failed')
+        self.assertEqual(outcomes[3][0], 'held')
+        self.assertEqual(scalar("SELECT FirstName FROM Patient WHERE PatientRegNo=%s", ("WQ-HELD",)), "Test")
+        self.assertEqual(applied_key(behind['key']), 0)
+
+    def test_flush_holds_saves_behind_a_rejected_one(self):
+        queue = WriteQueue({**WRITE_QUEUE_CONFIG, 'path': os.path.join(self.folder, "held.db")})
+        queue._started = True
+        for item_id, reg_no, status in [(1, "WQ-ROW", 'failed'), (2, "WQ-ROW", 'pending'), (3, "WQ-OTHER", 'pending')]:
+            queue.items[item_id] = {**patient_write(item_id, reg_no), 'status': status, 'next_attempt': 0,
+                                    'error': None}
+        with mock.patch('write_queue.run_task') as run_task:
+            queue.flush()
+        self.assertEqual([item['id'] for item in run_task.call_args[0][1]], [3])
+        self.assertEqual(queue.items[2]['status'], 'held')
+        self.assertEqual(queue.counts(), (1, 2))
+
+    def test_transient_error_rolls_back_and_is_retried(self):
+        calls = []
+
+        def flaky(cur, item):
+            calls.append(item['id'])
+            if len(calls) == 1:
+                raise pymysql.err.OperationalError(2013, "Lost connection to MySQL server during query")
+            cur.execute(item['sql'], item['params'])
+
+        APPLIERS['flaky'] = flaky
+        first, second = patient_write(1, "WQ-BEFORE"), patient_write(2, "WQ-FLAKY", kind='flaky')
+        with self.assertRaises(pymysql.err.OperationalError):
+            apply_batch([first, second])
+        self.assertEqual(patients("WQ-BEFORE"), 0)
+        self.assertEqual(applied_key(first['key']), 0)
+
+        self.assertEqual(apply_batch([first, second]), {1: ('applied', None), 2: ('applied', None)})
+        self.assertEqual(patients("WQ-BEFORE"), 1)
+        self.assertEqual(patients("WQ-FLAKY"), 1)
+
+    def test_transient_error_backs_off(self):
+        def locked(cur, item):
+            raise pymysql.err.OperationalError(1205, "Lock wait timeout exceeded")
+
+        APPLIERS['flaky'] = locked
+        queue = WriteQueue({**WRITE_QUEUE_CONFIG, 'path': os.path.join(self.folder, "journal.db")})
+        started = time.time()
+        outcomes = queue._apply([patient_write(1, "WQ-BACKOFF", kind='flaky')])
+        status, error, attempts, next_attempt = outcomes[1]
+        self.assertEqual((status, attempts), ('pending', 1))
+        self.assertIn("Lock wait timeout", error)
+        self.assertGreater(next_attempt, started)
+        self.assertEqual(patients("WQ-BACKOFF"), 0)
+
+    def test_purge_keeps_recent_keys(self):
+        keep_days = WRITE_QUEUE_CONFIG['keep_days']
+        item = patient_write(1, "WQ-RECENT")
+        apply_batch([item])
+        with db_connection() as conn:
+            conn.cursor().execute("INSERT INTO AppliedWrite (WriteKey, AppliedON) VALUES (%s, %s)",
+                                  ("old-key", datetime.now() - timedelta(days=keep_days + 1)))
+            conn.commit()
+        purge_applied(keep_days)
+        self.assertEqual(applied_key("old-key"), 0)
+        self.assertEqual(applied_key(item['key']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
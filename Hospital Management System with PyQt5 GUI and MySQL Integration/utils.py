@@ -1,19 +1,235 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import pymysql
 from PyQt5.QtWidgets import QHeaderView
 
-from config import MYSQL_CONFIG
+from config import MYSQL_CONFIG, POOL_CONFIG
+from query_stats import instrument
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PooledConnection:
+    # Thin wrapper so existing conn.close() calls hand the connection back instead of closing it.
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise pymysql.err.InterfaceError("Connection already returned to the pool")
+        return getattr(self._raw, name)
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw)
+
+    def discard(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw, broken=True)
+
+
+class ConnectionPool:
+    def __init__(self, config, min_size=1, max_size=10, idle_timeout=300, acquire_timeout=10):
+        self.config = config
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self._idle = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._counters = {'hits': 0, 'waits': 0, 'creates': 0, 'reconnects': 0, 'expired': 0, 'timeouts': 0}
+
+    def _count(self, name):
+        with self._cond:
+            self._counters[name] += 1
+
+    def _connect(self):
+        conn = pymysql.connect(**self.config)
+        self._count('creates')
+        return conn
+
+    def fill(self):
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                raw = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            self.release(raw)
+
+    def acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        raw = None
+        waited = False
+        with self._cond:
+            while raw is None:
+                now = time.monotonic()
+                while self._idle:
+                    candidate, released_at = self._idle.pop()
+                    if now - released_at > self.idle_timeout and self._size > self.min_size:
+                        self._size -= 1
+                        self._counters['expired'] += 1
+                        self._close_quietly(candidate)
+                        continue
+                    self._counters['hits'] += 1
+                    raw = candidate
+                    break
+                if raw is not None:
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(f"No free connection after {self.acquire_timeout}s "
+                                      f"(max_size={self.max_size})")
+                if not waited:
+                    waited = True
+                    self._counters['waits'] += 1
+                self._cond.wait(remaining)
+
+        try:
+            raw = self._connect() if raw is None else self._ensure_alive(raw)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, raw)
+
+    def _ensure_alive(self, raw):
+        try:
+            raw.ping(reconnect=False)
+            return raw
+        except Exception:
+            self._close_quietly(raw)
+            self._count('reconnects')
+            return self._connect()
+
+    def release(self, raw, broken=False):
+        if not broken and raw.open:
+            try:
+                # Ends any implicit read transaction so the next user doesn't see a stale snapshot.
+                raw.rollback()
+            except Exception:
+                broken = True
+        if broken or not raw.open:
+            self._close_quietly(raw)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((raw, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+        for raw, _ in idle:
+            self._close_quietly(raw)
+
+    def stats(self):
+        with self._cond:
+            return dict(self._counters, size=self._size, idle=len(self._idle), max_size=self.max_size)
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(MYSQL_CONFIG, **POOL_CONFIG)
+            try:
+                _pool.fill()
+            except Exception as e:
+                print("Connection Error:", e)
+        return _pool
+
+
+_fallback = None
+
+
+def set_fallback(source):
+    # Reads go to source.connect() while source.offline is set; go_offline(error) is asked whether
+    # to switch when MySQL can't be reached. See local_replica.
+    global _fallback
+    _fallback = source
+
 
 def get_connection():
+    if _fallback is None or not _fallback.offline:
+        try:
+            return instrument(get_pool().acquire())
+        except Exception as e:
+            print("Connection Error:", e)
+            if _fallback is None or not _fallback.go_offline(e):
+                return None
     try:
-        return pymysql.connect(**MYSQL_CONFIG)
+        return instrument(_fallback.connect())
     except Exception as e:
         print("Connection Error:", e)
         return None
 
+
+@contextmanager
+def db_connection():
+    conn = get_connection()
+    try:
+        yield conn
+        if conn:
+            conn.commit()
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+
+def execute_write(sql, params=None):
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        return cur.lastrowid
+
+
+def pool_stats():
+    return get_pool().stats()
+
 def style_table(table):
     table.setAlternatingRowColors(True)
     table.setStyleSheet("""
-        QTableWidget {
+        QTableView {
             background-color: #f4faff;
             alternate-background-color: #e6f2ff;
             border: none;
@@ -26,4 +242,4 @@ def style_table(table):
             height: 30px;
         }
     """)
-    table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
\ No newline at end of file
+    table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
@@ -0,0 +1,156 @@
+import pymysql.cursors
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt5.QtWidgets import QMessageBox
+
+from query_stats import current_origin, query_origin
+from utils import get_connection
+
+# Rows sent back to the GUI thread per signal while a query is streaming.
+CHUNK_SIZE = 500
+
+_running = set()
+_loads = {}
+
+
+class WorkerSignals(QObject):
+    columns = pyqtSignal(list)
+    chunk = pyqtSignal(list)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    progress = pyqtSignal(object)
+    stopped = pyqtSignal()
+
+
+class QueryWorker(QRunnable):
+    def __init__(self, sql, params=None, chunk_size=CHUNK_SIZE, connect=get_connection):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.sql = sql
+        self.params = params
+        self.chunk_size = chunk_size
+        self.connect = connect
+        self.cancelled = False
+        self.origin = current_origin()
+        self.signals = WorkerSignals()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            with query_origin(self.origin):
+                self._stream()
+        finally:
+            self.signals.stopped.emit()
+
+    def _stream(self):
+        conn = self.connect()
+        if not conn:
+            self.signals.failed.emit("Could not connect to the database.")
+            return
+        try:
+            cur = conn.cursor(pymysql.cursors.SSCursor)
+            cur.execute(self.sql, self.params)
+            self.signals.columns.emit([d[0] for d in cur.description])
+            total = 0
+            while not self.cancelled:
+                rows = cur.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                total += len(rows)
+                self.signals.chunk.emit(list(rows))
+        except Exception as e:
+            conn.discard()
+            if not self.cancelled:
+                self.signals.failed.emit(str(e))
+            return
+        if self.cancelled:
+            # Unread rows are still on the wire; drop the socket rather than drain it.
+            conn.discard()
+            return
+        conn.close()
+        self.signals.finished.emit(total)
+
+
+class TaskWorker(QRunnable):
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+        self.origin = current_origin()
+        self.signals = WorkerSignals()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            with query_origin(self.origin):
+                result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+        finally:
+            self.signals.stopped.emit()
+
+
+def _guard(worker, slot):
+    # Signals already queued when a worker is cancelled must not reach the GUI.
+    return lambda *args: None if worker.cancelled else slot(*args)
+
+
+def _start(worker, on_done=None, on_error=None):
+    if on_done:
+        worker.signals.finished.connect(_guard(worker, on_done))
+    if on_error:
+        worker.signals.failed.connect(_guard(worker, on_error))
+    _running.add(worker)
+    worker.signals.stopped.connect(lambda: _running.discard(worker))
+    QThreadPool.globalInstance().start(worker)
+    return worker
+
+
+def run_task(fn, *args, on_done=None, on_error=None, on_progress=None):
+    # With on_progress, fn is called with a progress= callback it may invoke from the worker thread.
+    if on_progress is None:
+        return _start(TaskWorker(fn, *args), on_done, on_error)
+    worker = TaskWorker(fn, *args)
+    worker.kwargs['progress'] = worker.signals.progress.emit
+    worker.signals.progress.connect(_guard(worker, on_progress))
+    return _start(worker, on_done, on_error)
+
+
+def start_load(key, sql, params=None, on_columns=None, on_chunk=None, on_done=None, on_error=None,
+               connect=get_connection):
+    cancel_load(key)
+    worker = QueryWorker(sql, params, connect=connect)
+    if on_columns:
+        worker.signals.columns.connect(_guard(worker, on_columns))
+    if on_chunk:
+        worker.signals.chunk.connect(_guard(worker, on_chunk))
+    _loads[key] = worker
+    worker.signals.stopped.connect(lambda: _loads.pop(key, None) if _loads.get(key) is worker else None)
+    return _start(worker, on_done, on_error)
+
+
+def cancel_load(key):
+    worker = _loads.pop(key, None)
+    if worker:
+        worker.cancel()
+
+
+def is_loading(key):
+    return key in _loads
+
+
+def pending_tasks():
+    # Workers whose results have not been delivered to the GUI thread yet.
+    return len(_running)
+
+
+def show_db_error(message):
+    QMessageBox.critical(None, "Database Error", message)
@@ -0,0 +1,425 @@
+import json
+import random
+import sqlite3
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+
+import pymysql
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from config import WRITE_QUEUE_CONFIG
+from dashboard_counts import adjust, counted
+from lookups import invalidate_lookup
+from occupancy import rooms, write_booking
+from patient_record import patient_records
+from query_stats import instrument
+from table_model import refresh_row
+from utils import PoolTimeout, get_pool
+from workers import run_task
+
+# MySQL errors worth retrying: too many connections, lock wait timeout, deadlock, can't connect,
+# server gone away, lost connection. Anything else rejects the save.
+TRANSIENT_MYSQL_ERRORS = {1040, 1205, 1213, 2002, 2003, 2006, 2013}
+# Reference tables whose cached lookup goes stale when a queued save lands.
+LOOKUP_TABLES = {'Disease'}
+RECENT_APPLIED = 50
+HELD_ERROR = "Held: save {} of this row was rejected; retry or discard it first"
+SAVEPOINT_SQL = "SAVEPOINT queued_write"
+ROLLBACK_SAVEPOINT_SQL = "ROLLBACK TO SAVEPOINT queued_write"
+APPLIED_KEY_SQL = "INSERT IGNORE INTO AppliedWrite (WriteKey) VALUES (%s)"
+PURGE_APPLIED_SQL = "DELETE FROM AppliedWrite WHERE AppliedON < %s"
+JOURNAL_SQL = """
+    CREATE TABLE IF NOT EXISTS QueuedWrite (
+        Id INTEGER PRIMARY KEY AUTOINCREMENT,
+        WriteKey TEXT NOT NULL UNIQUE,
+        Kind TEXT NOT NULL,
+        TableName TEXT NOT NULL,
+        KeyColumn TEXT NOT NULL,
+        RowKey TEXT NOT NULL,
+        Statement TEXT NOT NULL,
+        Params TEXT NOT NULL,
+        Extra TEXT,
+        Status TEXT NOT NULL DEFAULT 'pending',
+        Attempts INTEGER NOT NULL DEFAULT 0,
+        NextAttempt REAL NOT NULL DEFAULT 0,
+        Error TEXT,
+        QueuedAt TEXT NOT NULL
+    )
+"""
+JOURNAL_COLUMNS = ['id', 'key', 'kind', 'table', 'key_column', 'row_key', 'sql', 'params', 'extra', 'status',
+                   'attempts', 'next_attempt', 'error', 'queued_at']
+
+
+def is_transient(error):
+    if isinstance(error, pymysql.err.OperationalError):
+        return error.args[0] in TRANSIENT_MYSQL_ERRORS
+    if isinstance(error, sqlite3.OperationalError):
+        return "locked" in str(error)
+    return isinstance(error, (pymysql.err.InterfaceError, PoolTimeout, OSError))
+
+
+def _apply_write(cur, item):
+    # The dashboard totals move by what the row counted before and after, inside the item's savepoint.
+    before = counted(cur, item['table'], item['key_column'], [item['row_key']])
+    cur.execute(item['sql'], item['params'])
+    adjust(cur, before, counted(cur, item['table'], item['key_column'], [item['row_key']]))
+
+
+def _apply_booking(cur, item):
+    extra = item['extra']
+    start = datetime.fromisoformat(extra['start'])
+    end = datetime.fromisoformat(extra['end']) if extra['end'] else None
+    saved = write_booking(cur, item['sql'], item['params'], extra['reg'], extra['room'], start, end)
+    return lambda: rooms.add(extra['reg'] or saved, extra['room'], start, end)
+
+
+# Kind -> function(cursor, item) doing the write; it may return a callback to run after the commit.
+APPLIERS = {'write': _apply_write, 'booking': _apply_booking}
+
+
+def apply_batch(items):
+    # One transaction for the batch, a savepoint per item: a save the database rejects is rolled back
+    # on its own and reported, a transient error is raised so the whole batch is retried later.
+    # AppliedWrite makes a retry of a batch whose commit acknowledgement was lost a no-op. Later
+    # saves of a rejected save's row are held, not applied over it.
+    conn = instrument(get_pool().acquire())
+    outcomes = {}
+    after_commit = []
+    rejected = {}
+    try:
+        cur = conn.cursor()
+        for item in items:
+            row = (item.get('table'), item.get('row_key'))
+            if row in rejected:
+                outcomes[item['id']] = ('held', HELD_ERROR.format(rejected[row]))
+                continue
+            cur.execute(SAVEPOINT_SQL)
+            try:
+                if not cur.execute(APPLIED_KEY_SQL, (item['key'],)):
+                    outcomes[item['id']] = ('applied', None)
+                    continue
+                done = APPLIERS[item['kind']](cur, item)
+            except Exception as e:
+                if is_transient(e):
+                    raise
+                cur.execute(ROLLBACK_SAVEPOINT_SQL)
+                outcomes[item['id']] = ('failed', str(e))
+                rejected[row] = item['id']
+                continue
+            outcomes[item['id']] = ('applied', None)
+            if done:
+                after_commit.append(done)
+        conn.commit()
+    except Exception:
+        conn.discard()
+        raise
+    conn.close()
+    for done in after_commit:
+        done()
+    return outcomes
+
+
+def purge_applied(keep_days):
+    # A key is only needed while its save can still be replayed, i.e. while it may sit in a journal.
+    conn = instrument(get_pool().acquire())
+    try:
+        cur = conn.cursor()
+        purged = cur.execute(PURGE_APPLIED_SQL, (datetime.now() - timedelta(days=keep_days),))
+        conn.commit()
+    except Exception:
+        conn.discard()
+        raise
+    conn.close()
+    return purged
+
+
+class WriteQueue(QObject):
+    # Dialog saves are journaled to a local SQLite file and applied in the background, oldest first.
+    # changed fires whenever the counts or any item's status move.
+    changed = pyqtSignal()
+
+    def __init__(self, config=WRITE_QUEUE_CONFIG):
+        super().__init__()
+        self.path = config['path']
+        self.batch_size = config['batch_size']
+        self.retry_base_ms = config['retry_base_ms']
+        self.retry_max_ms = config['retry_max_ms']
+        self.keep_days = config['keep_days']
+        self.items = {}
+        self.recent = deque(maxlen=RECENT_APPLIED)
+        self.tables = {}
+        self._by_row = {}
+        self._started = False
+        self._purged = False
+        self._in_flight = set()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+
+    def _journal(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(JOURNAL_SQL)
+        return conn
+
+    def start(self):
+        # Saves left over from a previous session (or a crash) go out again; AppliedWrite keeps
+        # any that had already reached the database from being applied twice. Past keep_days their
+        # keys may have been purged, so those are held as failed until someone retries them.
+        if self._started:
+            return
+        self._started = True
+        cutoff = (datetime.now() - timedelta(days=self.keep_days)).isoformat(" ", timespec='seconds')
+        conn = self._journal()
+        try:
+            conn.execute("UPDATE QueuedWrite SET Status='failed', Error=? WHERE Status='pending' AND QueuedAt < ?",
+                         (f"Queued over {self.keep_days} days ago; check the record before retrying", cutoff))
+            conn.commit()
+            for row in conn.execute("SELECT Id, WriteKey, Kind, TableName, KeyColumn, RowKey, Statement, Params, "
+                                    "Extra, Status, Attempts, NextAttempt, Error, QueuedAt FROM QueuedWrite "
+                                    "ORDER BY Id"):
+                item = dict(zip(JOURNAL_COLUMNS, row))
+                item['params'] = json.loads(item['params'])
+                item['extra'] = json.loads(item['extra']) if item['extra'] else None
+                self.items[item['id']] = item
+                self._by_row[(item['table'], item['row_key'])] = item
+        finally:
+            conn.close()
+        if self.items:
+            self.changed.emit()
+            self.flush()
+
+    def track(self, table):
+        # Rows of this grid show queued saves optimistically and are re-read once they are applied.
+        model = table.model()
+        source = model.spec['table']
+        self.tables.setdefault(source, []).append(table)
+        model.row_status = lambda key: self.row_status(source, key)
+
+    def submit(self, table, key_column, key, sql, params, values, kind='write', extra=None):
+        self.start()
+        item = {'key': str(uuid.uuid4()), 'kind': kind, 'table': table, 'key_column': key_column,
+                'row_key': str(key), 'sql': sql, 'params': list(params), 'extra': extra, 'status': 'pending',
+                'attempts': 0, 'next_attempt': 0, 'error': None,
+                'queued_at': datetime.now().isoformat(" ", timespec='seconds')}
+        conn = self._journal()
+        try:
+            cur = conn.execute("INSERT INTO QueuedWrite (WriteKey, Kind, TableName, KeyColumn, RowKey, Statement, "
+                               "Params, Extra, QueuedAt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               (item['key'], kind, table, key_column, item['row_key'], sql, json.dumps(item['params']),
+                                json.dumps(extra) if extra else None, item['queued_at']))
+            conn.commit()
+            item['id'] = cur.lastrowid
+        finally:
+            conn.close()
+        self.items[item['id']] = item
+        self._by_row[(table, item['row_key'])] = item
+        for view in self.tables.get(table, []):
+            if view.model().columns:
+                view.model().patch_values(key_column, key, values)
+        self.changed.emit()
+        self.flush()
+        return item
+
+    def row_status(self, table, key):
+        item = self._by_row.get((table, str(key)))
+        if item is None:
+            return None
+        if item['status'] != 'pending':
+            return 'failed', f"Not saved: {item['error']}"
+        if item['error']:
+            return 'pending', f"Not saved yet, retrying (attempt {item['attempts'] + 1}): {item['error']}"
+        return 'pending', "Saving…"
+
+    def counts(self):
+        pending = sum(1 for item in self.items.values() if item['status'] == 'pending')
+        return pending, len(self.items) - pending
+
+    def busy(self):
+        return self.counts()[0] > 0
+
+    def failed(self):
+        return [item for item in self.items.values() if item['status'] == 'failed']
+
+    def flush(self):
+        # Strictly oldest first: while the head of the queue is backing off, nothing behind it goes,
+        # so a later edit can't land before the insert it depends on. Saves behind a rejected (or
+        # held) save of the same row are held until that one is retried or discarded.
+        if self._in_flight:
+            return
+        now = time.time()
+        due, held, stopped = [], [], {}
+        for item in self.items.values():
+            row = (item['table'], item['row_key'])
+            if item['status'] != 'pending':
+                stopped.setdefault(row, item['id'])
+                continue
+            if row in stopped:
+                held.append((item, stopped[row]))
+                continue
+            if item['next_attempt'] > now or len(due) == self.batch_size:
+                break
+            due.append(item)
+        if held:
+            self._hold(held)
+        if not due:
+            self._schedule()
+            return
+        self._in_flight = {item['id'] for item in due}
+        run_task(self._apply, [dict(item) for item in due], on_done=self._applied, on_error=self._apply_failed)
+
+    def _hold(self, held):
+        conn = self._journal()
+        try:
+            for item, blocker in held:
+                item['status'], item['error'] = 'held', HELD_ERROR.format(blocker)
+                conn.execute("UPDATE QueuedWrite SET Status='held', Error=? WHERE Id=?", (item['error'], item['id']))
+            conn.commit()
+        finally:
+            conn.close()
+        for item, _ in held:
+            self._repaint_row(item)
+        self.changed.emit()
+
+    def _schedule(self):
+        waiting = [item['next_attempt'] for item in self.items.values() if item['status'] == 'pending']
+        if waiting:
+            self._timer.start(max(0, int((min(waiting) - time.time()) * 1000)))
+
+    def _apply(self, items):
+        if not self._purged:
+            try:
+                purge_applied(self.keep_days)
+                self._purged = True
+            except Exception as e:
+                print("Write Queue Error:", e)
+        try:
+            outcomes = {item_id: (status, error, None, 0) for item_id, (status, error) in apply_batch(items).items()}
+        except Exception as e:
+            print("Write Queue Error:", e)
+            outcomes = {}
+            for item in items:
+                attempts = item['attempts'] + 1
+                delay = min(self.retry_base_ms * 2 ** (attempts - 1), self.retry_max_ms) * random.uniform(0.5, 1)
+                outcomes[item['id']] = ('pending', str(e), attempts, time.time() + delay / 1000)
+        conn = self._journal()
+        try:
+            for item_id, (status, error, attempts, next_attempt) in outcomes.items():
+                if status == 'applied':
+                    conn.execute("DELETE FROM QueuedWrite WHERE Id=?", (item_id,))
+                elif attempts is None:
+                    conn.execute("UPDATE QueuedWrite SET Status=?, Error=? WHERE Id=?", (status, error, item_id))
+                else:
+                    conn.execute("UPDATE QueuedWrite SET Error=?, Attempts=?, NextAttempt=? WHERE Id=?",
+                                 (error, attempts, next_attempt, item_id))
+            conn.commit()
+        finally:
+            conn.close()
+        return outcomes
+
+    def _applied(self, outcomes):
+        self._in_flight = set()
+        for item_id, (status, error, attempts, next_attempt) in outcomes.items():
+            item = self.items.get(item_id)
+            if item is None:
+                continue
+            item['status'], item['error'] = status, error
+            if attempts is not None:
+                item['attempts'], item['next_attempt'] = attempts, next_attempt
+            if status == 'applied':
+                self._forget(item)
+                self.recent.append(item)
+                if item['table'] in LOOKUP_TABLES:
+                    invalidate_lookup(item['table'])
+                if item['table'] == 'Disease':
+                    # Not imported with the module: symptom_index brings numpy, which startup does not need.
+                    from symptom_index import reindex_diseases
+                    reindex_diseases([item['row_key']])
+                if item['table'] == 'PatientLabReport':
+                    # Likewise lab_flags, which brings pandas: the saved report is flagged again.
+                    from lab_flags import flags
+                    flags.invalidate([item['row_key']])
+                patient_records.written(item['table'], [item['row_key']])
+                self._reload_row(item)
+            else:
+                self._repaint_row(item)
+        self.changed.emit()
+        self.flush()
+
+    def _apply_failed(self, message):
+        # The journal itself could not be updated; try again after the base delay.
+        print("Write Queue Error:", message)
+        self._in_flight = set()
+        self._timer.start(self.retry_base_ms)
+
+    def _forget(self, item):
+        del self.items[item['id']]
+        row = (item['table'], item['row_key'])
+        if self._by_row.get(row) is item:
+            older = [other for other in self.items.values() if (other['table'], other['row_key']) == row]
+            if older:
+                self._by_row[row] = older[-1]
+            else:
+                del self._by_row[row]
+
+    def _reload_row(self, item):
+        for view in self.tables.get(item['table'], []):
+            if view.model().columns:
+                refresh_row(view, item['table'], item['key_column'], item['row_key'])
+
+    def _repaint_row(self, item):
+        for view in self.tables.get(item['table'], []):
+            if view.model().columns:
+                view.model().repaint_row(item['key_column'], item['row_key'])
+
+    def retry(self, item_ids=None):
+        # Rejected saves go back in the queue and backoff is cut short, e.g. once the server is back.
+        # Saves held behind them go too; flush holds them again if an older one is still rejected.
+        rows = {(item['table'], item['row_key']) for item in self.items.values()
+                if item_ids is None or item['id'] in item_ids}
+        conn = self._journal()
+        try:
+            for item in self.items.values():
+                if item['status'] == 'held' and (item['table'], item['row_key']) in rows:
+                    item['status'], item['error'], item['next_attempt'] = 'pending', None, 0
+                    conn.execute("UPDATE QueuedWrite SET Status='pending', Error=NULL, NextAttempt=0 WHERE Id=?",
+                                 (item['id'],))
+                elif item_ids is None or item['id'] in item_ids:
+                    item['status'], item['next_attempt'] = 'pending', 0
+                    conn.execute("UPDATE QueuedWrite SET Status='pending', NextAttempt=0 WHERE Id=?", (item['id'],))
+            conn.commit()
+        finally:
+            conn.close()
+        for item in self.items.values():
+            self._repaint_row(item)
+        self.changed.emit()
+        self.flush()
+
+    def discard(self, item_ids):
+        # Drops saves that are not being applied right now; their rows go back to what the database has.
+        # Saves held behind them are released; flush holds them again if an older one is still rejected.
+        dropped = [self.items[i] for i in item_ids if i in self.items and i not in self._in_flight]
+        rows = {(item['table'], item['row_key']) for item in dropped}
+        released = [item for item in self.items.values()
+                    if item['status'] == 'held' and item['id'] not in item_ids and (item['table'], item['row_key']) in rows]
+        conn = self._journal()
+        try:
+            conn.executemany("DELETE FROM QueuedWrite WHERE Id=?", [(item['id'],) for item in dropped])
+            conn.executemany("UPDATE QueuedWrite SET Status='pending', Error=NULL WHERE Id=?",
+                             [(item['id'],) for item in released])
+            conn.commit()
+        finally:
+            conn.close()
+        for item in dropped:
+            self._forget(item)
+            self._reload_row(item)
+        for item in released:
+            item['status'], item['error'] = 'pending', None
+        self.changed.emit()
+        self.flush()
+        return len(dropped)
+
+
+write_queue = WriteQueue()